@@ -0,0 +1,159 @@
+"""
+Compaction benchmark: long conversations with and without compaction.
+
+Runs the agent service in-process with FakeClaudeSDKClient, whose context
+grows with every turn (prompts, tool output, replies) and whose time to
+first token and input cost grow with the context (see
+FakeScript.context_latency_per_1k_tokens). Each session sends --turns
+messages, once with compaction disabled and once with
+AGENT_COMPACTION_THRESHOLD_TOKENS set to --threshold.
+
+Reports turn latency over the first and the last --tail turns of each
+session, the context size at the end, total cost (summary turns included)
+and the number of compactions. Runs fully offline.
+
+Usage (from backend/):
+    python -m benchmarks.bench_compaction [--sessions 4] [--turns 40] [--threshold 8000]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Any
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run_policy(name: str, threshold: int, args: argparse.Namespace) -> dict[str, Any]:
+    from src.modules.agent.compaction import CompactionConfig, Compactor
+    from src.modules.agent.service import agent_service
+
+    agent_service.compactor = Compactor(agent_service, CompactionConfig(threshold_tokens=threshold))
+    by_turn: list[list[float]] = [[] for _ in range(args.turns)]
+    final_context: list[int] = []
+    compactions = 0
+    errors = 0
+    message = "Continue with the next step of the task. " * 10
+
+    # Every run is charged, summary turns included: sum the charged cost
+    cost = 0.0
+    charge = agent_service.budgets.charge
+
+    async def counting_charge(session_id, api_key, usage, total_cost_usd):
+        nonlocal cost
+        cost += total_cost_usd or 0.0
+        await charge(session_id, api_key, usage, total_cost_usd)
+
+    async def session(index: int) -> None:
+        nonlocal errors, compactions
+        session_id = f"{name}-{index}"
+        for turn in range(args.turns):
+            started = time.perf_counter()
+            async for event in agent_service.chat(message, session_id):
+                if event["type"] == "error":
+                    errors += 1
+            by_turn[turn].append(time.perf_counter() - started)
+        # Let a compaction started by the last turn finish before reading the record
+        while agent_service.compactor.pending:
+            await asyncio.sleep(0.01)
+        record = await agent_service.store.get(session_id)
+        final_context.append(record.get("context_tokens", 0))
+        compactions += record.get("compactions", 0)
+        await agent_service.end_session(session_id)
+
+    agent_service.budgets.charge = counting_charge
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(session(i) for i in range(args.sessions)))
+    finally:
+        agent_service.budgets.charge = charge
+    wall = time.perf_counter() - started
+
+    head = [value for turn in by_turn[:args.tail] for value in turn]
+    tail = [value for turn in by_turn[-args.tail:] for value in turn]
+    return {
+        "policy": name,
+        "threshold_tokens": threshold,
+        "turns": sum(len(turn) for turn in by_turn),
+        "errors": errors,
+        "wall_s": round(wall, 2),
+        "first_turns_ms_p50": round(percentile(head, 50) * 1000, 1),
+        "last_turns_ms_p50": round(percentile(tail, 50) * 1000, 1),
+        "last_turns_ms_p95": round(percentile(tail, 95) * 1000, 1),
+        "final_context_tokens_max": max(final_context, default=0),
+        "compactions": compactions,
+        "cost_usd": round(cost, 4),
+    }
+
+
+async def run(args: argparse.Namespace) -> list[dict[str, Any]]:
+    from benchmarks.fake_sdk import FakeScript, install_fake_sdk
+    from src.modules.agent.driver import claude_sdk_driver
+    from src.modules.agent.service import agent_service
+
+    script = FakeScript(
+        first_token_latency=args.first_token_ms / 1000,
+        chunk_interval=args.chunk_ms / 1000,
+        context_latency_per_1k_tokens=args.context_ms_per_1k / 1000,
+        cost_per_input_token=0.000003,
+        tool_calls=1,
+    )
+    with install_fake_sdk(script):
+        await claude_sdk_driver.start(preload_sdk=False)
+        try:
+            return [
+                await run_policy("off", 0, args),
+                await run_policy("on", args.threshold, args),
+            ]
+        finally:
+            await agent_service.compactor.close()
+            await claude_sdk_driver.shutdown()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sessions", type=int, default=4)
+    parser.add_argument("--turns", type=int, default=40)
+    parser.add_argument("--threshold", type=int, default=8000, help="compaction threshold (context tokens)")
+    parser.add_argument("--tail", type=int, default=5, help="turns at each end to compare")
+    parser.add_argument("--first-token-ms", type=float, default=100)
+    parser.add_argument("--chunk-ms", type=float, default=2)
+    parser.add_argument("--context-ms-per-1k", type=float, default=20, help="extra first token time per 1k context tokens")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_compaction_")
+    os.environ.setdefault("AGENT_WORKSPACE_DIR", os.path.join(workdir, "workspaces"))
+    os.environ.setdefault("AGENT_TEMPLATES_DIR", os.path.join(workdir, "templates"))
+    os.environ.setdefault("HISTORY_ENABLED", "false")
+    os.environ.setdefault("RESPONSE_CACHE_ENABLED", "false")
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    for result in results:
+        print(
+            f"compaction {result['policy']:3s} turns={result['turns']} errors={result['errors']} "
+            f"first_p50={result['first_turns_ms_p50']}ms last_p50={result['last_turns_ms_p50']}ms "
+            f"last_p95={result['last_turns_ms_p95']}ms context={result['final_context_tokens_max']} "
+            f"compactions={result['compactions']} cost=${result['cost_usd']}"
+        )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    sys.exit(1 if any(result["errors"] for result in results) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+"""
+Load benchmark: N concurrent sessions against the real app, fake SDK.
+
+Starts the FastAPI app in-process on a loopback port (uvicorn) with
+FakeClaudeSDKClient installed, then drives N concurrent sessions, each
+sending M messages in sequence through /api/chat/message (SSE) and/or
+/api/chat/message/sync. Runs fully offline.
+
+Reports throughput, time to first text event (SSE only), p50/p99
+latencies and memory growth per session. With --max-* / --min-* budgets
+the exit status is 1 when a budget is exceeded, for regression checks.
+
+Usage (from backend/):
+    python -m benchmarks.bench_load [--sessions 50] [--messages 3] [--endpoint both]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass, field
+from typing import Optional
+
+
+@dataclass
+class Sample:
+    endpoint: str
+    latency: float
+    ttft: Optional[float] = None
+    events: int = 0
+    ok: bool = True
+
+
+@dataclass
+class Report:
+    samples: list[Sample] = field(default_factory=list)
+    wall: float = 0.0
+    rss_per_session: float = 0.0
+    heap_per_session: Optional[float] = None
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def rss_bytes() -> int:
+    """Resident set size of this process."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def configure_environment(args: argparse.Namespace, workdir: str) -> None:
+    """Settings are read at import time, so set them before importing src."""
+    defaults = {
+        "AGENT_WORKSPACE_DIR": os.path.join(workdir, "workspaces"),
+        "AGENT_TEMPLATES_DIR": os.path.join(workdir, "templates"),
+        "AGENT_MAX_CONCURRENT_RUNS": str(args.sessions),
+        "AGENT_MAX_QUEUED_RUNS": str(args.sessions * 2),
+        "AGENT_MAX_LIVE_CLIENTS": str(args.sessions * 2),
+        "AGENT_SHARDS": str(args.shards),
+        "HISTORY_ENABLED": "false",
+        "RESPONSE_CACHE_ENABLED": "false",
+        "DEBUG": "false",
+    }
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+
+
+async def send_stream(client, session_id: str, message: str) -> Sample:
+    started = time.perf_counter()
+    sample = Sample("stream", 0.0)
+    async with client.stream(
+        "POST", "/api/chat/message", json={"message": message, "session_id": session_id}
+    ) as response:
+        sample.ok = response.status_code == 200
+        async for line in response.aiter_lines():
+            if not line.startswith("event: "):
+                continue
+            sample.events += 1
+            event_type = line[7:]
+            if event_type == "text" and sample.ttft is None:
+                sample.ttft = time.perf_counter() - started
+            elif event_type == "error":
+                sample.ok = False
+    sample.latency = time.perf_counter() - started
+    return sample
+
+
+async def send_sync(client, session_id: str, message: str) -> Sample:
+    started = time.perf_counter()
+    response = await client.post(
+        "/api/chat/message/sync", json={"message": message, "session_id": session_id}
+    )
+    return Sample("sync", time.perf_counter() - started, ok=response.status_code == 200)
+
+
+async def run_session(client, index: int, args: argparse.Namespace, report: Report) -> None:
+    response = await client.post("/api/chat/sessions")
+    session_id = response.json()["session_id"]
+    for turn in range(args.messages):
+        message = f"session {index} message {turn}: summarize the workspace"
+        if args.endpoint == "stream" or (args.endpoint == "both" and (index + turn) % 2 == 0):
+            sample = await send_stream(client, session_id, message)
+        else:
+            sample = await send_sync(client, session_id, message)
+        report.samples.append(sample)
+
+
+async def run(args: argparse.Namespace) -> Report:
+    import httpx
+    import uvicorn
+
+    from benchmarks.fake_sdk import FakeScript, install_fake_sdk
+    from src.main import app
+
+    script = FakeScript(
+        connect_latency=args.connect_ms / 1000,
+        first_token_latency=args.first_token_ms / 1000,
+        text_chunks=args.chunks,
+        chunk_bytes=args.chunk_bytes,
+        chunk_interval=args.chunk_interval_ms / 1000,
+        tool_calls=args.tool_calls,
+        tool_latency=args.tool_ms / 1000,
+        tool_output_bytes=args.tool_output_bytes,
+    )
+    report = Report()
+    with install_fake_sdk(script):
+        server = uvicorn.Server(uvicorn.Config(
+            app, host="127.0.0.1", port=0, log_level="warning", lifespan="on",
+        ))
+        serve = asyncio.create_task(server.serve())
+        while not server.started:
+            if serve.done():
+                serve.result()
+            await asyncio.sleep(0.01)
+        port = server.servers[0].sockets[0].getsockname()[1]
+
+        limits = httpx.Limits(max_connections=args.sessions + 10)
+        async with httpx.AsyncClient(
+            base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=120
+        ) as client:
+            # Warm up imports, encoders and the connection pool
+            await run_session(client, -1, argparse.Namespace(**{**vars(args), "messages": 1}), Report())
+
+            if args.tracemalloc:
+                tracemalloc.start()
+            heap_before = tracemalloc.get_traced_memory()[0] if args.tracemalloc else 0
+            rss_before = rss_bytes()
+            started = time.perf_counter()
+            await asyncio.gather(*(
+                run_session(client, i, args, report) for i in range(args.sessions)
+            ))
+            report.wall = time.perf_counter() - started
+            # Sessions are still live (clients connected, buffers retained)
+            report.rss_per_session = (rss_bytes() - rss_before) / args.sessions
+            if args.tracemalloc:
+                heap_after = tracemalloc.get_traced_memory()[0]
+                report.heap_per_session = (heap_after - heap_before) / args.sessions
+                tracemalloc.stop()
+
+        server.should_exit = True
+        await serve
+    return report
+
+
+def summarize(report: Report, args: argparse.Namespace) -> dict:
+    ok = [s for s in report.samples if s.ok]
+    summary = {
+        "sessions": args.sessions,
+        "messages": len(report.samples),
+        "errors": len(report.samples) - len(ok),
+        "wall_seconds": round(report.wall, 3),
+        "messages_per_second": round(len(ok) / report.wall, 2) if report.wall else 0.0,
+        "events_per_second": round(sum(s.events for s in ok) / report.wall, 1) if report.wall else 0.0,
+        "rss_kib_per_session": round(report.rss_per_session / 1024, 1),
+        "endpoints": {},
+    }
+    if report.heap_per_session is not None:
+        summary["heap_kib_per_session"] = round(report.heap_per_session / 1024, 1)
+    for endpoint in ("stream", "sync"):
+        samples = [s for s in ok if s.endpoint == endpoint]
+        if not samples:
+            continue
+        latencies = [s.latency * 1000 for s in samples]
+        stats = {
+            "count": len(samples),
+            "latency_p50_ms": round(percentile(latencies, 50), 1),
+            "latency_p99_ms": round(percentile(latencies, 99), 1),
+        }
+        ttfts = [s.ttft * 1000 for s in samples if s.ttft is not None]
+        if ttfts:
+            stats["ttft_p50_ms"] = round(percentile(ttfts, 50), 1)
+            stats["ttft_p99_ms"] = round(percentile(ttfts, 99), 1)
+        summary["endpoints"][endpoint] = stats
+    return summary
+
+
+def check_budgets(summary: dict, args: argparse.Namespace) -> list[str]:
+    """Budget violations (empty if all budgets are met)."""
+    failures = []
+    if summary["errors"]:
+        failures.append(f"{summary['errors']} messages failed")
+    if args.min_rps and summary["messages_per_second"] < args.min_rps:
+        failures.append(f"throughput {summary['messages_per_second']}/s < {args.min_rps}/s")
+    for endpoint, stats in summary["endpoints"].items():
+        if args.max_p99_ms and stats["latency_p99_ms"] > args.max_p99_ms:
+            failures.append(f"{endpoint} p99 {stats['latency_p99_ms']}ms > {args.max_p99_ms}ms")
+        ttft = stats.get("ttft_p99_ms")
+        if args.max_ttft_p99_ms and ttft is not None and ttft > args.max_ttft_p99_ms:
+            failures.append(f"{endpoint} TTFT p99 {ttft}ms > {args.max_ttft_p99_ms}ms")
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=3, help="messages per session")
+    parser.add_argument("--endpoint", choices=("stream", "sync", "both"), default="both")
+    parser.add_argument("--shards", type=int, default=0, help="driver worker processes (AGENT_SHARDS)")
+    # Fake SDK script
+    parser.add_argument("--connect-ms", type=float, default=50)
+    parser.add_argument("--first-token-ms", type=float, default=200)
+    parser.add_argument("--chunks", type=int, default=20)
+    parser.add_argument("--chunk-bytes", type=int, default=40)
+    parser.add_argument("--chunk-interval-ms", type=float, default=10)
+    parser.add_argument("--tool-calls", type=int, default=1)
+    parser.add_argument("--tool-ms", type=float, default=50)
+    parser.add_argument("--tool-output-bytes", type=int, default=512)
+    # Reporting and budgets
+    parser.add_argument("--tracemalloc", action="store_true", help="also measure Python heap per session")
+    parser.add_argument("--json", help="write the summary to this file")
+    parser.add_argument("--max-p99-ms", type=float, default=0)
+    parser.add_argument("--max-ttft-p99-ms", type=float, default=0)
+    parser.add_argument("--min-rps", type=float, default=0)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_load_")
+    try:
+        configure_environment(args, workdir)
+        report = asyncio.run(run(args))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    summary = summarize(report, args)
+    print(f"{summary['sessions']} sessions, {summary['messages']} messages "
+          f"({summary['errors']} errors) in {summary['wall_seconds']}s")
+    print(f"  throughput: {summary['messages_per_second']} msg/s, "
+          f"{summary['events_per_second']} events/s")
+    print(f"  memory: {summary['rss_kib_per_session']} KiB RSS/session"
+          + (f", {summary['heap_kib_per_session']} KiB heap/session"
+             if "heap_kib_per_session" in summary else ""))
+    for endpoint, stats in summary["endpoints"].items():
+        line = (f"  {endpoint:6s} n={stats['count']:<5d} "
+                f"p50={stats['latency_p50_ms']:.1f}ms p99={stats['latency_p99_ms']:.1f}ms")
+        if "ttft_p50_ms" in stats:
+            line += f" ttft p50={stats['ttft_p50_ms']:.1f}ms p99={stats['ttft_p99_ms']:.1f}ms"
+        print(line)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+
+    failures = check_budgets(summary, args)
+    for failure in failures:
+        print(f"BUDGET EXCEEDED: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
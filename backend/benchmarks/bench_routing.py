@@ -0,0 +1,188 @@
+"""
+Routing benchmark: one mixed workload under several model routing policies.
+
+Runs the agent service in-process with FakeClaudeSDKClient, whose latency
+and cost scale per model (haiku fast and cheap, opus slow and expensive;
+see FakeScript.model_latency / model_cost). The same sequence of turns
+(short questions, tool tasks, long requests; two turns per session, so
+follow-ups switch live clients between models) is run once per policy:
+
+    default   every turn on CLAUDE_MODEL (routing disabled)
+    rules     --rules (default: short messages without tool needs -> haiku,
+              long ones -> opus)
+
+Reports p50/p95 turn latency and time to first token, total cost and the
+per-route breakdown from ModelRouter.stats(). Runs fully offline.
+
+Usage (from backend/):
+    python -m benchmarks.bench_routing [--sessions 100] [--concurrency 20] [--rules '[...]']
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from typing import Any
+
+DEFAULT_RULES = [
+    {"name": "quick", "model": "haiku", "max_chars": 280, "needs_tools": False},
+    {"name": "long", "model": "opus", "min_chars": 2000},
+]
+
+QUESTIONS = [
+    "What does HTTP status 418 mean?",
+    "Explain the difference between a process and a thread in two sentences.",
+    "Is UTC the same as GMT?",
+    "Give me a synonym for 'ephemeral'.",
+    "What is the capital of Australia?",
+]
+TASKS = [
+    "Run the test suite in tests/ and fix any failures.",
+    "Refactor src/app/handlers.py to remove the duplicated validation code.",
+    "Install the dependencies and build the project, then list the artifacts.",
+    "Create a script that downloads the CSV and writes a summary to report.md.",
+]
+LONG = "Review this design document and list risks.\n\n" + ("The service stores sessions in memory. " * 80)
+
+
+def workload(sessions: int, seed: int) -> list[list[str]]:
+    """Two messages per session: ~60% questions, ~30% tasks, ~10% long."""
+    rng = random.Random(seed)
+
+    def pick() -> str:
+        roll = rng.random()
+        if roll < 0.6:
+            return rng.choice(QUESTIONS)
+        if roll < 0.9:
+            return rng.choice(TASKS)
+        return LONG
+
+    return [[pick(), pick()] for _ in range(sessions)]
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run_policy(name: str, routing_config, turns: list[list[str]], concurrency: int) -> dict[str, Any]:
+    from src.modules.agent.routing import ModelRouter
+    from src.modules.agent.service import agent_service
+
+    agent_service.router = ModelRouter(routing_config)
+    latencies: list[float] = []
+    first_tokens: list[float] = []
+    cost = 0.0
+    errors = 0
+    limit = asyncio.Semaphore(concurrency)
+
+    async def session(index: int, messages: list[str]) -> None:
+        nonlocal cost, errors
+        session_id = f"{name}-{index}"
+        async with limit:
+            for message in messages:
+                started = time.perf_counter()
+                first = None
+                async for event in agent_service.chat(message, session_id):
+                    if event["type"] == "text" and first is None:
+                        first = time.perf_counter() - started
+                    elif event["type"] == "error":
+                        errors += 1
+                    elif event["type"] == "done":
+                        cost += event.get("total_cost_usd") or 0.0
+                latencies.append(time.perf_counter() - started)
+                if first is not None:
+                    first_tokens.append(first)
+            await agent_service.end_session(session_id)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(session(i, messages) for i, messages in enumerate(turns)))
+    stats = agent_service.router.stats()
+    return {
+        "policy": name,
+        "turns": len(latencies),
+        "errors": errors,
+        "wall_s": round(time.perf_counter() - started, 2),
+        "latency_ms_p50": round(percentile(latencies, 50) * 1000, 1),
+        "latency_ms_p95": round(percentile(latencies, 95) * 1000, 1),
+        "ttft_ms_p50": round(percentile(first_tokens, 50) * 1000, 1),
+        "cost_usd": round(cost, 4),
+        "routes": stats["routes"],
+    }
+
+
+async def run(args: argparse.Namespace) -> list[dict[str, Any]]:
+    from benchmarks.fake_sdk import FakeScript, install_fake_sdk
+    from src.modules.agent.driver import claude_sdk_driver
+    from src.modules.agent.routing import RoutingConfig
+
+    script = FakeScript(
+        first_token_latency=args.first_token_ms / 1000,
+        chunk_interval=args.chunk_ms / 1000,
+        tool_calls=1,
+    )
+    rules = json.loads(args.rules) if args.rules else DEFAULT_RULES
+    turns = workload(args.sessions, args.seed)
+    policies = [
+        ("default", RoutingConfig(enabled=False)),
+        ("rules", RoutingConfig(enabled=True, rules=rules, allow_hints=False)),
+    ]
+    with install_fake_sdk(script):
+        await claude_sdk_driver.start(preload_sdk=False)
+        try:
+            return [
+                await run_policy(name, config, turns, args.concurrency)
+                for name, config in policies
+            ]
+        finally:
+            await claude_sdk_driver.shutdown()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--first-token-ms", type=float, default=300, help="sonnet time to first token")
+    parser.add_argument("--chunk-ms", type=float, default=10, help="sonnet delay between text chunks")
+    parser.add_argument("--rules", help="routing rules as JSON (default: quick -> haiku, long -> opus)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_routing_")
+    os.environ.setdefault("AGENT_WORKSPACE_DIR", os.path.join(workdir, "workspaces"))
+    os.environ.setdefault("AGENT_TEMPLATES_DIR", os.path.join(workdir, "templates"))
+    os.environ.setdefault("AGENT_MAX_CONCURRENT_RUNS", str(args.concurrency))
+    os.environ.setdefault("HISTORY_ENABLED", "false")
+    os.environ.setdefault("RESPONSE_CACHE_ENABLED", "false")
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    for result in results:
+        print(
+            f"{result['policy']:8s} turns={result['turns']} errors={result['errors']} "
+            f"p50={result['latency_ms_p50']}ms p95={result['latency_ms_p95']}ms "
+            f"ttft_p50={result['ttft_ms_p50']}ms cost=${result['cost_usd']}"
+        )
+        for route in result["routes"]:
+            print(
+                f"    {route['route']:10s} {route['model']:8s} turns={route['turns']:4d} "
+                f"p50={route['duration_ms']['p50']:.1f}ms cost/turn=${route['cost_usd_per_turn']}"
+            )
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    sys.exit(1 if any(result["errors"] for result in results) else 0)
+
+
+if __name__ == "__main__":
+    main()
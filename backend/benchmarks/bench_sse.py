@@ -0,0 +1,103 @@
+"""
+SSE encoding micro-benchmark.
+
+Compares the original per-event json.dumps + f-string framing with
+SSEEncoder (pre-encoded framing, optional orjson, text coalescing).
+Reports input events encoded per second of CPU time on one core.
+
+Usage (from backend/):
+    python -m benchmarks.bench_sse [--events 200000]
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from src.modules.chat.sse import SSEConfig, SSEEncoder, orjson
+
+
+def make_events(count: int) -> list[dict]:
+    """Synthetic agent stream: mostly short text chunks, some tool traffic."""
+    events = []
+    for i in range(count):
+        kind = i % 20
+        if kind == 18:
+            events.append({"type": "tool_use", "tool": "Bash", "input": {"command": "ls -la"}})
+        elif kind == 19:
+            events.append({
+                "type": "tool_result",
+                "tool_use_id": f"toolu_{i}",
+                "output": "file1.txt\nfile2.txt\n" * 4,
+                "is_error": False,
+            })
+        else:
+            events.append({"type": "text", "content": f"token {i} of a streamed reply, "})
+    return events
+
+
+def baseline(events: list[dict]) -> int:
+    """The original event_generator framing (str, then encoded by Starlette)."""
+    total = 0
+    for event in events:
+        event_type = event.get("type", "text")
+        data = json.dumps(event)
+        total += len(f"event: {event_type}\ndata: {data}\n\n".encode())
+    return total
+
+
+def encoder_per_event(encoder: SSEEncoder, events: list[dict]) -> int:
+    total = 0
+    for event in events:
+        total += len(encoder.encode(event))
+    return total
+
+
+async def _source(events: list[dict]):
+    for event in events:
+        yield event
+
+
+async def _drain(encoder: SSEEncoder, events: list[dict]) -> int:
+    total = 0
+    async for frame in encoder.stream(_source(events)):
+        total += len(frame)
+    return total
+
+
+def encoder_stream(encoder: SSEEncoder, events: list[dict]) -> int:
+    return asyncio.run(_drain(encoder, events))
+
+
+def measure(name: str, fn, events: list[dict]) -> float:
+    started = time.process_time()
+    size = fn(events)
+    elapsed = time.process_time() - started
+    rate = len(events) / elapsed if elapsed else float("inf")
+    print(f"{name:<34} {rate:>14,.0f} events/s  {size / 1024:>10,.0f} KiB")
+    return rate
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--events", type=int, default=200_000)
+    args = parser.parse_args()
+
+    events = make_events(args.events)
+    print(f"{args.events:,} events, orjson {'available' if orjson else 'not installed'}\n")
+
+    base = measure("baseline (json + f-string)", baseline, events)
+    stdlib = SSEEncoder(SSEConfig(json_backend="json", coalesce_interval_ms=0))
+    measure("encoder, json", lambda e: encoder_per_event(stdlib, e), events)
+    results = [base]
+    if orjson is not None:
+        fast = SSEEncoder(SSEConfig(json_backend="orjson", coalesce_interval_ms=0))
+        results.append(measure("encoder, orjson", lambda e: encoder_per_event(fast, e), events))
+    coalescing = SSEEncoder(SSEConfig(coalesce_interval_ms=20))
+    results.append(measure("encoder stream, coalescing", lambda e: encoder_stream(coalescing, e), events))
+
+    print(f"\nbest speedup vs baseline: {max(results) / base:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
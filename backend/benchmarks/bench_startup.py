@@ -0,0 +1,194 @@
+"""
+Startup benchmark: import time of the app and cold start of a server process.
+
+Import: runs `python -X importtime -c "import src.main"` in fresh
+interpreters and reports the cumulative import time of src.main plus the
+heaviest packages it imports. Modules that must stay deferred (the Claude
+Agent SDK, SQLAlchemy, redis) are checked to not be imported.
+
+Cold start: spawns `uvicorn src.main:app` and polls /health; the time from
+spawning the process to the first 200 response is what a new replica
+takes before it can receive traffic.
+
+With --max-* budgets the exit status is 1 when a budget is exceeded (or a
+deferred module is imported), for regression checks.
+
+Usage (from backend/):
+    python -m benchmarks.bench_startup [--runs 5] [--max-import-ms 1000] [--max-startup-ms 2500]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from typing import Any
+
+# Must not be imported by `import src.main`; they load on first use
+DEFERRED_MODULES = ("claude_agent_sdk", "mcp", "sqlalchemy", "redis")
+
+_CHECK_DEFERRED = (
+    "import json, sys; import src.main; "
+    f"print(json.dumps([m for m in {DEFERRED_MODULES!r} if m in sys.modules]))"
+)
+
+
+def bench_env(workdir: str) -> dict[str, Any]:
+    """Environment for child processes: defaults, scratch directories."""
+    env = dict(os.environ)
+    env.setdefault("AGENT_WORKSPACE_DIR", os.path.join(workdir, "workspaces"))
+    env.setdefault("AGENT_TEMPLATES_DIR", os.path.join(workdir, "templates"))
+    env.setdefault("HISTORY_ENABLED", "false")
+    env.setdefault("JOBS_ENABLED", "false")
+    env.setdefault("DEBUG", "false")
+    return env
+
+
+def parse_importtime(stderr: str) -> tuple[float, dict[str, float]]:
+    """
+    Parse -X importtime output.
+
+    Returns:
+        (cumulative ms of src.main, cumulative ms per package imported
+        directly by src.main)
+    """
+    total = 0.0
+    packages: dict[str, float] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        try:
+            cumulative = int(parts[1]) / 1000
+        except ValueError:
+            continue  # header line
+        module = parts[2].strip()
+        # One space, then two more per nesting level
+        depth = (len(parts[2]) - len(parts[2].lstrip()) - 1) // 2
+        if depth == 0 and module == "src.main":
+            total = cumulative
+        elif depth == 1:
+            package = module.split(".")[0]
+            packages[package] = packages.get(package, 0.0) + cumulative
+    return total, packages
+
+
+def measure_import(env: dict[str, Any], runs: int) -> dict[str, Any]:
+    totals = []
+    packages: dict[str, float] = {}
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import src.main"],
+            env=env, capture_output=True, text=True, check=True,
+        )
+        total, packages = parse_importtime(result.stderr)
+        totals.append(total)
+    deferred = subprocess.run(
+        [sys.executable, "-c", _CHECK_DEFERRED],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    heaviest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:8]
+    return {
+        "import_ms_median": round(statistics.median(totals), 1),
+        "import_ms_min": round(min(totals), 1),
+        "heaviest_packages_ms": {name: round(ms, 1) for name, ms in heaviest},
+        "deferred_imported": json.loads(deferred.stdout.strip().splitlines()[-1]),
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_cold_start(env: dict[str, Any], runs: int, timeout: float) -> dict[str, Any]:
+    samples = []
+    for _ in range(runs):
+        port = free_port()
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "src.main:app",
+             "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            while True:
+                if process.poll() is not None:
+                    raise RuntimeError(f"server exited with status {process.returncode}")
+                if time.perf_counter() - started > timeout:
+                    raise RuntimeError(f"server not ready after {timeout}s")
+                try:
+                    with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as response:
+                        if response.status == 200:
+                            break
+                except OSError:
+                    time.sleep(0.005)
+            samples.append((time.perf_counter() - started) * 1000)
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+    return {
+        "startup_ms_median": round(statistics.median(samples), 1),
+        "startup_ms_max": round(max(samples), 1),
+    }
+
+
+def check_budgets(summary: dict[str, Any], args: argparse.Namespace) -> list[str]:
+    """Budget violations (empty if all budgets are met)."""
+    failures = []
+    if summary["deferred_imported"]:
+        failures.append(f"deferred modules imported by src.main: {', '.join(summary['deferred_imported'])}")
+    if args.max_import_ms and summary["import_ms_median"] > args.max_import_ms:
+        failures.append(f"import {summary['import_ms_median']}ms > {args.max_import_ms}ms")
+    startup = summary.get("startup_ms_median")
+    if args.max_startup_ms and startup is not None and startup > args.max_startup_ms:
+        failures.append(f"cold start {startup}ms > {args.max_startup_ms}ms")
+    return failures
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--skip-server", action="store_true", help="only measure import time")
+    parser.add_argument("--timeout", type=float, default=30, help="seconds to wait for a server")
+    parser.add_argument("--json", help="write the summary to this file")
+    parser.add_argument("--max-import-ms", type=float, default=0)
+    parser.add_argument("--max-startup-ms", type=float, default=0)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench_startup_")
+    try:
+        env = bench_env(workdir)
+        summary = measure_import(env, args.runs)
+        if not args.skip_server:
+            summary.update(measure_cold_start(env, args.runs, args.timeout))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"import src.main: median {summary['import_ms_median']}ms, min {summary['import_ms_min']}ms")
+    for name, ms in summary["heaviest_packages_ms"].items():
+        print(f"  {name:24s} {ms:8.1f}ms")
+    print(f"  deferred modules imported: {', '.join(summary['deferred_imported']) or 'none'}")
+    if "startup_ms_median" in summary:
+        print(f"cold start to /health: median {summary['startup_ms_median']}ms, "
+              f"max {summary['startup_ms_max']}ms")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+
+    failures = check_budgets(summary, args)
+    for failure in failures:
+        print(f"BUDGET EXCEEDED: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+Offline stand-in for ClaudeSDKClient.
+
+Emits scripted SDK message streams (tool calls, text chunks, a result)
+with configurable latencies and payload sizes, so the backend can be
+load-tested without network access or API keys.
+
+Usage:
+    from benchmarks.fake_sdk import FakeScript, install_fake_sdk
+
+    with install_fake_sdk(FakeScript(first_token_latency=0.1)):
+        ...  # the driver and client pool now use FakeClaudeSDKClient
+
+Agent shard processes started inside the block use it too: the client
+class and script are passed on through the environment.
+
+Each SDK session keeps a context (system prompt, prompts, tool output and
+replies, in characters) that carries over on resume. It is reported as
+input tokens and, with context_latency_per_1k_tokens, slows the first
+token the way a long conversation does.
+"""
+
+import asyncio
+import itertools
+import json
+import os
+import uuid
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import AsyncIterator, Iterator, Optional
+
+from claude_agent_sdk import (
+    AssistantMessage,
+    ClaudeAgentOptions,
+    ResultMessage,
+    TextBlock,
+    ToolResultBlock,
+    ToolUseBlock,
+    UserMessage,
+)
+
+
+@dataclass
+class FakeScript:
+    """Shape and timing of every fake turn (seconds, bytes)."""
+    connect_latency: float = 0.05
+    first_token_latency: float = 0.2
+    text_chunks: int = 20
+    chunk_bytes: int = 40
+    chunk_interval: float = 0.01
+    tool_calls: int = 1
+    tool_latency: float = 0.05
+    tool_output_bytes: int = 512
+    model: str = "fake-sonnet"
+    cost_per_output_token: float = 0.000015
+    cost_per_input_token: float = 0.0
+    # Extra time to first token per 1000 context tokens
+    context_latency_per_1k_tokens: float = 0.0
+    # Per model (options.model / set_model): latency and cost multipliers
+    model_latency: dict = field(default_factory=lambda: {"haiku": 0.3, "sonnet": 1.0, "opus": 2.5})
+    model_cost: dict = field(default_factory=lambda: {"haiku": 0.25, "sonnet": 1.0, "opus": 5.0})
+
+
+class FakeClaudeSDKClient:
+    """Drop-in replacement for the ClaudeSDKClient calls the driver makes."""
+
+    # Script used by clients created through the driver and pool
+    script = FakeScript()
+    _ids = itertools.count(1)
+    # Context size (characters) per SDK session id
+    _contexts: dict[str, int] = {}
+
+    def __init__(self, options: Optional[ClaudeAgentOptions] = None, script: Optional[FakeScript] = None):
+        self.options = options
+        self.script = script or type(self).script
+        self.connected = False
+        self.session_id = (options.resume if options and options.resume else None) or str(uuid.uuid4())
+        self.model = (options.model if options is not None else None) or self.script.model
+        self._prompt: Optional[str] = None
+        self._input_tokens = 0
+        self._interrupted = asyncio.Event()
+
+    async def connect(self, prompt=None) -> None:
+        await asyncio.sleep(self.script.connect_latency)
+        if self.session_id not in self._contexts:
+            system_prompt = getattr(self.options, "system_prompt", None)
+            self._contexts[self.session_id] = len(system_prompt) if isinstance(system_prompt, str) else 0
+        self.connected = True
+
+    async def disconnect(self) -> None:
+        self.connected = False
+
+    async def query(self, prompt: str, session_id: str = "default") -> None:
+        if not self.connected:
+            raise RuntimeError("Not connected")
+        self._prompt = prompt
+        self._grow(len(prompt))
+        self._interrupted.clear()
+
+    async def interrupt(self) -> None:
+        self._interrupted.set()
+
+    async def set_model(self, model: Optional[str] = None) -> None:
+        self.model = model or self.script.model
+
+    async def receive_response(self) -> AsyncIterator:
+        script = self.script
+        started = asyncio.get_running_loop().time()
+        self._input_tokens = self._contexts.get(self.session_id, 0) // 4 + 1
+        first_token = script.first_token_latency + (
+            script.context_latency_per_1k_tokens * self._input_tokens / 1000
+        )
+        if await self._sleep(first_token):
+            yield self._result(started, is_error=True, output_tokens=0)
+            return
+
+        # tools=[] (e.g. compaction summary turns) disables tool use
+        tool_calls = 0 if getattr(self.options, "tools", None) == [] else script.tool_calls
+        for _ in range(tool_calls):
+            tool_id = f"toolu_fake_{next(self._ids)}"
+            yield AssistantMessage(
+                [ToolUseBlock(tool_id, "Bash", {"command": "ls -la"})], self.model
+            )
+            if await self._sleep(script.tool_latency):
+                yield self._result(started, is_error=True, output_tokens=0)
+                return
+            yield UserMessage([ToolResultBlock(tool_id, "x" * script.tool_output_bytes, False)])
+            self._grow(script.tool_output_bytes)
+
+        chunk = ("lorem ipsum " * (script.chunk_bytes // 12 + 1))[:script.chunk_bytes]
+        for i in range(script.text_chunks):
+            if i and await self._sleep(script.chunk_interval):
+                yield self._result(started, is_error=True, output_tokens=i)
+                return
+            yield AssistantMessage([TextBlock(chunk)], self.model)
+            self._grow(len(chunk))
+
+        yield self._result(started, is_error=False, output_tokens=script.text_chunks)
+
+    def _grow(self, chars: int) -> None:
+        self._contexts[self.session_id] = self._contexts.get(self.session_id, 0) + chars
+
+    async def _sleep(self, seconds: float) -> bool:
+        """Sleep (scaled for the model) unless interrupted; True if interrupted."""
+        seconds *= self.script.model_latency.get(self.model, 1.0)
+        if seconds <= 0:
+            return self._interrupted.is_set()
+        try:
+            async with asyncio.timeout(seconds):
+                await self._interrupted.wait()
+            return True
+        except TimeoutError:
+            return False
+
+    def _result(self, started: float, is_error: bool, output_tokens: int) -> ResultMessage:
+        duration_ms = int((asyncio.get_running_loop().time() - started) * 1000)
+        input_tokens = self._input_tokens
+        output_tokens = output_tokens * max(1, self.script.chunk_bytes // 4)
+        script = self.script
+        return ResultMessage(
+            subtype="error_during_execution" if is_error else "success",
+            duration_ms=duration_ms,
+            duration_api_ms=duration_ms,
+            is_error=is_error,
+            num_turns=1,
+            session_id=self.session_id,
+            total_cost_usd=(
+                (output_tokens * script.cost_per_output_token + input_tokens * script.cost_per_input_token)
+                * script.model_cost.get(self.model, 1.0)
+            ),
+            usage={"input_tokens": input_tokens, "output_tokens": output_tokens},
+        )
+
+
+# Set by install_fake_sdk for child processes (agent shards)
+_SCRIPT_ENV = "FAKE_SDK_SCRIPT"
+if os.environ.get(_SCRIPT_ENV):
+    FakeClaudeSDKClient.script = FakeScript(**json.loads(os.environ[_SCRIPT_ENV]))
+
+
+@contextmanager
+def install_fake_sdk(script: Optional[FakeScript] = None) -> Iterator[type]:
+    """Make the driver and client pool create FakeClaudeSDKClient instances."""
+    from src.modules.agent import sdk
+
+    previous = (sdk.client_class, FakeClaudeSDKClient.script)
+    previous_env = {key: os.environ.get(key) for key in ("AGENT_SDK_CLIENT_CLASS", _SCRIPT_ENV)}
+    if script is not None:
+        FakeClaudeSDKClient.script = script
+    sdk.client_class = FakeClaudeSDKClient
+    os.environ["AGENT_SDK_CLIENT_CLASS"] = f"{__name__}:FakeClaudeSDKClient"
+    os.environ[_SCRIPT_ENV] = json.dumps(asdict(FakeClaudeSDKClient.script))
+    try:
+        yield FakeClaudeSDKClient
+    finally:
+        sdk.client_class, FakeClaudeSDKClient.script = previous
+        for key, value in previous_env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
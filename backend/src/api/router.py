@@ -3,6 +3,9 @@ API Router - aggregates all API routes
 """
 from fastapi import APIRouter
 
+from src.modules.chat.router import router as chat_router
+from src.modules.jobs.router import router as jobs_router
+
 api_router = APIRouter()
 
 
@@ -14,9 +17,11 @@ async def ping():
 
 
 # Chat routes (Agent interaction)
-from src.modules.chat.router import router as chat_router
 api_router.include_router(chat_router, tags=["chat"])
 
+# Background jobs
+api_router.include_router(jobs_router, tags=["jobs"])
+
 
 # Example: Include other module routers
 # from src.modules.user.api import router as user_router
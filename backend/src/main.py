@@ -2,11 +2,18 @@
 FastAPI Application Entry Point
 """
 from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 
-from src.config.settings import settings
 from src.api.router import api_router
+from src.config.settings import settings
+from src.modules.agent import agent_service, claude_sdk_driver
+from src.modules.chat.replay import replay_store
+from src.modules.core.metrics import CONTENT_TYPE, registry
+from src.modules.history import history_service
+from src.modules.jobs import job_service
 
 
 @asynccontextmanager
@@ -14,9 +21,20 @@ async def lifespan(app: FastAPI):
     """Application lifespan handler."""
     # Startup
     print(f"Starting {settings.app_name}...")
+    await history_service.start()
+    await agent_service.start()
+    await job_service.start()
     yield
     # Shutdown
     print("Shutting down...")
+    await job_service.close()
+    await agent_service.compactor.close()
+    await replay_store.shutdown()
+    await agent_service.shards.shutdown()
+    await claude_sdk_driver.shutdown()
+    await agent_service.store.close()
+    await agent_service.budgets.close()
+    await history_service.close()
 
 
 def create_app() -> FastAPI:
@@ -53,3 +71,11 @@ app = create_app()
 async def health_check():
     """Health check endpoint."""
     return {"status": "healthy", "version": "0.1.0"}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics() -> PlainTextResponse:
+    """Prometheus text-format metrics."""
+    # Driver metrics of shard processes are merged in with a shard label
+    extra = await agent_service.shards.metric_samples()
+    return PlainTextResponse(registry.render(extra), media_type=CONTENT_TYPE)
@@ -0,0 +1,203 @@
+"""
+Batch Execution
+
+Runs many independent prompts, each in its own fresh session, with a
+bounded number in flight. Results are yielded as items complete (not in
+input order), followed by a summary with aggregate usage and cost.
+Items served from the response cache cost nothing: they report the
+original run's cost as cached_cost_usd and stay out of the summary's
+usage and total_cost_usd.
+Sessions and their workspaces are removed after each item unless asked
+to keep them.
+"""
+
+import asyncio
+import time
+import uuid
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, AsyncIterator, Optional
+
+from ...config.settings import settings
+
+if TYPE_CHECKING:
+    from .service import AgentService
+
+
+@dataclass
+class BatchConfig:
+    """Limits for batch requests."""
+    max_items: int = settings.batch_max_items
+    max_parallelism: int = settings.batch_max_parallelism
+
+
+@dataclass
+class BatchItem:
+    """One prompt of a batch."""
+    message: str
+    id: Optional[str] = None  # caller's reference, echoed in the result
+    persona: Optional[str] = None
+    template: Optional[str] = None
+    cache: bool = True
+    model: Optional[str] = None  # routing hint
+
+
+def _add_usage(total: dict[str, Any], usage: Any) -> None:
+    if not isinstance(usage, dict):
+        return
+    for key, value in usage.items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            total[key] = total.get(key, 0) + value
+
+
+class BatchRunner:
+    """Executes batches through the agent service."""
+
+    def __init__(self, service: "AgentService", config: Optional[BatchConfig] = None):
+        self.service = service
+        self.config = config or BatchConfig()
+
+    def validate(self, items: list[BatchItem], parallelism: int) -> int:
+        """
+        Check batch limits.
+
+        Returns:
+            The parallelism to use (capped at max_parallelism)
+
+        Raises:
+            ValueError: If the batch is empty or too large
+        """
+        if not items:
+            raise ValueError("Batch has no items")
+        if len(items) > self.config.max_items:
+            raise ValueError(f"Batch has {len(items)} items; the limit is {self.config.max_items}")
+        return max(1, min(parallelism, self.config.max_parallelism, len(items)))
+
+    async def run(
+        self,
+        items: list[BatchItem],
+        parallelism: int,
+        keep_sessions: bool = False,
+        api_key: Optional[str] = None,
+    ) -> AsyncIterator[dict[str, Any]]:
+        """
+        Run a batch.
+
+        Items are charged to api_key's usage budget (if given); an item
+        rejected for an exhausted budget fails like any other.
+
+        Yields:
+            {"type": "result", ...} per item as it completes, then
+            {"type": "summary", ...}
+        """
+        parallelism = self.validate(items, parallelism)
+        started = time.monotonic()
+        results: asyncio.Queue[dict[str, Any]] = asyncio.Queue()
+        pending = iter(range(len(items)))
+
+        async def worker() -> None:
+            # Workers share the index iterator; each takes the next item when free
+            for index in pending:
+                await results.put(await self._run_item(index, items[index], keep_sessions, api_key))
+
+        workers = [asyncio.create_task(worker()) for _ in range(parallelism)]
+        usage: dict[str, Any] = {}
+        cost = 0.0
+        cached = 0
+        cached_cost = 0.0
+        failed = 0
+        try:
+            for _ in range(len(items)):
+                result = await results.get()
+                if result.get("cache") == "HIT":
+                    cached += 1
+                    cached_cost += result.get("cached_cost_usd") or 0.0
+                else:
+                    _add_usage(usage, result.get("usage"))
+                    cost += result.get("total_cost_usd") or 0.0
+                failed += result["status"] != "ok"
+                yield result
+            yield {
+                "type": "summary",
+                "items": len(items),
+                "succeeded": len(items) - failed,
+                "failed": failed,
+                "parallelism": parallelism,
+                "usage": usage,
+                "total_cost_usd": round(cost, 6),
+                "cached": cached,
+                "cached_cost_usd": round(cached_cost, 6),
+                "duration_ms": round((time.monotonic() - started) * 1000, 1),
+            }
+        finally:
+            # Client went away (or we are done): stop scheduling items
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    async def _run_item(
+        self,
+        index: int,
+        item: BatchItem,
+        keep_sessions: bool,
+        api_key: Optional[str] = None,
+    ) -> dict[str, Any]:
+        service = self.service
+        session_id = str(uuid.uuid4())
+        started = time.monotonic()
+        result = {"type": "result", "index": index, "id": item.id, "session_id": session_id}
+        chunks: list[str] = []
+        first_token_ms = None
+        error = None
+        try:
+            await service.start_session(session_id, persona=item.persona)
+            if item.template:
+                await service.provision_template(session_id, item.template)
+            status, cached = "BYPASS", None
+            if item.cache:
+                status, cached = await service.lookup_cached_response(
+                    item.message, session_id, item.model
+                )
+            if cached is not None:
+                events = service.replay_cached(item.message, session_id, cached)
+            else:
+                events = service.chat(
+                    item.message, session_id,
+                    continue_conversation=False, use_cache=status == "MISS",
+                    api_key=api_key, model=item.model,
+                )
+            result["cache"] = status
+            async for event in events:
+                if event["type"] == "text":
+                    if first_token_ms is None:
+                        first_token_ms = round((time.monotonic() - started) * 1000, 1)
+                    chunks.append(event["content"])
+                elif event["type"] == "error":
+                    error = event["message"]
+                elif event["type"] == "done":
+                    result["usage"] = event.get("usage")
+                    result["total_cost_usd"] = event.get("total_cost_usd")
+                    result["model"] = event.get("model")
+                    if cached is not None:
+                        # Replayed: the usage was spent by the original run
+                        result["cached_cost_usd"] = result["total_cost_usd"]
+                        result["total_cost_usd"] = 0.0
+                    if event.get("is_error") and error is None:
+                        error = "Agent run ended with an error"
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        finally:
+            if not keep_sessions:
+                try:
+                    await service.end_session(session_id)
+                except Exception:
+                    pass
+
+        result["status"] = "error" if error else "ok"
+        result["response"] = "".join(chunks)
+        if error:
+            result["error"] = error
+        result["timings"] = {
+            "first_token_ms": first_token_ms,
+            "duration_ms": round((time.monotonic() - started) * 1000, 1),
+        }
+        return result
@@ -0,0 +1,353 @@
+"""
+Usage Budgets
+
+Token and cost budgets per session and per API key over a sliding window,
+so one heavy user cannot take all agent capacity. Runs are checked before
+they are queued and charged with the usage and cost of their result
+(the done event). A budget is therefore a soft limit: runs admitted while
+under it finish even if they take the subject past it.
+
+Tokens are input + output + cache creation tokens; cache reads are cheap
+and only count through the cost budget.
+
+Accounting is in memory, in buckets of window/60 seconds per subject, so
+memory stays bounded and a charge leaves the window at most one bucket
+early. With BUDGET_DATABASE_PATH set, charges are also written to SQLite
+and reloaded on start, so a restart does not reset the window. Each
+process enforces budgets on its own charges plus those loaded at start.
+"""
+
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from ...config.settings import settings
+from ..core.metrics import registry
+from .exceptions import BudgetExceededError
+
+REJECTED = registry.counter(
+    "agent_budget_rejections_total",
+    "Runs rejected for an exhausted usage budget, by subject (session, key)",
+    labelnames=("subject",),
+)
+
+# Usage keys counted against token budgets
+_TOKEN_KEYS = ("input_tokens", "output_tokens", "cache_creation_input_tokens")
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS budget_charges ("
+    " at REAL NOT NULL, kind TEXT NOT NULL, subject TEXT NOT NULL,"
+    " tokens INTEGER NOT NULL, cost REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS budget_charges_at ON budget_charges (at)",
+)
+
+_LABELS = {"session": "session", "key": "API key"}
+
+
+@dataclass
+class BudgetConfig:
+    """Configuration for usage budgets (0 = no limit for that dimension)."""
+    enabled: bool = settings.budget_enabled
+    window_seconds: int = settings.budget_window_seconds
+    session_tokens: int = settings.budget_session_tokens
+    session_cost_usd: float = settings.budget_session_cost_usd
+    key_tokens: int = settings.budget_key_tokens
+    key_cost_usd: float = settings.budget_key_cost_usd
+    # SQLite file for charges; empty keeps them in memory only
+    database_path: str = settings.budget_database_path
+    # Buckets per window (accounting granularity)
+    buckets: int = 60
+
+
+def usage_tokens(usage: Any) -> int:
+    """Tokens of a result's usage that count against token budgets."""
+    if not isinstance(usage, dict):
+        return 0
+    total = 0
+    for key in _TOKEN_KEYS:
+        value = usage.get(key)
+        if isinstance(value, (int, float)):
+            total += int(value)
+    return total
+
+
+def key_id(api_key: Optional[str]) -> Optional[str]:
+    """Stable id for an API key; the key itself is never stored."""
+    if not api_key:
+        return None
+    return hashlib.sha256(api_key.encode()).hexdigest()[:16]
+
+
+class _Window:
+    """Charges of one subject as [bucket start, tokens, cost], oldest first."""
+
+    __slots__ = ("buckets", "tokens", "cost")
+
+    def __init__(self) -> None:
+        self.buckets: deque[list[Any]] = deque()
+        self.tokens = 0
+        self.cost = 0.0
+
+    def add(self, start: float, tokens: int, cost: float) -> None:
+        # Buckets stay in order; a late charge goes into the newest bucket
+        if self.buckets and self.buckets[-1][0] >= start:
+            bucket = self.buckets[-1]
+            bucket[1] += tokens
+            bucket[2] += cost
+        else:
+            self.buckets.append([start, tokens, cost])
+        self.tokens += tokens
+        self.cost += cost
+
+    def expire(self, cutoff: float) -> None:
+        """Drop buckets that started before cutoff."""
+        while self.buckets and self.buckets[0][0] < cutoff:
+            _, tokens, cost = self.buckets.popleft()
+            self.tokens -= tokens
+            self.cost -= cost
+        if not self.buckets:
+            self.tokens, self.cost = 0, 0.0
+
+    def reset_at(self, token_limit: int, cost_limit: float, window: float) -> float:
+        """Time at which usage is back under both limits (0 if it is now)."""
+        tokens, cost = self.tokens, self.cost
+        at = 0.0
+        for start, bucket_tokens, bucket_cost in self.buckets:
+            if (not token_limit or tokens < token_limit) and (not cost_limit or cost < cost_limit):
+                break
+            tokens -= bucket_tokens
+            cost -= bucket_cost
+            at = start + window
+        return at
+
+
+class BudgetTracker:
+    """Sliding-window token and cost accounting per session and API key."""
+
+    def __init__(self, config: Optional[BudgetConfig] = None):
+        self.config = config or BudgetConfig()
+        self._windows: dict[tuple[str, str], _Window] = {}
+        self._last_sweep = 0.0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @property
+    def enabled(self) -> bool:
+        config = self.config
+        return config.enabled and any((
+            config.session_tokens, config.session_cost_usd,
+            config.key_tokens, config.key_cost_usd,
+        ))
+
+    @property
+    def _width(self) -> float:
+        return max(1.0, self.config.window_seconds / max(1, self.config.buckets))
+
+    def _limits(self, kind: str) -> tuple[int, float]:
+        if kind == "session":
+            return self.config.session_tokens, self.config.session_cost_usd
+        return self.config.key_tokens, self.config.key_cost_usd
+
+    def _subjects(
+        self,
+        session_id: Optional[str],
+        api_key: Optional[str],
+        api_key_id: Optional[str] = None,
+    ) -> list[tuple[str, str]]:
+        subjects = []
+        if session_id is not None and any(self._limits("session")):
+            subjects.append(("session", session_id))
+        key = api_key_id or key_id(api_key)
+        if key is not None and any(self._limits("key")):
+            subjects.append(("key", key))
+        return subjects
+
+    def _window(self, subject: tuple[str, str], now: float) -> Optional[_Window]:
+        window = self._windows.get(subject)
+        if window is not None:
+            window.expire(now - self.config.window_seconds)
+        return window
+
+    def _remaining(self, subject: tuple[str, str], now: float) -> dict[str, Any]:
+        token_limit, cost_limit = self._limits(subject[0])
+        window = self._window(subject, now)
+        tokens = window.tokens if window is not None else 0
+        cost = window.cost if window is not None else 0.0
+        reset = 0.0
+        if window is not None:
+            reset = window.reset_at(token_limit, cost_limit, self.config.window_seconds)
+        return {
+            "tokens": max(0, token_limit - tokens) if token_limit else None,
+            "cost_usd": max(0.0, cost_limit - cost) if cost_limit else None,
+            "reset": max(0.0, reset - now),
+        }
+
+    def check(
+        self,
+        session_id: Optional[str],
+        api_key: Optional[str] = None,
+        api_key_id: Optional[str] = None,
+    ) -> None:
+        """
+        Reject a run whose session or API key has used up its budget.
+
+        Args:
+            session_id: Session of the run, or None to check only the key
+            api_key: Caller's API key, if any
+            api_key_id: key_id() of the caller's key, where only that was
+                kept (background jobs); used instead of api_key
+
+        Raises:
+            BudgetExceededError: If a budget is exhausted
+        """
+        if not self.enabled:
+            return
+        now = time.time()
+        for subject in self._subjects(session_id, api_key, api_key_id):
+            remaining = self._remaining(subject, now)
+            if remaining["tokens"] == 0 or remaining["cost_usd"] == 0:
+                REJECTED.inc(subject[0])
+                dimension = "Token" if remaining["tokens"] == 0 else "Cost"
+                raise BudgetExceededError(
+                    f"{dimension} budget exhausted for this {_LABELS[subject[0]]}",
+                    retry_after=max(1, int(remaining["reset"] + 0.999)),
+                    remaining=remaining,
+                )
+
+    def remaining(self, session_id: str, api_key: Optional[str] = None) -> Optional[dict[str, Any]]:
+        """
+        Tightest remaining budget over the session and the API key.
+
+        Returns:
+            {"tokens": n | None, "cost_usd": x | None, "reset": seconds}
+            (None for a dimension without a limit), or None if budgets
+            are disabled
+        """
+        if not self.enabled:
+            return None
+        now = time.time()
+        tightest = {"tokens": None, "cost_usd": None, "reset": 0.0}
+        for subject in self._subjects(session_id, api_key):
+            remaining = self._remaining(subject, now)
+            for dimension in ("tokens", "cost_usd"):
+                value = remaining[dimension]
+                if value is not None and (tightest[dimension] is None or value < tightest[dimension]):
+                    tightest[dimension] = value
+            tightest["reset"] = max(tightest["reset"], remaining["reset"])
+        return tightest
+
+    def _add(self, subject: tuple[str, str], at: float, tokens: int, cost: float) -> None:
+        window = self._windows.get(subject)
+        if window is None:
+            window = self._windows[subject] = _Window()
+        window.add(at - at % self._width, tokens, cost)
+
+    async def charge(
+        self,
+        session_id: str,
+        api_key: Optional[str],
+        usage: Any,
+        total_cost_usd: Optional[float],
+        api_key_id: Optional[str] = None,
+    ) -> None:
+        """Charge a finished run's usage and cost to its session and API key."""
+        if not self.enabled:
+            return
+        tokens = usage_tokens(usage)
+        cost = float(total_cost_usd or 0.0)
+        if not tokens and not cost:
+            return
+        now = time.time()
+        subjects = self._subjects(session_id, api_key, api_key_id)
+        for subject in subjects:
+            self._add(subject, now, tokens, cost)
+        self._sweep(now)
+        if self.config.database_path and subjects:
+            rows = [(now, kind, subject, tokens, cost) for kind, subject in subjects]
+            await asyncio.to_thread(self._insert, rows)
+
+    def _sweep(self, now: float) -> None:
+        """Forget subjects whose charges have all left the window."""
+        if now - self._last_sweep < self._width:
+            return
+        self._last_sweep = now
+        cutoff = now - self.config.window_seconds
+        for subject in list(self._windows):
+            window = self._windows[subject]
+            window.expire(cutoff)
+            if not window.buckets:
+                del self._windows[subject]
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(
+                self.config.database_path, timeout=5.0,
+                isolation_level=None, check_same_thread=False,
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            self._conn = conn
+        return self._conn
+
+    def _insert(self, rows: list[tuple[Any, ...]]) -> None:
+        with self._lock:
+            self._db().executemany(
+                "INSERT INTO budget_charges (at, kind, subject, tokens, cost) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def _load(self, cutoff: float) -> list[tuple[Any, ...]]:
+        with self._lock:
+            conn = self._db()
+            conn.execute("DELETE FROM budget_charges WHERE at < ?", (cutoff,))
+            return conn.execute(
+                "SELECT at, kind, subject, tokens, cost FROM budget_charges WHERE at >= ? ORDER BY at",
+                (cutoff,),
+            ).fetchall()
+
+    async def start(self) -> None:
+        """Reload charges still inside the window (app lifespan)."""
+        if not (self.enabled and self.config.database_path):
+            return
+        cutoff = time.time() - self.config.window_seconds
+        for at, kind, subject, tokens, cost in await asyncio.to_thread(self._load, cutoff):
+            self._add((kind, subject), at, tokens, cost)
+
+    async def close(self) -> None:
+        if self._conn is not None:
+            with self._lock:
+                self._conn.close()
+                self._conn = None
+
+    def stats(self, top: int = 10) -> dict[str, Any]:
+        """Limits and the heaviest subjects in the current window."""
+        now = time.time()
+        usage = []
+        for (kind, subject), window in list(self._windows.items()):
+            window.expire(now - self.config.window_seconds)
+            if window.buckets:
+                usage.append({
+                    "kind": kind,
+                    "subject": subject,
+                    "tokens": window.tokens,
+                    "cost_usd": round(window.cost, 6),
+                })
+        usage.sort(key=lambda item: (item["tokens"], item["cost_usd"]), reverse=True)
+        config = self.config
+        return {
+            "enabled": self.enabled,
+            "window_seconds": config.window_seconds,
+            "limits": {
+                "session": {"tokens": config.session_tokens, "cost_usd": config.session_cost_usd},
+                "key": {"tokens": config.key_tokens, "cost_usd": config.key_cost_usd},
+            },
+            "persisted": bool(config.database_path),
+            "subjects": len(usage),
+            "top": usage[:top],
+        }
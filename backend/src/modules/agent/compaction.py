@@ -0,0 +1,207 @@
+"""
+Conversation Compaction
+
+A long session's context grows with every turn, and so do the latency and
+cost of each turn. Once a session's context passes
+AGENT_COMPACTION_THRESHOLD_TOKENS, it is compacted after the turn:
+
+1. A summary turn resumes the session ("summarize our conversation so
+   far") on a client of its own with no tools and a single model call,
+   so it cannot touch the workspace. It is queued like a turn of the
+   session so it never overlaps one.
+2. The summary is stored in the session record. The next turn starts a
+   fresh SDK session whose system prompt ends with the summary.
+
+Clients see nothing of this beyond a shorter first token time; a turn
+that arrives while the summary runs waits for it in the scheduler.
+
+Context size is estimated from the done event's usage: prompt tokens
+(input plus cache reads and writes) divided by the model calls of the
+turn.
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Optional
+
+from ...config.settings import settings
+from ..core.metrics import registry
+from .exceptions import AgentOverloadedError
+from .session_store import WORKER_ID
+
+if TYPE_CHECKING:
+    from .scheduler import RunTicket
+    from .service import AgentService
+
+COMPACTIONS = registry.counter(
+    "agent_compactions_total",
+    "Session compactions by outcome (ok, error, skipped)",
+    labelnames=("outcome",),
+)
+COMPACTION_SECONDS = registry.histogram(
+    "agent_compaction_seconds",
+    "Duration of compaction summary turns",
+)
+
+SUMMARY_PROMPT = (
+    "Summarize our conversation so far so that it can be continued from the "
+    "summary alone. Keep the user's goals, the decisions made, facts and "
+    "constraints that were established, the files and commands involved, and "
+    "open questions or next steps. Be concise and do not use any tools. "
+    "Reply with the summary only."
+)
+
+_PROMPT_KEYS = ("input_tokens", "cache_read_input_tokens", "cache_creation_input_tokens")
+
+
+@dataclass
+class CompactionConfig:
+    """Configuration for conversation compaction."""
+    # Context tokens that trigger compaction; 0 disables it
+    threshold_tokens: int = settings.agent_compaction_threshold_tokens
+    # Model for the summary turn; empty = the driver's default model
+    model: str = settings.agent_compaction_model
+    max_summary_chars: int = settings.agent_compaction_max_summary_chars
+
+
+def context_tokens(usage: Any, num_turns: Optional[int] = None) -> int:
+    """Estimated context size of a turn: prompt tokens per model call."""
+    if not isinstance(usage, dict):
+        return 0
+    prompt = sum(
+        int(value) for key in _PROMPT_KEYS
+        if isinstance(value := usage.get(key), (int, float))
+    )
+    return prompt // max(1, num_turns or 1)
+
+
+def seed_prompt(system_prompt: Optional[str], summary: Optional[str]) -> Optional[str]:
+    """The system prompt for a compacted session (unchanged without a summary)."""
+    if not summary:
+        return system_prompt
+    return f"{system_prompt or ''}\n\n## Earlier conversation (summary)\n\n{summary}".lstrip()
+
+
+class Compactor:
+    """Summarizes and restarts sessions whose context got too large."""
+
+    def __init__(self, service: "AgentService", config: Optional[CompactionConfig] = None):
+        self.service = service
+        self.config = config or CompactionConfig()
+        self._tasks: dict[str, asyncio.Task[None]] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.config.threshold_tokens > 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._tasks)
+
+    def should_compact(self, session: dict[str, Any]) -> bool:
+        return self.enabled and session.get("context_tokens", 0) >= self.config.threshold_tokens
+
+    def schedule(self, session_id: str) -> None:
+        """
+        Queue a compaction behind the session's current turn.
+
+        The scheduler ticket is taken now, so a turn that arrives later
+        runs after the summary, on the compacted session.
+        """
+        if session_id in self._tasks:
+            return
+        try:
+            ticket = self.service.scheduler.enqueue(session_id)
+        except AgentOverloadedError:
+            COMPACTIONS.inc("skipped")
+            return
+        task = asyncio.create_task(self._compact(session_id, ticket))
+        self._tasks[session_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(session_id, None))
+
+    async def _compact(self, session_id: str, ticket: "RunTicket") -> None:
+        service = self.service
+        try:
+            async for _ in ticket.wait():
+                pass
+            await service._acquire_lease(session_id)
+            try:
+                await self.compact(session_id)
+            finally:
+                await service.store.release(session_id, WORKER_ID)
+        except AgentOverloadedError:
+            # Busy; the next turn past the threshold tries again
+            COMPACTIONS.inc("skipped")
+        except Exception:
+            COMPACTIONS.inc("error")
+        finally:
+            ticket.release()
+
+    async def compact(self, session_id: str) -> bool:
+        """
+        Summarize the session and reset it to start over from the summary.
+
+        The caller must hold the session's turn (scheduler ticket and lease).
+
+        Returns:
+            True if the session was compacted
+        """
+        service = self.service
+        session = await service.store.get(session_id)
+        if session is None or not self.should_compact(session):
+            return False
+        system_prompt = seed_prompt(
+            await service.prompts.get(session["persona"]), session.get("summary")
+        )
+        started = time.monotonic()
+        chunks: list[str] = []
+        failed = False
+        async for event in service._runner.execute(
+            message=SUMMARY_PROMPT,
+            session_id=session_id,
+            system_prompt=system_prompt,
+            continue_conversation=True,
+            model=self.config.model or None,
+            resume=session.get("sdk_session_id"),
+            tools=[],
+            max_turns=1,
+        ):
+            if event["type"] == "text":
+                chunks.append(event["content"])
+            elif event["type"] == "error":
+                failed = True
+            elif event["type"] == "done":
+                failed = failed or bool(event.get("is_error"))
+                await service.budgets.charge(
+                    session_id, None, event.get("usage"), event.get("total_cost_usd")
+                )
+        COMPACTION_SECONDS.observe(time.monotonic() - started)
+        summary = "".join(chunks).strip()[:self.config.max_summary_chars]
+        if failed or not summary:
+            COMPACTIONS.inc("error")
+            return False
+
+        # The session may have been deleted meanwhile
+        session = await service.store.get(session_id)
+        if session is None:
+            return False
+        session.update(
+            summary=summary,
+            sdk_session_id=None,
+            context_tokens=0,
+            compactions=session.get("compactions", 0) + 1,
+            # The next turn starts a fresh SDK session seeded with the summary
+            restart=True,
+        )
+        await service.store.put(session_id, session)
+        await service._runner.hibernate(session_id)
+        COMPACTIONS.inc("ok")
+        return True
+
+    async def close(self) -> None:
+        """Cancel pending compactions (shutdown); the sessions stay as they were."""
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -9,21 +9,25 @@ This allows leveraging Claude's agentic capabilities:
 - Multi-turn conversations
 """
 
-from typing import AsyncIterator, Optional
-from pathlib import Path
+import asyncio
+import time
+from collections import OrderedDict
 from dataclasses import dataclass
+from pathlib import Path
+from types import ModuleType
+from typing import TYPE_CHECKING, Any, AsyncIterator, Optional
 
-from claude_agent_sdk import (
-    ClaudeSDKClient,
-    ClaudeAgentOptions,
-    AssistantMessage,
-    ResultMessage,
-    TextBlock,
-    ToolUseBlock,
-    ToolResultBlock,
-)
+from ...config.settings import settings
+from ..core.metrics import registry
+from . import metrics, sdk
+from .pool import ClientPool, PoolKey
+from .templates import ProvisionResult, TemplateManager
+from .tool_outputs import ToolOutputStore
+from .tracing import RunTrace, Tracer
+from .workspace import POOL_DIR, WorkspaceManager
 
-from ..config.settings import settings
+if TYPE_CHECKING:
+    from claude_agent_sdk import ClaudeAgentOptions, ClaudeSDKClient
 
 
 @dataclass
@@ -31,104 +35,304 @@ class ClaudeSDKConfig:
     """Configuration for Claude SDK."""
     model: str = settings.claude_model
     max_turns: int = settings.agent_max_turns
-    timeout: int = settings.agent_timeout
+    timeout: int = settings.agent_timeout  # hard deadline per run
+    idle_timeout: int = settings.agent_idle_timeout  # max gap between SDK messages
+    interrupt_grace: float = settings.agent_interrupt_grace
     workspace: Optional[Path] = None
     system_prompt_file: Optional[Path] = None
     permission_mode: str = settings.agent_permission_mode
+    # Live client limits; idle sessions beyond these are hibernated
+    max_live_clients: int = settings.agent_max_live_clients
+    idle_hibernate_seconds: int = settings.agent_idle_hibernate_seconds
 
 
 class ClaudeSDKDriver:
     """
     Driver for Claude Agent SDK.
-    
+
     Executes queries and streams output back.
     Each session runs in an isolated workspace.
+
+    Idle sessions are hibernated: their client is disconnected but the SDK
+    session id is kept, so the next message resumes the conversation.
+
+    Construction does no I/O and does not import the SDK; start() (called
+    from the app lifespan) creates the workspace root and preloads the SDK.
     """
-    
+
     def __init__(self, config: Optional[ClaudeSDKConfig] = None):
         self.config = config or ClaudeSDKConfig()
         # Use resolve() to convert relative path to absolute path
         self.base_workspace = Path(settings.AGENT_WORKSPACE_DIR).resolve()
-        self.base_workspace.mkdir(parents=True, exist_ok=True)
-        # Store active clients for session continuity
-        self._clients: dict[str, ClaudeSDKClient] = {}
-    
-    def _get_session_workspace(self, session_id: str) -> Path:
-        """Get or create workspace directory for a session."""
-        workspace = self.base_workspace / session_id
-        workspace.mkdir(parents=True, exist_ok=True)
-        return workspace
-    
+        # Store active clients for session continuity (LRU order)
+        self._clients: OrderedDict[str, ClaudeSDKClient] = OrderedDict()
+        # Model each live client currently uses (turns may be routed elsewhere)
+        self._client_models: dict[str, str] = {}
+        # SDK session ids of live and hibernated sessions, for resume
+        self._sdk_session_ids: dict[str, str] = {}
+        self._last_used: dict[str, float] = {}
+        self._busy: set[str] = set()
+        self._reaper_task: Optional[asyncio.Task[None]] = None
+        self._sdk_preload: Optional[asyncio.Task[ModuleType]] = None
+        # Pre-connected clients for new sessions
+        self.pool = ClientPool(
+            staging_dir=self.base_workspace / POOL_DIR,
+            options_factory=self._build_pool_options,
+        )
+        # Workspace creation/removal off the event loop, plus TTL sweeping
+        self.workspaces = WorkspaceManager(
+            self.base_workspace,
+            is_active=self._workspace_in_use,
+            staged=self.pool.staged,
+            on_removed=self._forget_session,
+        )
+        self.templates = TemplateManager()
+        # Large tool outputs are spilled to the workspace and sent by reference
+        self.tool_outputs = ToolOutputStore(self.workspaces)
+        # Span timings per run (connect, query, first token, tools, result)
+        self.tracer = Tracer()
+
+        registry.gauge(
+            "agent_live_clients", "Connected SDK clients",
+            callback=lambda: len(self._clients),
+        )
+        registry.gauge(
+            "agent_busy_sessions", "Sessions with a run in progress",
+            callback=lambda: len(self._busy),
+        )
+        registry.gauge(
+            "agent_pool_idle_clients", "Pre-connected clients waiting in the pool",
+            callback=self.pool.idle_count,
+        )
+
+    async def start(self, preload_sdk: bool = True) -> None:
+        """Create the workspace root and start loading the SDK in the background."""
+        await asyncio.to_thread(self.base_workspace.mkdir, parents=True, exist_ok=True)
+        if preload_sdk and not sdk.is_loaded() and self._sdk_preload is None:
+            self._sdk_preload = asyncio.create_task(sdk.aload())
+
+    def _workspace_in_use(self, session_id: str) -> bool:
+        """Whether a workspace must survive the TTL sweep."""
+        if session_id in self._clients or session_id in self._busy:
+            return True
+        last_used = self._last_used.get(session_id)
+        ttl = self.workspaces.config.ttl_seconds
+        return last_used is not None and time.monotonic() - last_used < ttl
+
+    def _forget_session(self, session_id: str) -> None:
+        """Drop resume state for a session whose workspace was swept."""
+        self._sdk_session_ids.pop(session_id, None)
+        self._last_used.pop(session_id, None)
+
     def _build_options(
         self,
-        session_id: str,
+        workspace: Path,
         system_prompt: Optional[str] = None,
         allowed_tools: Optional[list[str]] = None,
-    ) -> ClaudeAgentOptions:
-        """Build ClaudeAgentOptions for the query."""
-        workspace = self._get_session_workspace(session_id)
-        
-        return ClaudeAgentOptions(
+        model: Optional[str] = None,
+        resume: Optional[str] = None,
+        tools: Optional[list[str]] = None,
+        max_turns: Optional[int] = None,
+    ) -> "ClaudeAgentOptions":
+        """Build ClaudeAgentOptions for the query (workspace: real path)."""
+        return sdk.load().ClaudeAgentOptions(
             system_prompt=system_prompt,
+            tools=tools,
             allowed_tools=allowed_tools or [],
             permission_mode=self.config.permission_mode,
+            max_turns=max_turns or self.config.max_turns,
+            model=model or self.config.model,
+            cwd=str(workspace),
+            resume=resume,
+        )
+
+    def _build_pool_options(self, key: PoolKey, workspace: Path) -> "ClaudeAgentOptions":
+        """Build ClaudeAgentOptions for a pooled client in its staging directory."""
+        return sdk.load().ClaudeAgentOptions(
+            system_prompt=key.system_prompt,
+            allowed_tools=list(key.allowed_tools),
+            permission_mode=self.config.permission_mode,
             max_turns=self.config.max_turns,
-            model=self.config.model,
+            model=key.model,
             cwd=str(workspace),
         )
-    
-    def _map_message(self, message) -> list[dict]:
-        """Map SDK message to our event format."""
-        events = []
-        
-        if isinstance(message, AssistantMessage):
-            for block in message.content:
-                if isinstance(block, TextBlock):
-                    events.append({
-                        "type": "text",
-                        "content": block.text
-                    })
-                elif isinstance(block, ToolUseBlock):
+
+    def pool_key(
+        self,
+        system_prompt: Optional[str] = None,
+        allowed_tools: Optional[list[str]] = None,
+        model: Optional[str] = None,
+    ) -> PoolKey:
+        """Pool bucket key for the given connect-time options."""
+        return PoolKey(
+            model=model or self.config.model,
+            system_prompt=system_prompt,
+            allowed_tools=tuple(allowed_tools or ()),
+        )
+
+    async def _connect_client(
+        self,
+        session_id: str,
+        system_prompt: Optional[str] = None,
+        allowed_tools: Optional[list[str]] = None,
+        model: Optional[str] = None,
+        resume: Optional[str] = None,
+        tools: Optional[list[str]] = None,
+        max_turns: Optional[int] = None,
+    ) -> "ClaudeSDKClient":
+        """
+        Get a connected client for a session.
+
+        New sessions are served from the pool if possible; resumed
+        sessions, and runs with their own tools or max_turns, always
+        connect themselves.
+        """
+        await sdk.aload()
+        if resume is None and tools is None and max_turns is None:
+            key = self.pool_key(system_prompt, allowed_tools, model)
+            client = await self.pool.checkout(key, self.workspaces.path(session_id))
+            if client is not None:
+                self.workspaces.adopt(session_id)
+                return client
+
+        options = self._build_options(
+            workspace=await self.workspaces.resolve(session_id),
+            system_prompt=system_prompt,
+            allowed_tools=allowed_tools,
+            model=model,
+            resume=resume,
+            tools=tools,
+            max_turns=max_turns,
+        )
+        client = sdk.new_client(options)
+        await client.connect()
+        return client
+
+    async def _release_client(self, session_id: str) -> None:
+        """Disconnect and forget a session's live client, if any."""
+        client = self._clients.pop(session_id, None)
+        self._client_models.pop(session_id, None)
+        if client is not None:
+            try:
+                await client.disconnect()
+            except Exception:
+                pass
+
+    async def hibernate(self, session_id: str) -> bool:
+        """
+        Disconnect an idle session's client, keeping its SDK session id.
+
+        Returns:
+            True if a live client was hibernated
+        """
+        if session_id in self._busy or session_id not in self._clients:
+            return False
+        await self._release_client(session_id)
+        return True
+
+    async def _make_room(self) -> None:
+        """Hibernate least recently used idle clients until under the limit."""
+        while len(self._clients) >= self.config.max_live_clients:
+            victim = next((sid for sid in self._clients if sid not in self._busy), None)
+            if victim is None:
+                # Every live client is mid-run; allow a temporary overshoot
+                return
+            await self.hibernate(victim)
+
+    def _ensure_reaper(self) -> None:
+        """Start the idle hibernation task on first use."""
+        if self.config.idle_hibernate_seconds <= 0:
+            return
+        if self._reaper_task is None or self._reaper_task.done():
+            self._reaper_task = asyncio.create_task(self._reap_idle())
+
+    async def _reap_idle(self) -> None:
+        """Periodically hibernate clients idle for longer than the threshold."""
+        idle_seconds = self.config.idle_hibernate_seconds
+        interval = max(1.0, min(60.0, idle_seconds / 4))
+        while True:
+            await asyncio.sleep(interval)
+            cutoff = time.monotonic() - idle_seconds
+            for session_id in list(self._clients):
+                if self._last_used.get(session_id, 0.0) < cutoff:
+                    await self.hibernate(session_id)
+
+    def is_live(self, session_id: str) -> bool:
+        """Whether the session currently holds a connected client."""
+        return session_id in self._clients
+
+    @staticmethod
+    def _tool_output(content: Any) -> str:
+        """Flatten tool result content to text."""
+        if isinstance(content, list):
+            # Handle list of content blocks; join once instead of growing a string
+            return "".join(
+                item["text"] if isinstance(item, dict) else item
+                for item in content
+                if isinstance(item, str) or (isinstance(item, dict) and "text" in item)
+            )
+        if isinstance(content, str):
+            return content
+        return str(content) if content else ""
+
+    def _map_message(self, message: Any, trace: Optional[RunTrace] = None) -> list[dict[str, Any]]:
+        """
+        Map SDK message to our event format.
+
+        Tool results arrive in user messages (or inline in assistant
+        messages); with a trace they are paired with their tool_use by id
+        and carry the tool name and duration.
+        """
+        events: list[dict[str, Any]] = []
+        metrics.SDK_MESSAGES.inc(type(message).__name__)
+        types = sdk.load()
+
+        if isinstance(message, (types.AssistantMessage, types.UserMessage)):
+            blocks = message.content if isinstance(message.content, list) else []
+            for block in blocks:
+                if isinstance(block, types.TextBlock):
+                    if isinstance(message, types.AssistantMessage):
+                        events.append({
+                            "type": "text",
+                            "content": block.text
+                        })
+                elif isinstance(block, types.ToolUseBlock):
+                    if trace is not None:
+                        trace.tool_started(block.id, block.name)
                     events.append({
                         "type": "tool_use",
+                        "id": block.id,
                         "tool": block.name,
                         "input": block.input
                     })
-                elif isinstance(block, ToolResultBlock):
-                    # Extract content from tool result
-                    content = block.content
-                    if isinstance(content, list):
-                        # Handle list of content blocks
-                        output = ""
-                        for item in content:
-                            if isinstance(item, dict) and "text" in item:
-                                output += item["text"]
-                            elif isinstance(item, str):
-                                output += item
-                    elif isinstance(content, str):
-                        output = content
-                    else:
-                        output = str(content) if content else ""
-                    
-                    events.append({
+                elif isinstance(block, types.ToolResultBlock):
+                    is_error = block.is_error or False
+                    event: dict[str, Any] = {
                         "type": "tool_result",
                         "tool_use_id": block.tool_use_id,
-                        "output": output,
-                        "is_error": block.is_error or False
-                    })
-        
-        elif isinstance(message, ResultMessage):
+                        "output": self._tool_output(block.content),
+                        "is_error": is_error
+                    }
+                    span = trace.tool_finished(block.tool_use_id, is_error) if trace else None
+                    if span is not None:
+                        event["tool"] = span.attributes["tool"]
+                        event["duration_ms"] = span.duration_ms
+                    events.append(event)
+
+        elif isinstance(message, types.ResultMessage):
+            metrics.record_usage(message.usage, message.total_cost_usd)
             events.append({
                 "type": "done",
                 "session_id": message.session_id,
                 "duration_ms": message.duration_ms,
+                "num_turns": message.num_turns,
                 "is_error": message.is_error,
                 "usage": message.usage,
                 "total_cost_usd": message.total_cost_usd,
             })
-        
+
         return events
-    
+
     async def execute(
         self,
         message: str,
@@ -136,63 +340,188 @@ class ClaudeSDKDriver:
         system_prompt: Optional[str] = None,
         continue_conversation: bool = False,
         allowed_tools: Optional[list[str]] = None,
-    ) -> AsyncIterator[dict]:
+        model: Optional[str] = None,
+        resume: Optional[str] = None,
+        tools: Optional[list[str]] = None,
+        max_turns: Optional[int] = None,
+    ) -> AsyncIterator[dict[str, Any]]:
         """
         Execute a message through Claude SDK.
-        
+
         Args:
             message: User message
             session_id: Session identifier for workspace isolation
             system_prompt: Optional system prompt override
             continue_conversation: Whether to continue previous conversation
             allowed_tools: List of allowed tools (None = all)
-            
+            model: Model override (None = configured default)
+            resume: SDK session id to resume when this process has no live
+                client for the session (e.g. it last ran on another worker)
+            tools: Base tool set ([] = no tools, None = the CLI default)
+            max_turns: Model call limit (None = configured default)
+
+            Runs with tools or max_turns get a client of their own: the
+            session's live client is released before the run (options are
+            fixed per connection) and the run's client after it.
+
         Yields:
             Event dicts with structure:
             - {"type": "text", "content": "..."}
-            - {"type": "tool_use", "tool": "...", "input": {...}}
-            - {"type": "tool_result", "tool_use_id": "...", "output": "..."}
+            - {"type": "tool_use", "id": "...", "tool": "...", "input": {...}}
+            - {"type": "tool_result", "tool_use_id": "...", "tool": "...",
+               "duration_ms": ..., "output": "...", "output_ref": {...}}
+              (output_ref only when a large output was spilled to disk;
+              output is then a preview; truncated: true instead when the
+              session cannot hold spilled files)
             - {"type": "error", "message": "..."}
             - {"type": "done", "usage": {...}}
         """
+        self._ensure_reaper()
+        self.workspaces.ensure_janitor()
+        self._busy.add(session_id)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + self.config.timeout
+        client: Optional[ClaudeSDKClient] = None
+        completed = False
+        outcome = "cancelled"
+        event_count = 0
+        first_token = True
+        trace = self.tracer.start_run(session_id)
+        dedicated = tools is not None or max_turns is not None
         try:
-            options = self._build_options(
-                session_id=session_id,
-                system_prompt=system_prompt,
-                allowed_tools=allowed_tools,
-            )
-            
-            # Check if we should continue an existing session
-            if continue_conversation and session_id in self._clients:
-                client = self._clients[session_id]
-                await client.query(message)
-            else:
-                # Create new client for this session
-                client = ClaudeSDKClient(options=options)
-                await client.connect()
-                self._clients[session_id] = client
+            async with asyncio.timeout_at(deadline):
+                if dedicated:
+                    await self._release_client(session_id)
+                # Check if we should continue an existing session
+                if continue_conversation and session_id in self._clients:
+                    client = self._clients[session_id]
+                    self._clients.move_to_end(session_id)
+                    # Routed to another model: switch the live client in place
+                    wanted = model or self.config.model
+                    if self._client_models.get(session_id) != wanted:
+                        span = trace.start("set_model", model=wanted) if trace else None
+                        await client.set_model(wanted)
+                        if span is not None:
+                            span.end()
+                        self._client_models[session_id] = wanted
+                else:
+                    # Resume a hibernated session, or start a fresh one
+                    await self._release_client(session_id)
+                    if continue_conversation:
+                        resume = resume or self._sdk_session_ids.get(session_id)
+                    else:
+                        resume = None
+                        self._sdk_session_ids.pop(session_id, None)
+                    await self._make_room()
+                    span = trace.start("connect", resume=resume is not None) if trace else None
+                    client = await self._connect_client(
+                        session_id=session_id,
+                        system_prompt=system_prompt,
+                        allowed_tools=allowed_tools,
+                        model=model,
+                        resume=resume,
+                        tools=tools,
+                        max_turns=max_turns,
+                    )
+                    if span is not None:
+                        span.end()
+                    self._clients[session_id] = client
+                    self._client_models[session_id] = model or self.config.model
+                span = trace.start("query") if trace else None
                 await client.query(message)
-            
-            # Stream response
-            async for msg in client.receive_response():
-                events = self._map_message(msg)
+                if span is not None:
+                    span.end()
+
+            if trace is not None:
+                first_token_span = trace.start("first_token")
+                result_span = trace.start("result")
+
+            # Stream response; each message must arrive within the idle
+            # timeout and the whole turn within the run deadline
+            responses = client.receive_response().__aiter__()
+            result_type = sdk.load().ResultMessage
+            while True:
+                limit = min(deadline, loop.time() + self.config.idle_timeout)
+                try:
+                    async with asyncio.timeout_at(limit):
+                        msg = await responses.__anext__()
+                except StopAsyncIteration:
+                    break
+                if isinstance(msg, result_type):
+                    self._sdk_session_ids[session_id] = msg.session_id
+                    if trace is not None:
+                        result_span.end(
+                            is_error=msg.is_error,
+                            num_turns=msg.num_turns,
+                            sdk_duration_ms=msg.duration_ms,
+                            api_duration_ms=msg.duration_api_ms,
+                        )
+                events = self._map_message(msg, trace)
                 for event in events:
+                    if event["type"] == "tool_result" and self.tool_outputs.should_spill(event["output"]):
+                        event = await self.tool_outputs.spill(session_id, event)
+                    event_count += 1
+                    metrics.EVENTS.inc(event["type"])
+                    if first_token and event["type"] == "text":
+                        first_token = False
+                        metrics.TIME_TO_FIRST_TOKEN.observe(loop.time() - started)
+                        if trace is not None:
+                            first_token_span.end()
                     yield event
-            
+            completed = True
+            outcome = "completed"
+
+        except TimeoutError:
+            outcome = "timeout"
+            reason = "run deadline" if loop.time() >= deadline else "idle timeout"
+            yield {
+                "type": "error",
+                "code": "timeout",
+                "message": f"Agent run exceeded {reason}",
+            }
         except Exception as e:
+            outcome = "error"
             error_type = type(e).__name__
             yield {
                 "type": "error",
                 "message": f"{error_type}: {str(e)}"
             }
-            # Cleanup on error
-            if session_id in self._clients:
-                try:
-                    await self._clients[session_id].disconnect()
-                except Exception:
-                    pass
-                del self._clients[session_id]
-    
+            # Cleanup on error; the SDK session id is kept for resume
+            await self._release_client(session_id)
+            completed = True
+        finally:
+            # Timed out, cancelled or abandoned by the consumer mid-turn
+            if not completed and client is not None:
+                await self._abort_turn(session_id, client)
+            if dedicated:
+                await self._release_client(session_id)
+            self._busy.discard(session_id)
+            self._last_used[session_id] = time.monotonic()
+            metrics.RUNS.inc(outcome)
+            metrics.RUN_DURATION.observe(loop.time() - started)
+            metrics.EVENTS_PER_RUN.observe(event_count)
+            self.tracer.finish(trace, outcome)
+
+    async def _abort_turn(self, session_id: str, client: "ClaudeSDKClient") -> None:
+        """
+        Stop an in-flight turn.
+
+        The client is interrupted and kept if it settles within the
+        interrupt grace period; otherwise it is disconnected (the session
+        stays resumable through its SDK session id).
+        """
+        try:
+            async with asyncio.timeout(self.config.interrupt_grace):
+                await client.interrupt()
+                async for msg in client.receive_response():
+                    if isinstance(msg, sdk.load().ResultMessage):
+                        self._sdk_session_ids[session_id] = msg.session_id
+            return
+        except (Exception, asyncio.CancelledError):
+            pass
+        await self._release_client(session_id)
+
     async def execute_simple(
         self,
         message: str,
@@ -201,7 +530,7 @@ class ClaudeSDKDriver:
     ) -> str:
         """
         Execute and return full response as string.
-        
+
         Convenience method for non-streaming use cases.
         """
         chunks = []
@@ -214,24 +543,40 @@ class ClaudeSDKDriver:
                 chunks.append(event["content"])
             elif event["type"] == "error":
                 raise RuntimeError(event["message"])
-        
+
         return "".join(chunks)
-    
+
     async def cleanup_session(self, session_id: str) -> None:
         """Clean up a session's workspace and client."""
         # Disconnect client if exists
-        if session_id in self._clients:
-            try:
-                await self._clients[session_id].disconnect()
-            except Exception:
-                pass
-            del self._clients[session_id]
-        
-        # Remove workspace
-        import shutil
-        workspace = self.base_workspace / session_id
-        if workspace.exists():
-            shutil.rmtree(workspace)
+        await self._release_client(session_id)
+        self._sdk_session_ids.pop(session_id, None)
+        self._last_used.pop(session_id, None)
+
+        # Remove workspace in the background
+        await self.workspaces.remove(session_id)
+
+    async def provision_workspace(self, session_id: str, template: str) -> ProvisionResult:
+        """
+        Clone a workspace template into a session's workspace.
+
+        Raises:
+            TemplateNotFoundError: If the template does not exist
+        """
+        workspace = await self.workspaces.ensure(session_id)
+        return await self.templates.provision(template, workspace)
+
+    async def shutdown(self) -> None:
+        """Close the client pool and disconnect all session clients."""
+        if self._reaper_task is not None:
+            self._reaper_task.cancel()
+        if self._sdk_preload is not None:
+            await asyncio.gather(self._sdk_preload, return_exceptions=True)
+        await self.pool.close()
+        await self.workspaces.close()
+        for session_id in list(self._clients):
+            await self._release_client(session_id)
+        await self.tracer.close()
 
 
 # Default driver instance
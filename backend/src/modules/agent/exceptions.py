@@ -0,0 +1,37 @@
+"""
+Agent Module Exceptions
+"""
+
+from typing import Any, Optional
+
+
+class AgentOverloadedError(Exception):
+    """Raised when an agent run cannot be admitted right now."""
+
+    def __init__(self, message: str, retry_after: Optional[int] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class QueueFullError(AgentOverloadedError):
+    """The run queue is at capacity."""
+
+
+class QueueTimeoutError(AgentOverloadedError):
+    """A queued run waited longer than the allowed queue time."""
+
+
+class SessionBusyError(AgentOverloadedError):
+    """Another worker kept the session's run lease for too long."""
+
+
+class BudgetExceededError(AgentOverloadedError):
+    """The session or API key has used up its token or cost budget."""
+
+    def __init__(self, message: str, retry_after: Optional[int] = None, remaining: Optional[dict[str, Any]] = None):
+        super().__init__(message, retry_after=retry_after)
+        self.remaining = remaining
+
+
+class TemplateNotFoundError(Exception):
+    """The requested workspace template does not exist."""
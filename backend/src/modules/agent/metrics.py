@@ -0,0 +1,85 @@
+"""
+Agent Metrics
+
+Counters and histograms for agent runs, registered in the process-wide
+metrics registry. State gauges (live clients, queue depth) are
+registered by the components that own the state.
+"""
+
+from typing import Any, Optional
+
+from ..core.metrics import registry
+
+# Event counts per run are small integers
+EVENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000)
+
+TIME_TO_FIRST_TOKEN = registry.histogram(
+    "agent_time_to_first_token_seconds",
+    "Time from run start to the first text event",
+)
+RUN_DURATION = registry.histogram(
+    "agent_run_duration_seconds",
+    "Wall time of agent runs, including connect",
+)
+EVENTS_PER_RUN = registry.histogram(
+    "agent_events_per_run",
+    "Events emitted per agent run",
+    buckets=EVENT_BUCKETS,
+)
+QUEUE_WAIT = registry.histogram(
+    "agent_queue_wait_seconds",
+    "Time runs waited for a scheduler slot",
+)
+RUNS = registry.counter(
+    "agent_runs_total",
+    "Agent runs by outcome",
+    labelnames=("outcome",),
+)
+EVENTS = registry.counter(
+    "agent_events_total",
+    "Events emitted by agent runs, by type",
+    labelnames=("type",),
+)
+SDK_MESSAGES = registry.counter(
+    "agent_sdk_messages_total",
+    "Messages received from the Claude SDK, by class",
+    labelnames=("message",),
+)
+TOKENS = registry.counter(
+    "agent_tokens_total",
+    "Tokens reported in run results, by kind",
+    labelnames=("kind",),
+)
+COST = registry.counter(
+    "agent_cost_usd_total",
+    "Total cost reported in run results (USD)",
+)
+TOOL_CALLS = registry.counter(
+    "agent_tool_calls_total",
+    "Tool calls by tool and status (ok, error, incomplete)",
+    labelnames=("tool", "status"),
+)
+TOOL_SECONDS = registry.counter(
+    "agent_tool_seconds_total",
+    "Time from tool_use to its tool_result, by tool",
+    labelnames=("tool",),
+)
+
+# Usage keys reported by the SDK -> token kind label
+_USAGE_KINDS = {
+    "input_tokens": "input",
+    "output_tokens": "output",
+    "cache_read_input_tokens": "cache_read",
+    "cache_creation_input_tokens": "cache_creation",
+}
+
+
+def record_usage(usage: Any, total_cost_usd: Optional[float]) -> None:
+    """Add a run's usage and cost to the totals."""
+    if isinstance(usage, dict):
+        for key, kind in _USAGE_KINDS.items():
+            value = usage.get(key)
+            if isinstance(value, (int, float)) and value:
+                TOKENS.inc(kind, amount=value)
+    if total_cost_usd:
+        COST.inc(amount=total_cost_usd)
@@ -0,0 +1,275 @@
+"""
+Warm Client Pool
+
+Keeps pre-connected ClaudeSDKClient instances ready so the first message
+of a session does not pay for the CLI subprocess spawn and handshake.
+
+Clients are grouped into buckets by the options that are fixed at connect
+time (model, system prompt, allowed tools). Each pooled client runs in its
+own staging directory under .pool/. The CLI records its working directory
+at startup (transcript location for resume, edit permission scope), so
+the directory never moves: on checkout the session workspace path becomes
+a symlink to it, and later clients of the session connect in the resolved
+path. If the workspace already has content (e.g. a provisioned template),
+that content is moved into the staging directory first.
+
+Only buckets created by warm() are filled. A checkout for any other key
+(e.g. a compacted session's summary-seeded system prompt) is a plain
+miss, so one-off option sets never leave idle subprocesses behind.
+"""
+
+import asyncio
+import os
+import shutil
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Optional
+
+from ...config.settings import settings
+from . import sdk
+
+if TYPE_CHECKING:
+    from claude_agent_sdk import ClaudeAgentOptions, ClaudeSDKClient
+
+
+def _bind_workspace(staging: Path, workspace: Path) -> None:
+    """Link workspace to staging, carrying over existing workspace entries."""
+    moved: list[str] = []
+    try:
+        if workspace.exists():
+            for entry in os.scandir(workspace):
+                os.rename(entry.path, staging / entry.name)
+                moved.append(entry.name)
+            os.rmdir(workspace)
+        # Relative, so the workspace root can be moved as a whole
+        os.symlink(os.path.relpath(staging, workspace.parent), workspace, target_is_directory=True)
+    except OSError:
+        if moved:
+            workspace.mkdir(exist_ok=True)
+        for name in moved:
+            os.rename(staging / name, workspace / name)
+        raise
+
+
+@dataclass(frozen=True)
+class PoolKey:
+    """Connect-time options a pooled client is bound to."""
+    model: str
+    system_prompt: Optional[str] = None
+    allowed_tools: tuple[str, ...] = ()
+
+
+@dataclass
+class PoolConfig:
+    """Configuration for the warm client pool."""
+    enabled: bool = settings.agent_pool_enabled
+    min_size: int = settings.agent_pool_min_size
+    max_size: int = settings.agent_pool_max_size
+    # eager: keep each bucket at min_size
+    # adaptive: every miss grows the bucket target by one, up to max_size
+    refill_policy: str = settings.agent_pool_refill_policy
+    models: list[str] = field(default_factory=lambda: list(settings.agent_pool_models))
+
+
+@dataclass
+class PoolStats:
+    """Counters for a single pool bucket."""
+    hits: int = 0
+    misses: int = 0
+    refills: int = 0
+    refill_failures: int = 0
+    refill_latency_ms_total: float = 0.0
+    refill_latency_ms_max: float = 0.0
+
+    def to_dict(self) -> dict[str, Any]:
+        avg = self.refill_latency_ms_total / self.refills if self.refills else 0.0
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "refills": self.refills,
+            "refill_failures": self.refill_failures,
+            "refill_latency_ms_avg": round(avg, 2),
+            "refill_latency_ms_max": round(self.refill_latency_ms_max, 2),
+        }
+
+
+@dataclass
+class _PooledClient:
+    client: "ClaudeSDKClient"
+    workspace: Path
+
+
+class _Bucket:
+    """Idle clients sharing the same PoolKey."""
+
+    def __init__(self, key: PoolKey, target: int):
+        self.key = key
+        self.target = target
+        self.idle: deque[_PooledClient] = deque()
+        self.stats = PoolStats()
+        self.refill_task: Optional[asyncio.Task[None]] = None
+
+
+class ClientPool:
+    """
+    Pool of pre-connected SDK clients.
+
+    Buckets are created on first use (or via warm()) and refilled in the
+    background so that checkout never waits on a connect.
+    """
+
+    def __init__(
+        self,
+        staging_dir: Path,
+        options_factory: Callable[[PoolKey, Path], "ClaudeAgentOptions"],
+        config: Optional[PoolConfig] = None,
+    ):
+        self.config = config or PoolConfig()
+        self.staging_dir = staging_dir
+        self._options_factory = options_factory
+        self._buckets: dict[PoolKey, _Bucket] = {}
+        # Names of staging directories owned by this pool
+        self._staging: set[str] = set()
+        self._closed = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.config.enabled and not self._closed
+
+    def warm(self, key: PoolKey) -> None:
+        """Create the bucket for key (if needed) and start filling it."""
+        if not self.enabled:
+            return
+        self._schedule_refill(self._get_bucket(key))
+
+    async def checkout(self, key: PoolKey, workspace: Path) -> Optional["ClaudeSDKClient"]:
+        """
+        Take a connected client for key and bind it to workspace.
+
+        The workspace path becomes a symlink to the client's staging
+        directory, which takes over any existing workspace content.
+
+        Returns:
+            A connected client, or None on a pool miss (always for keys
+            that were never warmed)
+        """
+        if not self.enabled:
+            return None
+
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return None
+        client = None
+        while bucket.idle:
+            pooled = bucket.idle.popleft()
+            try:
+                await asyncio.to_thread(_bind_workspace, pooled.workspace, workspace)
+            except OSError:
+                await self._dispose(pooled)
+                continue
+            self._staging.discard(pooled.workspace.name)
+            client = pooled.client
+            break
+
+        if client is not None:
+            bucket.stats.hits += 1
+        else:
+            bucket.stats.misses += 1
+            if self.config.refill_policy == "adaptive":
+                bucket.target = min(bucket.target + 1, self.config.max_size)
+
+        self._schedule_refill(bucket)
+        return client
+
+    def staged(self) -> frozenset[str]:
+        """Names of staging directories that belong to live pooled clients."""
+        return frozenset(self._staging)
+
+    def idle_count(self) -> int:
+        """Pre-connected clients across all buckets."""
+        return sum(len(bucket.idle) for bucket in self._buckets.values())
+
+    def stats(self) -> dict[str, Any]:
+        """Per-bucket pool metrics."""
+        buckets = []
+        for bucket in self._buckets.values():
+            buckets.append({
+                "model": bucket.key.model,
+                "allowed_tools": list(bucket.key.allowed_tools),
+                "idle": len(bucket.idle),
+                "target": bucket.target,
+                **bucket.stats.to_dict(),
+            })
+        return {
+            "enabled": self.enabled,
+            "refill_policy": self.config.refill_policy,
+            "buckets": buckets,
+        }
+
+    async def close(self) -> None:
+        """Stop refilling and disconnect all idle clients."""
+        self._closed = True
+        for bucket in self._buckets.values():
+            if bucket.refill_task is not None:
+                bucket.refill_task.cancel()
+        for bucket in self._buckets.values():
+            while bucket.idle:
+                await self._dispose(bucket.idle.popleft())
+        self._buckets.clear()
+
+    def _get_bucket(self, key: PoolKey) -> _Bucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = _Bucket(key, target=self.config.min_size)
+            self._buckets[key] = bucket
+        return bucket
+
+    def _schedule_refill(self, bucket: _Bucket) -> None:
+        if bucket.refill_task is None or bucket.refill_task.done():
+            bucket.refill_task = asyncio.create_task(self._refill(bucket))
+
+    async def _refill(self, bucket: _Bucket) -> None:
+        """Connect clients until the bucket reaches its target size."""
+        while not self._closed and len(bucket.idle) < bucket.target:
+            started = time.perf_counter()
+            try:
+                pooled = await self._connect(bucket.key)
+            except Exception:
+                # Retry on the next checkout rather than spinning on a broken CLI
+                bucket.stats.refill_failures += 1
+                return
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            bucket.stats.refills += 1
+            bucket.stats.refill_latency_ms_total += elapsed_ms
+            bucket.stats.refill_latency_ms_max = max(
+                bucket.stats.refill_latency_ms_max, elapsed_ms
+            )
+            if self._closed:
+                await self._dispose(pooled)
+                return
+            bucket.idle.append(pooled)
+
+    async def _connect(self, key: PoolKey) -> _PooledClient:
+        workspace = self.staging_dir / uuid.uuid4().hex
+        self._staging.add(workspace.name)
+        await asyncio.to_thread(workspace.mkdir, parents=True, exist_ok=True)
+        await sdk.aload()
+        client = sdk.new_client(self._options_factory(key, workspace))
+        try:
+            await client.connect()
+        except Exception:
+            self._staging.discard(workspace.name)
+            await asyncio.to_thread(shutil.rmtree, workspace, True)
+            raise
+        return _PooledClient(client=client, workspace=workspace)
+
+    async def _dispose(self, pooled: _PooledClient) -> None:
+        try:
+            await pooled.client.disconnect()
+        except Exception:
+            pass
+        self._staging.discard(pooled.workspace.name)
+        await asyncio.to_thread(shutil.rmtree, pooled.workspace, True)
@@ -0,0 +1,188 @@
+"""
+Prompt Cache
+
+Compiled system prompts (base prompt + persona), one entry per persona.
+
+- Files are read and composed once, in a worker thread
+- Entries are revalidated at most every check_interval seconds by
+  comparing file mtimes/sizes (stat only); the cached text is served
+  while the check runs in the background
+- A changed file is re-read and re-hashed; the prompt text object is
+  only replaced when the content actually changed
+"""
+
+import asyncio
+import hashlib
+import os
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Optional
+
+from ...config.settings import settings
+
+DEFAULT_PERSONA = "default"
+
+DEFAULT_PROMPT = """You are a helpful AI assistant.
+
+Be concise and helpful. If you need to use tools, explain what you're doing.
+"""
+
+# (mtime_ns, size) per source file; None when the file is missing
+_Signature = tuple[Optional[tuple[int, int]], ...]
+
+
+@dataclass
+class PromptCacheConfig:
+    """Configuration for the prompt cache."""
+    # Seconds between file change checks; 0 checks on every access
+    check_interval: float = settings.agent_prompt_check_interval
+
+
+@dataclass
+class CompiledPrompt:
+    """A composed system prompt and the file state it was built from."""
+    persona: str
+    text: str
+    digest: str
+    signature: _Signature
+    checked_at: float = field(default_factory=time.monotonic)
+
+
+class PromptCache:
+    """Serves compiled prompts without blocking the event loop."""
+
+    def __init__(self, prompts_dir: Path, config: Optional[PromptCacheConfig] = None):
+        self.prompts_dir = prompts_dir
+        self.config = config or PromptCacheConfig()
+        self._entries: dict[str, CompiledPrompt] = {}
+        self._pending: dict[str, asyncio.Future[CompiledPrompt]] = {}
+        # Background refreshes, referenced until done
+        self._tasks: set[asyncio.Task[CompiledPrompt]] = set()
+        # Last failed background refresh, for stats()
+        self.last_error: Optional[str] = None
+
+    @staticmethod
+    def validate_persona(persona: str) -> None:
+        """
+        Raises:
+            ValueError: If the name could escape the prompts directory
+        """
+        if not persona or persona.startswith(".") or "/" in persona or "\\" in persona:
+            raise ValueError(f"Invalid persona name: {persona!r}")
+
+    async def get(self, persona: str = DEFAULT_PERSONA) -> str:
+        """
+        Compiled system prompt for a persona.
+
+        Only the first request for a persona waits for the files to be
+        read; afterwards stale entries are revalidated in the background.
+
+        Raises:
+            ValueError: If the persona name is invalid
+        """
+        return (await self.get_compiled(persona)).text
+
+    async def get_compiled(self, persona: str = DEFAULT_PERSONA) -> CompiledPrompt:
+        """Like get(), but returns the entry with its content digest."""
+        entry = self._entries.get(persona)
+        if entry is None:
+            self.validate_persona(persona)
+            return await self._refresh(persona)
+        if time.monotonic() - entry.checked_at >= self.config.check_interval:
+            if self.config.check_interval <= 0:
+                return await self._refresh(persona)
+            self._refresh_in_background(persona)
+        return entry
+
+    def invalidate(self) -> None:
+        """Force a file check on the next access of every persona."""
+        for entry in self._entries.values():
+            entry.checked_at = float("-inf")
+
+    def cached(self, persona: str = DEFAULT_PERSONA) -> Optional[str]:
+        """Cached prompt text without any I/O (None if not loaded yet)."""
+        entry = self._entries.get(persona)
+        return entry.text if entry is not None else None
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "personas": {
+                persona: {"digest": entry.digest[:12], "chars": len(entry.text)}
+                for persona, entry in self._entries.items()
+            },
+            "check_interval": self.config.check_interval,
+            "last_error": self.last_error,
+        }
+
+    def _refresh_in_background(self, persona: str) -> None:
+        if persona in self._pending:
+            return
+        task = asyncio.create_task(self._refresh(persona))
+        self._tasks.add(task)
+        task.add_done_callback(self._refresh_done)
+
+    def _refresh_done(self, task: asyncio.Task[CompiledPrompt]) -> None:
+        self._tasks.discard(task)
+        if task.cancelled():
+            return
+        # Errors are retried on the next check; the cached text stays valid
+        error = task.exception()
+        if error is not None:
+            self.last_error = f"{type(error).__name__}: {error}"
+
+    async def _refresh(self, persona: str) -> CompiledPrompt:
+        """Revalidate one persona in a worker thread (deduplicated)."""
+        pending = self._pending.get(persona)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        future: asyncio.Future[CompiledPrompt] = asyncio.get_running_loop().create_future()
+        self._pending[persona] = future
+        try:
+            entry = await asyncio.to_thread(
+                self._load, persona, self._entries.get(persona)
+            )
+            self._entries[persona] = entry
+            future.set_result(entry)
+            return entry
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark retrieved so waiter-less failures aren't logged as unhandled
+            future.exception()
+            raise
+        finally:
+            del self._pending[persona]
+
+    def _paths(self, persona: str) -> list[Path]:
+        paths = [self.prompts_dir / "system.md"]
+        if persona != DEFAULT_PERSONA:
+            paths.append(self.prompts_dir / f"persona_{persona}.md")
+        return paths
+
+    def _load(self, persona: str, current: Optional[CompiledPrompt]) -> CompiledPrompt:
+        """Stat the source files; re-read and compose only if they changed."""
+        paths = self._paths(persona)
+        signature = tuple(_stat(path) for path in paths)
+        if current is not None and current.signature == signature:
+            current.checked_at = time.monotonic()
+            return current
+
+        base_stat, *persona_stat = signature
+        base = paths[0].read_text() if base_stat else DEFAULT_PROMPT
+        text = base
+        if persona_stat and persona_stat[0]:
+            text = f"{base}\n\n## Persona\n\n{paths[1].read_text()}"
+
+        digest = hashlib.sha256(text.encode()).hexdigest()
+        if current is not None and current.digest == digest:
+            # Touched but unchanged: keep the same text object
+            text = current.text
+        return CompiledPrompt(persona, text, digest, signature)
+
+
+def _stat(path: Path) -> Optional[tuple[int, int]]:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
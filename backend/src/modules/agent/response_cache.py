@@ -0,0 +1,225 @@
+"""
+Response Cache
+
+Caches the complete event sequence of successful first turns, keyed by
+a hash of everything that determines the answer (message, effective
+system prompt, model, allowed tools). Identical stateless questions are
+answered by replaying the stored events instead of running the agent.
+
+- Memory tier: LRU with TTL, bounded by entry count and total bytes
+- Disk tier (optional): one JSON file per key, read and written in a
+  worker thread, bounded by total bytes (oldest files removed first)
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Optional
+
+from ...config.settings import settings
+
+
+@dataclass
+class ResponseCacheConfig:
+    """Configuration for the response cache."""
+    enabled: bool = settings.response_cache_enabled
+    ttl_seconds: int = settings.response_cache_ttl_seconds
+    max_entries: int = settings.response_cache_max_entries
+    max_bytes: int = settings.response_cache_max_bytes
+    # Empty disables the disk tier
+    disk_dir: str = settings.response_cache_dir
+    disk_max_bytes: int = settings.response_cache_disk_max_bytes
+
+
+@dataclass
+class CachedResponse:
+    """A cached turn."""
+    key: str
+    events: list[dict[str, Any]]
+    created_at: float  # wall clock, shared with the disk tier
+    size: int
+
+    @property
+    def age(self) -> int:
+        return max(0, int(time.time() - self.created_at))
+
+
+def cache_key(
+    message: str,
+    system_prompt: Optional[str],
+    model: str,
+    allowed_tools: Optional[list[str]],
+) -> str:
+    """Hash of the inputs that determine a fresh session's reply."""
+    payload = json.dumps(
+        [message, system_prompt, model, sorted(allowed_tools) if allowed_tools else None],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def is_cacheable(events: list[dict[str, Any]]) -> bool:
+    """
+    Only complete, successful turns are cached.
+
+    Turns with spilled tool outputs are not: their references point into
+    the original session's workspace.
+    """
+    if not events or events[-1]["type"] != "done" or events[-1].get("is_error"):
+        return False
+    return not any(event["type"] == "error" or "output_ref" in event for event in events)
+
+
+class ResponseCache:
+    """Two-tier (memory, disk) cache of agent turns."""
+
+    def __init__(self, config: Optional[ResponseCacheConfig] = None):
+        self.config = config or ResponseCacheConfig()
+        self._entries: OrderedDict[str, CachedResponse] = OrderedDict()
+        self._bytes = 0
+        self._disk = Path(self.config.disk_dir).resolve() if self.config.disk_dir else None
+        self._disk_tasks: set[asyncio.Task[None]] = set()
+        self._next_disk_prune = 0.0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.config.enabled
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        """Look up a key in memory, then on disk."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            if self._expired(entry):
+                self._remove(key)
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+
+        if self._disk is not None:
+            entry = await asyncio.to_thread(self._read_disk, self._disk, key)
+            if entry is not None:
+                self._insert(entry)
+                self.hits += 1
+                self.disk_hits += 1
+                return entry
+
+        self.misses += 1
+        return None
+
+    def put(self, key: str, events: list[dict[str, Any]]) -> Optional[CachedResponse]:
+        """
+        Store a turn's events (no blocking I/O; the disk write runs in the background).
+
+        Returns:
+            The entry, or None if the turn is not cacheable or too large
+        """
+        if not is_cacheable(events):
+            return None
+        data = json.dumps(events, ensure_ascii=False)
+        entry = CachedResponse(key, events, time.time(), len(data))
+        if entry.size > self.config.max_bytes:
+            return None
+        self._insert(entry)
+        if self._disk is not None:
+            task = asyncio.create_task(asyncio.to_thread(self._write_disk, self._disk, entry, data))
+            self._disk_tasks.add(task)
+            task.add_done_callback(self._disk_tasks.discard)
+        return entry
+
+    async def clear(self) -> None:
+        """Drop all entries from both tiers."""
+        self._entries.clear()
+        self._bytes = 0
+        if self._disk is not None:
+            await asyncio.to_thread(self._clear_disk, self._disk)
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.config.max_bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "disk": str(self._disk) if self._disk is not None else None,
+        }
+
+    def _expired(self, entry: CachedResponse) -> bool:
+        return time.time() - entry.created_at > self.config.ttl_seconds
+
+    def _insert(self, entry: CachedResponse) -> None:
+        self._remove(entry.key)
+        self._entries[entry.key] = entry
+        self._bytes += entry.size
+        while self._entries and (
+            len(self._entries) > self.config.max_entries or self._bytes > self.config.max_bytes
+        ):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def _read_disk(self, disk: Path, key: str) -> Optional[CachedResponse]:
+        path = disk / f"{key}.json"
+        try:
+            with open(path, encoding="utf-8") as f:
+                stored = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        entry = CachedResponse(key, stored["events"], stored["created_at"], stored["size"])
+        if self._expired(entry):
+            path.unlink(missing_ok=True)
+            return None
+        return entry
+
+    def _write_disk(self, disk: Path, entry: CachedResponse, data: str) -> None:
+        disk.mkdir(parents=True, exist_ok=True)
+        path = disk / f"{entry.key}.json"
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(f'{{"created_at": {entry.created_at}, "size": {entry.size}, "events": {data}}}')
+        os.replace(tmp, path)
+        if time.monotonic() >= self._next_disk_prune:
+            self._next_disk_prune = time.monotonic() + 60
+            self._prune_disk(disk)
+
+    def _prune_disk(self, disk: Path) -> None:
+        """Remove expired files, then the oldest ones until under disk_max_bytes."""
+        files = []
+        cutoff = time.time() - self.config.ttl_seconds
+        for entry in os.scandir(disk):
+            if not entry.name.endswith(".json"):
+                continue
+            st = entry.stat()
+            if st.st_mtime < cutoff:
+                Path(entry.path).unlink(missing_ok=True)
+            else:
+                files.append((st.st_mtime, st.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.config.disk_max_bytes:
+                break
+            Path(path).unlink(missing_ok=True)
+            total -= size
+
+    def _clear_disk(self, disk: Path) -> None:
+        if not disk.exists():
+            return
+        for entry in os.scandir(disk):
+            if entry.name.endswith(".json"):
+                Path(entry.path).unlink(missing_ok=True)
@@ -0,0 +1,300 @@
+"""
+Model Routing
+
+Picks the model for each turn instead of sending everything to
+CLAUDE_MODEL, so short questions can go to a fast model and hard ones to
+a strong one. In order, a turn is routed by:
+
+1. the client's model hint (the request's "model" field), if allowed
+2. the first rule in AGENT_ROUTING_RULES that matches
+3. the default model (CLAUDE_MODEL)
+
+A rule is a JSON object with a name, a model and any of these conditions
+(all given conditions must hold):
+
+    {"name": "quick", "model": "haiku", "max_chars": 280, "needs_tools": false}
+    {"name": "review", "model": "opus", "personas": ["reviewer"]}
+    {"name": "long", "model": "opus", "min_chars": 4000}
+    {"name": "sql", "model": "sonnet", "pattern": "\\\\bselect\\\\b"}
+
+needs_tools is a heuristic on the message (file names, paths, code,
+verbs such as run, install or fix). pattern is a case-insensitive regex.
+
+Each model has its own warm pool bucket (see AgentService.warm_pool).
+Observed latency, tokens and cost are recorded per route, so a rule set
+can be judged from GET /chat/admin/routing and the agent_route_* metrics.
+"""
+
+import re
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from ...config.settings import settings
+from ..core.metrics import registry
+from .budgets import usage_tokens
+
+ROUTE_TURNS = registry.counter(
+    "agent_route_turns_total",
+    "Turns by route and model",
+    labelnames=("route", "model"),
+)
+ROUTE_ERRORS = registry.counter(
+    "agent_route_errors_total",
+    "Turns that ended with an error, by route and model",
+    labelnames=("route", "model"),
+)
+ROUTE_SECONDS = registry.counter(
+    "agent_route_seconds_total",
+    "Turn wall time by route and model; divide by turns for the mean",
+    labelnames=("route", "model"),
+)
+ROUTE_COST = registry.counter(
+    "agent_route_cost_usd_total",
+    "Reported cost (USD) by route and model",
+    labelnames=("route", "model"),
+)
+
+# Something in the message suggests the agent will need tools
+_TOOL_HINTS = re.compile(
+    r"```|`[^`\n]+`"
+    r"|(?:^|\s)[.~]?[\w-]*/[\w./-]+"
+    r"|\b[\w-]+\.(?:py|js|ts|tsx|jsx|json|md|txt|ya?ml|toml|ini|sh|sql|csv|html|css|go|rs|java)\b"
+    r"|\b(?:run|execute|install|edit|create|write|read|open|fix|debug|refactor|test|build"
+    r"|grep|search|list|delete|rename|commit|deploy|download)\b",
+    re.IGNORECASE,
+)
+
+_RULE_KEYS = {"name", "model", "min_chars", "max_chars", "personas", "needs_tools", "pattern"}
+
+# Recent samples kept per route for percentiles
+_SAMPLES = 1000
+
+
+def needs_tools(message: str) -> bool:
+    """Heuristic: whether answering the message likely takes tool calls."""
+    return _TOOL_HINTS.search(message) is not None
+
+
+@dataclass
+class RouteRule:
+    """One routing rule; None conditions always hold."""
+    name: str
+    model: str
+    min_chars: Optional[int] = None
+    max_chars: Optional[int] = None
+    personas: Optional[list[str]] = None
+    needs_tools: Optional[bool] = None
+    pattern: Optional[re.Pattern[str]] = None
+
+    @classmethod
+    def parse(cls, spec: dict[str, Any], models: list[str]) -> "RouteRule":
+        """
+        Build a rule from its JSON form.
+
+        Raises:
+            ValueError: If the rule has unknown keys or an unknown model
+        """
+        unknown = set(spec) - _RULE_KEYS
+        if unknown:
+            raise ValueError(f"Unknown routing rule keys: {', '.join(sorted(unknown))}")
+        if spec.get("model") not in models:
+            raise ValueError(f"Routing rule model must be one of {models}, got {spec.get('model')!r}")
+        pattern = spec.get("pattern")
+        return cls(
+            name=spec.get("name") or spec["model"],
+            model=spec["model"],
+            min_chars=spec.get("min_chars"),
+            max_chars=spec.get("max_chars"),
+            personas=spec.get("personas"),
+            needs_tools=spec.get("needs_tools"),
+            pattern=re.compile(pattern, re.IGNORECASE) if pattern else None,
+        )
+
+    def matches(self, message: str, persona: str, tools: Optional[bool]) -> bool:
+        if self.min_chars is not None and len(message) < self.min_chars:
+            return False
+        if self.max_chars is not None and len(message) > self.max_chars:
+            return False
+        if self.personas is not None and persona not in self.personas:
+            return False
+        if self.needs_tools is not None and tools is not self.needs_tools:
+            return False
+        if self.pattern is not None and self.pattern.search(message) is None:
+            return False
+        return True
+
+
+@dataclass
+class RoutingConfig:
+    """Configuration for model routing."""
+    enabled: bool = settings.agent_routing_enabled
+    default_model: str = settings.claude_model
+    rules: list[dict[str, Any]] = field(default_factory=lambda: list(settings.agent_routing_rules))
+    # Models that rules and hints may pick
+    models: list[str] = field(default_factory=lambda: list(settings.agent_routing_models))
+    allow_hints: bool = settings.agent_routing_allow_hints
+
+
+@dataclass(frozen=True)
+class RouteDecision:
+    """The model for a turn and the route (rule name, "hint", "default") that chose it."""
+    model: str
+    route: str
+
+
+class _RouteStats:
+    """Observed outcomes of one (route, model)."""
+
+    def __init__(self) -> None:
+        self.turns = 0
+        self.errors = 0
+        self.tokens = 0
+        self.cost = 0.0
+        self.first_token_ms: deque[float] = deque(maxlen=_SAMPLES)
+        self.duration_ms: deque[float] = deque(maxlen=_SAMPLES)
+
+    @staticmethod
+    def _percentiles(samples: deque[float]) -> dict[str, Any]:
+        if not samples:
+            return {"p50": None, "p95": None}
+        values = sorted(samples)
+        return {
+            "p50": round(values[len(values) // 2], 1),
+            "p95": round(values[min(len(values) - 1, int(len(values) * 0.95))], 1),
+        }
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "turns": self.turns,
+            "errors": self.errors,
+            "tokens": self.tokens,
+            "cost_usd": round(self.cost, 6),
+            "cost_usd_per_turn": round(self.cost / self.turns, 6) if self.turns else None,
+            "first_token_ms": self._percentiles(self.first_token_ms),
+            "duration_ms": self._percentiles(self.duration_ms),
+        }
+
+
+class TurnObservation:
+    """Measures one routed turn; feed it the turn's events, then finish()."""
+
+    def __init__(self, router: "ModelRouter", decision: RouteDecision):
+        self._router = router
+        self.decision = decision
+        self._started = time.monotonic()
+        self.first_token_ms: Optional[float] = None
+        self.done = False
+        self.error = False
+        self.usage = None
+        self.cost: Optional[float] = None
+
+    def event(self, event: dict[str, Any]) -> None:
+        kind = event["type"]
+        if kind == "text" and self.first_token_ms is None:
+            self.first_token_ms = (time.monotonic() - self._started) * 1000
+        elif kind == "error":
+            self.error = True
+        elif kind == "done":
+            self.done = True
+            self.usage = event.get("usage")
+            self.cost = event.get("total_cost_usd")
+            self.error = self.error or bool(event.get("is_error"))
+
+    def finish(self) -> None:
+        # Turns cut short by the client (interrupt, disconnect) say nothing about the route
+        if self.done or self.error:
+            self._router.record(self, (time.monotonic() - self._started) * 1000)
+
+
+class ModelRouter:
+    """Chooses a model per turn and keeps per-route statistics."""
+
+    def __init__(self, config: Optional[RoutingConfig] = None):
+        self.config = config or RoutingConfig()
+        models = self.config.models
+        self.rules = [RouteRule.parse(spec, models) for spec in self.config.rules]
+        self._stats: dict[tuple[str, str], _RouteStats] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.config.enabled
+
+    def models(self) -> list[str]:
+        """Models turns can be routed to (for pre-warming), default first."""
+        if not self.enabled:
+            return [self.config.default_model]
+        routed = [rule.model for rule in self.rules]
+        if self.config.allow_hints:
+            routed.extend(self.config.models)
+        return list(dict.fromkeys([self.config.default_model, *routed]))
+
+    def validate_hint(self, hint: Optional[str]) -> None:
+        """
+        Raises:
+            ValueError: If the hint names a model turns may not be routed to
+        """
+        if hint and self.enabled and self.config.allow_hints and hint not in self.config.models:
+            raise ValueError(f"Model must be one of {self.config.models}, got {hint!r}")
+
+    def route(self, message: str, persona: str, hint: Optional[str] = None) -> RouteDecision:
+        """
+        Pick the model for a turn.
+
+        Args:
+            message: User message
+            persona: The session's persona
+            hint: Model requested by the client (ignored unless hints are allowed)
+
+        Raises:
+            ValueError: If the hint is not an allowed model
+        """
+        if not self.enabled:
+            return RouteDecision(self.config.default_model, "default")
+        if hint and self.config.allow_hints:
+            self.validate_hint(hint)
+            return RouteDecision(hint, "hint")
+        tools = None
+        for rule in self.rules:
+            if rule.needs_tools is not None and tools is None:
+                tools = needs_tools(message)
+            if rule.matches(message, persona, tools):
+                return RouteDecision(rule.model, rule.name)
+        return RouteDecision(self.config.default_model, "default")
+
+    def observe(self, decision: RouteDecision) -> TurnObservation:
+        return TurnObservation(self, decision)
+
+    def record(self, turn: TurnObservation, duration_ms: float) -> None:
+        decision = turn.decision
+        labels = (decision.route, decision.model)
+        stats = self._stats.get(labels)
+        if stats is None:
+            stats = self._stats[labels] = _RouteStats()
+        stats.turns += 1
+        stats.duration_ms.append(duration_ms)
+        if turn.first_token_ms is not None:
+            stats.first_token_ms.append(turn.first_token_ms)
+        stats.tokens += usage_tokens(turn.usage)
+        stats.cost += turn.cost or 0.0
+        ROUTE_TURNS.inc(*labels)
+        ROUTE_SECONDS.inc(*labels, amount=duration_ms / 1000)
+        if turn.cost:
+            ROUTE_COST.inc(*labels, amount=turn.cost)
+        if turn.error:
+            stats.errors += 1
+            ROUTE_ERRORS.inc(*labels)
+
+    def stats(self) -> dict[str, Any]:
+        """Rules and observed latency, tokens and cost per (route, model)."""
+        return {
+            "enabled": self.enabled,
+            "default_model": self.config.default_model,
+            "allow_hints": self.config.allow_hints,
+            "rules": list(self.config.rules),
+            "routes": [
+                {"route": route, "model": model, **stats.to_dict()}
+                for (route, model), stats in sorted(self._stats.items())
+            ],
+        }
@@ -0,0 +1,194 @@
+"""
+Run Scheduler
+
+Admission control for agent runs:
+- Turns of the same session run one at a time, in arrival order
+- At most max_concurrent runs execute across the process
+- Excess runs wait in a bounded FIFO queue with a maximum wait time
+"""
+
+import asyncio
+import bisect
+import itertools
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Optional
+
+from ...config.settings import settings
+from .exceptions import QueueFullError, QueueTimeoutError
+
+
+@dataclass
+class SchedulerConfig:
+    """Configuration for the run scheduler."""
+    max_concurrent: int = settings.agent_max_concurrent_runs
+    max_queue: int = settings.agent_max_queued_runs
+    max_wait_seconds: float = settings.agent_queue_timeout
+
+
+class RunTicket:
+    """
+    A single run's place in the scheduler.
+
+    Obtained from RunScheduler.enqueue(); must always be released.
+    """
+
+    def __init__(self, scheduler: "RunScheduler", session_id: str, seq: int):
+        self.session_id = session_id
+        self.seq = seq
+        self.granted = False
+        self.released = False
+        self._scheduler = scheduler
+        self._changed = asyncio.Event()
+
+    @property
+    def position(self) -> int:
+        """Number of runs that must start before this one (0 = running)."""
+        return self._scheduler.position(self)
+
+    async def wait(self) -> AsyncIterator[int]:
+        """
+        Wait until the run may start.
+
+        Yields:
+            The queue position each time it changes while waiting
+
+        Raises:
+            QueueTimeoutError: If the run is not admitted in time
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self._scheduler.config.max_wait_seconds
+        while not self.granted:
+            yield self.position
+            self._changed.clear()
+            remaining = deadline - loop.time()
+            try:
+                if remaining <= 0:
+                    raise TimeoutError
+                await asyncio.wait_for(self._changed.wait(), remaining)
+            except TimeoutError:
+                if self.granted:
+                    break
+                raise QueueTimeoutError(
+                    "Timed out waiting for an agent slot",
+                    retry_after=self._scheduler.retry_after,
+                ) from None
+
+    def release(self) -> None:
+        """Free the run's slot (or drop it from the queue)."""
+        self._scheduler.release(self)
+
+    def _notify(self) -> None:
+        self._changed.set()
+
+
+class RunScheduler:
+    """
+    Per-session FIFO serialization plus global admission control.
+
+    Only the head ticket of each session competes for a global slot;
+    competing tickets are served in arrival order, so a busy session
+    cannot starve others.
+    """
+
+    def __init__(self, config: Optional[SchedulerConfig] = None):
+        self.config = config or SchedulerConfig()
+        self._seq = itertools.count()
+        self._session_queues: dict[str, deque[RunTicket]] = {}
+        # Session heads waiting for a global slot, ordered by seq
+        self._waiting: list[RunTicket] = []
+        self._pending = 0
+        self._active = 0
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def queued(self) -> int:
+        return self._pending
+
+    @property
+    def retry_after(self) -> int:
+        """Rough Retry-After hint in seconds for rejected runs."""
+        return max(1, int(self.config.max_wait_seconds // 2))
+
+    def check_admission(self, session_id: str) -> None:
+        """
+        Reject early if a run for session_id would not fit in the queue.
+
+        Raises:
+            QueueFullError: If the queue is at capacity
+        """
+        will_wait = (
+            session_id in self._session_queues
+            or self._active >= self.config.max_concurrent
+        )
+        if will_wait and self._pending >= self.config.max_queue:
+            raise QueueFullError("Agent run queue is full", retry_after=self.retry_after)
+
+    def enqueue(self, session_id: str) -> RunTicket:
+        """
+        Queue a run for session_id.
+
+        Raises:
+            QueueFullError: If the queue is at capacity
+        """
+        self.check_admission(session_id)
+        ticket = RunTicket(self, session_id, next(self._seq))
+        queue = self._session_queues.setdefault(session_id, deque())
+        queue.append(ticket)
+        self._pending += 1
+        if len(queue) == 1:
+            bisect.insort(self._waiting, ticket, key=lambda t: t.seq)
+        self._dispatch()
+        return ticket
+
+    def position(self, ticket: RunTicket) -> int:
+        if ticket.granted or ticket.released:
+            return 0
+        if ticket in self._waiting:
+            return self._waiting.index(ticket) + 1
+        queue = self._session_queues[ticket.session_id]
+        return queue.index(ticket) + self.position(queue[0])
+
+    def release(self, ticket: RunTicket) -> None:
+        if ticket.released:
+            return
+        ticket.released = True
+        if ticket.granted:
+            self._active -= 1
+        else:
+            self._pending -= 1
+            if ticket in self._waiting:
+                self._waiting.remove(ticket)
+
+        queue = self._session_queues[ticket.session_id]
+        was_head = queue[0] is ticket
+        queue.remove(ticket)
+        if not queue:
+            del self._session_queues[ticket.session_id]
+        elif was_head:
+            bisect.insort(self._waiting, queue[0], key=lambda t: t.seq)
+        self._dispatch()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "active": self._active,
+            "queued": self._pending,
+            "max_concurrent": self.config.max_concurrent,
+            "max_queue": self.config.max_queue,
+        }
+
+    def _dispatch(self) -> None:
+        """Grant free slots in arrival order and notify waiters."""
+        while self._waiting and self._active < self.config.max_concurrent:
+            ticket = self._waiting.pop(0)
+            ticket.granted = True
+            self._pending -= 1
+            self._active += 1
+            ticket._notify()
+        for queue in self._session_queues.values():
+            for ticket in queue:
+                if not ticket.granted:
+                    ticket._notify()
@@ -0,0 +1,58 @@
+"""
+Claude Agent SDK Loader
+
+Importing claude_agent_sdk (and the MCP packages it pulls in) takes about
+a second, so the SDK is loaded on first use instead of when the app is
+imported. Nothing here imports it at module level; code that only needs
+the names for annotations imports them under TYPE_CHECKING.
+
+The lifespan preloads the SDK in a worker thread, so the event loop keeps
+serving while it loads and the first run rarely waits for it.
+"""
+
+import asyncio
+import importlib
+from types import ModuleType
+from typing import TYPE_CHECKING, Any, Optional
+
+if TYPE_CHECKING:
+    from claude_agent_sdk import ClaudeSDKClient
+
+from ...config.settings import settings
+
+_module: Optional[ModuleType] = None
+
+# Client class override (e.g. benchmarks.fake_sdk); None = AGENT_SDK_CLIENT_CLASS,
+# or the SDK's ClaudeSDKClient
+client_class: Optional[type] = None
+
+
+def load() -> ModuleType:
+    """The claude_agent_sdk module, imported on first call."""
+    global _module
+    module = _module
+    if module is None:
+        module = _module = importlib.import_module("claude_agent_sdk")
+    return module
+
+
+async def aload() -> ModuleType:
+    """Like load(), but imports in a worker thread the first time."""
+    module = _module
+    if module is None:
+        module = await asyncio.to_thread(load)
+    return module
+
+
+def is_loaded() -> bool:
+    return _module is not None
+
+
+def new_client(options: Any) -> "ClaudeSDKClient":
+    """A (not yet connected) client for the given ClaudeAgentOptions."""
+    global client_class
+    if client_class is None and settings.agent_sdk_client_class:
+        module, _, name = settings.agent_sdk_client_class.partition(":")
+        client_class = getattr(importlib.import_module(module), name)
+    cls: type[ClaudeSDKClient] = client_class or load().ClaudeSDKClient
+    return cls(options=options)
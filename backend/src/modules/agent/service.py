@@ -3,158 +3,480 @@ Agent Service
 
 High-level agent service that manages:
 - System prompts and personas
-- Session management
+- Session management (records shared across workers via the session store)
 - Tool permissions
+- Model routing per turn
+- Compaction of sessions whose context grew too large
+- Run admission (per-session ordering, global concurrency, usage budgets)
 """
 
-from typing import AsyncIterator, Optional
+import asyncio
+import time
 from pathlib import Path
+from typing import Any, AsyncIterator, Optional, Union
 
-from .driver import claude_sdk_driver, ClaudeSDKConfig
+from ..core.metrics import registry
+from ..history.service import history_service
+from . import metrics
+from .batch import BatchRunner
+from .budgets import BudgetTracker
+from .compaction import Compactor, context_tokens, seed_prompt
+from .driver import ClaudeSDKDriver, claude_sdk_driver
+from .exceptions import SessionBusyError
+from .prompt_cache import DEFAULT_PERSONA, PromptCache
+from .response_cache import CachedResponse, ResponseCache, cache_key
+from .routing import ModelRouter
+from .scheduler import RunScheduler
+from .session_store import WORKER_ID, SessionStore, create_session_store
+from .shards import ShardPool
 
 
 class AgentService:
     """
     Main Agent Service.
-    
+
     Wraps Claude SDK driver with:
     - Prompt management
     - Session tracking
     - Tool permission control
     """
-    
+
     def __init__(self):
         self.prompts_dir = Path(__file__).parent / "prompts"
-        self.prompts_dir.mkdir(parents=True, exist_ok=True)
-        self._system_prompt: Optional[str] = None
-        self._persona: str = "default"
-        
+        self.prompts = PromptCache(self.prompts_dir)
+        # Persona for new sessions; existing sessions keep theirs
+        self._persona: str = DEFAULT_PERSONA
+
         # Tool permissions - customize which tools your agent can use
         # None means all tools allowed
         self.allowed_tools: Optional[list[str]] = None
-        
-        # Active sessions
-        self._sessions: dict[str, dict] = {}
-    
+
+        # Session records, shared with other workers
+        self.store: SessionStore = create_session_store()
+
+        # Serializes turns per session and caps concurrent runs
+        self.scheduler = RunScheduler()
+        registry.gauge(
+            "agent_runs_active", "Runs holding a scheduler slot",
+            callback=lambda: self.scheduler.active,
+        )
+        registry.gauge(
+            "agent_runs_queued", "Runs waiting for a scheduler slot",
+            callback=lambda: self.scheduler.queued,
+        )
+
+        # Token and cost budgets per session and API key
+        self.budgets = BudgetTracker()
+        # Model per turn (rules, client hints), with per-route statistics
+        self.router = ModelRouter()
+        # Summarizes and restarts sessions past the context threshold
+        self.compactor = Compactor(self)
+
+        # Replies to identical first messages of fresh sessions
+        self.response_cache = ResponseCache()
+        # Many independent prompts with bounded parallelism
+        self.batches = BatchRunner(self)
+        # Driver worker processes (AGENT_SHARDS); none by default
+        self.shards = ShardPool()
+
     @property
-    def system_prompt(self) -> str:
-        """Get current system prompt."""
-        if self._system_prompt is None:
-            self._system_prompt = self._load_prompt("system")
-        return self._system_prompt
-    
-    def _load_prompt(self, name: str) -> str:
-        """Load prompt from file."""
-        prompt_file = self.prompts_dir / f"{name}.md"
-        if prompt_file.exists():
-            return prompt_file.read_text()
-        return self._get_default_prompt()
-    
-    def _get_default_prompt(self) -> str:
-        """Default system prompt if none configured."""
-        return """You are a helpful AI assistant.
-
-Be concise and helpful. If you need to use tools, explain what you're doing.
-"""
-    
-    def set_persona(self, persona: str) -> None:
+    def _runner(self) -> Union[ShardPool, ClaudeSDKDriver]:
+        """Where turns run: the session's shard, or the in-process driver."""
+        return self.shards if self.shards.enabled else claude_sdk_driver
+
+    @property
+    def persona(self) -> str:
+        """Default persona for new sessions."""
+        return self._persona
+
+    async def get_system_prompt(self, persona: Optional[str] = None) -> str:
+        """
+        Compiled system prompt (base + persona) from the prompt cache.
+
+        Args:
+            persona: Persona name, or None for the default persona
+        """
+        return await self.prompts.get(persona or self._persona)
+
+    async def set_persona(self, persona: str) -> None:
         """
-        Switch agent persona.
-        
+        Switch the default persona for new sessions.
+
         Looks for persona file: prompts/persona_{name}.md
+        (falls back to the base prompt if missing). Sessions that
+        already exist keep the persona they started with.
+
+        Raises:
+            ValueError: If the persona name is invalid
         """
+        await self.prompts.get(persona)
         self._persona = persona
-        base_prompt = self._load_prompt("system")
-        
-        persona_file = self.prompts_dir / f"persona_{persona}.md"
-        if persona_file.exists():
-            persona_content = persona_file.read_text()
-            self._system_prompt = f"{base_prompt}\n\n## Persona\n\n{persona_content}"
-        else:
-            self._system_prompt = base_prompt
-    
+
     def reload_prompt(self) -> None:
-        """Force reload of system prompt."""
-        self._system_prompt = None
-    
+        """Re-check prompt files on next use (changes are also picked up automatically)."""
+        self.prompts.invalidate()
+
     def set_allowed_tools(self, tools: Optional[list[str]]) -> None:
         """
         Set which tools the agent can use.
-        
+
         Args:
             tools: List of tool names, or None for all tools
         """
         self.allowed_tools = tools
-    
-    def start_session(self, session_id: str) -> dict:
-        """Start a new chat session."""
-        self._sessions[session_id] = {
+
+    async def start(self) -> None:
+        """
+        Prepare the agent subsystem (app lifespan).
+
+        Construction is cheap and does no I/O, so importing the app stays
+        fast; directories, the SDK import and the warm pool happen here.
+        """
+        await asyncio.to_thread(self.prompts_dir.mkdir, parents=True, exist_ok=True)
+        await self.budgets.start()
+        # With shards the SDK is only needed in the shard processes
+        await claude_sdk_driver.start(preload_sdk=not self.shards.enabled)
+        await self.shards.start()
+        await self.warm_pool()
+
+    async def warm_pool(self) -> None:
+        """
+        Load the default prompt and pre-warm the driver's client pool for it.
+
+        Warms the configured default model, every model turns can be
+        routed to, and any extra pool models (one pool bucket each).
+        """
+        system_prompt = await self.get_system_prompt()
+        pool = claude_sdk_driver.pool
+        models = [*self.router.models(), *pool.config.models]
+        for model in dict.fromkeys(models):
+            if self.shards.enabled:
+                # Every shard keeps its own pool (same settings as this one)
+                if pool.enabled:
+                    await self.shards.call_all("warm", system_prompt, self.allowed_tools, model)
+                continue
+            pool.warm(claude_sdk_driver.pool_key(
+                system_prompt=system_prompt,
+                allowed_tools=self.allowed_tools,
+                model=model,
+            ))
+
+    async def start_session(self, session_id: str, persona: Optional[str] = None) -> dict[str, Any]:
+        """
+        Start a new chat session.
+
+        Args:
+            session_id: Session ID
+            persona: Persona for this session (default: current default persona)
+
+        Raises:
+            ValueError: If the persona name is invalid
+        """
+        if persona is not None:
+            self.prompts.validate_persona(persona)
+        record: dict[str, Any] = {
             "id": session_id,
             "message_count": 0,
-            "created_at": None,  # Will be set on first message
+            "persona": persona or self._persona,
+            "created_at": time.time(),
+            # SDK session id to resume from and the worker that last ran it
+            "sdk_session_id": None,
+            "owner": WORKER_ID,
         }
-        return self._sessions[session_id]
-    
-    def get_session(self, session_id: str) -> Optional[dict]:
+        await self.store.put(session_id, record)
+        history_service.record_session(session_id, record["persona"])
+        return record
+
+    async def provision_template(self, session_id: str, template: str) -> dict[str, Any]:
+        """
+        Seed a session's workspace from a named template.
+
+        Returns:
+            Provisioning report (mode, files, bytes, duration)
+
+        Raises:
+            TemplateNotFoundError: If the template does not exist
+        """
+        result = await claude_sdk_driver.provision_workspace(session_id, template)
+        report = result.to_dict()
+        await self.store.update(session_id, workspace=report)
+        return report
+
+    def list_templates(self) -> list[str]:
+        """Names of available workspace templates."""
+        return claude_sdk_driver.templates.names()
+
+    async def get_session(self, session_id: str) -> Optional[dict[str, Any]]:
         """Get session info."""
-        return self._sessions.get(session_id)
-    
+        return await self.store.get(session_id)
+
+    def check_admission(self, session_id: str, api_key: Optional[str] = None) -> None:
+        """
+        Fail fast if a new run for the session cannot be queued.
+
+        Raises:
+            BudgetExceededError: If the session or API key is over budget
+            QueueFullError: If the run queue is at capacity
+        """
+        self.budgets.check(session_id, api_key)
+        self.scheduler.check_admission(session_id)
+
     async def end_session(self, session_id: str) -> None:
         """End and cleanup a session."""
-        if session_id in self._sessions:
-            del self._sessions[session_id]
-        await claude_sdk_driver.cleanup_session(session_id)
-    
+        await self.store.delete(session_id)
+        await self._runner.cleanup_session(session_id)
+
+    async def _acquire_lease(self, session_id: str) -> None:
+        """
+        Wait until this worker holds the session's run lease.
+
+        Turns of one session are already serialized within a worker by
+        the scheduler; the lease covers turns landing on other workers.
+
+        Raises:
+            SessionBusyError: If another worker holds the lease too long
+        """
+        config = claude_sdk_driver.config
+        ttl = config.timeout + config.interrupt_grace + 30
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.scheduler.config.max_wait_seconds
+        delay = 0.05
+        while not await self.store.acquire(session_id, WORKER_ID, ttl):
+            if loop.time() + delay > deadline:
+                raise SessionBusyError(
+                    "Session is busy on another worker", retry_after=1
+                )
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 1.0)
+
+    async def lookup_cached_response(
+        self,
+        message: str,
+        session_id: str,
+        model: Optional[str] = None,
+    ) -> tuple[str, Optional[CachedResponse]]:
+        """
+        Look up a cached reply for the first message of a fresh session.
+
+        The key includes the model the turn would be routed to, given the
+        client's model hint.
+
+        Returns:
+            ("HIT", entry), ("MISS", None), or ("BYPASS", None) if the
+            cache is disabled or the session already has history
+        """
+        if not self.response_cache.enabled:
+            return "BYPASS", None
+        session = await self.store.get(session_id)
+        if session is not None and session["message_count"] > 0:
+            return "BYPASS", None
+        persona = session["persona"] if session is not None else self._persona
+        key = cache_key(
+            message,
+            await self.prompts.get(persona),
+            self.router.route(message, persona, model).model,
+            self.allowed_tools,
+        )
+        entry = await self.response_cache.get(key)
+        return ("HIT", entry) if entry is not None else ("MISS", None)
+
+    async def replay_cached(
+        self,
+        message: str,
+        session_id: str,
+        cached: CachedResponse,
+    ) -> AsyncIterator[dict[str, Any]]:
+        """
+        Answer a turn from the response cache without running the agent.
+
+        The turn is counted and recorded like a normal one; a follow-up
+        message starts a new agent conversation in the same session.
+        """
+        session = await self.store.get(session_id)
+        if session is None:
+            session = await self.start_session(session_id)
+        session["message_count"] += 1
+        await self.store.put(session_id, session)
+
+        recorder = history_service.start_turn(session_id, session["message_count"], message)
+        for event in cached.events:
+            if recorder is not None:
+                recorder.event(event)
+            yield event
+        if recorder is not None:
+            recorder.finish()
+
     async def chat(
         self,
         message: str,
         session_id: str,
-        continue_conversation: bool = True
-    ) -> AsyncIterator[dict]:
+        continue_conversation: bool = True,
+        use_cache: bool = False,
+        api_key: Optional[str] = None,
+        api_key_id: Optional[str] = None,
+        budget_session_id: Optional[str] = None,
+        model: Optional[str] = None,
+    ) -> AsyncIterator[dict[str, Any]]:
         """
         Send a message and stream response.
-        
+
         Args:
             message: User message
             session_id: Session ID
             continue_conversation: Whether to continue previous context
-            
+            use_cache: Store the reply in the response cache if this is
+                the session's first turn and it succeeds
+            api_key: Caller's API key, charged (with the session) for the
+                run's usage and cost
+            api_key_id: key_id() of the caller's key, instead of api_key
+                (background jobs keep only the hash)
+            budget_session_id: Session charged instead of session_id (a
+                job retried in a fresh session keeps its original budget)
+            model: Client's model hint for routing (see routing.py)
+
         Yields:
-            Event dicts from Claude SDK driver
-        """
-        # Ensure session exists
-        if session_id not in self._sessions:
-            self.start_session(session_id)
-        
-        self._sessions[session_id]["message_count"] += 1
-        
+            {"type": "queued", "position": n} while waiting for a slot,
+            then event dicts from Claude SDK driver; the done event
+            carries the model and route the turn used
+
+        Raises:
+            BudgetExceededError: If the session or API key is over budget
+            QueueFullError: If the run queue is at capacity
+            QueueTimeoutError: If the run waited too long for a slot
+            SessionBusyError: If another worker kept the session busy
+        """
+        budget_session_id = budget_session_id or session_id
+        self.budgets.check(budget_session_id, api_key, api_key_id)
+        ticket = self.scheduler.enqueue(session_id)
+        try:
+            enqueued = time.monotonic()
+            async for position in ticket.wait():
+                yield {"type": "queued", "position": position}
+            metrics.QUEUE_WAIT.observe(time.monotonic() - enqueued)
+
+            # Ensure session exists
+            if await self.store.get(session_id) is None:
+                await self.start_session(session_id)
+            await self._acquire_lease(session_id)
+            try:
+                async for event in self._run_turn(
+                    message, session_id, continue_conversation, use_cache,
+                    api_key, api_key_id, budget_session_id, model,
+                ):
+                    yield event
+            finally:
+                await self.store.release(session_id, WORKER_ID)
+        finally:
+            ticket.release()
+
+    async def _run_turn(
+        self,
+        message: str,
+        session_id: str,
+        continue_conversation: bool,
+        use_cache: bool = False,
+        api_key: Optional[str] = None,
+        api_key_id: Optional[str] = None,
+        budget_session_id: Optional[str] = None,
+        model: Optional[str] = None,
+    ) -> AsyncIterator[dict[str, Any]]:
+        """Execute one turn while holding the session lease."""
+        session = await self.store.get(session_id)
+        if session is None:
+            # Ended while this turn waited for the lease
+            session = await self.start_session(session_id)
+        session["message_count"] += 1
+        # Set by compaction: start a new SDK session from the summary
+        restart = session.pop("restart", False)
+        if not continue_conversation:
+            session.pop("summary", None)
+        system_prompt = seed_prompt(
+            await self.prompts.get(session["persona"]), session.get("summary")
+        )
+        decision = self.router.route(message, session["persona"], model)
+
         # Determine if we should continue
         should_continue = (
-            continue_conversation and 
-            self._sessions[session_id]["message_count"] > 1
+            continue_conversation and
+            session["message_count"] > 1 and
+            not restart
         )
-        
-        async for event in claude_sdk_driver.execute(
-            message=message,
-            session_id=session_id,
-            system_prompt=self.system_prompt,
-            continue_conversation=should_continue,
-            allowed_tools=self.allowed_tools,
-        ):
-            yield event
-    
+
+        # A live client here is stale if another worker ran a turn since
+        if session.get("owner") != WORKER_ID:
+            await self._runner.hibernate(session_id)
+        session["owner"] = WORKER_ID
+        await self.store.put(session_id, session)
+
+        key = None
+        if use_cache and self.response_cache.enabled and session["message_count"] == 1:
+            key = cache_key(message, system_prompt, decision.model, self.allowed_tools)
+        collected: list[dict[str, Any]] = []
+
+        recorder = history_service.start_turn(session_id, session["message_count"], message)
+        observation = self.router.observe(decision)
+        try:
+            async for event in self._runner.execute(
+                message=message,
+                session_id=session_id,
+                system_prompt=system_prompt,
+                continue_conversation=should_continue,
+                allowed_tools=self.allowed_tools,
+                model=decision.model,
+                resume=session.get("sdk_session_id"),
+            ):
+                observation.event(event)
+                if event["type"] == "done":
+                    event = {**event, "model": decision.model, "route": decision.route}
+                if recorder is not None:
+                    recorder.event(event)
+                if event["type"] == "done":
+                    await self.budgets.charge(
+                        budget_session_id or session_id, api_key,
+                        event.get("usage"), event.get("total_cost_usd"), api_key_id,
+                    )
+                    if event.get("session_id"):
+                        session["sdk_session_id"] = event["session_id"]
+                    session["context_tokens"] = context_tokens(event.get("usage"), event.get("num_turns"))
+                    await self.store.put(session_id, session)
+                if key is not None:
+                    collected.append(event)
+                yield event
+        finally:
+            observation.finish()
+            if recorder is not None:
+                recorder.finish()
+
+        if key is not None and collected:
+            # The SDK session id belongs to this session, not to replays
+            collected[-1] = {**collected[-1], "session_id": None, "cached": True}
+            self.response_cache.put(key, collected)
+        if self.compactor.should_compact(session):
+            self.compactor.schedule(session_id)
+
     async def chat_simple(
         self,
         message: str,
-        session_id: str
+        session_id: str,
+        use_cache: bool = False,
+        cached: Optional[CachedResponse] = None,
+        api_key: Optional[str] = None,
+        model: Optional[str] = None,
     ) -> str:
         """
         Send message and get complete response.
-        
-        Non-streaming convenience method.
+
+        Non-streaming convenience method. If cached is given, the reply
+        is replayed from the response cache instead of running the agent.
         """
+        if cached is not None:
+            events = self.replay_cached(message, session_id, cached)
+        else:
+            events = self.chat(
+                message, session_id, use_cache=use_cache, api_key=api_key, model=model
+            )
         chunks = []
-        async for event in self.chat(message, session_id):
+        async for event in events:
             if event["type"] == "text":
                 chunks.append(event["content"])
             elif event["type"] == "error":
@@ -0,0 +1,335 @@
+"""
+Session Store
+
+Session records shared by all worker processes, so a follow-up message
+can be served by another worker:
+- memory: process-local (single worker, the default)
+- sqlite: a local database file shared by workers on one host
+- redis: a Redis server; "memory://" selects an in-process stand-in
+
+Only the records are shared. Workspaces and the SDK's transcripts are
+files, so a worker can only resume a session if it sees the same
+AGENT_WORKSPACE_DIR and SDK session directory (one host, or a shared
+volume). Replay buffers, interrupts and the response cache stay in
+the process that ran the turn, so stream resumes and interrupts need
+sticky routing by session id.
+
+Records are plain dicts (message count, persona, SDK session id, owning
+worker, ...). Turns take a short lease on their session so two workers
+never run the same session at once.
+"""
+
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from ...config.settings import settings
+
+STORE_BACKENDS = ("memory", "sqlite", "redis")
+
+# Identifies this process in session ownership and leases
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+# Lease scripts for Redis: check the holder and act in one atomic step
+# KEYS[1] = lease key, ARGV[1] = owner, ARGV[2] = ttl in milliseconds
+_EXTEND_LEASE = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("pexpire", KEYS[1], ARGV[2])
+end
+return 0
+"""
+_RELEASE_LEASE = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+
+@dataclass
+class SessionStoreConfig:
+    """Configuration for the session store."""
+    backend: str = settings.session_store
+    url: str = settings.session_store_url
+    # Records unused for this long may be dropped; 0 keeps them forever
+    ttl_seconds: int = settings.agent_workspace_ttl_seconds
+
+
+class SessionStore(ABC):
+    """Base class for session stores."""
+
+    @abstractmethod
+    async def get(self, session_id: str) -> Optional[dict[str, Any]]:
+        """Copy of the session record (None if missing)."""
+
+    @abstractmethod
+    async def put(self, session_id: str, record: dict[str, Any]) -> None:
+        """Store the session record, replacing any previous one."""
+
+    @abstractmethod
+    async def delete(self, session_id: str) -> None:
+        """Drop the session record and its lease."""
+
+    @abstractmethod
+    async def acquire(self, session_id: str, owner: str, ttl: float) -> bool:
+        """
+        Take the session's run lease for ttl seconds (record must exist).
+
+        Re-acquiring a lease the owner already holds extends it.
+
+        Returns:
+            False if another owner holds an unexpired lease
+        """
+
+    @abstractmethod
+    async def release(self, session_id: str, owner: str) -> None:
+        """Give up the run lease if owner still holds it."""
+
+    async def update(self, session_id: str, **fields: Any) -> Optional[dict[str, Any]]:
+        """Merge fields into an existing record; returns it (None if missing)."""
+        record = await self.get(session_id)
+        if record is None:
+            return None
+        record.update(fields)
+        await self.put(session_id, record)
+        return record
+
+    async def close(self) -> None:
+        """Release the backend's connections (nothing to do by default)."""
+        return None
+
+
+class MemorySessionStore(SessionStore):
+    """Process-local store; only correct with a single worker."""
+
+    def __init__(self) -> None:
+        self._records: dict[str, dict[str, Any]] = {}
+        self._leases: dict[str, tuple[str, float]] = {}
+
+    async def get(self, session_id: str) -> Optional[dict[str, Any]]:
+        record = self._records.get(session_id)
+        return dict(record) if record is not None else None
+
+    async def put(self, session_id: str, record: dict[str, Any]) -> None:
+        self._records[session_id] = dict(record)
+
+    async def delete(self, session_id: str) -> None:
+        self._records.pop(session_id, None)
+        self._leases.pop(session_id, None)
+
+    async def acquire(self, session_id: str, owner: str, ttl: float) -> bool:
+        now = time.monotonic()
+        lease = self._leases.get(session_id)
+        if lease is not None and lease[0] != owner and lease[1] > now:
+            return False
+        self._leases[session_id] = (owner, now + ttl)
+        return True
+
+    async def release(self, session_id: str, owner: str) -> None:
+        lease = self._leases.get(session_id)
+        if lease is not None and lease[0] == owner:
+            del self._leases[session_id]
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Store backed by a SQLite file (WAL mode), shared by local workers.
+
+    Queries run in a worker thread on one connection per store.
+    """
+
+    def __init__(self, path: str, ttl_seconds: int = 0):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._next_purge = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(
+                self.path, timeout=5.0, isolation_level=None, check_same_thread=False
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL,"
+                " lease_owner TEXT, lease_expires REAL NOT NULL DEFAULT 0)"
+            )
+            self._conn = conn
+        return self._conn
+
+    def _run(self, sql: str, params: tuple[Any, ...] = ()) -> list[Any]:
+        with self._lock:
+            cursor = self._connect().execute(sql, params)
+            return cursor.fetchall() if cursor.description else [cursor.rowcount]
+
+    async def _query(self, sql: str, params: tuple[Any, ...] = ()) -> list[Any]:
+        return await asyncio.to_thread(self._run, sql, params)
+
+    async def get(self, session_id: str) -> Optional[dict[str, Any]]:
+        rows = await self._query("SELECT data FROM sessions WHERE id = ?", (session_id,))
+        return json.loads(rows[0][0]) if rows else None
+
+    async def put(self, session_id: str, record: dict[str, Any]) -> None:
+        await self._query(
+            "INSERT INTO sessions (id, data, updated_at) VALUES (?, ?, ?)"
+            " ON CONFLICT(id) DO UPDATE SET data = excluded.data,"
+            " updated_at = excluded.updated_at",
+            (session_id, json.dumps(record), time.time()),
+        )
+        if self.ttl_seconds > 0 and time.monotonic() >= self._next_purge:
+            self._next_purge = time.monotonic() + 60
+            await self._query(
+                "DELETE FROM sessions WHERE updated_at < ? AND lease_expires < ?",
+                (time.time() - self.ttl_seconds, time.time()),
+            )
+
+    async def delete(self, session_id: str) -> None:
+        await self._query("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    async def acquire(self, session_id: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        rows = await self._query(
+            "UPDATE sessions SET lease_owner = ?, lease_expires = ?"
+            " WHERE id = ? AND (lease_owner IS NULL OR lease_owner = ? OR lease_expires < ?)",
+            (owner, now + ttl, session_id, owner, now),
+        )
+        return bool(rows[0])
+
+    async def release(self, session_id: str, owner: str) -> None:
+        await self._query(
+            "UPDATE sessions SET lease_owner = NULL, lease_expires = 0"
+            " WHERE id = ? AND lease_owner = ?",
+            (session_id, owner),
+        )
+
+    async def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class LocalRedis:
+    """
+    In-process stand-in for the subset of the redis.asyncio API used here.
+
+    For tests and single-process development; nothing is shared.
+    """
+
+    def __init__(self) -> None:
+        self._data: dict[str, tuple[str, Optional[float]]] = {}
+
+    def _live(self, key: str) -> Optional[str]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        value, expires = item
+        if expires is not None and expires <= time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    async def get(self, key: str) -> Optional[str]:
+        return self._live(key)
+
+    async def set(
+        self, key: str, value: str, px: Optional[int] = None, nx: bool = False
+    ) -> Optional[bool]:
+        if nx and self._live(key) is not None:
+            return None
+        expires = time.monotonic() + px / 1000 if px else None
+        self._data[key] = (value, expires)
+        return True
+
+    async def delete(self, *keys: str) -> int:
+        return sum(self._data.pop(key, None) is not None for key in keys)
+
+    async def eval(self, script: str, numkeys: int, *keys_and_args: Any) -> int:
+        """Run one of the lease scripts (no await inside, so atomic here too)."""
+        key, owner, *rest = keys_and_args
+        if self._live(key) != owner:
+            return 0
+        if script == _EXTEND_LEASE:
+            self._data[key] = (owner, time.monotonic() + int(rest[0]) / 1000)
+            return 1
+        if script == _RELEASE_LEASE:
+            del self._data[key]
+            return 1
+        raise NotImplementedError("LocalRedis only runs the lease scripts")
+
+    async def aclose(self) -> None:
+        self._data.clear()
+
+
+class RedisSessionStore(SessionStore):
+    """Store backed by Redis (or LocalRedis), shared across hosts."""
+
+    def __init__(self, client: Any, ttl_seconds: int = 0, prefix: str = "agent:session:"):
+        self._redis = client
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+
+    async def get(self, session_id: str) -> Optional[dict[str, Any]]:
+        data = await self._redis.get(self.prefix + session_id)
+        return json.loads(data) if data is not None else None
+
+    async def put(self, session_id: str, record: dict[str, Any]) -> None:
+        px = self.ttl_seconds * 1000 if self.ttl_seconds > 0 else None
+        await self._redis.set(self.prefix + session_id, json.dumps(record), px=px)
+
+    async def delete(self, session_id: str) -> None:
+        await self._redis.delete(self.prefix + session_id, self._lease_key(session_id))
+
+    async def acquire(self, session_id: str, owner: str, ttl: float) -> bool:
+        key = self._lease_key(session_id)
+        px = max(1, int(ttl * 1000))
+        if await self._redis.set(key, owner, px=px, nx=True):
+            return True
+        # Held: extend it only if the holder is us (compare-and-extend)
+        return bool(await self._redis.eval(_EXTEND_LEASE, 1, key, owner, px))
+
+    async def release(self, session_id: str, owner: str) -> None:
+        # Compare-and-delete, so a lease taken over after expiry is kept
+        await self._redis.eval(_RELEASE_LEASE, 1, self._lease_key(session_id), owner)
+
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+    def _lease_key(self, session_id: str) -> str:
+        return f"{self.prefix}{session_id}:lease"
+
+
+def create_session_store(config: Optional[SessionStoreConfig] = None) -> SessionStore:
+    """
+    Build the configured session store.
+
+    Raises:
+        ValueError: If the backend is unknown
+        RuntimeError: If the redis backend is selected but redis is not installed
+    """
+    config = config or SessionStoreConfig()
+    if config.backend == "memory":
+        return MemorySessionStore()
+    if config.backend == "sqlite":
+        return SQLiteSessionStore(config.url or "./sessions.db", config.ttl_seconds)
+    if config.backend == "redis":
+        url = config.url or "redis://localhost:6379/0"
+        if url.startswith("memory://"):
+            return RedisSessionStore(LocalRedis(), config.ttl_seconds)
+        try:
+            # Imported here so other backends never pay for it
+            import redis.asyncio as aioredis  # type: ignore[import-untyped]
+        except ImportError as e:  # pragma: no cover - optional dependency
+            raise RuntimeError("SESSION_STORE=redis requires the 'redis' package") from e
+        return RedisSessionStore(aioredis.from_url(url), config.ttl_seconds)
+    raise ValueError(f"Unknown session store backend: {config.backend}")
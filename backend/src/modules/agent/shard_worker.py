@@ -0,0 +1,154 @@
+"""
+Execution Shard Worker
+
+Entry point of a shard process (python -m src.modules.agent.shard_worker),
+started by ShardPool. Serves driver calls for the sessions hashed to this
+shard over stdin/stdout; see shards.py for the protocol. The process
+exits, after shutting down its driver, when stdin closes.
+
+stdout carries frames only: it is moved to a private descriptor at
+start, and anything printed goes to stderr.
+"""
+
+import asyncio
+import os
+import sys
+from typing import Any, Coroutine
+
+from ..core.metrics import registry
+from .driver import claude_sdk_driver
+from .shards import ShardError, encode_frame, read_frame
+
+
+class _Credit:
+    """Events a stream may still send before the parent acknowledges more."""
+
+    def __init__(self, window: int):
+        self.available = window
+        self._granted = asyncio.Event()
+
+    def grant(self, count: int) -> None:
+        self.available += count
+        self._granted.set()
+
+    async def take(self) -> None:
+        while self.available <= 0:
+            self._granted.clear()
+            await self._granted.wait()
+        self.available -= 1
+
+
+class ShardWorker:
+    """Dispatches frames from the parent to the driver."""
+
+    def __init__(self, index: int, writer: asyncio.StreamWriter):
+        self.index = index
+        self.writer = writer
+        self._tasks: dict[int, asyncio.Task[None]] = {}
+        self._credits: dict[int, _Credit] = {}
+
+    async def serve(self, reader: asyncio.StreamReader) -> None:
+        await claude_sdk_driver.start()
+        try:
+            while True:
+                try:
+                    frame = await read_frame(reader)
+                except asyncio.IncompleteReadError:
+                    return
+                self._dispatch(frame)
+        finally:
+            for task in self._tasks.values():
+                task.cancel()
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+            await claude_sdk_driver.shutdown()
+
+    def _dispatch(self, frame: dict[str, Any]) -> None:
+        op = frame.get("op")
+        request_id: int = frame["i"]
+        if op == "execute":
+            self._credits[request_id] = _Credit(frame["window"])
+            self._spawn(request_id, self._execute(request_id, frame["args"]))
+        elif op == "credit":
+            credit = self._credits.get(request_id)
+            if credit is not None:
+                credit.grant(frame["n"])
+        elif op == "cancel":
+            task = self._tasks.get(request_id)
+            if task is not None:
+                task.cancel()
+        elif op == "call":
+            self._spawn(request_id, self._call(request_id, frame["method"], frame.get("args") or []))
+
+    def _spawn(self, request_id: int, coro: Coroutine[Any, Any, None]) -> None:
+        task = asyncio.create_task(coro)
+        self._tasks[request_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(request_id, None))
+
+    async def _send(self, frame: dict[str, Any]) -> None:
+        self.writer.write(encode_frame(frame))
+        await self.writer.drain()
+
+    async def _execute(self, request_id: int, args: dict[str, Any]) -> None:
+        credit = self._credits[request_id]
+        try:
+            async for event in claude_sdk_driver.execute(**args):
+                await credit.take()
+                await self._send({"i": request_id, "e": event})
+        except asyncio.CancelledError:
+            # The driver has aborted the turn; the parent already stopped reading
+            pass
+        except Exception as e:
+            await self._send({"i": request_id, "e": {"type": "error", "message": str(e)}})
+        finally:
+            self._credits.pop(request_id, None)
+        await self._send({"i": request_id, "end": 1})
+
+    async def _call(self, request_id: int, method: str, args: list[Any]) -> None:
+        try:
+            result = await self._run(method, args)
+        except Exception as e:
+            await self._send({"i": request_id, "err": f"{type(e).__name__}: {e}"})
+        else:
+            await self._send({"i": request_id, "r": result})
+
+    async def _run(self, method: str, args: list[Any]) -> Any:
+        driver = claude_sdk_driver
+        if method == "ping":
+            return os.getpid()
+        if method == "hibernate":
+            return await driver.hibernate(*args)
+        if method == "cleanup_session":
+            return await driver.cleanup_session(*args)
+        if method == "warm":
+            system_prompt, allowed_tools, model = args
+            driver.pool.warm(driver.pool_key(system_prompt, allowed_tools, model))
+            return None
+        if method == "pool_stats":
+            return driver.pool.stats()
+        if method == "traces":
+            return driver.tracer.memory.traces(*args)
+        if method == "tool_stats":
+            return driver.tracer.memory.tool_stats()
+        if method == "metrics":
+            return registry.samples(shard=str(self.index))
+        raise ShardError(f"Unknown shard method {method!r}")
+
+
+async def _main() -> None:
+    loop = asyncio.get_running_loop()
+    # Frames go to a private copy of stdout; fd 1 now points at stderr
+    ipc_out = os.fdopen(os.dup(sys.stdout.fileno()), "wb", buffering=0)
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    reader = asyncio.StreamReader(limit=2 ** 20)
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin.buffer)
+    transport, protocol = await loop.connect_write_pipe(asyncio.streams.FlowControlMixin, ipc_out)
+    writer = asyncio.StreamWriter(transport, protocol, None, loop)
+
+    worker = ShardWorker(int(os.environ.get("AGENT_SHARD_INDEX", "0")), writer)
+    await worker.serve(reader)
+    transport.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,386 @@
+"""
+Execution Shards
+
+Runs the SDK driver in N worker processes so SDK message parsing, event
+mapping and tool output spilling use more than one core. Each session is
+owned by one shard (consistent hashing on the session id), so its live
+client and turns stay in one process. The API process keeps admission,
+session records, replay buffers and SSE; only driver calls cross over.
+
+IPC is one pipe pair per shard (the worker's stdin/stdout) carrying
+length-prefixed JSON frames (orjson when installed):
+
+    parent -> shard: {"op": "execute", "i": id, "args": {...}, "window": n}
+                     {"op": "credit", "i": id, "n": k}
+                     {"op": "cancel", "i": id}
+                     {"op": "call", "i": id, "method": "...", "args": [...]}
+    shard -> parent: {"i": id, "e": event}      one driver event
+                     {"i": id, "end": 1}        end of an execute stream
+                     {"i": id, "r": result}     call result
+                     {"i": id, "err": "..."}    call failed
+
+Backpressure is credit based: a shard sends at most `window` events of a
+stream beyond what the parent has consumed, and the parent returns credit
+as the consumer (replay buffer) reads. A slow stream therefore stalls its
+own run without blocking the pipe for other sessions.
+
+A shard that exits fails its open streams with an error event and is
+restarted on next use; its sessions resume from their SDK session ids.
+"""
+
+import asyncio
+import bisect
+import hashlib
+import itertools
+import json
+import os
+import struct
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, AsyncIterator, Optional
+
+from ...config.settings import settings
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None  # type: ignore[assignment]
+
+
+# Directory that contains the src package; shard workers run from it
+_APP_ROOT = Path(__file__).resolve().parents[3]
+
+_HEADER = struct.Struct(">I")
+
+# Upper bound for one frame; a corrupt length must not allocate gigabytes
+MAX_FRAME_BYTES = 256 * 1024 * 1024
+
+
+def dumps(frame: dict[str, Any]) -> bytes:
+    if orjson is not None:
+        try:
+            return orjson.dumps(frame)
+        except TypeError:
+            pass
+    return json.dumps(frame).encode("utf-8")
+
+
+def loads(data: bytes) -> dict[str, Any]:
+    frame: dict[str, Any] = orjson.loads(data) if orjson is not None else json.loads(data)
+    return frame
+
+
+def encode_frame(frame: dict[str, Any]) -> bytes:
+    data = dumps(frame)
+    return _HEADER.pack(len(data)) + data
+
+
+async def read_frame(reader: asyncio.StreamReader) -> dict[str, Any]:
+    """
+    Read one frame.
+
+    Raises:
+        asyncio.IncompleteReadError: At end of stream
+        ValueError: If the frame length is implausible
+    """
+    (size,) = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    if size > MAX_FRAME_BYTES:
+        raise ValueError(f"IPC frame of {size} bytes exceeds the limit")
+    return loads(await reader.readexactly(size))
+
+
+@dataclass
+class ShardConfig:
+    """Configuration for execution shards."""
+    # Worker processes; 0 runs the driver in the API process
+    shards: int = settings.agent_shards
+    # Events a shard may send per stream before waiting for credit
+    window_events: int = settings.agent_shard_window_events
+    # Virtual nodes per shard on the hash ring
+    vnodes: int = 64
+    # Seconds to wait for a new shard to answer
+    start_timeout: float = 30.0
+    # Seconds to wait for a shard to exit on shutdown before killing it
+    stop_timeout: float = 10.0
+
+
+class HashRing:
+    """Consistent hashing of keys onto nodes 0..n-1."""
+
+    def __init__(self, nodes: int, vnodes: int = 64):
+        points = sorted(
+            (self._hash(f"{node}:{replica}"), node)
+            for node in range(nodes)
+            for replica in range(vnodes)
+        )
+        self._hashes = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+    def node(self, key: str) -> int:
+        index = bisect.bisect(self._hashes, self._hash(key)) % len(self._hashes)
+        return self._nodes[index]
+
+
+class ShardError(RuntimeError):
+    """A shard call failed or the shard process went away."""
+
+
+class _Stream:
+    """Parent side of one execute call."""
+
+    def __init__(self) -> None:
+        self.queue: asyncio.Queue[Optional[dict[str, Any]]] = asyncio.Queue()
+        self.unacked = 0
+
+
+class ShardProcess:
+    """One shard worker process and its IPC channel."""
+
+    def __init__(self, index: int, config: ShardConfig):
+        self.index = index
+        self.config = config
+        self.restarts = 0
+        self._process: Optional[asyncio.subprocess.Process] = None
+        self._reader_task: Optional[asyncio.Task[None]] = None
+        self._streams: dict[int, _Stream] = {}
+        self._calls: dict[int, asyncio.Future[Any]] = {}
+        self._ids = itertools.count(1)
+        self._lock = asyncio.Lock()
+        self._started = False
+
+    @property
+    def alive(self) -> bool:
+        """Whether the channel is open (the reader sees EOF before the exit is reaped)."""
+        return self._reader_task is not None and not self._reader_task.done()
+
+    async def start(self) -> None:
+        """Start the worker if it is not running (restart after a crash)."""
+        async with self._lock:
+            if self.alive:
+                return
+            if self._started:
+                self.restarts += 1
+                await self._reap()
+            self._started = True
+            env = {
+                **os.environ,
+                "AGENT_SHARDS": "0",
+                "AGENT_SHARD_INDEX": str(self.index),
+            }
+            self._process = await asyncio.create_subprocess_exec(
+                sys.executable, "-m", "src.modules.agent.shard_worker",
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                cwd=str(_APP_ROOT),
+                env=env,
+            )
+            self._reader_task = asyncio.create_task(self._read(self._process))
+        async with asyncio.timeout(self.config.start_timeout):
+            await self.call("ping")
+
+    async def _reap(self) -> None:
+        process = self._process
+        if process is not None and process.returncode is None:
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+            await process.wait()
+
+    async def stop(self) -> None:
+        """Close the channel and wait for the worker to shut down its driver."""
+        process = self._process
+        if process is None:
+            return
+        if process.returncode is None:
+            if process.stdin is not None:
+                process.stdin.close()
+            try:
+                async with asyncio.timeout(self.config.stop_timeout):
+                    await process.wait()
+            except TimeoutError:
+                await self._reap()
+        if self._reader_task is not None:
+            await asyncio.gather(self._reader_task, return_exceptions=True)
+
+    async def _read(self, process: asyncio.subprocess.Process) -> None:
+        assert process.stdout is not None
+        try:
+            while True:
+                frame = await read_frame(process.stdout)
+                request_id: int = frame["i"]
+                if "e" in frame:
+                    stream = self._streams.get(request_id)
+                    if stream is not None:
+                        stream.queue.put_nowait(frame["e"])
+                elif "end" in frame:
+                    stream = self._streams.get(request_id)
+                    if stream is not None:
+                        stream.queue.put_nowait(None)
+                else:
+                    future = self._calls.pop(request_id, None)
+                    if future is None or future.done():
+                        continue
+                    if "err" in frame:
+                        future.set_exception(ShardError(frame["err"]))
+                    else:
+                        future.set_result(frame.get("r"))
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            self._fail_all(f"Agent shard {self.index} exited")
+
+    def _fail_all(self, message: str) -> None:
+        for stream in self._streams.values():
+            stream.queue.put_nowait({"type": "error", "message": message})
+            stream.queue.put_nowait(None)
+        for future in self._calls.values():
+            if not future.done():
+                future.set_exception(ShardError(message))
+        self._calls.clear()
+
+    def _stdin(self) -> Optional[asyncio.StreamWriter]:
+        if not self.alive or self._process is None:
+            return None
+        return self._process.stdin
+
+    def _send_nowait(self, frame: dict[str, Any]) -> None:
+        stdin = self._stdin()
+        if stdin is not None:
+            stdin.write(encode_frame(frame))
+
+    async def _send(self, frame: dict[str, Any]) -> None:
+        stdin = self._stdin()
+        if stdin is None:
+            raise ShardError(f"Agent shard {self.index} is not running")
+        stdin.write(encode_frame(frame))
+        await stdin.drain()
+
+    async def call(self, method: str, *args: Any) -> Any:
+        """
+        Run a driver method in the shard.
+
+        Raises:
+            ShardError: If the call failed or the shard went away
+        """
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._calls[request_id] = future
+        try:
+            await self._send({"op": "call", "i": request_id, "method": method, "args": list(args)})
+            return await future
+        finally:
+            self._calls.pop(request_id, None)
+
+    async def execute(self, **kwargs: Any) -> AsyncIterator[dict[str, Any]]:
+        """Stream driver.execute(**kwargs) from the shard."""
+        await self.start()
+        request_id = next(self._ids)
+        stream = _Stream()
+        self._streams[request_id] = stream
+        window = max(1, self.config.window_events)
+        ended = False
+        try:
+            try:
+                await self._send({"op": "execute", "i": request_id, "args": kwargs, "window": window})
+            except (ShardError, ConnectionError) as e:
+                ended = True
+                yield {"type": "error", "message": str(e)}
+                return
+            while True:
+                event = await stream.queue.get()
+                if event is None:
+                    ended = True
+                    return
+                # Return credit in batches, once half the window is consumed
+                stream.unacked += 1
+                if stream.unacked * 2 >= window:
+                    self._send_nowait({"op": "credit", "i": request_id, "n": stream.unacked})
+                    stream.unacked = 0
+                yield event
+        finally:
+            self._streams.pop(request_id, None)
+            if not ended:
+                # Consumer went away (client gone, interrupt): stop the run
+                self._send_nowait({"op": "cancel", "i": request_id})
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "shard": self.index,
+            "pid": self._process.pid if self._process is not None else None,
+            "alive": self.alive,
+            "restarts": self.restarts,
+            "streams": len(self._streams),
+        }
+
+
+class ShardPool:
+    """Routes driver calls to the shard owning each session."""
+
+    def __init__(self, config: Optional[ShardConfig] = None):
+        self.config = config or ShardConfig()
+        self.shards = [ShardProcess(i, self.config) for i in range(max(0, self.config.shards))]
+        self.ring = HashRing(len(self.shards), self.config.vnodes) if self.shards else None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.shards)
+
+    async def start(self) -> None:
+        await asyncio.gather(*(shard.start() for shard in self.shards))
+
+    async def shutdown(self) -> None:
+        await asyncio.gather(*(shard.stop() for shard in self.shards))
+
+    def shard_for(self, session_id: str) -> ShardProcess:
+        if self.ring is None:
+            raise RuntimeError("Execution shards are disabled")
+        return self.shards[self.ring.node(session_id)]
+
+    def execute(self, message: str, session_id: str, **kwargs: Any) -> AsyncIterator[dict[str, Any]]:
+        """Same contract as ClaudeSDKDriver.execute, run in the session's shard."""
+        return self.shard_for(session_id).execute(message=message, session_id=session_id, **kwargs)
+
+    async def _call(self, session_id: str, method: str, *args: Any) -> Any:
+        shard = self.shard_for(session_id)
+        await shard.start()
+        return await shard.call(method, *args)
+
+    async def hibernate(self, session_id: str) -> bool:
+        return bool(await self._call(session_id, "hibernate", session_id))
+
+    async def cleanup_session(self, session_id: str) -> None:
+        await self._call(session_id, "cleanup_session", session_id)
+
+    async def call_all(self, method: str, *args: Any) -> list[dict[str, Any]]:
+        """Call a method on every shard; failures are reported per shard."""
+        async def one(shard: ShardProcess) -> dict[str, Any]:
+            try:
+                await shard.start()
+                return {"shard": shard.index, "result": await shard.call(method, *args)}
+            except (ShardError, OSError, TimeoutError) as e:
+                return {"shard": shard.index, "error": str(e)}
+
+        return list(await asyncio.gather(*(one(shard) for shard in self.shards)))
+
+    async def metric_samples(self) -> Optional[dict[str, list[str]]]:
+        """Metric samples of all shards (labelled by shard), for /metrics."""
+        if not self.enabled:
+            return None
+        merged: dict[str, list[str]] = {}
+        for reply in await self.call_all("metrics"):
+            for name, lines in (reply.get("result") or {}).items():
+                merged.setdefault(name, []).extend(lines)
+        return merged
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "window_events": self.config.window_events,
+            "shards": [shard.stats() for shard in self.shards],
+        }
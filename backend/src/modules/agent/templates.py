@@ -0,0 +1,171 @@
+"""
+Workspace Templates
+
+Named, pre-seeded workspaces (reference files, scripts) that are cloned
+into a session workspace instead of copied byte for byte.
+
+Each template is a directory under the templates root. Files are cloned
+with the cheapest method available:
+- reflink: copy-on-write clone (btrfs, XFS, APFS-style filesystems)
+- hardlink: shares the inode; only safe for files the agent never edits
+- copy: regular copy (kernel-side copy where supported)
+
+In "auto" mode reflinks are tried first and copying is used once the
+filesystem reports it cannot clone.
+
+Symbolic links, to files or directories, are recreated with the same
+target rather than followed.
+"""
+
+import asyncio
+import errno
+import os
+import shutil
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Optional
+
+from ...config.settings import settings
+from .exceptions import TemplateNotFoundError
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None  # type: ignore[assignment]
+
+# ioctl request code for FICLONE (linux/fs.h)
+FICLONE = 0x40049409
+
+CLONE_MODES = ("auto", "reflink", "hardlink", "copy")
+
+_UNSUPPORTED = {errno.EOPNOTSUPP, errno.EXDEV, errno.EINVAL, errno.ENOTTY, errno.EPERM}
+
+
+@dataclass
+class TemplateConfig:
+    """Configuration for workspace templates."""
+    templates_dir: str = settings.agent_templates_dir
+    clone_mode: str = settings.agent_template_clone_mode
+
+
+@dataclass
+class ProvisionResult:
+    """What provisioning a template cost."""
+    template: str
+    mode: str
+    files: int = 0
+    bytes: int = 0
+    # Bytes that were physically copied (new disk usage)
+    bytes_copied: int = 0
+    duration_ms: float = 0.0
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "template": self.template,
+            "mode": self.mode,
+            "files": self.files,
+            "bytes": self.bytes,
+            "bytes_copied": self.bytes_copied,
+            "duration_ms": round(self.duration_ms, 2),
+        }
+
+
+class TemplateManager:
+    """Lists templates and provisions them into session workspaces."""
+
+    def __init__(self, config: Optional[TemplateConfig] = None):
+        self.config = config or TemplateConfig()
+        if self.config.clone_mode not in CLONE_MODES:
+            raise ValueError(f"Unknown template clone mode: {self.config.clone_mode}")
+        self.root = Path(self.config.templates_dir).resolve()
+
+    def names(self) -> list[str]:
+        """Names of available templates."""
+        if not self.root.is_dir():
+            return []
+        return sorted(
+            entry.name for entry in os.scandir(self.root)
+            if entry.is_dir() and not entry.name.startswith(".")
+        )
+
+    def get_path(self, name: str) -> Path:
+        """
+        Resolve a template directory.
+
+        Raises:
+            TemplateNotFoundError: If the template does not exist
+        """
+        path = (self.root / name).resolve()
+        if path.parent != self.root or not path.is_dir() or name.startswith("."):
+            raise TemplateNotFoundError(f"Unknown workspace template: {name}")
+        return path
+
+    async def provision(self, name: str, workspace: Path) -> ProvisionResult:
+        """
+        Clone template name into workspace (created if missing).
+
+        Raises:
+            TemplateNotFoundError: If the template does not exist
+        """
+        source = self.get_path(name)
+        return await asyncio.to_thread(self._clone_tree, name, source, workspace)
+
+    def _clone_tree(self, name: str, source: Path, workspace: Path) -> ProvisionResult:
+        started = time.perf_counter()
+        mode = self.config.clone_mode
+        if mode == "auto":
+            mode = "reflink" if fcntl is not None else "copy"
+        result = ProvisionResult(template=name, mode=mode)
+
+        workspace.mkdir(parents=True, exist_ok=True)
+        for dirpath, dirnames, filenames in os.walk(source):
+            relative = Path(dirpath).relative_to(source)
+            target_dir = workspace / relative
+            for dirname in dirnames:
+                src_dir = Path(dirpath) / dirname
+                if src_dir.is_symlink():
+                    # os.walk lists links to directories but does not enter them
+                    os.symlink(os.readlink(src_dir), target_dir / dirname, target_is_directory=True)
+                else:
+                    (target_dir / dirname).mkdir(exist_ok=True)
+            for filename in filenames:
+                src = Path(dirpath) / filename
+                dst = target_dir / filename
+                if src.is_symlink():
+                    os.symlink(os.readlink(src), dst)
+                    continue
+                size = src.stat().st_size
+                used = self._clone_file(src, dst, result.mode)
+                if used != result.mode and self.config.clone_mode == "auto":
+                    # Filesystem can't clone; don't retry for every file
+                    result.mode = used
+                result.files += 1
+                result.bytes += size
+                if used == "copy":
+                    result.bytes_copied += size
+
+        result.duration_ms = (time.perf_counter() - started) * 1000
+        return result
+
+    @staticmethod
+    def _clone_file(src: Path, dst: Path, mode: str) -> str:
+        """Clone one file; returns the method actually used."""
+        if mode == "reflink" and fcntl is not None:
+            try:
+                with open(src, "rb") as s, open(dst, "wb") as d:
+                    fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+                shutil.copystat(src, dst)
+                return "reflink"
+            except OSError as e:
+                if e.errno not in _UNSUPPORTED:
+                    raise
+        elif mode == "hardlink":
+            try:
+                os.link(src, dst)
+                return "hardlink"
+            except OSError as e:
+                if e.errno not in _UNSUPPORTED:
+                    raise
+        shutil.copy2(src, dst)
+        return "copy"
@@ -0,0 +1,127 @@
+"""
+Tool Output Spilling
+
+Tool results larger than a threshold are written to the session
+workspace instead of travelling inside events. The event keeps a short
+preview plus a reference; the full content is served by the chat API
+with HTTP range support. This bounds event size, replay buffer and
+history rows no matter what a tool prints.
+
+Files live in the session workspace, so they are removed together with
+it (session deletion or the workspace TTL sweep). Sessions without a
+plain workspace directory (ids starting with a dot or containing a path
+separator) cannot hold spilled files; their outputs are truncated to the
+preview instead.
+"""
+
+import asyncio
+import os
+import re
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Optional
+
+from ...config.settings import settings
+from .workspace import WorkspaceManager
+
+OUTPUTS_DIR = ".tool_outputs"
+
+# Output ids become file names; tool_use ids already match this
+_OUTPUT_ID = re.compile(r"^[A-Za-z0-9_-]{1,128}$")
+
+
+@dataclass
+class ToolOutputConfig:
+    """Configuration for spilling large tool outputs."""
+    # Outputs longer than this (characters) are spilled; 0 disables
+    spill_chars: int = settings.agent_tool_output_spill_chars
+    preview_chars: int = settings.agent_tool_output_preview_chars
+
+
+class ToolOutputStore:
+    """Writes large tool outputs to disk and resolves references to them."""
+
+    def __init__(self, workspaces: WorkspaceManager, config: Optional[ToolOutputConfig] = None):
+        self.config = config or ToolOutputConfig()
+        self.workspaces = workspaces
+        self.spilled = 0
+        self.spilled_bytes = 0
+        self.truncated = 0
+
+    def should_spill(self, output: str) -> bool:
+        """Whether an output is too long to send inline."""
+        return 0 < self.config.spill_chars < len(output)
+
+    async def spill(self, session_id: str, event: dict[str, Any]) -> dict[str, Any]:
+        """
+        Write a tool_result's output to disk.
+
+        Returns:
+            The event with output replaced by a preview and an output_ref
+            ({"id", "size"}; size in bytes), or, if the session has no
+            plain workspace directory, with the preview and truncated: true
+        """
+        output = event["output"]
+        output_id = event.get("tool_use_id") or ""
+        if not _OUTPUT_ID.match(output_id):
+            output_id = uuid.uuid4().hex
+        try:
+            path = self.path(session_id, output_id)
+        except ValueError:
+            self.truncated += 1
+            return {**event, "output": output[:self.config.preview_chars], "truncated": True}
+        size = await asyncio.to_thread(self._write, path, output)
+        self.spilled += 1
+        self.spilled_bytes += size
+        return {
+            **event,
+            "output": output[:self.config.preview_chars],
+            "output_ref": {"id": output_id, "size": size},
+        }
+
+    async def shrink(self, session_id: str, event: dict[str, Any]) -> dict[str, Any]:
+        """
+        Spill any output longer than the preview, regardless of spill_chars.
+
+        Used to relieve slow streams; events without a long output are
+        returned unchanged.
+        """
+        output = event.get("output")
+        if "output_ref" in event or not isinstance(output, str) or len(output) <= self.config.preview_chars:
+            return event
+        return await self.spill(session_id, event)
+
+    def path(self, session_id: str, output_id: str) -> Path:
+        """
+        File holding a spilled output (no I/O).
+
+        Raises:
+            ValueError: If the output id is not a plain name, or the session
+                workspace is not a plain directory under the workspace root
+        """
+        if not _OUTPUT_ID.match(output_id):
+            raise ValueError("Invalid output reference")
+        workspace = self.workspaces.path(session_id)
+        # Dot names are the root itself, its parent or the trash and pool
+        if session_id.startswith(".") or "\0" in session_id or workspace.parent != self.workspaces.base_dir:
+            raise ValueError("Invalid output reference")
+        return workspace / OUTPUTS_DIR / f"{output_id}.txt"
+
+    @staticmethod
+    def _write(path: Path, output: str) -> int:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = output.encode("utf-8")
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        return len(data)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "spill_chars": self.config.spill_chars,
+            "spilled": self.spilled,
+            "spilled_bytes": self.spilled_bytes,
+            "truncated": self.truncated,
+        }
@@ -0,0 +1,219 @@
+"""
+Run Tracing
+
+Span timings for agent runs: connect, query, first token, each tool call
+and the result. Tool spans are opened on tool_use and closed by the
+tool_result carrying the same id, so slow tools show up by name.
+
+Finished traces are handed to exporters:
+- InMemoryExporter: bounded ring of recent spans, served by the admin API
+- FileExporter: JSON lines appended in a worker thread
+"""
+
+import asyncio
+import json
+import time
+import uuid
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Optional
+
+from ...config.settings import settings
+from . import metrics
+
+
+@dataclass
+class TracingConfig:
+    """Configuration for run tracing."""
+    enabled: bool = settings.tracing_enabled
+    # Spans kept in memory for the admin API
+    buffer_spans: int = settings.tracing_buffer_spans
+    # JSON lines file, empty = no file export
+    file: str = settings.tracing_file
+
+
+@dataclass
+class Span:
+    """A timed step of a run."""
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    session_id: str
+    start_time: float  # wall clock
+    duration_ms: Optional[float] = None
+    attributes: dict[str, Any] = field(default_factory=dict)
+    _started: float = field(default=0.0, repr=False)
+
+    def end(self, **attributes: Any) -> "Span":
+        if self.duration_ms is None:
+            self.duration_ms = round((time.perf_counter() - self._started) * 1000, 3)
+        self.attributes.update(attributes)
+        return self
+
+    def to_dict(self) -> dict[str, Any]:
+        data = asdict(self)
+        del data["_started"]
+        return data
+
+
+class RunTrace:
+    """Spans of one run, with open tool calls indexed by tool_use id."""
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.trace_id = uuid.uuid4().hex
+        self.spans: list[Span] = []
+        self.root = self.start("run")
+        self._tools: dict[str, Span] = {}
+
+    def start(self, name: str, **attributes: Any) -> Span:
+        span = Span(
+            name=name,
+            trace_id=self.trace_id,
+            span_id=uuid.uuid4().hex[:16],
+            parent_id=self.root.span_id if self.spans else None,
+            session_id=self.session_id,
+            start_time=time.time(),
+            attributes=attributes,
+            _started=time.perf_counter(),
+        )
+        self.spans.append(span)
+        return span
+
+    def tool_started(self, tool_use_id: str, tool: str) -> None:
+        self._tools[tool_use_id] = self.start("tool", tool=tool, tool_use_id=tool_use_id)
+
+    def tool_finished(self, tool_use_id: str, is_error: bool) -> Optional[Span]:
+        """Close the tool span opened for this id (None if unknown)."""
+        span = self._tools.pop(tool_use_id, None)
+        if span is None:
+            return None
+        span.end(is_error=is_error)
+        metrics.TOOL_CALLS.inc(span.attributes["tool"], "error" if is_error else "ok")
+        metrics.TOOL_SECONDS.inc(span.attributes["tool"], amount=(span.duration_ms or 0.0) / 1000)
+        return span
+
+    def finish(self, outcome: str) -> None:
+        """End the run; tool calls still open were cut short."""
+        for span in self._tools.values():
+            span.end(incomplete=True)
+            metrics.TOOL_CALLS.inc(span.attributes["tool"], "incomplete")
+        self._tools.clear()
+        for span in self.spans:
+            if span.duration_ms is None and span is not self.root:
+                span.end(incomplete=True)
+        self.root.end(outcome=outcome)
+
+
+class InMemoryExporter:
+    """Keeps the most recent spans."""
+
+    def __init__(self, max_spans: int):
+        self._spans: deque[Span] = deque(maxlen=max_spans)
+
+    def export(self, spans: list[Span]) -> None:
+        self._spans.extend(spans)
+
+    def traces(self, session_id: Optional[str] = None, limit: int = 20) -> list[dict[str, Any]]:
+        """Most recent traces first, each with its spans in start order."""
+        grouped: dict[str, list[Span]] = {}
+        for span in reversed(self._spans):
+            if session_id is not None and span.session_id != session_id:
+                continue
+            if span.trace_id not in grouped:
+                if len(grouped) >= limit:
+                    break
+                grouped[span.trace_id] = []
+            grouped[span.trace_id].append(span)
+        return [
+            {
+                "trace_id": trace_id,
+                "session_id": spans[0].session_id,
+                "spans": [span.to_dict() for span in reversed(spans)],
+            }
+            for trace_id, spans in grouped.items()
+        ]
+
+    def tool_stats(self) -> dict[str, dict[str, Any]]:
+        """Per-tool call count, error count and latency over buffered spans."""
+        durations: dict[str, list[float]] = {}
+        errors: dict[str, int] = {}
+        for span in self._spans:
+            if span.name != "tool" or span.duration_ms is None:
+                continue
+            tool = span.attributes["tool"]
+            durations.setdefault(tool, []).append(span.duration_ms)
+            if span.attributes.get("is_error"):
+                errors[tool] = errors.get(tool, 0) + 1
+        stats = {}
+        for tool, values in sorted(durations.items(), key=lambda item: -sum(item[1])):
+            values.sort()
+            stats[tool] = {
+                "calls": len(values),
+                "errors": errors.get(tool, 0),
+                "total_ms": round(sum(values), 3),
+                "p50_ms": values[len(values) // 2],
+                "p99_ms": values[min(len(values) - 1, int(len(values) * 0.99))],
+                "max_ms": values[-1],
+            }
+        return stats
+
+
+class FileExporter:
+    """Appends spans as JSON lines without blocking the event loop."""
+
+    def __init__(self, path: str):
+        self.path = Path(path).resolve()
+        self._pending: list[str] = []
+        self._task: Optional[asyncio.Task[None]] = None
+
+    def export(self, spans: list[Span]) -> None:
+        self._pending.extend(json.dumps(span.to_dict(), ensure_ascii=False) for span in spans)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._drain())
+
+    async def _drain(self) -> None:
+        while self._pending:
+            lines, self._pending = self._pending, []
+            await asyncio.to_thread(self._write, lines)
+
+    def _write(self, lines: list[str]) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    async def close(self) -> None:
+        if self._task is not None:
+            await self._task
+
+
+class Tracer:
+    """Creates run traces and exports them when they finish."""
+
+    def __init__(self, config: Optional[TracingConfig] = None):
+        self.config = config or TracingConfig()
+        self.memory = InMemoryExporter(self.config.buffer_spans)
+        self.file = FileExporter(self.config.file) if self.config.file else None
+
+    @property
+    def enabled(self) -> bool:
+        return self.config.enabled
+
+    def start_run(self, session_id: str) -> Optional[RunTrace]:
+        """A new trace, or None when tracing is disabled."""
+        return RunTrace(session_id) if self.enabled else None
+
+    def finish(self, trace: Optional[RunTrace], outcome: str) -> None:
+        if trace is None:
+            return
+        trace.finish(outcome)
+        self.memory.export(trace.spans)
+        if self.file is not None:
+            self.file.export(trace.spans)
+
+    async def close(self) -> None:
+        """Wait for pending file writes."""
+        if self.file is not None:
+            await self.file.close()
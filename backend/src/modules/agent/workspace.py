@@ -0,0 +1,224 @@
+"""
+Session Workspaces
+
+Creates and removes per-session workspace directories without blocking
+the event loop:
+- Directory creation runs in a worker thread, once per session
+- Removal renames the directory into a trash folder (cheap) and a
+  background janitor deletes it later
+- The janitor also sweeps orphaned directories older than a TTL
+
+Several processes (workers, agent shards) may share the workspace root,
+and each runs its own janitor that only knows its own sessions. The
+modification time of a directory therefore serves as a lease: every
+janitor round touches the workspaces its process is using and its pool
+staging directories, at least every TTL/3, so other janitors skip them.
+Edits deep inside a workspace do not change the directory's mtime, so
+an unused workspace expires a TTL after its last use, not its last edit.
+
+A session workspace is either a directory or, for sessions served by the
+client pool, a symlink to the pooled client's directory under .pool/
+(see pool.py). Removal and sweeping take both forms.
+"""
+
+import asyncio
+import os
+import shutil
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Collection, Optional
+
+from ...config.settings import settings
+
+TRASH_DIR = ".trash"
+POOL_DIR = ".pool"
+
+
+@dataclass
+class WorkspaceConfig:
+    """Configuration for workspace lifecycle."""
+    # Orphaned workspaces untouched for this long are removed; 0 disables
+    ttl_seconds: int = settings.agent_workspace_ttl_seconds
+    janitor_interval_seconds: int = settings.agent_janitor_interval_seconds
+
+
+class WorkspaceManager:
+    """
+    Owns the directories under the agent workspace root.
+
+    is_active tells the sweeper which session directories must be kept
+    regardless of age, staged lists the client pool's staging directories;
+    both are kept and touched every round. on_removed is called for every
+    swept session.
+    """
+
+    def __init__(
+        self,
+        base_dir: Path,
+        config: Optional[WorkspaceConfig] = None,
+        is_active: Optional[Callable[[str], bool]] = None,
+        staged: Optional[Callable[[], Collection[str]]] = None,
+        on_removed: Optional[Callable[[str], None]] = None,
+    ):
+        self.config = config or WorkspaceConfig()
+        self.base_dir = base_dir
+        self.trash_dir = base_dir / TRASH_DIR
+        self.pool_dir = base_dir / POOL_DIR
+        self._is_active = is_active or (lambda name: False)
+        self._staged = staged or frozenset
+        self._on_removed = on_removed
+        self._known: set[str] = set()
+        self._janitor_task: Optional[asyncio.Task[None]] = None
+        self._wake = asyncio.Event()
+
+    def path(self, session_id: str) -> Path:
+        """Workspace path for a session (no I/O)."""
+        return self.base_dir / session_id
+
+    async def ensure(self, session_id: str) -> Path:
+        """Create the session workspace if needed."""
+        workspace = self.path(session_id)
+        if session_id not in self._known:
+            await asyncio.to_thread(workspace.mkdir, parents=True, exist_ok=True)
+            self._known.add(session_id)
+            self.ensure_janitor()
+        return workspace
+
+    async def resolve(self, session_id: str) -> Path:
+        """
+        Real path of the session workspace, created if needed.
+        SDK clients connect here: a pooled workspace is a symlink, and
+        the CLI keys transcripts and permissions by the real directory.
+        """
+        workspace = await self.ensure(session_id)
+        return Path(await asyncio.to_thread(os.path.realpath, workspace))
+
+    def adopt(self, session_id: str) -> None:
+        """Record a workspace created elsewhere (e.g. by the client pool)."""
+        self._known.add(session_id)
+        self.ensure_janitor()
+
+    async def remove(self, session_id: str) -> None:
+        """Move the session workspace to the trash; the janitor deletes it."""
+        self._known.discard(session_id)
+        await asyncio.to_thread(self._move_to_trash, self.path(session_id))
+        self.ensure_janitor()
+        self._wake.set()
+
+    async def close(self) -> None:
+        if self._janitor_task is not None:
+            self._janitor_task.cancel()
+
+    def ensure_janitor(self) -> None:
+        """Start the janitor task on first use."""
+        if self._janitor_task is None or self._janitor_task.done():
+            self._janitor_task = asyncio.create_task(self._janitor())
+
+    async def _janitor(self) -> None:
+        """Empty the trash and sweep expired workspaces, forever."""
+        interval: float = self.config.janitor_interval_seconds
+        if self.config.ttl_seconds > 0:
+            # Leases must be renewed well within the TTL
+            interval = min(interval, self.config.ttl_seconds / 3)
+        while True:
+            # Cleared before the round, so a wake-up during it is not lost
+            self._wake.clear()
+            try:
+                await asyncio.to_thread(self._empty_trash)
+                if self.config.ttl_seconds > 0:
+                    await asyncio.to_thread(self._touch, self._in_use())
+                    swept = await asyncio.to_thread(self._sweep_expired)
+                    for session_id in swept:
+                        self._known.discard(session_id)
+                        if self._on_removed is not None:
+                            self._on_removed(session_id)
+                    if swept:
+                        await asyncio.to_thread(self._empty_trash)
+            except OSError:
+                # Disk hiccups must not kill the janitor; retry next round
+                pass
+            try:
+                async with asyncio.timeout(interval):
+                    await self._wake.wait()
+            except TimeoutError:
+                pass
+
+    def _in_use(self) -> list[Path]:
+        """Directories this process is using (read on the event loop)."""
+        paths = [self.path(session_id) for session_id in self._known if self._is_active(session_id)]
+        paths.extend(self.pool_dir / name for name in list(self._staged()))
+        return paths
+
+    @staticmethod
+    def _touch(paths: list[Path]) -> None:
+        """Renew the leases (mtimes) of directories in use."""
+        for path in paths:
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                pass
+
+    def _move_to_trash(self, workspace: Path) -> None:
+        if workspace.is_symlink():
+            # Pooled workspace: drop the link first, then trash its directory
+            target = Path(os.path.realpath(workspace))
+            os.unlink(workspace)
+            workspace = target
+        if not workspace.exists():
+            return
+        self.trash_dir.mkdir(parents=True, exist_ok=True)
+        os.rename(workspace, self.trash_dir / f"{workspace.name}-{uuid.uuid4().hex[:8]}")
+
+    def _empty_trash(self) -> None:
+        if not self.trash_dir.exists():
+            return
+        for entry in os.scandir(self.trash_dir):
+            if entry.is_dir(follow_symlinks=False):
+                shutil.rmtree(entry.path, ignore_errors=True)
+            else:
+                os.unlink(entry.path)
+
+    def _sweep_expired(self) -> list[str]:
+        """
+        Trash workspaces older than the TTL that are not in use.
+
+        Returns:
+            Session ids whose workspace was swept
+        """
+        cutoff = time.time() - self.config.ttl_seconds
+        staged = set(self._staged())
+        swept: list[str] = []
+        # Pool directories that are session workspaces (symlink targets)
+        linked: set[str] = set()
+        for entry in os.scandir(self.base_dir):
+            if entry.name.startswith("."):
+                continue
+            if entry.is_symlink():
+                target = Path(os.path.realpath(entry.path))
+                if target.parent == self.pool_dir:
+                    linked.add(target.name)
+            elif not entry.is_dir(follow_symlinks=False):
+                continue
+            if self._is_active(entry.name):
+                continue
+            try:
+                mtime = entry.stat().st_mtime
+            except FileNotFoundError:
+                # Link to a directory that is gone
+                mtime = 0.0
+            if mtime >= cutoff:
+                continue
+            self._move_to_trash(Path(entry.path))
+            swept.append(entry.name)
+
+        # Staging directories left behind by a previous process
+        if self.pool_dir.exists():
+            for entry in os.scandir(self.pool_dir):
+                if entry.name in staged or entry.name in linked:
+                    continue
+                if entry.stat(follow_symlinks=False).st_mtime >= cutoff:
+                    continue
+                self._move_to_trash(Path(entry.path))
+        return swept
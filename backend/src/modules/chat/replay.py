@@ -0,0 +1,538 @@
+"""
+Replayable Event Streams
+
+Agent runs execute in background tasks and write their SSE frames into a
+bounded per-session ring buffer. HTTP responses only read from the buffer,
+so a dropped connection loses nothing: the client reconnects with
+Last-Event-ID and receives the missed frames without re-running the agent.
+
+Frames get monotonically increasing ids per session (across runs).
+Buffers of finished runs are kept for a retention period; memory use is
+tracked per buffer and capped globally. Buffers live in the process that
+ran the turn: with several workers, stream resumes must be routed to the
+same worker (sticky routing by session id).
+
+Runs that nobody is listening to are cancelled once no stream has been
+attached for disconnect_grace_seconds, so abandoned requests stop
+consuming tokens and agent slots.
+
+Backpressure: the bytes recorded but not yet sent to the slowest
+attached stream are bounded by max_pending_bytes. Past the bound the run
+applies the overflow policy before waiting for the stream to drain to
+half the bound:
+- block: wait
+- coalesce: merge text into the last unsent text frame, wait for others
+- reference: spill large tool outputs to disk (preview + output_ref), wait
+"""
+
+import asyncio
+import itertools
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+from ...config.settings import settings
+from ..agent.driver import claude_sdk_driver
+from ..core.metrics import registry
+from .sse import SSEEncoder, sse_encoder
+
+OVERFLOW_POLICIES = ("block", "coalesce", "reference")
+
+# Bytes; from a few frames up to a badly stalled stream
+PENDING_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+PENDING_HIGH_WATER = registry.histogram(
+    "chat_stream_pending_high_water_bytes",
+    "Most bytes waiting for the slowest attached stream, per run",
+    buckets=PENDING_BUCKETS,
+)
+OVERFLOWS = registry.counter(
+    "chat_stream_overflows_total",
+    "Events recorded past the pending bound, by policy and action",
+    labelnames=("policy", "action"),
+)
+BLOCKED_SECONDS = registry.histogram(
+    "chat_stream_blocked_seconds",
+    "Time runs waited for a slow stream to drain",
+)
+
+
+@dataclass
+class ReplayConfig:
+    """Configuration for replay buffers."""
+    max_events: int = settings.sse_replay_max_events
+    max_bytes: int = settings.sse_replay_max_bytes
+    max_total_bytes: int = settings.sse_replay_max_total_bytes
+    retention_seconds: int = settings.sse_replay_retention_seconds
+    disconnect_grace_seconds: float = settings.sse_disconnect_grace_seconds
+    # A run whose response never starts streaming is cancelled after this
+    attach_timeout_seconds: float = 5.0
+    # Unsent bytes allowed per stream before the overflow policy applies
+    max_pending_bytes: int = settings.sse_stream_max_pending_bytes
+    overflow_policy: str = settings.sse_overflow_policy
+
+
+@dataclass
+class _Frame:
+    id: int
+    run: int
+    data: bytes
+    end: int  # stream offset after this frame
+    # Content of a plain text frame while it is the newest (for coalescing)
+    text: Optional[str] = None
+
+
+class _Cursor:
+    """Progress of one attached stream."""
+    __slots__ = ("taken", "sent")
+
+    def __init__(self, taken: int, sent: int):
+        self.taken = taken  # last frame id handed to the response
+        self.sent = sent  # stream offset the response has written
+
+
+class StreamBuffer:
+    """Ring buffer of encoded SSE frames for one session."""
+
+    def __init__(self, store: "ReplayStore", session_id: str):
+        self.session_id = session_id
+        self.frames: deque[_Frame] = deque()
+        self.size = 0
+        self.finished_at: Optional[float] = None
+        # Set once the store forgets the buffer; later events are dropped
+        self.released = False
+        self._store = store
+        self._next_id = 1
+        self._runs = itertools.count(1)
+        self._active_runs: set[int] = set()
+        self._changed = asyncio.Event()
+        self._tasks: dict[int, asyncio.Task[None]] = {}
+        self._interrupted: set[int] = set()
+        self._subscribers = 0
+        self._orphan_timer: Optional[asyncio.TimerHandle] = None
+        # Backpressure bookkeeping (byte offsets into the session's stream)
+        self._appended = 0
+        self._cursors: dict[int, _Cursor] = {}
+        self._cursor_ids = itertools.count()
+        self._progress = asyncio.Event()
+        self.high_water = 0
+
+    @property
+    def last_id(self) -> int:
+        return self._next_id - 1
+
+    @property
+    def running(self) -> bool:
+        return bool(self._active_runs)
+
+    @property
+    def subscribers(self) -> int:
+        return self._subscribers
+
+    @property
+    def pending(self) -> int:
+        """Bytes recorded but not yet sent to the slowest attached stream."""
+        if not self._cursors:
+            return 0
+        return self._appended - min(cursor.sent for cursor in self._cursors.values())
+
+    def begin_run(self) -> int:
+        run = next(self._runs)
+        self._active_runs.add(run)
+        self.finished_at = None
+        return run
+
+    def end_run(self, run: int) -> None:
+        self._active_runs.discard(run)
+        self._tasks.pop(run, None)
+        self._interrupted.discard(run)
+        if not self._active_runs:
+            self.finished_at = time.monotonic()
+            self._disarm_orphan_timer()
+            PENDING_HIGH_WATER.observe(self.high_water)
+            self.high_water = 0
+        self._notify()
+
+    def append(self, run: int, event: dict[str, Any]) -> int:
+        """Encode and store an event; returns its id."""
+        event_id = self._next_id
+        self._next_id += 1
+        if self.released:
+            # Discarded mid-run: nobody can attach, so keep (and count) nothing
+            return event_id
+        data = self._store.encoder.encode(event, event_id)
+        self._appended += len(data)
+        text = event["content"] if event.get("type") == "text" and len(event) == 2 else None
+        if self.frames:
+            self.frames[-1].text = None
+        frame = _Frame(event_id, run, data, self._appended, text)
+        self.frames.append(frame)
+        self.size += len(frame.data)
+        self._store.total_bytes += len(frame.data)
+        self.high_water = max(self.high_water, self.pending)
+
+        config = self._store.config
+        while len(self.frames) > 1 and (
+            len(self.frames) > config.max_events or self.size > config.max_bytes
+        ):
+            self._drop_oldest()
+        self._store.enforce_limits(keep=self)
+        self._notify()
+        return event_id
+
+    def merge_text(self, run: int, content: str, max_chars: int) -> bool:
+        """
+        Append text to the newest frame if it is an unsent text frame of this run.
+
+        Returns:
+            False if the text has to go into a new frame
+        """
+        tail = self.frames[-1] if self.frames else None
+        if tail is None or tail.run != run or tail.text is None:
+            return False
+        if len(tail.text) + len(content) > max_chars:
+            return False
+        if any(cursor.taken >= tail.id for cursor in self._cursors.values()):
+            return False
+        tail.text += content
+        data = self._store.encoder.encode({"type": "text", "content": tail.text}, tail.id)
+        grown = len(data) - len(tail.data)
+        tail.data = data
+        tail.end += grown
+        self._appended += grown
+        self.size += grown
+        self._store.total_bytes += grown
+        self.high_water = max(self.high_water, self.pending)
+        self._notify()
+        return True
+
+    async def wait_for_room(self, limit: int) -> float:
+        """
+        Wait until attached streams have at most limit // 2 unsent bytes.
+
+        Returns immediately when pending is within limit (or nobody is
+        attached; detached runs are bounded by the ring buffer instead).
+
+        Returns:
+            Seconds spent waiting
+        """
+        if self.pending <= limit:
+            return 0.0
+        started = time.monotonic()
+        while self.pending > limit // 2:
+            await self._progress.wait()
+        return time.monotonic() - started
+
+    def trim(self) -> bool:
+        """Drop the oldest frame to free memory; False if empty."""
+        if not self.frames:
+            return False
+        self._drop_oldest()
+        return True
+
+    async def subscribe(
+        self,
+        after_id: int = 0,
+        run: Optional[int] = None,
+    ) -> AsyncIterator[bytes]:
+        """
+        Stream frames with id > after_id, live until the run(s) finish.
+
+        Args:
+            after_id: Last event id the client has seen
+            run: Only follow this run (None = all runs of the session)
+        """
+        cursor = after_id
+        oldest = self.frames[0].id if self.frames else self._next_id
+        unsent = next(
+            itertools.islice(self.frames, max(0, cursor - oldest + 1), None), None
+        )
+        progress = _Cursor(cursor, unsent.end - len(unsent.data) if unsent else self._appended)
+        token = next(self._cursor_ids)
+        self._cursors[token] = progress
+        self._attach()
+        try:
+            while True:
+                changed = self._changed
+                oldest = self.frames[0].id if self.frames else self._next_id
+                if cursor < oldest - 1:
+                    yield self._store.encoder.encode({
+                        "type": "error",
+                        "code": "replay_gap",
+                        "message": f"Events {cursor + 1}-{oldest - 1} are no longer available",
+                    })
+                    cursor = oldest - 1
+
+                chunk = []
+                end = progress.sent
+                for frame in itertools.islice(self.frames, cursor - oldest + 1, None):
+                    if run is None or frame.run == run:
+                        chunk.append(frame.data)
+                    cursor = frame.id
+                    end = frame.end
+                progress.taken = cursor
+                if chunk:
+                    yield b"".join(chunk)
+                    # The response has handed the bytes to the transport
+                    progress.sent = end
+                    self._notify_progress()
+                    continue
+                progress.sent = end
+
+                if run is not None and run not in self._active_runs:
+                    return
+                if run is None and not self.running:
+                    return
+                await changed.wait()
+        finally:
+            # Runs on normal completion and on client disconnect alike
+            del self._cursors[token]
+            self._notify_progress()
+            self._detach()
+
+    def release(self) -> None:
+        """Drop all frames (buffer is being discarded)."""
+        self.released = True
+        self._store.total_bytes -= self.size
+        self.frames.clear()
+        self.size = 0
+
+    def track_run(self, run: int, task: asyncio.Task[None]) -> None:
+        """Register the task executing run so it can be cancelled."""
+        self._tasks[run] = task
+        if self._subscribers == 0:
+            self.arm_orphan_timer(self._store.config.attach_timeout_seconds)
+
+    def cancel_runs(self) -> None:
+        """Cancel all in-flight runs of this session."""
+        for task in list(self._tasks.values()):
+            task.cancel()
+
+    def interrupt(self) -> bool:
+        """Cancel in-flight runs at the client's request; False if none."""
+        if not self._tasks:
+            return False
+        self._interrupted.update(self._tasks)
+        self.cancel_runs()
+        return True
+
+    def interrupted(self, run: int) -> bool:
+        return run in self._interrupted
+
+    def arm_orphan_timer(self, delay: float) -> None:
+        """Cancel running work after delay unless a stream attaches first."""
+        self._disarm_orphan_timer()
+        loop = asyncio.get_running_loop()
+        self._orphan_timer = loop.call_later(delay, self._cancel_if_orphaned)
+
+    def _attach(self) -> None:
+        self._subscribers += 1
+        self._disarm_orphan_timer()
+
+    def _detach(self) -> None:
+        self._subscribers -= 1
+        if self._subscribers == 0 and self.running:
+            grace = self._store.config.disconnect_grace_seconds
+            if grace > 0:
+                self.arm_orphan_timer(grace)
+            else:
+                self.cancel_runs()
+
+    def _cancel_if_orphaned(self) -> None:
+        self._orphan_timer = None
+        if self._subscribers == 0:
+            self.cancel_runs()
+
+    def _disarm_orphan_timer(self) -> None:
+        if self._orphan_timer is not None:
+            self._orphan_timer.cancel()
+            self._orphan_timer = None
+
+    def _drop_oldest(self) -> None:
+        frame = self.frames.popleft()
+        self.size -= len(frame.data)
+        self._store.total_bytes -= len(frame.data)
+
+    def _notify(self) -> None:
+        # Wake every current subscriber and start a fresh wait generation
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _notify_progress(self) -> None:
+        # Wake a run waiting for room
+        self._progress.set()
+        self._progress = asyncio.Event()
+
+
+class ReplayStore:
+    """Per-session replay buffers and the background runs feeding them."""
+
+    def __init__(
+        self,
+        config: Optional[ReplayConfig] = None,
+        encoder: Optional[SSEEncoder] = None,
+        spill: Optional[Callable[[str, dict[str, Any]], Awaitable[dict[str, Any]]]] = None,
+    ):
+        self.config = config or ReplayConfig()
+        if self.config.overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(
+                f"Unknown SSE overflow policy {self.config.overflow_policy!r}; "
+                f"expected one of {', '.join(OVERFLOW_POLICIES)}"
+            )
+        self.encoder = encoder or sse_encoder
+        # Moves a large tool output out of an event (reference policy)
+        self._spill = spill
+        self.total_bytes = 0
+        self._buffers: dict[str, StreamBuffer] = {}
+        self._tasks: set[asyncio.Task[None]] = set()
+        registry.gauge(
+            "chat_streams_active", "Connected SSE streams",
+            callback=self.subscribers,
+        )
+        registry.gauge(
+            "chat_replay_buffer_bytes", "Memory held by SSE replay buffers",
+            callback=lambda: self.total_bytes,
+        )
+        registry.gauge(
+            "chat_stream_pending_bytes", "Bytes waiting for attached streams to read",
+            callback=self.pending_bytes,
+        )
+
+    def get(self, session_id: str) -> Optional[StreamBuffer]:
+        self._sweep()
+        return self._buffers.get(session_id)
+
+    def start_run(self, session_id: str, events: AsyncIterator[dict[str, Any]]) -> tuple[StreamBuffer, int]:
+        """
+        Run an event stream in the background, recording it for replay.
+
+        Returns:
+            The session buffer and the run number to subscribe to
+        """
+        self._sweep()
+        buffer = self._buffers.get(session_id)
+        if buffer is None:
+            buffer = StreamBuffer(self, session_id)
+            self._buffers[session_id] = buffer
+        run = buffer.begin_run()
+        task = asyncio.create_task(self._record(buffer, run, events))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        buffer.track_run(run, task)
+        return buffer, run
+
+    def discard(self, session_id: str) -> None:
+        """Forget a session's buffer (e.g. when the session is deleted)."""
+        buffer = self._buffers.pop(session_id, None)
+        if buffer is not None:
+            buffer.cancel_runs()
+            buffer.release()
+
+    def enforce_limits(self, keep: Optional[StreamBuffer] = None) -> None:
+        """Evict finished buffers (oldest first), then trim, to fit max_total_bytes."""
+        if self.total_bytes <= self.config.max_total_bytes:
+            return
+        finished = sorted(
+            (b for b in self._buffers.values() if not b.running and b is not keep),
+            key=lambda b: b.finished_at or 0.0,
+        )
+        for buffer in finished:
+            if self.total_bytes <= self.config.max_total_bytes:
+                return
+            self.discard(buffer.session_id)
+        for buffer in sorted(self._buffers.values(), key=lambda b: b.size, reverse=True):
+            while self.total_bytes > self.config.max_total_bytes and len(buffer.frames) > 1:
+                buffer.trim()
+
+    def subscribers(self) -> int:
+        """Streams currently attached to any buffer."""
+        return sum(buffer.subscribers for buffer in self._buffers.values())
+
+    def pending_bytes(self) -> int:
+        """Unsent bytes across all buffers."""
+        return sum(buffer.pending for buffer in self._buffers.values())
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "buffers": len(self._buffers),
+            "running": sum(1 for b in self._buffers.values() if b.running),
+            "total_bytes": self.total_bytes,
+            "max_total_bytes": self.config.max_total_bytes,
+            "pending_bytes": self.pending_bytes(),
+            "max_pending_bytes": self.config.max_pending_bytes,
+            "overflow_policy": self.config.overflow_policy,
+        }
+
+    async def shutdown(self) -> None:
+        """Cancel in-flight runs."""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def _record(self, buffer: StreamBuffer, run: int, events: AsyncIterator[dict[str, Any]]) -> None:
+        try:
+            # Events read ahead of the recorder stay within the pending bound too
+            read_ahead = min(self.config.max_pending_bytes, self.encoder.config.coalesce_max_bytes)
+            async for batch in self.encoder.coalesce(events, read_ahead):
+                for event in batch:
+                    if buffer.pending > self.config.max_pending_bytes:
+                        relieved = await self._relieve(buffer, run, event)
+                        if relieved is None:
+                            continue
+                        event = relieved
+                    buffer.append(run, event)
+        except asyncio.CancelledError:
+            if buffer.interrupted(run):
+                buffer.append(run, {
+                    "type": "error",
+                    "code": "interrupted",
+                    "message": "Run interrupted by the client",
+                })
+            else:
+                buffer.append(run, {
+                    "type": "error",
+                    "code": "cancelled",
+                    "message": "Run cancelled: no client connected",
+                })
+            raise
+        except Exception as e:
+            buffer.append(run, {"type": "error", "message": str(e)})
+        finally:
+            buffer.end_run(run)
+
+    async def _relieve(self, buffer: StreamBuffer, run: int, event: dict[str, Any]) -> Optional[dict[str, Any]]:
+        """
+        Apply the overflow policy to an event recorded past the pending bound.
+
+        Returns:
+            The event to append (possibly shrunk), or None if it was merged
+        """
+        policy = self.config.overflow_policy
+        if policy == "coalesce" and event.get("type") == "text" and len(event) == 2:
+            if buffer.merge_text(run, event["content"], self.encoder.config.coalesce_max_bytes):
+                OVERFLOWS.inc(policy, "coalesced")
+                return None
+        elif policy == "reference" and event.get("type") == "tool_result" and self._spill:
+            shrunk = await self._spill(buffer.session_id, event)
+            if shrunk is not event:
+                OVERFLOWS.inc(policy, "referenced")
+                event = shrunk
+        OVERFLOWS.inc(policy, "blocked")
+        BLOCKED_SECONDS.observe(await buffer.wait_for_room(self.config.max_pending_bytes))
+        return event
+
+    def _sweep(self) -> None:
+        """Drop buffers whose runs finished more than retention_seconds ago."""
+        cutoff = time.monotonic() - self.config.retention_seconds
+        expired = [
+            session_id for session_id, buffer in self._buffers.items()
+            if not buffer.running and buffer.finished_at is not None
+            and buffer.finished_at < cutoff
+        ]
+        for session_id in expired:
+            self.discard(session_id)
+
+
+# Default replay store
+replay_store = ReplayStore(spill=claude_sdk_driver.tool_outputs.shrink)
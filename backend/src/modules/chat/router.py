@@ -4,119 +4,568 @@ Chat API Routes
 Handles chat interactions with the agent via SSE streaming.
 """
 
-from fastapi import APIRouter, HTTPException
+import asyncio
+import functools
+import uuid
+from pathlib import Path
+from typing import Any, AsyncIterator, Optional
+
+from fastapi import APIRouter, Header, HTTPException, Response, WebSocket
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Optional
-import json
-import uuid
 
+from ...config.settings import settings
+from ..agent.batch import BatchItem
+from ..agent.driver import claude_sdk_driver
+from ..agent.exceptions import AgentOverloadedError, BudgetExceededError, TemplateNotFoundError
+from ..agent.response_cache import CachedResponse
 from ..agent.service import agent_service
-
+from ..agent.session_store import WORKER_ID
+from ..core.metrics import registry
+from ..history import history_service
+from .replay import StreamBuffer, replay_store
+from .sse import get_json_dumps
+from .websocket import ChatConnection
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
+MESSAGES = registry.counter(
+    "chat_messages_total",
+    "Chat messages received, by endpoint and response cache status",
+    labelnames=("endpoint", "cache"),
+)
+REJECTED = registry.counter(
+    "chat_rejected_total",
+    "Chat messages rejected as overloaded (429), by endpoint",
+    labelnames=("endpoint",),
+)
+
 
 class ChatRequest(BaseModel):
     """Chat request payload."""
     message: str
     session_id: Optional[str] = None
+    # Allow answering from / storing into the response cache (if enabled)
+    cache: bool = True
+    # Model hint for routing (haiku, sonnet, opus), if hints are allowed
+    model: Optional[str] = None
+
+
+def _budget_headers(remaining: Optional[dict[str, Any]]) -> dict[str, Any]:
+    """Remaining usage budget (tightest of session and API key) as headers."""
+    if remaining is None:
+        return {}
+    headers = {}
+    if remaining["tokens"] is not None:
+        headers["X-Budget-Remaining-Tokens"] = str(remaining["tokens"])
+    if remaining["cost_usd"] is not None:
+        headers["X-Budget-Remaining-Cost-USD"] = f"{remaining['cost_usd']:.6f}"
+    if remaining["reset"]:
+        headers["X-Budget-Reset"] = str(int(remaining["reset"] + 0.999))
+    return headers
+
+
+def _overloaded(e: AgentOverloadedError, endpoint: str) -> HTTPException:
+    """Map an admission failure to 429 Too Many Requests."""
+    REJECTED.inc(endpoint)
+    headers = {"Retry-After": str(e.retry_after)} if e.retry_after else {}
+    if isinstance(e, BudgetExceededError):
+        headers.update(_budget_headers(e.remaining))
+    return HTTPException(status_code=429, detail=str(e), headers=headers or None)
+
+
+class BatchItemRequest(BaseModel):
+    """One prompt of a batch."""
+    message: str
+    id: Optional[str] = None
+    persona: Optional[str] = None
+    template: Optional[str] = None
+    cache: bool = True
+    model: Optional[str] = None
+
+
+class BatchRequest(BaseModel):
+    """Batch request payload."""
+    items: list[BatchItemRequest]
+    parallelism: int = 4
+    # Keep each item's session (and workspace) instead of removing it
+    keep_sessions: bool = False
+
+
+class CreateSessionRequest(BaseModel):
+    """Create session payload."""
+    template: Optional[str] = None
+    persona: Optional[str] = None
+
+
+class WorkspaceInfo(BaseModel):
+    """How a session's workspace was provisioned."""
+    template: str
+    mode: str
+    files: int
+    bytes: int
+    bytes_copied: int
+    duration_ms: float
 
 
 class SessionResponse(BaseModel):
     """Session info response."""
     session_id: str
     message_count: int
+    persona: Optional[str] = None
+    workspace: Optional[WorkspaceInfo] = None
+    # Estimated context size after the last turn, and times compacted
+    context_tokens: int = 0
+    compactions: int = 0
 
 
 @router.post("/sessions")
-async def create_session() -> SessionResponse:
-    """Create a new chat session."""
+async def create_session(request: Optional[CreateSessionRequest] = None) -> SessionResponse:
+    """
+    Create a new chat session.
+
+    Optionally selects a persona for this session only, and seeds the
+    workspace from a named template; the response reports the clone mode,
+    size and provisioning time.
+    """
     session_id = str(uuid.uuid4())
-    session = agent_service.start_session(session_id)
+    persona = request.persona if request is not None else None
+    try:
+        session = await agent_service.start_session(session_id, persona=persona)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    workspace = None
+    if request is not None and request.template:
+        try:
+            report = await agent_service.provision_template(session_id, request.template)
+        except TemplateNotFoundError as e:
+            await agent_service.end_session(session_id)
+            raise HTTPException(status_code=400, detail=str(e)) from e
+        workspace = WorkspaceInfo(**report)
     return SessionResponse(
         session_id=session_id,
-        message_count=0
+        message_count=0,
+        persona=session["persona"],
+        workspace=workspace,
     )
 
 
+@router.get("/templates")
+async def list_templates() -> dict[str, list[str]]:
+    """List available workspace templates."""
+    return {"templates": agent_service.list_templates()}
+
+
 @router.delete("/sessions/{session_id}")
 async def delete_session(session_id: str):
     """End and cleanup a chat session."""
     await agent_service.end_session(session_id)
+    replay_store.discard(session_id)
     return {"status": "ok"}
 
 
 @router.get("/sessions/{session_id}")
 async def get_session(session_id: str) -> SessionResponse:
     """Get session info."""
-    session = agent_service.get_session(session_id)
+    session = await agent_service.get_session(session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     return SessionResponse(
         session_id=session["id"],
-        message_count=session["message_count"]
+        message_count=session["message_count"],
+        persona=session.get("persona"),
+        workspace=session.get("workspace"),
+        context_tokens=session.get("context_tokens", 0),
+        compactions=session.get("compactions", 0),
     )
 
 
+@router.get("/sessions/{session_id}/history")
+async def get_session_history(session_id: str, events: bool = False) -> dict[str, Any]:
+    """
+    Stored transcript of a session, with per-turn usage and cost.
+
+    Requires HISTORY_ENABLED; pass events=true to include agent events.
+    """
+    if not history_service.enabled:
+        raise HTTPException(status_code=404, detail="History persistence is disabled")
+    transcript = await history_service.get_transcript(session_id, include_events=events)
+    return {"session_id": session_id, **transcript}
+
+
+_OUTPUT_CHUNK = 65536
+
+
+def _parse_range(header: Optional[str], size: int) -> Optional[tuple[int, int]]:
+    """
+    Parse a single-range Range header into inclusive (start, end).
+
+    Returns None for no header or a form we serve in full (multiple
+    ranges, other units).
+
+    Raises:
+        ValueError: If the range cannot be satisfied
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[6:].strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        else:
+            # Suffix range: the last N bytes
+            start, end = max(0, size - int(last)), size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        raise ValueError("Range not satisfiable")
+    return start, min(end, size - 1)
+
+
+async def _read_file(path: Path, start: int, length: int) -> AsyncIterator[bytes]:
+    """Stream part of a file in chunks read off the event loop."""
+    f = await asyncio.to_thread(open, path, "rb")
+    try:
+        await asyncio.to_thread(f.seek, start)
+        while length > 0:
+            chunk = await asyncio.to_thread(f.read, min(_OUTPUT_CHUNK, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        await asyncio.to_thread(f.close)
+
+
+@router.get("/sessions/{session_id}/outputs/{output_id}")
+async def get_tool_output(
+    session_id: str,
+    output_id: str,
+    range_header: Optional[str] = Header(default=None, alias="Range"),
+) -> StreamingResponse:
+    """
+    Full content of a spilled tool output (see output_ref in tool_result events).
+
+    Supports a single byte range (Range: bytes=start-end) for paging
+    through large outputs.
+    """
+    try:
+        path = claude_sdk_driver.tool_outputs.path(session_id, output_id)
+        size = (await asyncio.to_thread(path.stat)).st_size
+    except (ValueError, FileNotFoundError):
+        raise HTTPException(status_code=404, detail="Output not found") from None
+
+    headers = {"Accept-Ranges": "bytes"}
+    try:
+        byte_range = _parse_range(range_header, size)
+    except ValueError:
+        raise HTTPException(
+            status_code=416,
+            detail="Range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"},
+        ) from None
+    if byte_range is None:
+        start, end, status = 0, size - 1, 200
+    else:
+        start, end = byte_range
+        status = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        _read_file(path, start, end - start + 1),
+        status_code=status,
+        media_type="text/plain; charset=utf-8",
+        headers=headers,
+    )
+
+
+async def _lookup_cache(
+    request: ChatRequest, session_id: str
+) -> tuple[str, Optional[CachedResponse]]:
+    """Response cache lookup; ("BYPASS", None) if the client opted out."""
+    if not request.cache:
+        return "BYPASS", None
+    return await agent_service.lookup_cached_response(request.message, session_id, request.model)
+
+
+def _cache_headers(status: str, cached: Optional[CachedResponse]) -> dict[str, str]:
+    headers = {"X-Cache": status}
+    if cached is not None:
+        headers["Age"] = str(cached.age)
+        headers["X-Cache-Key"] = cached.key[:16]
+    return headers
+
+
+_SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    # Lets a session-aware proxy route follow-ups back to this worker
+    "X-Worker-Id": WORKER_ID,
+}
+
+
+async def _agent_events(
+    message: str,
+    session_id: str,
+    use_cache: bool = False,
+    api_key: Optional[str] = None,
+    model: Optional[str] = None,
+) -> AsyncIterator[dict[str, Any]]:
+    """Agent events for one turn, with failures mapped to error events."""
+    try:
+        async for event in agent_service.chat(
+            message=message, session_id=session_id, use_cache=use_cache,
+            api_key=api_key, model=model,
+        ):
+            yield event
+    except AgentOverloadedError as e:
+        yield {
+            "type": "error",
+            "message": str(e),
+            "code": "budget_exceeded" if isinstance(e, BudgetExceededError) else "overloaded",
+            "retry_after": e.retry_after,
+        }
+    except Exception as e:
+        yield {"type": "error", "message": str(e)}
+
+
+async def _start_turn(
+    request: ChatRequest,
+    endpoint: str,
+    api_key: Optional[str] = None,
+) -> tuple[str, str, Optional[CachedResponse], StreamBuffer, int]:
+    """
+    Admit a turn and run it in the background, recording into the replay buffer.
+
+    Returns:
+        (session_id, cache status, cached entry or None, buffer, run)
+
+    Raises:
+        AgentOverloadedError: If the run queue is full or a budget is exhausted
+        ValueError: If the model hint is not an allowed model
+    """
+    agent_service.router.validate_hint(request.model)
+    session_id = request.session_id or str(uuid.uuid4())
+    cache_status, cached = await _lookup_cache(request, session_id)
+    MESSAGES.inc(endpoint, cache_status)
+
+    if cached is not None:
+        events = agent_service.replay_cached(request.message, session_id, cached)
+    else:
+        agent_service.check_admission(session_id, api_key)
+        events = _agent_events(
+            request.message, session_id, use_cache=cache_status == "MISS",
+            api_key=api_key, model=request.model,
+        )
+
+    buffer, run = replay_store.start_run(session_id, events)
+    return session_id, cache_status, cached, buffer, run
+
+
 @router.post("/message")
-async def send_message(request: ChatRequest):
+async def send_message(
+    request: ChatRequest,
+    api_key: Optional[str] = Header(default=None, alias="X-API-Key"),
+) -> StreamingResponse:
     """
     Send a message and stream response via SSE.
-    
+
+    The run continues in the background if the connection drops; every
+    event carries an `id:` that can be passed as Last-Event-ID to
+    GET /sessions/{session_id}/stream to resume.
+
     Returns Server-Sent Events stream with events:
     - event: text, data: {"content": "..."}
-    - event: tool_use, data: {"tool": "...", "input": {...}}
-    - event: tool_result, data: {"tool": "...", "output": "..."}
-    - event: error, data: {"message": "..."}
+      (consecutive text chunks may be merged into one event)
+    - event: tool_use, data: {"id": "...", "tool": "...", "input": {...}}
+    - event: tool_result, data: {"tool": "...", "duration_ms": ..., "output": "..."}
+      (large outputs: a preview plus output_ref, see GET /sessions/{id}/outputs/{ref})
+    - event: queued, data: {"position": n}
+    - event: error, data: {"message": "...", "code": "..."}
     - event: done, data: {}
+
+    First messages of fresh sessions may be answered from the response
+    cache (X-Cache: HIT), replaying the stored events.
+
+    With usage budgets enabled, X-Budget-* headers report the remaining
+    budget of the session and the X-API-Key before this run. The done
+    event reports the model and route the turn used.
+
+    Returns 400 for a model hint that is not allowed, 429 if the run
+    queue is full or a budget is exhausted.
     """
-    session_id = request.session_id or str(uuid.uuid4())
-    
-    async def event_generator():
-        try:
-            async for event in agent_service.chat(
-                message=request.message,
-                session_id=session_id
-            ):
-                event_type = event.get("type", "text")
-                data = json.dumps(event)
-                yield f"event: {event_type}\ndata: {data}\n\n"
-        except Exception as e:
-            error_data = json.dumps({"type": "error", "message": str(e)})
-            yield f"event: error\ndata: {error_data}\n\n"
-    
+    try:
+        session_id, cache_status, cached, buffer, run = await _start_turn(request, "stream", api_key)
+    except AgentOverloadedError as e:
+        raise _overloaded(e, "stream") from e
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    headers = {
+        **_SSE_HEADERS,
+        "X-Session-Id": session_id,
+        **_cache_headers(cache_status, cached),
+        **_budget_headers(agent_service.budgets.remaining(session_id, api_key)),
+    }
+
     return StreamingResponse(
-        event_generator(),
+        buffer.subscribe(after_id=buffer.last_id, run=run),
         media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-            "X-Session-Id": session_id,
-        }
+        headers=headers,
+    )
+
+
+async def _start_websocket_turn(
+    frame: dict[str, Any],
+    api_key: Optional[str] = None,
+) -> tuple[str, str, StreamBuffer, int]:
+    request = ChatRequest(**{
+        key: frame[key] for key in ("message", "session_id", "cache", "model") if key in frame
+    })
+    try:
+        session_id, cache_status, _, buffer, run = await _start_turn(request, "websocket", api_key)
+    except AgentOverloadedError:
+        REJECTED.inc("websocket")
+        raise
+    return session_id, cache_status, buffer, run
+
+
+@router.websocket("/ws")
+async def chat_websocket(websocket: WebSocket) -> None:
+    """
+    Chat over one WebSocket: many turns, many sessions, interrupts.
+
+    See modules/chat/websocket.py (and docs/API.md) for the frame protocol.
+    Turns are charged to the X-API-Key of the handshake.
+    """
+    start_turn = functools.partial(_start_websocket_turn, api_key=websocket.headers.get("x-api-key"))
+    await ChatConnection(websocket, start_turn=start_turn).serve()
+
+
+@router.post("/sessions/{session_id}/interrupt")
+async def interrupt_session(session_id: str) -> dict[str, str]:
+    """Stop the session's running turn; its stream ends with an "interrupted" error event."""
+    buffer = replay_store.get(session_id)
+    if buffer is None or not buffer.interrupt():
+        raise HTTPException(status_code=409, detail="No run in progress")
+    return {"status": "ok"}
+
+
+@router.get("/sessions/{session_id}/stream")
+async def resume_stream(
+    session_id: str,
+    last_event_id: Optional[str] = Header(default=None),
+) -> StreamingResponse:
+    """
+    Resume a session's event stream after a dropped connection.
+
+    Replays buffered events with id > Last-Event-ID, then follows the
+    running turn live until it finishes. Does not re-run the agent.
+    If requested events were already evicted, the stream starts with
+    an error event with code "replay_gap".
+    """
+    buffer = replay_store.get(session_id)
+    if buffer is None:
+        raise HTTPException(status_code=404, detail="No stream to resume")
+    try:
+        after_id = int(last_event_id) if last_event_id else 0
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid Last-Event-ID") from None
+
+    return StreamingResponse(
+        buffer.subscribe(after_id=after_id),
+        media_type="text/event-stream",
+        headers={**_SSE_HEADERS, "X-Session-Id": session_id},
     )
 
 
 @router.post("/message/sync")
-async def send_message_sync(request: ChatRequest):
+async def send_message_sync(
+    request: ChatRequest,
+    response: Response,
+    api_key: Optional[str] = Header(default=None, alias="X-API-Key"),
+) -> dict[str, Any]:
     """
     Send a message and wait for complete response.
-    
+
     Non-streaming alternative for simple use cases.
+    First messages of fresh sessions may be answered from the response
+    cache (see the X-Cache header). X-Budget-* headers report the
+    remaining usage budget after this run.
+    Returns 400 for a model hint that is not allowed, 429 if the run
+    cannot be admitted in time or a budget is exhausted.
     """
+    try:
+        agent_service.router.validate_hint(request.model)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
     session_id = request.session_id or str(uuid.uuid4())
-    
+    cache_status, cached = await _lookup_cache(request, session_id)
+    MESSAGES.inc("sync", cache_status)
+    response.headers.update(_cache_headers(cache_status, cached))
+
     try:
-        response = await agent_service.chat_simple(
+        reply = await agent_service.chat_simple(
             message=request.message,
-            session_id=session_id
+            session_id=session_id,
+            use_cache=cache_status == "MISS",
+            cached=cached,
+            api_key=api_key,
+            model=request.model,
         )
+        response.headers.update(_budget_headers(agent_service.budgets.remaining(session_id, api_key)))
         return {
             "session_id": session_id,
-            "response": response
+            "response": reply
         }
+    except AgentOverloadedError as e:
+        raise _overloaded(e, "sync") from e
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise HTTPException(status_code=500, detail=str(e)) from e
+
+
+_ndjson_dumps = get_json_dumps(settings.sse_json_backend)
+
+
+async def _ndjson(records: AsyncIterator[dict[str, Any]]) -> AsyncIterator[bytes]:
+    """Encode records as newline-delimited JSON."""
+    async for record in records:
+        yield _ndjson_dumps(record) + b"\n"
+
+
+@router.post("/batch")
+async def run_batch(
+    request: BatchRequest,
+    api_key: Optional[str] = Header(default=None, alias="X-API-Key"),
+) -> StreamingResponse:
+    """
+    Run many independent prompts, each in a fresh session.
+
+    At most `parallelism` items run at once (capped by BATCH_MAX_PARALLELISM).
+    Streams NDJSON: one {"type": "result"} line per item as it completes,
+    then a {"type": "summary"} line with aggregate usage and cost.
+    Sessions are removed after each item unless keep_sessions is set.
+    Items are charged to the X-API-Key's usage budget; returns 429 if it
+    is already exhausted.
+    """
+    items = [BatchItem(**item.model_dump()) for item in request.items]
+    try:
+        agent_service.batches.validate(items, request.parallelism)
+        for item in items:
+            agent_service.router.validate_hint(item.model)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    try:
+        agent_service.budgets.check(None, api_key)
+    except BudgetExceededError as e:
+        raise _overloaded(e, "batch") from e
+    return StreamingResponse(
+        _ndjson(agent_service.batches.run(
+            items, request.parallelism, request.keep_sessions, api_key=api_key
+        )),
+        media_type="application/x-ndjson",
+        headers={"X-Worker-Id": WORKER_ID},
+    )
 
 
 # ============================================
@@ -124,14 +573,97 @@ async def send_message_sync(request: ChatRequest):
 # ============================================
 
 @router.post("/admin/reload-prompt")
-async def reload_prompt():
-    """Reload system prompt from file."""
+async def reload_prompt() -> dict[str, str]:
+    """Re-check prompt files now instead of after the check interval."""
     agent_service.reload_prompt()
     return {"status": "ok", "message": "Prompt reloaded"}
 
 
 @router.post("/admin/set-persona")
-async def set_persona(persona: str):
-    """Switch agent persona."""
-    agent_service.set_persona(persona)
+async def set_persona(persona: str) -> dict[str, str]:
+    """Switch the default persona for new sessions."""
+    try:
+        await agent_service.set_persona(persona)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
     return {"status": "ok", "persona": persona}
+
+
+@router.get("/admin/prompts")
+async def prompt_stats() -> dict[str, Any]:
+    """Compiled prompts in the prompt cache."""
+    return {"default_persona": agent_service.persona, **agent_service.prompts.stats()}
+
+
+@router.get("/admin/scheduler")
+async def scheduler_stats() -> dict[str, Any]:
+    """Run scheduler state (active and queued runs)."""
+    return agent_service.scheduler.stats()
+
+
+@router.get("/admin/budgets")
+async def budget_stats() -> dict[str, Any]:
+    """Usage budget limits and the heaviest sessions and API keys in the window."""
+    return agent_service.budgets.stats()
+
+
+@router.get("/admin/routing")
+async def routing_stats() -> dict[str, Any]:
+    """Routing rules and observed latency and cost per route and model."""
+    return agent_service.router.stats()
+
+
+@router.get("/admin/replay")
+async def replay_stats() -> dict[str, Any]:
+    """Replay buffer memory usage."""
+    return replay_store.stats()
+
+
+@router.get("/admin/cache")
+async def cache_stats() -> dict[str, Any]:
+    """Response cache metrics (entries, bytes, hit rate)."""
+    return agent_service.response_cache.stats()
+
+
+@router.delete("/admin/cache")
+async def clear_cache() -> dict[str, str]:
+    """Drop all cached responses (memory and disk)."""
+    await agent_service.response_cache.clear()
+    return {"status": "ok"}
+
+
+@router.get("/admin/history")
+async def history_stats() -> dict[str, Any]:
+    """History write-behind buffer metrics."""
+    return history_service.stats()
+
+
+@router.get("/admin/traces")
+async def recent_traces(session_id: Optional[str] = None, limit: int = 20) -> dict[str, Any]:
+    """Span timings of recent runs, newest first (per shard with AGENT_SHARDS)."""
+    limit = max(1, min(limit, 200))
+    if agent_service.shards.enabled:
+        return {"shards": await agent_service.shards.call_all("traces", session_id, limit)}
+    return {"traces": claude_sdk_driver.tracer.memory.traces(session_id, limit)}
+
+
+@router.get("/admin/tools")
+async def tool_stats() -> dict[str, Any]:
+    """Per-tool call counts and latency over the buffered spans."""
+    if agent_service.shards.enabled:
+        return {"shards": await agent_service.shards.call_all("tool_stats")}
+    return {"tools": claude_sdk_driver.tracer.memory.tool_stats()}
+
+
+@router.get("/admin/pool")
+async def pool_stats() -> dict[str, Any]:
+    """Warm client pool metrics (hits, misses, refill latency)."""
+    if agent_service.shards.enabled:
+        return {"shards": await agent_service.shards.call_all("pool_stats")}
+    return claude_sdk_driver.pool.stats()
+
+
+@router.get("/admin/shards")
+async def shard_stats() -> dict[str, Any]:
+    """Execution shard processes (AGENT_SHARDS)."""
+    return agent_service.shards.stats()
@@ -0,0 +1,231 @@
+"""
+SSE Encoding
+
+Turns agent events into Server-Sent Events frames:
+- Event framing is pre-encoded as bytes per event type
+- Consecutive text events are coalesced within a flush window
+- JSON uses orjson when installed (optional), stdlib json otherwise
+"""
+
+import asyncio
+import json
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Optional
+
+from ...config.settings import settings
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None  # type: ignore[assignment]
+
+
+def _stdlib_dumps(obj: dict[str, Any]) -> bytes:
+    return json.dumps(obj).encode("ascii")
+
+
+def _orjson_dumps(obj: dict[str, Any]) -> bytes:
+    try:
+        return orjson.dumps(obj)
+    except TypeError:
+        # orjson is stricter (e.g. non-str keys, huge ints); fall back
+        return _stdlib_dumps(obj)
+
+
+def get_json_dumps(backend: str = "auto") -> Callable[[dict[str, Any]], bytes]:
+    """
+    Pick a JSON serializer that returns UTF-8 bytes.
+
+    Args:
+        backend: "auto" (orjson if installed), "orjson" or "json"
+    """
+    if backend == "json":
+        return _stdlib_dumps
+    if orjson is None:
+        if backend == "orjson":
+            raise RuntimeError("SSE_JSON_BACKEND=orjson but orjson is not installed")
+        return _stdlib_dumps
+    return _orjson_dumps
+
+
+@dataclass
+class SSEConfig:
+    """Configuration for SSE encoding."""
+    json_backend: str = settings.sse_json_backend
+    # Max time a text chunk may wait for more text before being flushed;
+    # 0 disables coalescing
+    coalesce_interval_ms: int = settings.sse_coalesce_interval_ms
+    coalesce_max_bytes: int = settings.sse_coalesce_max_bytes
+
+
+class SSEEncoder:
+    """Encodes event dicts as SSE frames (bytes)."""
+
+    def __init__(self, config: Optional[SSEConfig] = None):
+        self.config = config or SSEConfig()
+        self._dumps = get_json_dumps(self.config.json_backend)
+        self._prefixes: dict[str, bytes] = {}
+
+    def encode(self, event: dict[str, Any], event_id: Optional[int] = None) -> bytes:
+        """Encode a single event as an SSE frame, with an optional id line."""
+        event_type = event.get("type", "text")
+        prefix = self._prefixes.get(event_type)
+        if prefix is None:
+            prefix = f"event: {event_type}\ndata: ".encode()
+            self._prefixes[event_type] = prefix
+        if event_id is not None:
+            prefix = b"id: %d\n" % event_id + prefix
+        return prefix + self._dumps(event) + b"\n\n"
+
+    async def stream(self, events: AsyncIterator[dict[str, Any]]) -> AsyncIterator[bytes]:
+        """Encode an event stream, coalescing consecutive text events."""
+        async for batch in self.coalesce(events):
+            yield b"".join([self.encode(event) for event in batch])
+
+    async def coalesce(
+        self,
+        events: AsyncIterator[dict[str, Any]],
+        read_ahead_bytes: Optional[int] = None,
+    ) -> AsyncIterator[list[dict[str, Any]]]:
+        """
+        Merge consecutive text events, yielding events in batches.
+
+        Events are read ahead by a producer task and processed in batches.
+        Buffered text is flushed when a non-text event arrives, when it
+        reaches coalesce_max_bytes, or after coalesce_interval_ms without a
+        non-text event.
+
+        Args:
+            events: Source events
+            read_ahead_bytes: Bound on events read but not yet taken by
+                the consumer (estimated size; at least one event).
+                Defaults to coalesce_max_bytes. A consumer that stops
+                reading stops the source once this is reached.
+        """
+        interval = self.config.coalesce_interval_ms / 1000
+        if interval <= 0:
+            async for event in events:
+                yield [event]
+            return
+
+        if read_ahead_bytes is None:
+            read_ahead_bytes = self.config.coalesce_max_bytes
+        pump = _EventPump(events, read_ahead_bytes)
+        task = asyncio.create_task(pump.run())
+        loop = asyncio.get_running_loop()
+        text: list[str] = []
+        text_size = 0
+        deadline = 0.0
+        try:
+            while True:
+                if not pump.items:
+                    if pump.finished:
+                        break
+                    if text:
+                        try:
+                            async with asyncio.timeout_at(deadline):
+                                await pump.wait()
+                        except TimeoutError:
+                            yield [self._merge_text(text)]
+                            text, text_size = [], 0
+                            continue
+                    else:
+                        await pump.wait()
+                    continue
+
+                batch = []
+                for event in pump.drain():
+                    if event.get("type") == "text" and len(event) == 2:
+                        if not text:
+                            deadline = loop.time() + interval
+                        content = event.get("content") or ""
+                        text.append(content)
+                        # Character count; close enough to bytes for a flush bound
+                        text_size += len(content)
+                        if text_size >= self.config.coalesce_max_bytes:
+                            batch.append(self._merge_text(text))
+                            text, text_size = [], 0
+                        continue
+                    if text:
+                        batch.append(self._merge_text(text))
+                        text, text_size = [], 0
+                    batch.append(event)
+                if batch:
+                    yield batch
+
+            if text:
+                yield [self._merge_text(text)]
+            if pump.error is not None:
+                raise pump.error
+        finally:
+            # Wait for the pump to close the source, so the agent run's own
+            # cleanup (client release, scheduler slot) is done when we return
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    @staticmethod
+    def _merge_text(chunks: list[str]) -> dict[str, Any]:
+        return {"type": "text", "content": "".join(chunks)}
+
+
+def _event_size(event: dict[str, Any]) -> int:
+    """Rough encoded size of an event: its strings plus framing."""
+    return 64 + _strings_size(event)
+
+
+def _strings_size(value: Any) -> int:
+    """Characters in the strings of a JSON-like value (e.g. tool input)."""
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(_strings_size(item) for item in value.values())
+    if isinstance(value, list):
+        return sum(_strings_size(item) for item in value)
+    return 0
+
+
+class _EventPump:
+    """Reads an event iterator ahead of the consumer, up to max_bytes."""
+
+    def __init__(self, source: AsyncIterator[dict[str, Any]], max_bytes: int):
+        self.source = source
+        self.max_bytes = max_bytes
+        self.items: list[dict[str, Any]] = []
+        self.size = 0
+        self.finished = False
+        self.error: Optional[BaseException] = None
+        self._data = asyncio.Event()
+        self._space = asyncio.Event()
+
+    async def run(self) -> None:
+        try:
+            async for event in self.source:
+                self.items.append(event)
+                self.size += _event_size(event)
+                self._data.set()
+                if self.size >= self.max_bytes:
+                    self._space.clear()
+                    await self._space.wait()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.finished = True
+            self._data.set()
+            aclose = getattr(self.source, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+    async def wait(self) -> None:
+        """Wait until events are available or the source is exhausted."""
+        await self._data.wait()
+
+    def drain(self) -> list[dict[str, Any]]:
+        items, self.items = self.items, []
+        self.size = 0
+        self._data.clear()
+        self._space.set()
+        return items
+
+
+# Default encoder instance
+sse_encoder = SSEEncoder()
@@ -0,0 +1,272 @@
+"""
+WebSocket Chat Transport
+
+One connection carries many turns for any number of sessions. Turns run
+through the same replay buffers as SSE, so a turn started here can be
+resumed over SSE (GET /sessions/{id}/stream) and vice versa.
+
+Client -> server (JSON text frames; binary frames get a bad_request error):
+    {"type": "message", "message": "...", "session_id": "...", "cache": true, "ref": "..."}
+    {"type": "interrupt", "session_id": "..."}
+    {"type": "resume", "session_id": "...", "last_event_id": 41}
+    {"type": "window", "bytes": 262144}    enable credit flow control
+    {"type": "ack", "bytes": 65536}        return credit for received events
+    {"type": "ping"}
+
+Server -> client:
+    {"type": "accepted", "session_id": "...", "ref": "...", "cache": "MISS"}
+    {"type": "event", "session_id": "...", "id": 42, "event": {...}}
+    {"type": "end", "session_id": "..."}
+    {"type": "error", "session_id": "...", "ref": "...", "code": "...", "message": "..."}
+    {"type": "pong"}
+
+"event" frames wrap the same event dicts as the SSE stream; "end" follows
+the last event of a turn (or of a resumed stream).
+
+Flow control is per connection: event frames of all sessions share one
+outbound buffer of send_buffer_bytes. While it is full, session streams
+stop reading their replay buffers, which applies the SSE backpressure
+policy to the runs. A client that sets a window receives at most that
+many event bytes beyond what it has acknowledged.
+"""
+
+import asyncio
+import json
+from collections import deque
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, Awaitable, Callable, Optional
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from ...config.settings import settings
+from ..agent.exceptions import AgentOverloadedError, BudgetExceededError
+from ..core.metrics import registry
+from .replay import StreamBuffer, replay_store
+
+
+@dataclass
+class WebSocketConfig:
+    """Configuration for WebSocket connections."""
+    # Outbound event bytes queued per connection before session streams pause
+    send_buffer_bytes: int = settings.ws_send_buffer_bytes
+    # Concurrent turn/resume streams per connection
+    max_streams: int = settings.ws_max_streams
+
+
+# Starts a turn for a "message" frame: returns (session_id, cache status,
+# replay buffer, run); raises ValueError (bad frame) or AgentOverloadedError
+StartTurn = Callable[[dict[str, Any]], Awaitable[tuple[str, str, StreamBuffer, int]]]
+
+_connections = 0
+registry.gauge(
+    "chat_websockets_active", "Connected chat WebSockets",
+    callback=lambda: _connections,
+)
+
+
+def _event_frame(session_json: bytes, frame: bytes) -> bytes:
+    """Re-wrap an encoded SSE frame as a WebSocket event frame (no JSON parsing)."""
+    header, _, data = frame.partition(b"data: ")
+    event_id = b"null"
+    if header.startswith(b"id: "):
+        event_id = header[4:header.index(b"\n")]
+    return (
+        b'{"type":"event","session_id":' + session_json
+        + b',"id":' + event_id + b',"event":' + data + b"}"
+    )
+
+
+class _Outbox:
+    """Outbound frames, bounded in bytes for event frames."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._frames: deque[tuple[str, int]] = deque()
+        self._changed = asyncio.Condition()
+
+    async def put(self, text: str, size: int = 0) -> None:
+        """Queue a frame; event frames (size > 0) wait while the buffer is full."""
+        async with self._changed:
+            if size:
+                await self._changed.wait_for(lambda: self.size < self.max_bytes)
+            self._frames.append((text, size))
+            self.size += size
+            self._changed.notify_all()
+
+    async def get(self) -> tuple[str, int]:
+        async with self._changed:
+            await self._changed.wait_for(lambda: bool(self._frames))
+            text, size = self._frames.popleft()
+            self.size -= size
+            self._changed.notify_all()
+            return text, size
+
+
+class ChatConnection:
+    """Serves one chat WebSocket."""
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        start_turn: StartTurn,
+        config: Optional[WebSocketConfig] = None,
+    ):
+        self.websocket = websocket
+        self.start_turn = start_turn
+        self.config = config or WebSocketConfig()
+        self.outbox = _Outbox(self.config.send_buffer_bytes)
+        self._streams: set[asyncio.Task[None]] = set()
+        # Credit flow control (window 0 = off)
+        self._window = 0
+        self._in_flight = 0
+        self._credit = asyncio.Condition()
+
+    async def serve(self) -> None:
+        """Accept the connection and handle frames until it closes."""
+        global _connections
+        await self.websocket.accept()
+        _connections += 1
+        writer = asyncio.create_task(self._write())
+        try:
+            while True:
+                message = await self.websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                text = message.get("text")
+                if text is None:
+                    await self._error("bad_request", "Binary frames are not supported")
+                    continue
+                try:
+                    frame = json.loads(text)
+                    if not isinstance(frame, dict):
+                        raise ValueError("Frame must be a JSON object")
+                except ValueError as e:
+                    await self._error("bad_request", str(e))
+                    continue
+                await self._dispatch(frame)
+        except WebSocketDisconnect:
+            pass
+        finally:
+            _connections -= 1
+            # Runs keep going; like a dropped SSE stream they are resumable
+            # and get cancelled after the disconnect grace
+            for task in (*self._streams, writer):
+                task.cancel()
+            await asyncio.gather(*self._streams, writer, return_exceptions=True)
+
+    async def _dispatch(self, frame: dict[str, Any]) -> None:
+        kind = frame.get("type")
+        session_id = frame.get("session_id")
+        if kind == "message":
+            await self._start(frame)
+        elif kind == "interrupt":
+            buffer = replay_store.get(session_id) if isinstance(session_id, str) else None
+            if buffer is None or not buffer.interrupt():
+                await self._error("not_running", "No run in progress", session_id=session_id)
+        elif kind == "resume":
+            buffer = replay_store.get(session_id) if isinstance(session_id, str) else None
+            if buffer is None:
+                await self._error("not_found", "No stream to resume", session_id=session_id)
+            elif await self._can_stream(session_id):
+                after_id = frame.get("last_event_id") or 0
+                if not isinstance(after_id, int):
+                    await self._error("bad_request", "Invalid last_event_id", session_id=session_id)
+                    return
+                self._stream(buffer.session_id, buffer, after_id, None)
+        elif kind in ("window", "ack"):
+            size = frame.get("bytes")
+            if not isinstance(size, int) or size < 0:
+                await self._error("bad_request", "bytes must be a non-negative integer")
+            elif kind == "window":
+                await self._set_credit(window=size)
+            else:
+                await self._set_credit(acked=size)
+        elif kind == "ping":
+            await self._send({"type": "pong"})
+        else:
+            await self._error("bad_request", f"Unknown frame type {kind!r}")
+
+    async def _start(self, frame: dict[str, Any]) -> None:
+        ref = frame.get("ref")
+        if not await self._can_stream(frame.get("session_id"), ref):
+            return
+        try:
+            session_id, cache_status, buffer, run = await self.start_turn(frame)
+        except ValueError as e:
+            # Includes pydantic's ValidationError
+            await self._error("bad_request", str(e), ref=ref)
+            return
+        except AgentOverloadedError as e:
+            code = "budget_exceeded" if isinstance(e, BudgetExceededError) else "overloaded"
+            await self._error(
+                code, str(e), ref=ref,
+                session_id=frame.get("session_id"), retry_after=e.retry_after,
+            )
+            return
+        await self._send({
+            "type": "accepted", "session_id": session_id, "ref": ref, "cache": cache_status,
+        })
+        self._stream(session_id, buffer, buffer.last_id, run)
+
+    async def _can_stream(self, session_id: Any, ref: Any = None) -> bool:
+        if len(self._streams) < self.config.max_streams:
+            return True
+        await self._error(
+            "too_many_streams",
+            f"At most {self.config.max_streams} concurrent streams per connection",
+            session_id=session_id, ref=ref,
+        )
+        return False
+
+    def _stream(self, session_id: str, buffer: StreamBuffer, after_id: int, run: Optional[int]) -> None:
+        task = asyncio.create_task(self._forward(session_id, buffer, after_id, run))
+        self._streams.add(task)
+        task.add_done_callback(self._streams.discard)
+
+    async def _forward(
+        self, session_id: str, buffer: StreamBuffer, after_id: int, run: Optional[int]
+    ) -> None:
+        """Copy a replay buffer subscription into the outbox."""
+        session_json = json.dumps(session_id).encode()
+        async for chunk in buffer.subscribe(after_id=after_id, run=run):
+            for frame in chunk.split(b"\n\n"):
+                if frame:
+                    data = _event_frame(session_json, frame)
+                    await self.outbox.put(data.decode("utf-8"), len(data))
+        await self._send({"type": "end", "session_id": session_id})
+
+    async def _write(self) -> None:
+        while True:
+            text, size = await self.outbox.get()
+            if size:
+                async with self._credit:
+                    await self._credit.wait_for(partial(self._has_credit, size))
+                    if self._window:
+                        self._in_flight += size
+            await self.websocket.send_text(text)
+
+    def _has_credit(self, size: int) -> bool:
+        """Whether a frame of size bytes fits the window (one frame always may)."""
+        return not self._window or not self._in_flight or self._in_flight + size <= self._window
+
+    async def _set_credit(self, window: Optional[int] = None, acked: int = 0) -> None:
+        async with self._credit:
+            if window is not None:
+                self._window = window
+                if not window:
+                    self._in_flight = 0
+            self._in_flight = max(0, self._in_flight - acked)
+            self._credit.notify_all()
+
+    async def _send(self, frame: dict[str, Any]) -> None:
+        await self.outbox.put(json.dumps(frame))
+
+    async def _error(self, code: str, message: str, **fields: Any) -> None:
+        await self._send({
+            "type": "error",
+            "code": code,
+            "message": message,
+            **{key: value for key, value in fields.items() if value is not None},
+        })
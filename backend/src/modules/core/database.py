@@ -0,0 +1,32 @@
+"""
+Database Engine
+
+Async SQLAlchemy engine construction shared by modules that persist data.
+"""
+
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+from ...config.settings import settings
+
+
+def create_engine(url: str = "", pool_size: int = 0, echo: bool = False) -> AsyncEngine:
+    """
+    Create a pooled async engine.
+
+    Args:
+        url: Database URL (default: settings.database_url), e.g.
+            postgresql+asyncpg://... or sqlite+aiosqlite:///./app.db
+        pool_size: Connection pool size (default: settings.db_pool_size)
+        echo: Log SQL statements
+    """
+    url = url or settings.database_url
+    if url.startswith("sqlite"):
+        # SQLite serializes writers anyway; keep the driver's default pool
+        return create_async_engine(url, echo=echo)
+    return create_async_engine(
+        url,
+        echo=echo,
+        pool_size=pool_size or settings.db_pool_size,
+        max_overflow=pool_size or settings.db_pool_size,
+        pool_pre_ping=True,
+    )
@@ -0,0 +1,259 @@
+"""
+Metrics
+
+Minimal Prometheus-style counters, gauges and histograms rendered in the
+text exposition format.
+
+Updates are plain attribute/list operations with no locks: all
+instrumentation runs on the event loop thread. Gauges that mirror
+existing state (live clients, queue depth, ...) are read through
+callbacks at scrape time instead of being updated on the hot path.
+"""
+
+import bisect
+import math
+from typing import Callable, Iterable, Optional, TypeVar
+
+# Seconds; covers sub-second first tokens up to multi-minute runs
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+M = TypeVar("M", bound="_Metric")
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values, strict=True))
+    return "{" + pairs + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def header(self) -> list[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+
+    def render(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing value, optionally per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        """
+        Add amount for the given label values (in labelnames order).
+
+        Raises:
+            ValueError: If the number of label values does not match labelnames
+        """
+        if len(labels) != len(self.labelnames):
+            raise ValueError(
+                f"{self.name} takes {len(self.labelnames)} label values, got {len(labels)}"
+            )
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> list[str]:
+        lines = self.header()
+        for labels, value in self._values.items():
+            lines.append(
+                f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            )
+        return lines
+
+
+class Gauge(_Metric):
+    """Current value, either set directly or read from a callback at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        callback: Optional[Callable[[], float]] = None,
+    ) -> None:
+        super().__init__(name, documentation)
+        self._value = 0.0
+        self._callback = callback
+
+    def set(self, value: float) -> None:
+        self._value = value
+
+    def inc(self, amount: float = 1) -> None:
+        self._value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self._value -= amount
+
+    def value(self) -> float:
+        return self._callback() if self._callback is not None else self._value
+
+    def render(self) -> list[str]:
+        return [*self.header(), f"{self.name} {_format_value(self.value())}"]
+
+
+class Histogram(_Metric):
+    """Distribution of observations in cumulative buckets."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation)
+        self.buckets = tuple(sorted(buckets))
+        # One slot per bucket plus +Inf; stored non-cumulative, summed at render
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+
+    def observe(self, value: float) -> None:
+        self._counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._sum += value
+        self._count += 1
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def sum(self) -> float:
+        return self._sum
+
+    def render(self) -> list[str]:
+        lines = self.header()
+        cumulative = 0
+        for bound, count in zip((*self.buckets, math.inf), self._counts, strict=True):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{_format_value(bound)}"}} {cumulative}')
+        lines.append(f"{self.name}_sum {_format_value(self._sum)}")
+        lines.append(f"{self.name}_count {self._count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds metrics and renders them for scraping."""
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+
+    def register(self, metric: M) -> M:
+        """
+        Add a metric; a metric of the same name and type is returned instead if present.
+
+        Raises:
+            ValueError: If the name is taken by a metric of another type
+        """
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            if not isinstance(existing, type(metric)):
+                raise ValueError(f"Metric {metric.name} is already registered as a {existing.kind}")
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(
+        self,
+        name: str,
+        documentation: str,
+        callback: Optional[Callable[[], float]] = None,
+    ) -> Gauge:
+        return self.register(Gauge(name, documentation, callback))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, buckets))
+
+    def render(self, extra: Optional[dict[str, list[str]]] = None) -> str:
+        """
+        All metrics in the Prometheus text exposition format.
+
+        Args:
+            extra: Sample lines from other processes by metric name (see
+                samples()), rendered after this process's samples
+        """
+        extra = dict(extra or {})
+        lines: list[str] = []
+        for metric in self._metrics.values():
+            try:
+                lines.extend(metric.render())
+            except Exception:
+                # A failing gauge callback must not break the whole scrape
+                continue
+            lines.extend(extra.pop(metric.name, ()))
+        for samples in extra.values():
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+    def samples(self, **labels: str) -> dict[str, list[str]]:
+        """
+        Sample lines (no HELP/TYPE) by metric name, with extra labels added.
+
+        Used to merge metrics of worker processes into one scrape; the
+        labels (e.g. shard="0") keep their series apart.
+        """
+        added = ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+        result = {}
+        for metric in self._metrics.values():
+            try:
+                rendered = metric.render()
+            except Exception:
+                continue
+            lines = []
+            for line in rendered:
+                if line.startswith("#"):
+                    continue
+                name, _, rest = line.partition(" ")
+                if "{" in name:
+                    name = name.replace("{", "{" + added + ",", 1)
+                elif added:
+                    name = name + "{" + added + "}"
+                lines.append(f"{name} {rest}")
+            result[metric.name] = lines
+        return result
+
+
+# Process-wide registry
+registry = MetricsRegistry()
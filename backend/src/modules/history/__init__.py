@@ -0,0 +1,9 @@
+"""
+History Module
+
+Async persistence of sessions, transcripts, events and usage.
+"""
+
+from .service import history_service
+
+__all__ = ["history_service"]
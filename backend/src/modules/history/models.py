@@ -0,0 +1,58 @@
+"""
+History Tables
+
+Sessions, messages (user and assistant turns) and agent events.
+Rows reference sessions by id without foreign keys so batches can be
+written in any order.
+"""
+
+from sqlalchemy import (
+    JSON,
+    Column,
+    DateTime,
+    Float,
+    Index,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    Text,
+)
+
+metadata = MetaData()
+
+sessions = Table(
+    "agent_sessions",
+    metadata,
+    Column("id", String(64), primary_key=True),
+    Column("persona", String(128)),
+    Column("created_at", DateTime(timezone=True), nullable=False),
+)
+
+messages = Table(
+    "agent_messages",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("session_id", String(64), nullable=False),
+    Column("turn", Integer, nullable=False),
+    Column("role", String(16), nullable=False),  # user, assistant
+    Column("content", Text, nullable=False),
+    Column("usage", JSON),
+    Column("total_cost_usd", Float),
+    Column("duration_ms", Integer),
+    Column("created_at", DateTime(timezone=True), nullable=False),
+    Index("ix_agent_messages_session", "session_id", "turn"),
+)
+
+events = Table(
+    "agent_events",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("session_id", String(64), nullable=False),
+    Column("turn", Integer, nullable=False),
+    Column("seq", Integer, nullable=False),
+    Column("type", String(32), nullable=False),
+    Column("payload", JSON, nullable=False),
+    Column("created_at", DateTime(timezone=True), nullable=False),
+    Index("ix_agent_events_session", "session_id", "turn", "seq"),
+)
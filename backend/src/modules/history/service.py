@@ -0,0 +1,204 @@
+"""
+History Service
+
+Persists sessions, transcripts and agent events, including the usage and
+cost reported with each turn's done event.
+
+Recording never touches the database on the streaming path: rows go to
+the write-behind writer, which inserts them in batches. Consecutive text
+events are merged into one event row; the full reply is also stored as
+the assistant message.
+
+SQLAlchemy and the table definitions are imported by start(), so a
+disabled history costs nothing at import time.
+"""
+
+from datetime import UTC, datetime
+from types import ModuleType
+from typing import TYPE_CHECKING, Any, Optional
+
+from ...config.settings import settings
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncEngine
+
+    from .writer import WriteBehindWriter
+
+
+def _now() -> datetime:
+    return datetime.now(UTC)
+
+
+class TurnRecorder:
+    """Collects one turn's events and queues its rows."""
+
+    def __init__(self, writer: "WriteBehindWriter", tables: ModuleType, session_id: str, turn: int):
+        self._writer = writer
+        self._tables = tables
+        self.session_id = session_id
+        self.turn = turn
+        self._seq = 0
+        self._text: list[str] = []
+        self._pending_text: list[str] = []
+        self._finished = False
+
+    def event(self, event: dict[str, Any]) -> None:
+        """Record an agent event (no I/O)."""
+        if event["type"] == "text":
+            self._text.append(event["content"])
+            self._pending_text.append(event["content"])
+            return
+        self._flush_text()
+        self._submit_event(event)
+        if event["type"] == "done":
+            self._submit_reply(event)
+
+    def finish(self) -> None:
+        """Record what is left of a turn that ended without a done event."""
+        if self._finished:
+            return
+        self._flush_text()
+        self._submit_reply(None)
+
+    def _flush_text(self) -> None:
+        if self._pending_text:
+            self._submit_event({"type": "text", "content": "".join(self._pending_text)})
+            self._pending_text.clear()
+
+    def _submit_event(self, event: dict[str, Any]) -> None:
+        self._seq += 1
+        self._writer.submit(self._tables.events, {
+            "session_id": self.session_id,
+            "turn": self.turn,
+            "seq": self._seq,
+            "type": event["type"],
+            "payload": event,
+            "created_at": _now(),
+        })
+
+    def _submit_reply(self, done: Optional[dict[str, Any]]) -> None:
+        self._finished = True
+        if done is None and not self._text:
+            return
+        done = done or {}
+        self._writer.submit(self._tables.messages, {
+            "session_id": self.session_id,
+            "turn": self.turn,
+            "role": "assistant",
+            "content": "".join(self._text),
+            "usage": done.get("usage"),
+            "total_cost_usd": done.get("total_cost_usd"),
+            "duration_ms": done.get("duration_ms"),
+            "created_at": _now(),
+        })
+
+
+class HistoryService:
+    """Conversation persistence; a no-op unless enabled."""
+
+    def __init__(self, enabled: bool = settings.history_enabled, url: str = ""):
+        self.enabled = enabled
+        self.url = url or settings.history_database_url or settings.database_url
+        self._engine: Optional[AsyncEngine] = None
+        self._writer: Optional[WriteBehindWriter] = None
+        # The models module (sessions, messages, events tables), once started
+        self._tables: Optional[ModuleType] = None
+
+    @property
+    def writer(self) -> Optional["WriteBehindWriter"]:
+        return self._writer
+
+    async def start(self, create_tables: bool = settings.history_create_tables) -> None:
+        """Create the engine (and tables) if persistence is enabled."""
+        if not self.enabled or self._engine is not None:
+            return
+        from ..core.database import create_engine
+        from . import models
+        from .writer import WriteBehindWriter
+
+        self._tables = models
+        self._engine = create_engine(self.url, echo=settings.db_echo)
+        if create_tables:
+            async with self._engine.begin() as conn:
+                await conn.run_sync(models.metadata.create_all)
+        self._writer = WriteBehindWriter(self._engine)
+
+    async def close(self) -> None:
+        """Write buffered rows and dispose of the engine."""
+        if self._writer is not None:
+            await self._writer.close()
+            self._writer = None
+        if self._engine is not None:
+            await self._engine.dispose()
+            self._engine = None
+
+    def record_session(self, session_id: str, persona: Optional[str] = None) -> None:
+        if self._writer is not None and self._tables is not None:
+            self._writer.submit(self._tables.sessions, {
+                "id": session_id,
+                "persona": persona,
+                "created_at": _now(),
+            })
+
+    def start_turn(self, session_id: str, turn: int, message: str) -> Optional[TurnRecorder]:
+        """
+        Record the user message and return a recorder for the reply.
+
+        Returns:
+            None if persistence is disabled
+        """
+        if self._writer is None or self._tables is None:
+            return None
+        self._writer.submit(self._tables.messages, {
+            "session_id": session_id,
+            "turn": turn,
+            "role": "user",
+            "content": message,
+            "usage": None,
+            "total_cost_usd": None,
+            "duration_ms": None,
+            "created_at": _now(),
+        })
+        return TurnRecorder(self._writer, self._tables, session_id, turn)
+
+    async def get_transcript(self, session_id: str, include_events: bool = False) -> dict[str, Any]:
+        """
+        Stored messages (and optionally events) of a session.
+
+        Rows still buffered by this process are written first.
+        """
+        if self._engine is None or self._writer is None or self._tables is None:
+            return {"messages": [], "events": [] if include_events else None}
+        from sqlalchemy import select
+
+        messages, events = self._tables.messages, self._tables.events
+        await self._writer.flush()
+        async with self._engine.connect() as conn:
+            result = await conn.execute(
+                select(messages)
+                .where(messages.c.session_id == session_id)
+                .order_by(messages.c.turn, messages.c.id)
+            )
+            message_rows = [dict(row._mapping) for row in result]
+            event_rows = None
+            if include_events:
+                result = await conn.execute(
+                    select(events)
+                    .where(events.c.session_id == session_id)
+                    .order_by(events.c.turn, events.c.seq)
+                )
+                event_rows = [dict(row._mapping) for row in result]
+        return {"messages": message_rows, "events": event_rows}
+
+    def stats(self) -> dict[str, Any]:
+        if self._writer is None:
+            return {"enabled": self.enabled}
+        return {
+            "enabled": True,
+            "buffered": self._writer.buffered,
+            **self._writer.stats.to_dict(),
+        }
+
+
+# Singleton instance
+history_service = HistoryService()
@@ -0,0 +1,174 @@
+"""
+Write-Behind Writer
+
+Rows are queued in memory by submit() (no I/O, never awaits) and a
+background task inserts them in batches:
+- a batch is written when batch_size rows are queued, or after
+  flush_interval_ms otherwise
+- each batch is one transaction with one executemany per table
+- the queue is bounded: past max_buffered, event rows are dropped (and
+  counted); session and message rows get twice that headroom
+- failed batches are put back and retried on the next flush
+"""
+
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from sqlalchemy import Insert, Table, insert
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from ...config.settings import settings
+from .models import events, messages, sessions
+
+# Insert order within a batch
+_TABLES = (sessions, messages, events)
+
+
+@dataclass
+class WriterConfig:
+    """Configuration for the write-behind writer."""
+    batch_size: int = settings.history_batch_size
+    flush_interval_ms: int = settings.history_flush_interval_ms
+    max_buffered: int = settings.history_max_buffered
+
+
+@dataclass
+class WriterStats:
+    """Writer counters."""
+    written: int = 0
+    dropped: int = 0
+    batches: int = 0
+    errors: int = 0
+    last_batch_rows: int = 0
+    last_batch_ms: float = 0.0
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "written": self.written,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "errors": self.errors,
+            "last_batch_rows": self.last_batch_rows,
+            "last_batch_ms": round(self.last_batch_ms, 2),
+        }
+
+
+class WriteBehindWriter:
+    """Buffers rows and inserts them in batches off the request path."""
+
+    def __init__(self, engine: AsyncEngine, config: Optional[WriterConfig] = None):
+        self.engine = engine
+        self.config = config or WriterConfig()
+        self.stats = WriterStats()
+        self._rows: deque[tuple[Table, dict[str, Any]]] = deque()
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task[None]] = None
+        self._closed = False
+
+    @property
+    def buffered(self) -> int:
+        return len(self._rows)
+
+    def submit(self, table: Table, row: dict[str, Any]) -> bool:
+        """
+        Queue a row for insertion (rows of one table must have the same keys).
+
+        Returns:
+            False if the row was dropped because the buffer is full
+        """
+        if self._closed:
+            return False
+        if len(self._rows) >= self._limit(table):
+            self.stats.dropped += 1
+            return False
+        self._rows.append((table, row))
+        if len(self._rows) >= self.config.batch_size:
+            self._wake.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+        return True
+
+    async def flush(self) -> None:
+        """Write everything queued so far."""
+        while self._rows:
+            if not await self._write_batch():
+                return
+
+    async def close(self) -> None:
+        """Stop the background task and write what is left."""
+        self._closed = True
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+
+    async def _run(self) -> None:
+        interval = self.config.flush_interval_ms / 1000
+        while True:
+            try:
+                async with asyncio.timeout(interval):
+                    await self._wake.wait()
+            except TimeoutError:
+                pass
+            self._wake.clear()
+            while self._rows:
+                if not await self._write_batch():
+                    break
+                if len(self._rows) < self.config.batch_size:
+                    # Partial batch: let it fill up until the next tick
+                    break
+
+    async def _write_batch(self) -> bool:
+        """Insert up to batch_size rows in one transaction; False on error."""
+        count = min(len(self._rows), self.config.batch_size)
+        batch = [self._rows.popleft() for _ in range(count)]
+        grouped: dict[Table, list[dict[str, Any]]] = {}
+        for table, row in batch:
+            grouped.setdefault(table, []).append(row)
+
+        started = time.perf_counter()
+        try:
+            async with self.engine.begin() as conn:
+                for table in _TABLES:
+                    rows = grouped.get(table)
+                    if rows:
+                        await conn.execute(self._insert(table), rows)
+        except Exception:
+            self.stats.errors += 1
+            # Retry later, keeping order; rows that no longer fit are dropped
+            for table, row in reversed(batch):
+                if len(self._rows) >= self._limit(table):
+                    self.stats.dropped += 1
+                    continue
+                self._rows.appendleft((table, row))
+            return False
+
+        self.stats.written += count
+        self.stats.batches += 1
+        self.stats.last_batch_rows = count
+        self.stats.last_batch_ms = (time.perf_counter() - started) * 1000
+        return True
+
+    def _limit(self, table: Table) -> int:
+        if table is events:
+            return self.config.max_buffered
+        return self.config.max_buffered * 2
+
+    def _insert(self, table: Table) -> Insert:
+        if table is not sessions:
+            return insert(table)
+        # Sessions may be recorded more than once (e.g. by several workers)
+        dialect = self.engine.dialect.name
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as pg_insert
+            return pg_insert(table).on_conflict_do_nothing()
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+            return sqlite_insert(table).on_conflict_do_nothing()
+        return insert(table).prefix_with("IGNORE")
@@ -0,0 +1,9 @@
+"""
+Jobs Module
+
+Background agent jobs on a durable local queue.
+"""
+
+from .service import job_service
+
+__all__ = ["job_service"]
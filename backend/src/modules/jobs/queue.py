@@ -0,0 +1,289 @@
+"""
+Job Queue
+
+Durable queue of agent jobs in a SQLite file (WAL mode), shared by the
+workers of one host. Queries run in a worker thread on one connection.
+
+Jobs are claimed with a lease that the running worker renews. A job
+whose lease expired (its worker died or the process restarted) is
+claimed again, up to max_attempts, so delivery is at-least-once.
+
+A job keeps the session and (hashed) API key it was submitted with as
+its budget subjects, also when a retry moves it to a fresh session.
+"""
+
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Optional
+
+JOB_STATUSES = ("queued", "running", "succeeded", "failed", "cancelled")
+FINISHED = ("succeeded", "failed", "cancelled")
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS jobs ("
+    " id TEXT PRIMARY KEY, status TEXT NOT NULL, message TEXT NOT NULL,"
+    " session_id TEXT NOT NULL, persona TEXT, template TEXT,"
+    " created_at REAL NOT NULL, started_at REAL, finished_at REAL,"
+    " attempts INTEGER NOT NULL DEFAULT 0, worker TEXT, lease_expires REAL NOT NULL DEFAULT 0,"
+    " response TEXT, error TEXT, usage TEXT, total_cost_usd REAL,"
+    " api_key_id TEXT, budget_session_id TEXT)",
+    "CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at)",
+    "CREATE TABLE IF NOT EXISTS job_events ("
+    " job_id TEXT NOT NULL, seq INTEGER NOT NULL, attempt INTEGER NOT NULL,"
+    " type TEXT NOT NULL, data TEXT NOT NULL, PRIMARY KEY (job_id, seq))",
+)
+
+_COLUMNS = (
+    "id", "status", "message", "session_id", "persona", "template",
+    "created_at", "started_at", "finished_at", "attempts", "worker",
+    "lease_expires", "response", "error", "usage", "total_cost_usd",
+    "api_key_id", "budget_session_id",
+)
+
+# Columns added after the first release: (name, type); added on connect
+_MIGRATIONS = (
+    ("api_key_id", "TEXT"),
+    ("budget_session_id", "TEXT"),
+)
+
+
+def _row_to_job(row: tuple[Any, ...]) -> dict[str, Any]:
+    job = dict(zip(_COLUMNS, row, strict=True))
+    job["usage"] = json.loads(job["usage"]) if job["usage"] else None
+    return job
+
+
+class JobQueue:
+    """SQLite-backed job queue."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(
+                self.path, timeout=5.0, isolation_level=None, check_same_thread=False
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            existing = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for name, kind in _MIGRATIONS:
+                if name not in existing:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {kind}")
+            self._conn = conn
+        return self._conn
+
+    def _run(self, sql: str, params: tuple[Any, ...] = ()) -> list[Any]:
+        with self._lock:
+            cursor = self._connect().execute(sql, params)
+            return cursor.fetchall() if cursor.description else [cursor.rowcount]
+
+    async def _query(self, sql: str, params: tuple[Any, ...] = ()) -> list[Any]:
+        return await asyncio.to_thread(self._run, sql, params)
+
+    async def submit(
+        self,
+        message: str,
+        session_id: Optional[str] = None,
+        persona: Optional[str] = None,
+        template: Optional[str] = None,
+        api_key_id: Optional[str] = None,
+    ) -> dict[str, Any]:
+        """
+        Queue a job; returns its record.
+
+        Args:
+            api_key_id: key_id() of the submitter's API key, charged for
+                the job's runs (the key itself is never stored)
+        """
+        job_id = uuid.uuid4().hex
+        session_id = session_id or str(uuid.uuid4())
+        await self._query(
+            "INSERT INTO jobs (id, status, message, session_id, persona, template, created_at,"
+            " api_key_id, budget_session_id) VALUES (?, 'queued', ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, message, session_id, persona, template, time.time(), api_key_id, session_id),
+        )
+        job = await self.get(job_id)
+        if job is None:
+            raise RuntimeError(f"Job {job_id} was not stored")
+        return job
+
+    async def get(self, job_id: str) -> Optional[dict[str, Any]]:
+        rows = await self._query(f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE id = ?", (job_id,))
+        return _row_to_job(rows[0]) if rows else None
+
+    async def recent(self, status: Optional[str] = None, limit: int = 50) -> list[dict[str, Any]]:
+        sql = f"SELECT {', '.join(_COLUMNS)} FROM jobs"
+        params: tuple[Any, ...] = ()
+        if status is not None:
+            sql += " WHERE status = ?"
+            params = (status,)
+        rows = await self._query(sql + " ORDER BY created_at DESC LIMIT ?", (*params, limit))
+        return [_row_to_job(row) for row in rows]
+
+    def _claim(self, worker: str, lease_seconds: float, max_attempts: int) -> Optional[tuple[Any, ...]]:
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Jobs whose worker vanished mid-run and used up their attempts
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', finished_at = ?,"
+                    " error = 'Worker lost the job ' || attempts || ' times'"
+                    " WHERE status = 'running' AND lease_expires < ? AND attempts >= ?",
+                    (now, now, max_attempts),
+                )
+                row = conn.execute(
+                    "SELECT id FROM jobs WHERE status = 'queued'"
+                    " OR (status = 'running' AND lease_expires < ?)"
+                    " ORDER BY created_at LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is None:
+                    conn.execute("COMMIT")
+                    return None
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', worker = ?, lease_expires = ?,"
+                    " attempts = attempts + 1, started_at = ? WHERE id = ?",
+                    (worker, now + lease_seconds, now, row[0]),
+                )
+                job: tuple[Any, ...] = conn.execute(
+                    f"SELECT {', '.join(_COLUMNS)} FROM jobs WHERE id = ?", (row[0],)
+                ).fetchone()
+                conn.execute("COMMIT")
+                return job
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    async def claim(self, worker: str, lease_seconds: float, max_attempts: int) -> Optional[dict[str, Any]]:
+        """Take the oldest runnable job, or None if there is none."""
+        row = await asyncio.to_thread(self._claim, worker, lease_seconds, max_attempts)
+        return _row_to_job(row) if row else None
+
+    async def renew(self, job_id: str, worker: str, lease_seconds: float) -> bool:
+        """
+        Extend a running job's lease.
+
+        Returns:
+            False if the job is no longer running under this worker
+            (cancelled, or reclaimed after the lease expired)
+        """
+        rows = await self._query(
+            "UPDATE jobs SET lease_expires = ?"
+            " WHERE id = ? AND worker = ? AND status = 'running'",
+            (time.time() + lease_seconds, job_id, worker),
+        )
+        return bool(rows[0])
+
+    async def finish(
+        self,
+        job_id: str,
+        worker: str,
+        status: str,
+        response: str = "",
+        error: Optional[str] = None,
+        usage: Optional[dict[str, Any]] = None,
+        total_cost_usd: Optional[float] = None,
+    ) -> None:
+        await self._query(
+            "UPDATE jobs SET status = ?, finished_at = ?, lease_expires = 0,"
+            " response = ?, error = ?, usage = ?, total_cost_usd = ?"
+            " WHERE id = ? AND worker = ? AND status = 'running'",
+            (status, time.time(), response, error,
+             json.dumps(usage) if usage is not None else None, total_cost_usd, job_id, worker),
+        )
+
+    async def requeue(self, job_id: str, worker: str) -> None:
+        """Hand a running job back (worker shutting down); the attempt is not counted."""
+        await self._query(
+            "UPDATE jobs SET status = 'queued', worker = NULL, lease_expires = 0,"
+            " attempts = attempts - 1 WHERE id = ? AND worker = ? AND status = 'running'",
+            (job_id, worker),
+        )
+
+    async def move_session(self, job_id: str, worker: str, session_id: str) -> None:
+        """Run a running job in another session from now on (retry in a fresh session)."""
+        await self._query(
+            "UPDATE jobs SET session_id = ? WHERE id = ? AND worker = ? AND status = 'running'",
+            (session_id, job_id, worker),
+        )
+
+    async def cancel(self, job_id: str) -> Optional[str]:
+        """
+        Cancel a queued or running job (a running one stops at its next lease renewal).
+
+        Returns:
+            The job's status before cancelling, or None if it does not exist
+        """
+        job = await self.get(job_id)
+        if job is None:
+            return None
+        if job["status"] not in FINISHED:
+            await self._query(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ?"
+                " WHERE id = ? AND status IN ('queued', 'running')",
+                (time.time(), job_id),
+            )
+        status: str = job["status"]
+        return status
+
+    async def add_events(self, job_id: str, attempt: int, first_seq: int, events: list[dict[str, Any]]) -> None:
+        rows = [
+            (job_id, first_seq + i, attempt, event["type"], json.dumps(event))
+            for i, event in enumerate(events)
+        ]
+        await asyncio.to_thread(self._insert_events, rows)
+
+    def _insert_events(self, rows: list[tuple[Any, ...]]) -> None:
+        with self._lock:
+            self._connect().executemany(
+                "INSERT OR REPLACE INTO job_events (job_id, seq, attempt, type, data)"
+                " VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    async def last_seq(self, job_id: str) -> int:
+        rows = await self._query("SELECT MAX(seq) FROM job_events WHERE job_id = ?", (job_id,))
+        return int(rows[0][0] or 0)
+
+    async def events(self, job_id: str, after_seq: int = 0, limit: int = 1000) -> list[dict[str, Any]]:
+        rows = await self._query(
+            "SELECT seq, attempt, data FROM job_events WHERE job_id = ? AND seq > ?"
+            " ORDER BY seq LIMIT ?",
+            (job_id, after_seq, limit),
+        )
+        return [{"seq": seq, "attempt": attempt, "event": json.loads(data)} for seq, attempt, data in rows]
+
+    async def counts(self) -> dict[str, Any]:
+        rows = await self._query("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+        return {status: 0 for status in JOB_STATUSES} | dict(rows)
+
+    async def purge(self, older_than: float) -> int:
+        """Delete finished jobs (and their events) finished before a timestamp."""
+        await self._query(
+            "DELETE FROM job_events WHERE job_id IN (SELECT id FROM jobs"
+            " WHERE status IN ('succeeded', 'failed', 'cancelled') AND finished_at < ?)",
+            (older_than,),
+        )
+        rows = await self._query(
+            "DELETE FROM jobs WHERE status IN ('succeeded', 'failed', 'cancelled')"
+            " AND finished_at < ?",
+            (older_than,),
+        )
+        return int(rows[0])
+
+    async def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,145 @@
+"""
+Job API Routes
+
+Submit agent turns as background jobs and poll their status, result and
+event log. Requires JOBS_ENABLED.
+"""
+
+from typing import Any, Optional
+
+from fastapi import APIRouter, Header, HTTPException, Query
+from pydantic import BaseModel
+
+from ..agent.exceptions import BudgetExceededError, TemplateNotFoundError
+from .queue import FINISHED, JOB_STATUSES, JobQueue
+from .service import job_service
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+# Fields of a job record shown by the status endpoints (the result has its own)
+_STATUS_FIELDS = (
+    "id", "status", "session_id", "persona", "template", "created_at",
+    "started_at", "finished_at", "attempts", "error",
+)
+
+
+class JobRequest(BaseModel):
+    """Job submission payload."""
+    message: str
+    # Continue an existing session; a new one is created if omitted
+    session_id: Optional[str] = None
+    persona: Optional[str] = None
+    template: Optional[str] = None
+
+
+def _queue() -> JobQueue:
+    if not job_service.enabled:
+        raise HTTPException(status_code=404, detail="Background jobs are disabled")
+    return job_service.queue
+
+
+async def _get_job(job_id: str) -> dict[str, Any]:
+    job = await _queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+def _status(job: dict[str, Any]) -> dict[str, Any]:
+    return {field: job[field] for field in _STATUS_FIELDS}
+
+
+@router.post("", status_code=202)
+async def submit_job(
+    request: JobRequest,
+    api_key: Optional[str] = Header(default=None, alias="X-API-Key"),
+) -> dict[str, Any]:
+    """
+    Queue an agent turn and return at once.
+
+    Poll GET /jobs/{id} for the status, then read the result and events.
+    The job's runs are charged to the X-API-Key budget; 429 if the key or
+    session is already over budget.
+    """
+    _queue()
+    try:
+        job = await job_service.submit(
+            request.message,
+            session_id=request.session_id,
+            persona=request.persona,
+            template=request.template,
+            api_key=api_key,
+        )
+    except (ValueError, TemplateNotFoundError) as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    except BudgetExceededError as e:
+        headers = {"Retry-After": str(e.retry_after)} if e.retry_after else None
+        raise HTTPException(status_code=429, detail=str(e), headers=headers) from e
+    return _status(job)
+
+
+@router.get("")
+async def list_jobs(
+    status: Optional[str] = None,
+    limit: int = Query(default=50, ge=1, le=1000),
+) -> dict[str, Any]:
+    """Most recent jobs (optionally of one status) and counts by status."""
+    queue = _queue()
+    if status is not None and status not in JOB_STATUSES:
+        raise HTTPException(status_code=400, detail=f"status must be one of {', '.join(JOB_STATUSES)}")
+    jobs = await queue.recent(status=status, limit=limit)
+    return {"jobs": [_status(job) for job in jobs], "counts": await queue.counts()}
+
+
+@router.get("/{job_id}")
+async def get_job(job_id: str) -> dict[str, Any]:
+    """Job status."""
+    return _status(await _get_job(job_id))
+
+
+@router.get("/{job_id}/result")
+async def get_job_result(job_id: str) -> dict[str, Any]:
+    """
+    Final response, usage and cost of a finished job.
+
+    Returns 409 while the job is queued or running.
+    """
+    job = await _get_job(job_id)
+    if job["status"] not in FINISHED:
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    return {
+        "id": job["id"],
+        "status": job["status"],
+        "session_id": job["session_id"],
+        "response": job["response"],
+        "error": job["error"],
+        "usage": job["usage"],
+        "total_cost_usd": job["total_cost_usd"],
+    }
+
+
+@router.get("/{job_id}/events")
+async def get_job_events(
+    job_id: str,
+    after: int = Query(default=0, ge=0),
+    limit: int = Query(default=1000, ge=1, le=10000),
+) -> dict[str, Any]:
+    """
+    Event log of a job, in order; pass the last seen seq as after to page.
+
+    Events are the chat stream events (text chunks merged); a retried job
+    continues the log, and each event records the attempt that wrote it.
+    """
+    job = await _get_job(job_id)
+    events = await _queue().events(job_id, after_seq=after, limit=limit)
+    return {"id": job_id, "status": job["status"], "events": events}
+
+
+@router.delete("/{job_id}")
+async def cancel_job(job_id: str) -> dict[str, Any]:
+    """Cancel a queued or running job (no-op for finished jobs)."""
+    _queue()
+    previous = await job_service.cancel(job_id)
+    if previous is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"id": job_id, "previous_status": previous, "cancelled": previous not in FINISHED}
@@ -0,0 +1,330 @@
+"""
+Job Service
+
+Runs agent turns submitted as background jobs. Each process runs a small
+pool of workers that claim jobs from the durable queue, execute them
+through AgentService.chat and store the result plus an event log.
+
+- A running job renews its lease; if renewal fails (cancelled, or the
+  job was reclaimed) the run is stopped
+- On shutdown, running jobs are put back in the queue; after a crash
+  they are picked up again once their lease expires
+- A retry whose earlier attempt already reached the agent runs in a
+  fresh session, so the turn is never sent twice into one conversation;
+  it is still charged to the original session's budget
+- Runs are charged to the submitter's API key; a job whose session or
+  key is over budget when it runs fails instead of waiting for the
+  window to reset
+- Events are written in batches, with consecutive text merged
+"""
+
+import asyncio
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from ...config.settings import settings
+from ..agent.budgets import key_id
+from ..agent.exceptions import AgentOverloadedError, BudgetExceededError, TemplateNotFoundError
+from ..agent.service import agent_service
+from ..agent.session_store import WORKER_ID
+from ..core.metrics import registry
+from .queue import JobQueue
+
+FINISHED_JOBS = registry.counter(
+    "jobs_finished_total",
+    "Background jobs finished by this process, by status",
+    labelnames=("status",),
+)
+
+
+@dataclass
+class JobConfig:
+    """Configuration for background jobs."""
+    enabled: bool = settings.jobs_enabled
+    database_path: str = settings.jobs_database_path
+    workers: int = settings.jobs_workers
+    lease_seconds: int = settings.jobs_lease_seconds
+    max_attempts: int = settings.jobs_max_attempts
+    # Finished jobs and their events are deleted after this; 0 keeps them
+    retention_seconds: int = settings.jobs_retention_seconds
+    # Idle workers re-check the queue this often (jobs from other processes,
+    # expired leases); local submissions wake them at once
+    poll_interval: float = 1.0
+    # Event log batching
+    event_batch_size: int = 100
+    event_flush_interval: float = 0.5
+
+
+class _EventLog:
+    """Buffers a job's events and writes them in batches."""
+
+    def __init__(self, queue: JobQueue, job_id: str, attempt: int, next_seq: int, config: JobConfig):
+        self.queue = queue
+        self.job_id = job_id
+        self.attempt = attempt
+        self.next_seq = next_seq
+        self.config = config
+        self._events: list[dict[str, Any]] = []
+        self._text: list[str] = []
+        # The first event is written at once, so a retry can tell that
+        # this attempt reached the agent
+        self._flushed = float("-inf")
+
+    async def add(self, event: dict[str, Any]) -> None:
+        if event["type"] == "text":
+            self._text.append(event["content"])
+        else:
+            self._merge_text()
+            self._events.append(event)
+        if (
+            len(self._events) >= self.config.event_batch_size
+            or time.monotonic() - self._flushed >= self.config.event_flush_interval
+        ):
+            await self.flush()
+
+    async def flush(self) -> None:
+        self._merge_text()
+        self._flushed = time.monotonic()
+        if not self._events:
+            return
+        events, self._events = self._events, []
+        await self.queue.add_events(self.job_id, self.attempt, self.next_seq, events)
+        self.next_seq += len(events)
+
+    def _merge_text(self) -> None:
+        if self._text:
+            self._events.append({"type": "text", "content": "".join(self._text)})
+            self._text.clear()
+
+
+class JobService:
+    """Background job submission and execution."""
+
+    def __init__(self, config: Optional[JobConfig] = None):
+        self.config = config or JobConfig()
+        self._queue = JobQueue(self.config.database_path) if self.config.enabled else None
+        self._workers: list[asyncio.Task[None]] = []
+        self._running: dict[str, asyncio.Task[None]] = {}
+        self._wake = asyncio.Event()
+        self._closing = False
+        self._next_purge = 0.0
+        registry.gauge(
+            "jobs_running", "Background jobs running in this process",
+            callback=lambda: len(self._running),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self._queue is not None
+
+    @property
+    def queue(self) -> JobQueue:
+        """
+        The job queue.
+
+        Raises:
+            RuntimeError: If jobs are disabled
+        """
+        if self._queue is None:
+            raise RuntimeError("Background jobs are disabled (JOBS_ENABLED=false)")
+        return self._queue
+
+    async def start(self) -> None:
+        """Start the worker pool (no-op if jobs are disabled)."""
+        if not self.enabled or self._workers:
+            return
+        self._closing = False
+        self._workers = [
+            asyncio.create_task(self._worker()) for _ in range(self.config.workers)
+        ]
+
+    async def close(self) -> None:
+        """Stop workers; running jobs go back to the queue."""
+        if not self.enabled:
+            return
+        self._closing = True
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        await self.queue.close()
+
+    async def submit(
+        self,
+        message: str,
+        session_id: Optional[str] = None,
+        persona: Optional[str] = None,
+        template: Optional[str] = None,
+        api_key: Optional[str] = None,
+    ) -> dict[str, Any]:
+        """
+        Queue an agent turn.
+
+        Args:
+            api_key: Submitter's API key; its budget (and the session's)
+                is checked now and charged when the job runs
+
+        Raises:
+            ValueError: If the persona name is invalid
+            TemplateNotFoundError: If the template does not exist
+            BudgetExceededError: If the session or API key is over budget
+        """
+        if persona is not None:
+            agent_service.prompts.validate_persona(persona)
+        if template is not None and template not in agent_service.list_templates():
+            raise TemplateNotFoundError(f"Unknown workspace template: {template}")
+        agent_service.budgets.check(session_id, api_key)
+        job = await self.queue.submit(message, session_id, persona, template, key_id(api_key))
+        self._wake.set()
+        return job
+
+    async def cancel(self, job_id: str) -> Optional[str]:
+        """
+        Cancel a job; a job running in this process stops at once.
+
+        Returns:
+            The status before cancelling, or None if the job does not exist
+        """
+        previous = await self.queue.cancel(job_id)
+        task = self._running.get(job_id)
+        if previous == "running" and task is not None:
+            task.cancel()
+        return previous
+
+    async def stats(self) -> dict[str, Any]:
+        if not self.enabled:
+            return {"enabled": False}
+        return {
+            "enabled": True,
+            "workers": len(self._workers),
+            "running_here": len(self._running),
+            "jobs": await self.queue.counts(),
+        }
+
+    async def _worker(self) -> None:
+        while True:
+            await self._maybe_purge()
+            job = await self.queue.claim(
+                WORKER_ID, self.config.lease_seconds, self.config.max_attempts
+            )
+            if job is None:
+                self._wake.clear()
+                try:
+                    async with asyncio.timeout(self.config.poll_interval):
+                        await self._wake.wait()
+                except TimeoutError:
+                    pass
+                continue
+            task = asyncio.create_task(self._execute(job))
+            self._running[job["id"]] = task
+            try:
+                await asyncio.shield(task)
+            except asyncio.CancelledError:
+                worker = asyncio.current_task()
+                if task.done() and worker is not None and not worker.cancelling():
+                    # Only the job was cancelled (by the user, or it lost its lease)
+                    continue
+                # Worker stopped (shutdown): stop the job too, then exit
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                raise
+            except Exception:
+                pass
+            finally:
+                self._running.pop(job["id"], None)
+
+    async def _maybe_purge(self) -> None:
+        if self.config.retention_seconds <= 0 or time.monotonic() < self._next_purge:
+            return
+        self._next_purge = time.monotonic() + 600
+        await self.queue.purge(time.time() - self.config.retention_seconds)
+
+    async def _renew_lease(self, job_id: str, run: Optional[asyncio.Task[Any]]) -> None:
+        interval = max(1.0, self.config.lease_seconds / 3)
+        while True:
+            await asyncio.sleep(interval)
+            if not await self.queue.renew(job_id, WORKER_ID, self.config.lease_seconds):
+                if run is not None:
+                    run.cancel()
+                return
+
+    async def _execute(self, job: dict[str, Any]) -> None:
+        job_id = job["id"]
+        session_id = job["session_id"]
+        next_seq = await self.queue.last_seq(job_id) + 1
+        if next_seq > 1:
+            # An earlier attempt already sent the message into the session;
+            # sending it again would repeat the turn there
+            session_id = str(uuid.uuid4())
+            await self.queue.move_session(job_id, WORKER_ID, session_id)
+        log = _EventLog(self.queue, job_id, job["attempts"], next_seq, self.config)
+        renewer = asyncio.create_task(self._renew_lease(job_id, asyncio.current_task()))
+        chunks: list[str] = []
+        error = None
+        done: dict[str, Any] = {}
+        status = None
+        backoff = 0
+        try:
+            if await agent_service.get_session(session_id) is None:
+                await agent_service.start_session(session_id, persona=job["persona"])
+                if job["template"]:
+                    await agent_service.provision_template(session_id, job["template"])
+            events = agent_service.chat(
+                job["message"], session_id,
+                api_key_id=job["api_key_id"],
+                budget_session_id=job["budget_session_id"],
+            )
+            async for event in events:
+                if event["type"] == "queued":
+                    continue
+                await log.add(event)
+                if event["type"] == "text":
+                    chunks.append(event["content"])
+                elif event["type"] == "error":
+                    error = event["message"]
+                elif event["type"] == "done":
+                    done = event
+                    if event.get("is_error") and error is None:
+                        error = "Agent run ended with an error"
+            status = "failed" if error else "succeeded"
+        except BudgetExceededError as e:
+            # Requeueing would retry until the window resets; the caller
+            # resubmits once the budget allows
+            error = str(e)
+            status = "failed"
+        except AgentOverloadedError as e:
+            # Not the job's fault: hand it back and let this worker back off
+            await self.queue.requeue(job_id, WORKER_ID)
+            backoff = min(e.retry_after or 1, self.config.lease_seconds)
+        except asyncio.CancelledError:
+            # Cancelled by the user, lost the lease, or shutting down
+            if self._closing:
+                await self.queue.requeue(job_id, WORKER_ID)
+            raise
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            status = "failed"
+        finally:
+            renewer.cancel()
+            try:
+                await log.flush()
+            except Exception:
+                pass
+
+        if backoff:
+            await asyncio.sleep(backoff)
+        if status is not None:
+            await self.queue.finish(
+                job_id, WORKER_ID, status,
+                response="".join(chunks),
+                error=error,
+                usage=done.get("usage"),
+                total_cost_usd=done.get("total_cost_usd"),
+            )
+            FINISHED_JOBS.inc(status)
+
+
+# Singleton instance
+job_service = JobService()
@@ -1,11 +1,46 @@
 """
 Pytest configuration and fixtures for backend tests.
 """
-import pytest
+import os
+import sys
+import tempfile
 from typing import AsyncGenerator
-from httpx import AsyncClient, ASGITransport
 
-from src.main import app
+import pytest
+import pytest_asyncio
+from httpx import ASGITransport, AsyncClient
+
+from benchmarks.fake_sdk import FakeScript, install_fake_sdk
+
+
+def pytest_configure(config):
+    """Keep test runs out of the working tree (settings are read on import)."""
+    scratch = tempfile.mkdtemp(prefix="backend-tests-")
+    os.environ.setdefault("AGENT_WORKSPACE_DIR", os.path.join(scratch, "workspaces"))
+    os.environ.setdefault("AGENT_TEMPLATES_DIR", os.path.join(scratch, "templates"))
+    os.environ.setdefault("JOBS_DATABASE_PATH", os.path.join(scratch, "jobs.db"))
+
+
+def pytest_collection_modifyitems(items):
+    """
+    Run all async tests on one event loop.
+
+    The agent service and driver are module-level singletons whose
+    background tasks belong to the loop they started on.
+    """
+    marker = pytest.mark.asyncio(loop_scope="session")
+    for item in items:
+        if pytest_asyncio.is_async_test(item):
+            item.add_marker(marker, append=False)
+
+
+@pytest_asyncio.fixture(scope="session", loop_scope="session", autouse=True)
+async def shutdown_driver():
+    """Stop the driver singleton's background tasks once the run is over."""
+    yield
+    driver = sys.modules.get("src.modules.agent.driver")
+    if driver is not None:
+        await driver.claude_sdk_driver.shutdown()
 
 
 @pytest.fixture
@@ -17,6 +52,8 @@ def anyio_backend():
 @pytest.fixture
 async def client() -> AsyncGenerator[AsyncClient, None]:
     """Create async test client."""
+    from src.main import app
+
     async with AsyncClient(
         transport=ASGITransport(app=app),
         base_url="http://test"
@@ -24,6 +61,16 @@ async def client() -> AsyncGenerator[AsyncClient, None]:
         yield ac
 
 
+@pytest.fixture
+def fake_sdk():
+    """Make the driver and client pool create instant fake clients (three text chunks per turn)."""
+    script = FakeScript(
+        connect_latency=0, first_token_latency=0, text_chunks=3, chunk_interval=0, tool_latency=0
+    )
+    with install_fake_sdk(script) as client_class:
+        yield client_class
+
+
 @pytest.fixture
 def sample_user_data():
     """Sample user data for tests."""
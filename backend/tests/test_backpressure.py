@@ -0,0 +1,205 @@
+"""
+Tests for stream backpressure and the overflow policies.
+"""
+import asyncio
+import json
+
+import pytest
+
+from src.modules.agent.tool_outputs import ToolOutputConfig, ToolOutputStore
+from src.modules.agent.workspace import WorkspaceManager
+from src.modules.chat.replay import ReplayConfig, ReplayStore
+from src.modules.chat.sse import SSEConfig, SSEEncoder
+
+MAX_PENDING = 512
+
+
+class Source:
+    """Agent events fed by the test, counting what the recorder consumed."""
+
+    def __init__(self):
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.taken = 0
+
+    async def events(self):
+        while (event := await self.queue.get()) is not None:
+            self.taken += 1
+            yield event
+
+    def put(self, *events: dict) -> None:
+        for event in events:
+            self.queue.put_nowait(event)
+
+
+def make_store(policy: str, spill=None) -> ReplayStore:
+    config = ReplayConfig(
+        max_events=1000,
+        max_bytes=1 << 20,
+        max_total_bytes=1 << 22,
+        retention_seconds=60,
+        disconnect_grace_seconds=5,
+        max_pending_bytes=MAX_PENDING,
+        overflow_policy=policy,
+    )
+    return ReplayStore(config, encoder=SSEEncoder(SSEConfig(coalesce_interval_ms=0)), spill=spill)
+
+
+def tool_use(i: int) -> dict:
+    return {"type": "tool_use", "id": f"tool-{i}", "tool": "Bash", "input": {"command": "x" * 300}}
+
+
+def events_of(chunks: list[bytes]) -> list[dict]:
+    return [
+        json.loads(block.split("data: ", 1)[1])
+        for block in b"".join(chunks).decode().split("\n\n") if block
+    ]
+
+
+async def stalled_stream(store: ReplayStore, source: Source):
+    """
+    Start a run and read its first frame, then stop reading.
+
+    Two tool_use events (about 400 bytes each) then take the unsent
+    bytes past MAX_PENDING.
+    """
+    buffer, run = store.start_run("s1", source.events())
+    stream = buffer.subscribe(run=run)
+    source.put({"type": "text", "content": "start"})
+    first = await anext(stream)
+    return buffer, stream, first
+
+
+async def settle() -> None:
+    await asyncio.sleep(0.02)
+
+
+async def finish(source: Source, stream, first: bytes) -> list[dict]:
+    """Resume reading, end the source and return every event received."""
+    rest = asyncio.create_task(read_all(stream))
+    source.put(None)
+    return events_of([first, *await rest])
+
+
+async def read_all(stream) -> list[bytes]:
+    return [chunk async for chunk in stream]
+
+
+async def test_block_policy_stops_reading_the_run():
+    store = make_store("block")
+    source = Source()
+    buffer, stream, first = await stalled_stream(store, source)
+
+    source.put(*(tool_use(i) for i in range(20)))
+    await settle()
+
+    # The recorder stopped just past the bound and left the rest unread
+    assert MAX_PENDING < buffer.pending < 2 * MAX_PENDING
+    assert source.taken == 4  # start, two appended, one waiting
+    assert buffer.running
+
+    events = await finish(source, stream, first)
+    assert [event["id"] for event in events[1:]] == [f"tool-{i}" for i in range(20)]
+    assert not buffer.running
+
+
+async def test_block_policy_ignores_detached_runs():
+    """Without an attached stream the ring buffer bounds memory instead."""
+    store = make_store("block")
+    source = Source()
+    buffer, _ = store.start_run("s1", source.events())
+
+    source.put(*(tool_use(i) for i in range(20)), None)
+    async with asyncio.timeout(1):
+        while buffer.running:
+            await asyncio.sleep(0.005)
+
+    assert buffer.last_id == 20
+    assert buffer.pending == 0
+
+
+async def test_coalesce_policy_merges_text_instead_of_blocking():
+    store = make_store("coalesce")
+    source = Source()
+    buffer, stream, first = await stalled_stream(store, source)
+
+    chunks = [f"chunk {i:02d} " + "." * 80 for i in range(50)]
+    source.put(*({"type": "text", "content": chunk} for chunk in chunks))
+    await settle()
+    # Past the bound, text is merged into the newest unsent frame without waiting
+    assert source.taken == 51
+    frames = buffer.last_id
+    assert frames < 10
+
+    # Other events still wait for the stream
+    source.put(tool_use(0), tool_use(1))
+    await settle()
+    assert source.taken == 52 and buffer.last_id == frames
+
+    events = await finish(source, stream, first)
+    texts = [event["content"] for event in events if event["type"] == "text"]
+    assert texts[0] == "start"
+    assert "".join(texts[1:]) == "".join(chunks)
+    assert len(texts) == frames
+    assert [event["id"] for event in events[-2:]] == ["tool-0", "tool-1"]
+
+
+async def test_reference_policy_spills_tool_output(tmp_path):
+    workspaces = WorkspaceManager(tmp_path)
+    outputs = ToolOutputStore(workspaces, ToolOutputConfig(spill_chars=0, preview_chars=20))
+    store = make_store("reference", spill=outputs.shrink)
+    source = Source()
+    buffer, stream, first = await stalled_stream(store, source)
+
+    source.put(tool_use(0), tool_use(1))
+    await settle()
+    output = "line\n" * 2000
+    source.put({"type": "tool_result", "tool_use_id": "toolu_big", "tool": "Bash", "output": output})
+    await settle()
+
+    events = await finish(source, stream, first)
+    result = events[-1]
+    assert result["output"] == output[:20]
+    assert result["output_ref"] == {"id": "toolu_big", "size": len(output)}
+    assert outputs.path("s1", "toolu_big").read_text() == output
+    await workspaces.close()
+
+
+async def test_reference_policy_keeps_small_outputs():
+    spilled = []
+
+    async def spill(session_id: str, event: dict) -> dict:
+        spilled.append(event)
+        return event
+
+    store = make_store("reference", spill=spill)
+    source = Source()
+    buffer, stream, first = await stalled_stream(store, source)
+
+    source.put(tool_use(0), tool_use(1))
+    await settle()
+    source.put({"type": "tool_result", "tool_use_id": "t", "tool": "Bash", "output": "ok"})
+    await settle()
+
+    events = await finish(source, stream, first)
+    assert events[-1]["output"] == "ok" and "output_ref" not in events[-1]
+    assert len(spilled) == 1
+
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        make_store("drop")
+
+
+async def test_coalescing_read_ahead_is_bounded_by_bytes():
+    """A consumer that stops reading stops the source near the byte bound."""
+    encoder = SSEEncoder(SSEConfig(coalesce_interval_ms=5, coalesce_max_bytes=4096))
+    source = Source()
+    source.put(*(tool_use(i) for i in range(100)))
+    batches = encoder.coalesce(source.events(), read_ahead_bytes=2000)
+
+    await anext(batches)
+    await settle()
+
+    # About 2000 bytes of ~360 byte events, plus the batch taken
+    assert source.taken < 15
+    await batches.aclose()
@@ -0,0 +1,169 @@
+"""
+Tests for batch execution: parallelism, per-item results and the summary.
+"""
+import asyncio
+import json
+from typing import Any, AsyncIterator, Optional
+
+import pytest
+
+from src.modules.agent.batch import BatchConfig, BatchItem, BatchRunner
+from src.modules.agent.driver import claude_sdk_driver
+
+
+def done(cost: float = 0.5) -> dict[str, Any]:
+    return {"type": "done", "usage": {"input_tokens": 10, "output_tokens": 5}, "total_cost_usd": cost}
+
+
+class FakeService:
+    """The parts of AgentService a batch uses, with scripted turns."""
+
+    def __init__(self, delay: float = 0.0, cached: Optional[set[str]] = None):
+        self.delay = delay
+        self.cached = cached or set()
+        self.running = 0
+        self.max_running = 0
+        self.started: list[str] = []
+        self.ended: list[str] = []
+        self.models: list[Optional[str]] = []
+
+    async def start_session(self, session_id: str, persona: Optional[str] = None) -> None:
+        if persona == "missing":
+            raise ValueError("Unknown persona")
+        self.started.append(session_id)
+
+    async def provision_template(self, session_id: str, template: str) -> None:
+        pass
+
+    async def lookup_cached_response(
+        self, message: str, session_id: str, model: Optional[str] = None
+    ) -> tuple[str, Any]:
+        return ("HIT", object()) if message in self.cached else ("MISS", None)
+
+    async def replay_cached(self, message: str, session_id: str, cached: Any) -> AsyncIterator[dict[str, Any]]:
+        yield {"type": "text", "content": "cached " + message}
+        yield done(cost=2.0)
+
+    async def chat(self, message: str, session_id: str, **kwargs: Any) -> AsyncIterator[dict[str, Any]]:
+        self.models.append(kwargs.get("model"))
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        try:
+            await asyncio.sleep(self.delay)
+            if message == "fail":
+                yield {"type": "error", "message": "boom"}
+                yield {"type": "done", "is_error": True}
+                return
+            if message == "raise":
+                raise RuntimeError("driver gone")
+            yield {"type": "text", "content": "re: "}
+            yield {"type": "text", "content": message}
+            yield done()
+        finally:
+            self.running -= 1
+
+    async def end_session(self, session_id: str) -> None:
+        self.ended.append(session_id)
+
+
+async def run(runner: BatchRunner, items: list[BatchItem], parallelism: int = 4, **kwargs: Any):
+    records = [record async for record in runner.run(items, parallelism, **kwargs)]
+    return records[:-1], records[-1]
+
+
+async def test_results_and_summary():
+    service = FakeService()
+    items = [BatchItem("a", id="first"), BatchItem("b", model="haiku")]
+
+    results, summary = await run(BatchRunner(service), items)
+
+    by_index = {r["index"]: r for r in results}
+    assert by_index[0]["id"] == "first"
+    assert [by_index[i]["response"] for i in (0, 1)] == ["re: a", "re: b"]
+    assert all(r["status"] == "ok" and r["timings"]["first_token_ms"] is not None for r in results)
+    assert summary["type"] == "summary"
+    assert (summary["items"], summary["succeeded"], summary["failed"]) == (2, 2, 0)
+    assert summary["usage"] == {"input_tokens": 20, "output_tokens": 10}
+    assert summary["total_cost_usd"] == 1.0
+    # Model hints reach the service
+    assert sorted(service.models, key=str) == [None, "haiku"]
+
+
+async def test_item_errors_do_not_fail_the_batch():
+    service = FakeService()
+    items = [BatchItem("fail"), BatchItem("raise"), BatchItem("ok"), BatchItem("x", persona="missing")]
+
+    results, summary = await run(BatchRunner(service), items)
+
+    by_index = {r["index"]: r for r in results}
+    assert by_index[0]["error"] == "boom"
+    assert by_index[1]["error"] == "RuntimeError: driver gone"
+    assert by_index[2]["status"] == "ok"
+    assert by_index[3]["error"] == "ValueError: Unknown persona"
+    assert (summary["succeeded"], summary["failed"]) == (1, 3)
+
+
+@pytest.mark.parametrize("requested, expected", [(2, 2), (50, 3), (0, 1)])
+async def test_parallelism_is_bounded(requested, expected):
+    service = FakeService(delay=0.01)
+    runner = BatchRunner(service, BatchConfig(max_items=100, max_parallelism=3))
+
+    _, summary = await run(runner, [BatchItem(str(i)) for i in range(8)], parallelism=requested)
+
+    assert summary["parallelism"] == expected
+    assert service.max_running == expected
+
+
+def test_batch_limits():
+    runner = BatchRunner(FakeService(), BatchConfig(max_items=2, max_parallelism=4))
+
+    with pytest.raises(ValueError):
+        runner.validate([], 1)
+    with pytest.raises(ValueError):
+        runner.validate([BatchItem("a")] * 3, 1)
+    assert runner.validate([BatchItem("a")], 4) == 1
+
+
+@pytest.mark.parametrize("keep_sessions", [False, True])
+async def test_sessions_are_removed_unless_kept(keep_sessions):
+    service = FakeService()
+
+    results, _ = await run(BatchRunner(service), [BatchItem("a"), BatchItem("fail")], keep_sessions=keep_sessions)
+
+    assert sorted(r["session_id"] for r in results) == sorted(service.started)
+    assert service.ended == ([] if keep_sessions else service.started)
+
+
+async def test_cached_items_are_not_counted_as_spent():
+    service = FakeService(cached={"hit"})
+
+    results, summary = await run(BatchRunner(service), [BatchItem("hit"), BatchItem("miss")])
+
+    hit = next(r for r in results if r["cache"] == "HIT")
+    assert (hit["total_cost_usd"], hit["cached_cost_usd"]) == (0.0, 2.0)
+    assert hit["response"] == "cached hit"
+    assert summary["usage"] == {"input_tokens": 10, "output_tokens": 5}
+    assert summary["total_cost_usd"] == 0.5
+    assert (summary["cached"], summary["cached_cost_usd"]) == (1, 2.0)
+
+
+async def test_endpoint_streams_ndjson(client, fake_sdk):
+    response = await client.post("/api/chat/batch", json={
+        "items": [{"message": "a", "id": "x", "cache": False}, {"message": "b", "cache": False}],
+        "parallelism": 2,
+    })
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    *results, summary = (json.loads(line) for line in response.text.splitlines())
+    assert sorted(r["index"] for r in results) == [0, 1]
+    assert all(r["status"] == "ok" for r in results)
+    assert (summary["type"], summary["succeeded"]) == ("summary", 2)
+    # Item sessions are gone with their workspaces
+    assert not any(claude_sdk_driver.workspaces.path(r["session_id"]).exists() for r in results)
+
+
+async def test_endpoint_rejects_an_empty_batch(client):
+    response = await client.post("/api/chat/batch", json={"items": []})
+
+    assert response.status_code == 400
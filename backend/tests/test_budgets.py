@@ -0,0 +1,157 @@
+"""
+Tests for token and cost budgets.
+"""
+from types import SimpleNamespace
+
+import pytest
+
+from src.modules.agent import budgets
+from src.modules.agent.budgets import BudgetConfig, BudgetTracker, key_id, usage_tokens
+from src.modules.agent.exceptions import BudgetExceededError
+from src.modules.agent.service import agent_service
+
+WINDOW = 600
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controllable wall clock for the budget windows."""
+    now = SimpleNamespace(value=1_000_000.0)
+    monkeypatch.setattr(budgets, "time", SimpleNamespace(time=lambda: now.value))
+    return now
+
+
+def tracker(**limits) -> BudgetTracker:
+    return BudgetTracker(BudgetConfig(**{
+        "enabled": True,
+        "window_seconds": WINDOW,
+        "session_tokens": 0,
+        "session_cost_usd": 0.0,
+        "key_tokens": 0,
+        "key_cost_usd": 0.0,
+        "database_path": "",
+        **limits,
+    }))
+
+
+def usage(tokens: int) -> dict:
+    return {"input_tokens": tokens, "output_tokens": 0}
+
+
+def test_usage_tokens_skip_cache_reads():
+    assert usage_tokens({
+        "input_tokens": 10,
+        "output_tokens": 20,
+        "cache_creation_input_tokens": 30,
+        "cache_read_input_tokens": 1000,
+    }) == 60
+    assert usage_tokens(None) == 0
+
+
+async def test_disabled_budgets_never_reject(clock):
+    budget = tracker(enabled=False, session_tokens=10)
+    await budget.charge("s1", None, usage(1000), 1.0)
+
+    budget.check("s1")
+    assert budget.remaining("s1") is None
+
+
+async def test_session_token_budget(clock):
+    budget = tracker(session_tokens=1000)
+
+    await budget.charge("s1", None, usage(600), None)
+    budget.check("s1")
+    assert budget.remaining("s1")["tokens"] == 400
+
+    await budget.charge("s1", None, usage(600), None)
+    with pytest.raises(BudgetExceededError) as exc:
+        budget.check("s1")
+    assert str(exc.value) == "Token budget exhausted for this session"
+    assert exc.value.remaining["tokens"] == 0
+    assert exc.value.retry_after >= 1
+    # Other sessions are not affected
+    budget.check("s2")
+
+
+async def test_key_cost_budget_spans_sessions(clock):
+    budget = tracker(key_cost_usd=1.0)
+
+    await budget.charge("s1", "key-a", None, 0.6)
+    await budget.charge("s2", "key-a", None, 0.6)
+
+    with pytest.raises(BudgetExceededError, match="Cost budget exhausted for this API key"):
+        budget.check("s3", "key-a")
+    budget.check("s3", "key-b")
+    # Keys are only stored hashed
+    assert budget.stats()["top"][0]["subject"] == key_id("key-a") != "key-a"
+
+
+async def test_key_id_stands_in_for_the_key(clock):
+    """Background jobs keep only the key's hash; it draws on the same budget."""
+    budget = tracker(key_tokens=100)
+
+    await budget.charge("s1", None, usage(100), None, api_key_id=key_id("key-a"))
+
+    with pytest.raises(BudgetExceededError):
+        budget.check("s2", "key-a")
+    with pytest.raises(BudgetExceededError):
+        budget.check(None, api_key_id=key_id("key-a"))
+
+
+async def test_usage_leaves_the_window(clock):
+    budget = tracker(session_tokens=1000)
+    await budget.charge("s1", None, usage(800), None)
+    clock.value += WINDOW / 2
+    await budget.charge("s1", None, usage(300), None)
+
+    with pytest.raises(BudgetExceededError) as exc:
+        budget.check("s1")
+    # Back under the limit once the first charge leaves the window
+    assert WINDOW / 2 - 10 <= exc.value.retry_after <= WINDOW / 2 + 10
+
+    clock.value += WINDOW / 2 + 10
+    budget.check("s1")
+    assert budget.remaining("s1")["tokens"] == 700
+
+
+async def test_remaining_reports_the_tightest_budget(clock):
+    budget = tracker(session_tokens=1000, key_tokens=5000, key_cost_usd=2.0)
+    await budget.charge("s1", "key-a", usage(300), 1.5)
+    await budget.charge("s2", "key-a", usage(4000), 0.0)
+
+    remaining = budget.remaining("s1", "key-a")
+
+    assert remaining["tokens"] == 700
+    assert remaining["cost_usd"] == pytest.approx(0.5)
+
+
+async def test_charges_survive_a_restart(clock, tmp_path):
+    path = str(tmp_path / "budgets.db")
+    budget = tracker(session_tokens=1000, database_path=path)
+    await budget.charge("s1", None, usage(1200), None)
+    await budget.close()
+
+    restarted = tracker(session_tokens=1000, database_path=path)
+    await restarted.start()
+    with pytest.raises(BudgetExceededError):
+        restarted.check("s1")
+
+    # Charges older than the window are not reloaded
+    await restarted.close()
+    clock.value += WINDOW + 1
+    later = tracker(session_tokens=1000, database_path=path)
+    await later.start()
+    later.check("s1")
+    await later.close()
+
+
+async def test_exhausted_budget_is_a_429(client, fake_sdk, monkeypatch):
+    monkeypatch.setattr(agent_service, "budgets", tracker(key_tokens=10))
+    headers = {"X-API-Key": "key-a"}
+
+    first = await client.post("/api/chat/message/sync", json={"message": "hi"}, headers=headers)
+    assert first.status_code == 200
+
+    second = await client.post("/api/chat/message/sync", json={"message": "hi"}, headers=headers)
+    assert second.status_code == 429
+    assert int(second.headers["Retry-After"]) >= 1
@@ -0,0 +1,130 @@
+"""
+Tests for conversation compaction.
+"""
+import asyncio
+
+import pytest
+from claude_agent_sdk import ClaudeAgentOptions
+
+from src.modules.agent.compaction import (
+    CompactionConfig,
+    Compactor,
+    context_tokens,
+    seed_prompt,
+)
+from src.modules.agent.pool import ClientPool, PoolConfig, PoolKey
+from src.modules.agent.service import agent_service
+
+
+@pytest.fixture
+def clients(fake_sdk, monkeypatch):
+    """Every fake client created, in order."""
+    created = []
+    init = fake_sdk.__init__
+
+    def record(self, options=None, script=None):
+        init(self, options, script)
+        created.append(self)
+
+    monkeypatch.setattr(fake_sdk, "__init__", record)
+    return created
+
+
+@pytest.fixture
+def compactor(monkeypatch):
+    compactor = Compactor(agent_service, CompactionConfig(
+        threshold_tokens=20, model="", max_summary_chars=4000
+    ))
+    monkeypatch.setattr(agent_service, "compactor", compactor)
+    return compactor
+
+
+async def turn(message: str, session_id: str) -> list[dict]:
+    return [event async for event in agent_service.chat(message, session_id)]
+
+
+async def settled(compactor: Compactor) -> None:
+    async with asyncio.timeout(5):
+        while compactor.pending:
+            await asyncio.sleep(0.01)
+
+
+def test_context_tokens_per_model_call():
+    usage = {"input_tokens": 100, "cache_read_input_tokens": 500, "cache_creation_input_tokens": 200, "output_tokens": 50}
+    assert context_tokens(usage) == 800
+    assert context_tokens(usage, num_turns=4) == 200
+    assert context_tokens(None) == 0
+
+
+def test_seed_prompt_appends_the_summary():
+    assert seed_prompt("Be brief.", None) == "Be brief."
+    seeded = seed_prompt("Be brief.", "We fixed the parser.")
+    assert seeded.startswith("Be brief.\n\n## Earlier conversation (summary)")
+    assert seeded.endswith("We fixed the parser.")
+    assert seed_prompt(None, "Summary").startswith("## Earlier conversation")
+
+
+async def test_long_session_restarts_from_a_summary(clients, compactor):
+    session_id = "compaction-1"
+    await turn("Let us plan the migration. " * 20, session_id)
+    first = clients[-1]
+    await settled(compactor)
+
+    record = await agent_service.store.get(session_id)
+    assert record["compactions"] == 1
+    assert record["restart"] is True
+    assert record["sdk_session_id"] is None
+    assert record["summary"]
+
+    # The summary turn resumed the session on a client of its own, without tools
+    summary_client = clients[-1]
+    assert summary_client is not first
+    assert summary_client.options.resume == first.session_id
+    assert summary_client.options.tools == []
+    assert summary_client.options.max_turns == 1
+    assert not summary_client.connected
+
+    events = await turn("What was the next step?", session_id)
+    assert events[-1]["type"] == "done"
+
+    # The next turn starts a fresh SDK session seeded with the summary
+    restarted = clients[-1]
+    assert restarted.options.resume is None
+    assert restarted.session_id != first.session_id
+    assert restarted.options.system_prompt.endswith(record["summary"])
+    record = await agent_service.store.get(session_id)
+    assert "restart" not in record
+    assert record["sdk_session_id"] == restarted.session_id
+    await agent_service.end_session(session_id)
+
+
+async def test_short_session_is_not_compacted(clients, compactor):
+    compactor.config.threshold_tokens = 1_000_000
+    session_id = "compaction-2"
+
+    await turn("hi", session_id)
+    await settled(compactor)
+
+    record = await agent_service.store.get(session_id)
+    assert record.get("compactions", 0) == 0
+    assert len(clients) == 1
+    await agent_service.end_session(session_id)
+
+
+async def test_summary_seeded_prompts_are_not_pooled(tmp_path, fake_sdk):
+    """Keys that were never warmed miss without starting a refill."""
+    def options(key: PoolKey, workspace) -> ClaudeAgentOptions:
+        return ClaudeAgentOptions(system_prompt=key.system_prompt, model=key.model, cwd=str(workspace))
+
+    pool = ClientPool(tmp_path / ".pool", options, PoolConfig(
+        enabled=True, min_size=2, max_size=4, refill_policy="eager", models=[]
+    ))
+    seeded = PoolKey(model="fake-sonnet", system_prompt=seed_prompt("Be brief.", "Summary"))
+    try:
+        assert await pool.checkout(seeded, tmp_path / "session-1") is None
+        await asyncio.sleep(0.05)
+
+        assert pool.stats()["buckets"] == []
+        assert pool.idle_count() == 0
+    finally:
+        await pool.close()
@@ -0,0 +1,107 @@
+"""
+Tests for run deadlines, idle timeouts and aborting unfinished turns.
+"""
+import asyncio
+
+import pytest
+from claude_agent_sdk import AssistantMessage, ResultMessage, TextBlock
+
+from src.modules.agent.driver import ClaudeSDKConfig, ClaudeSDKDriver
+
+
+def result(session_id: str) -> ResultMessage:
+    return ResultMessage(
+        subtype="success", duration_ms=1, duration_api_ms=1, is_error=False,
+        num_turns=1, session_id=session_id, total_cost_usd=0.0, usage={},
+    )
+
+
+@pytest.fixture
+def stalling(fake_sdk, monkeypatch):
+    """
+    Clients that send one chunk and then stall until interrupted.
+
+    Set settles = False to make interrupts hang instead.
+    """
+    state = {"settles": True, "interrupts": 0}
+
+    async def receive_response(self):
+        stop = self.__dict__.setdefault("stop", asyncio.Event())
+        if not stop.is_set():
+            yield AssistantMessage([TextBlock("partial")], "fake")
+            await stop.wait()
+        if state["settles"]:
+            yield result(self.session_id)
+        else:
+            await asyncio.Event().wait()
+
+    async def interrupt(self):
+        state["interrupts"] += 1
+        self.__dict__.setdefault("stop", asyncio.Event()).set()
+
+    monkeypatch.setattr(fake_sdk, "receive_response", receive_response)
+    monkeypatch.setattr(fake_sdk, "interrupt", interrupt)
+    return state
+
+
+def make_driver(**config) -> ClaudeSDKDriver:
+    defaults = {"timeout": 10, "idle_timeout": 10, "interrupt_grace": 1.0, "idle_hibernate_seconds": 0}
+    return ClaudeSDKDriver(ClaudeSDKConfig(**{**defaults, **config}))
+
+
+async def run(driver: ClaudeSDKDriver, session_id: str = "s1") -> list[dict]:
+    async with asyncio.timeout(5):
+        return [event async for event in driver.execute("hello", session_id)]
+
+
+async def test_idle_timeout_interrupts_and_keeps_a_settled_client(stalling):
+    driver = make_driver(idle_timeout=0.05)
+
+    events = await run(driver)
+
+    assert events[0] == {"type": "text", "content": "partial"}
+    assert events[-1]["code"] == "timeout"
+    assert events[-1]["message"] == "Agent run exceeded idle timeout"
+    assert stalling["interrupts"] == 1
+    # The interrupted turn settled within the grace period: the client stays
+    assert driver.is_live("s1")
+    await driver.shutdown()
+
+
+async def test_run_deadline_applies_while_messages_keep_coming(fake_sdk, monkeypatch):
+    async def trickle(self):
+        while True:
+            yield AssistantMessage([TextBlock(".")], "fake")
+            await asyncio.sleep(0.01)
+
+    monkeypatch.setattr(fake_sdk, "receive_response", trickle)
+    driver = make_driver(timeout=0.1, idle_timeout=1, interrupt_grace=0.05)
+
+    events = await run(driver)
+
+    assert events[-1]["message"] == "Agent run exceeded run deadline"
+    assert len(events) > 2
+    await driver.shutdown()
+
+
+async def test_client_that_does_not_settle_is_released(stalling):
+    stalling["settles"] = False
+    driver = make_driver(idle_timeout=0.05, interrupt_grace=0.05)
+
+    events = await run(driver)
+
+    assert events[-1]["code"] == "timeout"
+    assert not driver.is_live("s1")
+    await driver.shutdown()
+
+
+async def test_consumer_closing_mid_turn_aborts_it(stalling):
+    driver = make_driver()
+    stream = driver.execute("hello", "s1")
+    assert (await anext(stream))["type"] == "text"
+
+    await stream.aclose()
+
+    assert stalling["interrupts"] == 1
+    assert "s1" not in driver._busy
+    await driver.shutdown()
@@ -0,0 +1,73 @@
+"""
+Tests for hibernating idle SDK sessions and resuming them.
+"""
+import pytest
+
+from src.modules.agent.driver import ClaudeSDKConfig, ClaudeSDKDriver
+
+
+@pytest.fixture
+async def driver(fake_sdk):
+    driver = ClaudeSDKDriver(ClaudeSDKConfig(max_live_clients=2, idle_hibernate_seconds=0))
+    yield driver
+    await driver.shutdown()
+
+
+async def run(driver: ClaudeSDKDriver, session_id: str, continue_conversation: bool = True) -> list[dict]:
+    return [
+        event async for event in driver.execute(
+            "hello", session_id, continue_conversation=continue_conversation
+        )
+    ]
+
+
+async def test_hibernated_session_resumes_its_sdk_session(driver):
+    """Hibernation disconnects the client; the next message resumes the same SDK session."""
+    [*_, done] = await run(driver, "s1", continue_conversation=False)
+    first = driver._clients["s1"]
+
+    assert await driver.hibernate("s1")
+    assert not driver.is_live("s1")
+    assert not first.connected
+
+    [*_, resumed] = await run(driver, "s1")
+    client = driver._clients["s1"]
+    assert client is not first
+    assert client.options.resume == done["session_id"]
+    assert resumed["session_id"] == done["session_id"]
+
+
+async def test_new_conversation_does_not_resume(driver):
+    """A message that does not continue the conversation starts a fresh SDK session."""
+    [*_, done] = await run(driver, "s1", continue_conversation=False)
+    await driver.hibernate("s1")
+
+    [*_, fresh] = await run(driver, "s1", continue_conversation=False)
+
+    assert driver._clients["s1"].options.resume is None
+    assert fresh["session_id"] != done["session_id"]
+
+
+async def test_busy_session_is_not_hibernated(driver):
+    """A session mid-run keeps its client."""
+    stream = driver.execute("hello", "s1", continue_conversation=False)
+    await anext(stream)
+
+    assert not await driver.hibernate("s1")
+    assert driver.is_live("s1")
+    await stream.aclose()
+
+
+async def test_live_client_limit_hibernates_least_recently_used(driver):
+    """Going over max_live_clients hibernates the idle session used longest ago."""
+    for session_id in ("s1", "s2"):
+        await run(driver, session_id, continue_conversation=False)
+    # Touch s1 so that s2 is the least recently used
+    await run(driver, "s1")
+
+    await run(driver, "s3", continue_conversation=False)
+
+    assert [driver.is_live(s) for s in ("s1", "s2", "s3")] == [True, False, True]
+    # s2 comes back from its SDK session id
+    await run(driver, "s2")
+    assert driver._clients["s2"].options.resume is not None
@@ -0,0 +1,144 @@
+"""
+Tests for the write-behind history writer.
+"""
+import asyncio
+from datetime import UTC, datetime
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.modules.history.models import events, messages, metadata, sessions
+from src.modules.history.writer import WriteBehindWriter, WriterConfig
+
+NOW = datetime.now(UTC)
+
+
+@pytest.fixture
+async def engine(tmp_path):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'history.db'}")
+    yield engine
+    await engine.dispose()
+
+
+async def create_tables(engine) -> None:
+    async with engine.begin() as conn:
+        await conn.run_sync(metadata.create_all)
+
+
+async def count(engine, table) -> int:
+    async with engine.connect() as conn:
+        return await conn.scalar(select(func.count()).select_from(table))
+
+
+def event_row(seq: int) -> dict:
+    return {
+        "session_id": "s1", "turn": 1, "seq": seq, "type": "text",
+        "payload": {"content": str(seq)}, "created_at": NOW,
+    }
+
+
+def message_row(turn: int) -> dict:
+    return {
+        "session_id": "s1", "turn": turn, "role": "user", "content": "hi",
+        "usage": None, "total_cost_usd": None, "duration_ms": None, "created_at": NOW,
+    }
+
+
+def writer(engine, batch_size: int = 10, flush_interval_ms: int = 10_000, max_buffered: int = 1000):
+    return WriteBehindWriter(engine, WriterConfig(
+        batch_size=batch_size, flush_interval_ms=flush_interval_ms, max_buffered=max_buffered
+    ))
+
+
+async def test_full_batches_are_written_right_away(engine):
+    await create_tables(engine)
+    rows = writer(engine, batch_size=10)
+
+    for seq in range(25):
+        assert rows.submit(events, event_row(seq))
+    await asyncio.sleep(0.2)
+
+    # Two full batches; the partial one waits for the flush interval
+    assert rows.stats.batches == 2
+    assert rows.stats.last_batch_rows == 10
+    assert rows.buffered == 5
+    assert await count(engine, events) == 20
+
+    await rows.close()
+    assert await count(engine, events) == 25
+    assert rows.stats.to_dict()["written"] == 25
+
+
+async def test_partial_batch_is_written_after_the_interval(engine):
+    await create_tables(engine)
+    rows = writer(engine, batch_size=100, flush_interval_ms=20)
+
+    rows.submit(messages, message_row(1))
+    rows.submit(events, event_row(1))
+    await asyncio.sleep(0.2)
+
+    assert rows.stats.batches == 1
+    assert await count(engine, messages) == 1
+    assert await count(engine, events) == 1
+    await rows.close()
+
+
+async def test_events_are_dropped_first_when_the_buffer_is_full(engine):
+    rows = writer(engine, batch_size=100, max_buffered=5)
+
+    accepted = [rows.submit(events, event_row(seq)) for seq in range(8)]
+    assert accepted == [True] * 5 + [False] * 3
+    assert rows.stats.dropped == 3
+
+    # Messages keep twice the headroom
+    accepted = [rows.submit(messages, message_row(turn)) for turn in range(7)]
+    assert accepted == [True] * 5 + [False] * 2
+    assert rows.stats.dropped == 5
+
+    await create_tables(engine)
+    await rows.close()
+    assert await count(engine, events) == 5
+    assert await count(engine, messages) == 5
+
+
+async def test_failed_batch_is_kept_and_retried(engine):
+    rows = writer(engine, batch_size=100)
+    for seq in range(3):
+        rows.submit(events, event_row(seq))
+
+    # No tables yet: the batch fails and goes back into the buffer
+    await rows.flush()
+    assert rows.stats.errors == 1
+    assert rows.buffered == 3
+    assert rows.stats.written == 0
+
+    await create_tables(engine)
+    await rows.flush()
+    assert rows.buffered == 0
+    assert await count(engine, events) == 3
+    await rows.close()
+
+
+async def test_duplicate_session_rows_are_ignored(engine):
+    await create_tables(engine)
+    rows = writer(engine)
+    row = {"id": "s1", "persona": "default", "created_at": NOW}
+
+    rows.submit(sessions, row)
+    await rows.flush()
+    rows.submit(sessions, row)
+    await rows.flush()
+
+    assert rows.stats.errors == 0
+    assert await count(engine, sessions) == 1
+    await rows.close()
+
+
+async def test_closed_writer_rejects_rows(engine):
+    await create_tables(engine)
+    rows = writer(engine)
+    await rows.close()
+
+    assert not rows.submit(events, event_row(1))
+    assert rows.buffered == 0
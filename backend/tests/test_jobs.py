@@ -0,0 +1,285 @@
+"""
+Tests for background jobs: the durable queue, leases and retries.
+"""
+import asyncio
+import sqlite3
+
+import pytest
+
+from benchmarks.fake_sdk import FakeScript
+from src.modules.agent.budgets import BudgetConfig, BudgetTracker, key_id
+from src.modules.agent.exceptions import BudgetExceededError
+from src.modules.agent.service import agent_service
+from src.modules.jobs import router
+from src.modules.jobs.queue import JobQueue
+from src.modules.jobs.service import JobConfig, JobService
+
+
+@pytest.fixture
+async def queue(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"))
+    yield queue
+    await queue.close()
+
+
+def job_service(path, **overrides) -> JobService:
+    return JobService(JobConfig(**{
+        "enabled": True,
+        "database_path": str(path),
+        "workers": 1,
+        "lease_seconds": 30,
+        "max_attempts": 2,
+        "retention_seconds": 0,
+        "poll_interval": 0.02,
+        **overrides,
+    }))
+
+
+@pytest.fixture
+def budget(monkeypatch):
+    """Generous session and key token budgets on the agent service."""
+    tracker = BudgetTracker(BudgetConfig(
+        enabled=True, window_seconds=600, session_tokens=10**6, session_cost_usd=0.0,
+        key_tokens=10**6, key_cost_usd=0.0, database_path="",
+    ))
+    monkeypatch.setattr(agent_service, "budgets", tracker)
+    return tracker
+
+
+def charged(tracker: BudgetTracker) -> dict[tuple[str, str], int]:
+    return {(item["kind"], item["subject"]): item["tokens"] for item in tracker.stats()["top"]}
+
+
+async def wait_for_status(queue: JobQueue, job_id: str, *statuses: str, timeout: float = 5.0) -> dict:
+    async with asyncio.timeout(timeout):
+        while (job := await queue.get(job_id))["status"] not in statuses:
+            await asyncio.sleep(0.01)
+    return job
+
+
+async def test_claim_takes_the_oldest_job_with_a_lease(queue):
+    first = await queue.submit("one")
+    second = await queue.submit("two")
+
+    claimed = await queue.claim("worker-a", lease_seconds=30, max_attempts=2)
+
+    assert claimed["id"] == first["id"]
+    assert (claimed["status"], claimed["worker"], claimed["attempts"]) == ("running", "worker-a", 1)
+    assert (await queue.claim("worker-b", 30, 2))["id"] == second["id"]
+    assert await queue.claim("worker-b", 30, 2) is None
+
+
+async def test_expired_lease_is_claimed_again(queue):
+    job = await queue.submit("hello")
+    await queue.claim("worker-a", lease_seconds=-1, max_attempts=2)
+
+    reclaimed = await queue.claim("worker-b", lease_seconds=30, max_attempts=2)
+
+    assert reclaimed["id"] == job["id"]
+    assert (reclaimed["worker"], reclaimed["attempts"]) == ("worker-b", 2)
+    # The old worker can no longer renew or finish it
+    assert not await queue.renew(job["id"], "worker-a", 30)
+    await queue.finish(job["id"], "worker-a", "succeeded")
+    assert (await queue.get(job["id"]))["status"] == "running"
+    assert await queue.renew(job["id"], "worker-b", 30)
+
+
+async def test_job_fails_after_max_attempts(queue):
+    job = await queue.submit("hello")
+    await queue.claim("worker-a", lease_seconds=-1, max_attempts=2)
+    await queue.claim("worker-b", lease_seconds=-1, max_attempts=2)
+
+    assert await queue.claim("worker-c", lease_seconds=30, max_attempts=2) is None
+    failed = await queue.get(job["id"])
+    assert failed["status"] == "failed"
+    assert failed["error"] == "Worker lost the job 2 times"
+
+
+async def test_requeue_does_not_count_the_attempt(queue):
+    job = await queue.submit("hello")
+    await queue.claim("worker-a", 30, 2)
+
+    await queue.requeue(job["id"], "worker-a")
+
+    requeued = await queue.get(job["id"])
+    assert (requeued["status"], requeued["attempts"], requeued["worker"]) == ("queued", 0, None)
+
+
+async def test_cancel_stops_lease_renewal(queue):
+    job = await queue.submit("hello")
+    await queue.claim("worker-a", 30, 2)
+
+    assert await queue.cancel(job["id"]) == "running"
+    assert not await queue.renew(job["id"], "worker-a", 30)
+    assert (await queue.get(job["id"]))["status"] == "cancelled"
+    # Cancelling a finished job changes nothing
+    assert await queue.cancel(job["id"]) == "cancelled"
+    assert await queue.cancel("missing") is None
+
+
+async def test_event_log(queue):
+    job = await queue.submit("hello")
+    await queue.add_events(job["id"], 1, 1, [{"type": "text", "content": "a"}, {"type": "done"}])
+
+    assert await queue.last_seq(job["id"]) == 2
+    assert await queue.events(job["id"], after_seq=1) == [
+        {"seq": 2, "attempt": 1, "event": {"type": "done"}}
+    ]
+
+
+async def test_job_runs_to_completion(tmp_path, fake_sdk):
+    jobs = job_service(tmp_path / "jobs.db")
+    await jobs.start()
+    try:
+        job = await jobs.submit("hello")
+        finished = await wait_for_status(jobs.queue, job["id"], "succeeded", "failed")
+
+        assert finished["status"] == "succeeded"
+        assert finished["response"]
+        assert finished["usage"]["output_tokens"] > 0
+        events = [item["event"]["type"] for item in await jobs.queue.events(job["id"])]
+        assert events[-1] == "done"
+        # Text is stored merged
+        assert events.count("text") == 1
+    finally:
+        await jobs.close()
+
+
+async def test_retry_after_a_lost_worker_runs_in_a_fresh_session(tmp_path, fake_sdk, budget):
+    """The turn already reached the agent once: never send it twice into one session."""
+    path = tmp_path / "jobs.db"
+    queue = JobQueue(str(path))
+    job = await queue.submit("hello", session_id="job-session")
+    # A worker took the job, logged its first event and died
+    await queue.claim("dead-worker", lease_seconds=-1, max_attempts=2)
+    await queue.add_events(job["id"], 1, 1, [{"type": "tool_use", "id": "t", "tool": "Bash", "input": {}}])
+    await queue.close()
+
+    jobs = job_service(path)
+    await jobs.start()
+    try:
+        finished = await wait_for_status(jobs.queue, job["id"], "succeeded", "failed")
+        assert finished["status"] == "succeeded"
+        assert finished["attempts"] == 2
+        assert finished["session_id"] != "job-session"
+        events = await jobs.queue.events(job["id"])
+        assert [item["attempt"] for item in events][:2] == [1, 2]
+        # The original session still pays for the retry
+        assert list(charged(budget)) == [("session", "job-session")]
+    finally:
+        await jobs.close()
+
+
+async def test_shutdown_puts_running_jobs_back(tmp_path, fake_sdk, monkeypatch):
+    monkeypatch.setattr(fake_sdk, "script", FakeScript(connect_latency=0, first_token_latency=10))
+    path = tmp_path / "jobs.db"
+    jobs = job_service(path)
+    await jobs.start()
+    job = await jobs.submit("hello")
+    await wait_for_status(jobs.queue, job["id"], "running")
+    await asyncio.sleep(0.05)
+
+    await jobs.close()
+
+    queue = JobQueue(str(path))
+    try:
+        requeued = await queue.get(job["id"])
+        assert (requeued["status"], requeued["attempts"]) == ("queued", 0)
+    finally:
+        await queue.close()
+
+
+async def test_cancelled_job_stops_and_the_worker_goes_on(tmp_path, fake_sdk, monkeypatch):
+    monkeypatch.setattr(fake_sdk, "script", FakeScript(connect_latency=0, first_token_latency=10))
+    jobs = job_service(tmp_path / "jobs.db")
+    await jobs.start()
+    try:
+        slow = await jobs.submit("hello")
+        await wait_for_status(jobs.queue, slow["id"], "running")
+        await asyncio.sleep(0.05)
+
+        assert await jobs.cancel(slow["id"]) == "running"
+        monkeypatch.setattr(fake_sdk, "script", FakeScript(
+            connect_latency=0, first_token_latency=0, chunk_interval=0, tool_latency=0
+        ))
+        fast = await jobs.submit("hello again")
+
+        assert (await wait_for_status(jobs.queue, fast["id"], "succeeded", "failed"))["status"] == "succeeded"
+        assert (await jobs.queue.get(slow["id"]))["status"] == "cancelled"
+        assert len(jobs._workers) == 1 and not jobs._workers[0].done()
+    finally:
+        await jobs.close()
+
+
+async def test_job_runs_are_charged_to_the_submitter_key(tmp_path, fake_sdk, budget):
+    jobs = job_service(tmp_path / "jobs.db")
+    await jobs.start()
+    try:
+        job = await jobs.submit("hello", session_id="job-key", api_key="key-a")
+        finished = await wait_for_status(jobs.queue, job["id"], "succeeded", "failed")
+    finally:
+        await jobs.close()
+
+    # Only the key's hash is stored
+    assert finished["api_key_id"] == key_id("key-a") != "key-a"
+    tokens = finished["usage"]["input_tokens"] + finished["usage"]["output_tokens"]
+    assert charged(budget) == {("session", "job-key"): tokens, ("key", key_id("key-a")): tokens}
+
+
+async def test_submit_over_budget_is_rejected(tmp_path, budget, client, monkeypatch):
+    await budget.charge("s1", "key-a", {"input_tokens": 10**6}, None)
+    jobs = job_service(tmp_path / "jobs.db")
+    monkeypatch.setattr(router, "job_service", jobs)
+    try:
+        with pytest.raises(BudgetExceededError):
+            await jobs.submit("hello", api_key="key-a")
+        response = await client.post("/api/jobs", json={"message": "hello"}, headers={"X-API-Key": "key-a"})
+        other_key = await client.post("/api/jobs", json={"message": "hello"}, headers={"X-API-Key": "key-b"})
+    finally:
+        await jobs.close()
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    assert other_key.status_code == 202
+
+
+async def test_job_over_budget_when_it_runs_fails_without_retrying(tmp_path, fake_sdk, budget):
+    jobs = job_service(tmp_path / "jobs.db")
+    job = await jobs.submit("hello", session_id="job-spent", api_key="key-a")
+    # Another run used up the key's budget while the job was queued
+    await budget.charge("elsewhere", "key-a", {"input_tokens": 10**6}, None)
+
+    await jobs.start()
+    try:
+        finished = await wait_for_status(jobs.queue, job["id"], "succeeded", "failed")
+    finally:
+        await jobs.close()
+
+    assert finished["status"] == "failed"
+    assert "budget exhausted for this API key" in finished["error"]
+    assert finished["attempts"] == 1
+
+
+async def test_queue_adds_new_columns_to_an_existing_database(tmp_path):
+    path = tmp_path / "jobs.db"
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE jobs (id TEXT PRIMARY KEY, status TEXT NOT NULL, message TEXT NOT NULL,"
+        " session_id TEXT NOT NULL, persona TEXT, template TEXT,"
+        " created_at REAL NOT NULL, started_at REAL, finished_at REAL,"
+        " attempts INTEGER NOT NULL DEFAULT 0, worker TEXT, lease_expires REAL NOT NULL DEFAULT 0,"
+        " response TEXT, error TEXT, usage TEXT, total_cost_usd REAL)"
+    )
+    conn.execute("INSERT INTO jobs (id, status, message, session_id, created_at) VALUES ('old', 'queued', 'hi', 's', 0)")
+    conn.commit()
+    conn.close()
+
+    queue = JobQueue(str(path))
+    try:
+        old = await queue.get("old")
+        new = await queue.submit("hello", session_id="s2", api_key_id="abc")
+    finally:
+        await queue.close()
+
+    assert (old["api_key_id"], old["budget_session_id"]) == (None, None)
+    assert (new["api_key_id"], new["budget_session_id"]) == ("abc", "s2")
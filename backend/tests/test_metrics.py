@@ -0,0 +1,103 @@
+"""
+Tests for the metrics registry and the /metrics endpoint.
+"""
+import pytest
+
+from src.modules.core.metrics import CONTENT_TYPE, Counter, MetricsRegistry
+
+
+@pytest.fixture
+def registry() -> MetricsRegistry:
+    return MetricsRegistry()
+
+
+def test_counter_exposition(registry):
+    runs = registry.counter("runs_total", "Runs by outcome", labelnames=("outcome",))
+    runs.inc("completed")
+    runs.inc("completed")
+    runs.inc("error", amount=0.5)
+
+    assert registry.render() == (
+        "# HELP runs_total Runs by outcome\n"
+        "# TYPE runs_total counter\n"
+        'runs_total{outcome="completed"} 2\n'
+        'runs_total{outcome="error"} 0.5\n'
+    )
+    assert runs.value("completed") == 2
+
+
+def test_unlabelled_counter_has_no_braces(registry):
+    registry.counter("cost_total", "Cost").inc(amount=3)
+
+    assert registry.render().splitlines()[-1] == "cost_total 3"
+
+
+def test_label_values_are_escaped(registry):
+    registry.counter("c", "doc", labelnames=("path",)).inc('a\\b"c\nd')
+
+    assert registry.render().splitlines()[-1] == 'c{path="a\\\\b\\"c\\nd"} 1'
+
+
+@pytest.mark.parametrize("labels", [(), ("a", "b")])
+def test_wrong_number_of_label_values_is_rejected(registry, labels):
+    counter = registry.counter("c", "doc", labelnames=("one",))
+
+    with pytest.raises(ValueError):
+        counter.inc(*labels)
+    assert registry.render().splitlines()[2:] == []
+
+
+def test_histogram_buckets_are_cumulative(registry):
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(1, 0.1))
+    for value in (0.05, 0.1, 0.5, 2):
+        latency.observe(value)
+
+    assert registry.render().splitlines()[2:] == [
+        'latency_seconds_bucket{le="0.1"} 2',
+        'latency_seconds_bucket{le="1"} 3',
+        'latency_seconds_bucket{le="+Inf"} 4',
+        "latency_seconds_sum 2.65",
+        "latency_seconds_count 4",
+    ]
+    assert (latency.count, latency.sum) == (4, 2.65)
+
+
+def test_gauge_set_and_callback(registry):
+    depth = registry.gauge("depth", "Queue depth")
+    depth.set(3)
+    depth.inc()
+    depth.dec(2)
+    state = {"live": 7}
+    registry.gauge("live", "Live clients", callback=lambda: state["live"])
+    state["live"] = 8
+
+    assert registry.render().splitlines()[2::3] == ["depth 2", "live 8"]
+
+
+def test_failing_callback_does_not_break_the_scrape(registry):
+    registry.gauge("broken", "Broken", callback=lambda: 1 / 0)
+    registry.counter("ok_total", "Fine").inc()
+
+    assert registry.render() == "# HELP ok_total Fine\n# TYPE ok_total counter\nok_total 1\n"
+
+
+def test_register_returns_the_existing_metric(registry):
+    first = registry.counter("c", "doc")
+
+    assert registry.counter("c", "doc") is first
+    assert isinstance(first, Counter)
+    with pytest.raises(ValueError):
+        registry.gauge("c", "doc")
+
+
+async def test_metrics_endpoint(client, fake_sdk):
+    await client.post("/api/chat/message/sync", json={"message": "hi", "cache": False})
+
+    response = await client.get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == CONTENT_TYPE
+    lines = response.text.splitlines()
+    assert "# TYPE agent_run_duration_seconds histogram" in lines
+    assert any(line.startswith('agent_runs_total{outcome="completed"} ') for line in lines)
+    assert any(line.startswith('chat_messages_total{endpoint="sync",cache="BYPASS"} ') for line in lines)
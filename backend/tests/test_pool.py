@@ -0,0 +1,122 @@
+"""
+Tests for the warm client pool.
+"""
+import asyncio
+
+import pytest
+from claude_agent_sdk import ClaudeAgentOptions
+
+from src.modules.agent.pool import ClientPool, PoolConfig, PoolKey
+
+KEY = PoolKey(model="fake-sonnet", system_prompt="You are helpful.")
+
+
+def idle(pool: ClientPool) -> int:
+    return sum(bucket["idle"] for bucket in pool.stats()["buckets"])
+
+
+def staging_dirs(tmp_path) -> list[str]:
+    return sorted(entry.name for entry in (tmp_path / ".pool").iterdir())
+
+
+async def wait_for(predicate, timeout: float = 2.0) -> None:
+    """Poll until predicate() is true (background refills)."""
+    async with asyncio.timeout(timeout):
+        while not predicate():
+            await asyncio.sleep(0.005)
+
+
+@pytest.fixture
+async def pool(tmp_path, fake_sdk):
+    """A pool of fake clients staging under tmp_path/.pool."""
+    def options(key: PoolKey, workspace) -> ClaudeAgentOptions:
+        return ClaudeAgentOptions(
+            system_prompt=key.system_prompt, model=key.model, cwd=str(workspace)
+        )
+
+    pool = ClientPool(
+        tmp_path / ".pool",
+        options,
+        PoolConfig(enabled=True, min_size=1, max_size=2, refill_policy="eager", models=[]),
+    )
+    yield pool
+    await pool.close()
+
+
+async def test_checkout_hit_binds_workspace(pool, tmp_path):
+    """A warmed client is handed out in place and the workspace links to it."""
+    pool.warm(KEY)
+    await wait_for(lambda: idle(pool) == 1)
+    [staged] = staging_dirs(tmp_path)
+
+    (tmp_path / ".pool" / staged / "notes.md").write_text("scratch")
+    workspace = tmp_path / "session-1"
+
+    client = await pool.checkout(KEY, workspace)
+
+    assert client is not None and client.connected
+    assert workspace.is_symlink()
+    assert workspace.resolve() == (tmp_path / ".pool" / staged).resolve()
+    # The client keeps running in its staging directory
+    assert client.options.cwd == str(tmp_path / ".pool" / staged)
+    assert (workspace / "notes.md").read_text() == "scratch"
+
+    [bucket] = pool.stats()["buckets"]
+    assert (bucket["hits"], bucket["misses"]) == (1, 0)
+    # The bucket is topped up again in the background
+    await wait_for(lambda: idle(pool) == 1)
+
+
+async def test_checkout_carries_over_existing_workspace_content(pool, tmp_path):
+    """A provisioned workspace is moved into the staging directory it links to."""
+    pool.warm(KEY)
+    await wait_for(lambda: idle(pool) == 1)
+    workspace = tmp_path / "session-1"
+    (workspace / "src").mkdir(parents=True)
+    (workspace / "src" / "main.py").write_text("print()")
+
+    assert await pool.checkout(KEY, workspace) is not None
+
+    assert workspace.is_symlink()
+    assert (workspace / "src" / "main.py").read_text() == "print()"
+
+
+async def test_checkout_miss_when_bucket_is_empty(pool, tmp_path):
+    """An empty bucket is a miss that leaves the workspace alone."""
+    pool.config.min_size = 0
+    pool.warm(KEY)
+
+    assert await pool.checkout(KEY, tmp_path / "session-1") is None
+    assert not (tmp_path / "session-1").exists()
+    [bucket] = pool.stats()["buckets"]
+    assert (bucket["hits"], bucket["misses"]) == (0, 1)
+
+
+async def test_adaptive_policy_grows_target_on_miss(pool, tmp_path):
+    """Adaptive buckets start empty and grow by one per miss up to max_size."""
+    pool.config.min_size = 0
+    pool.config.refill_policy = "adaptive"
+    pool.warm(KEY)
+
+    # Back to back, before any refill can land
+    for session in range(3):
+        assert await pool.checkout(KEY, tmp_path / f"session-{session}") is None
+    await wait_for(lambda: idle(pool) == 2)
+
+    [bucket] = pool.stats()["buckets"]
+    assert bucket["target"] == 2
+    assert bucket["misses"] == 3
+
+
+async def test_close_disconnects_idle_clients(pool, tmp_path):
+    """Closing the pool disposes idle clients and their staging directories."""
+    pool.warm(KEY)
+    await wait_for(lambda: idle(pool) == 1)
+    client = pool._buckets[KEY].idle[0].client
+
+    await pool.close()
+
+    assert not client.connected
+    assert idle(pool) == 0
+    assert list((tmp_path / ".pool").iterdir()) == []
+    assert await pool.checkout(KEY, tmp_path / "session-1") is None
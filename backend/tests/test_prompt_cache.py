@@ -0,0 +1,138 @@
+"""
+Tests for the prompt cache and per-session personas.
+"""
+import asyncio
+import os
+
+import pytest
+
+from src.modules.agent import prompt_cache
+from src.modules.agent.prompt_cache import DEFAULT_PROMPT, PromptCache, PromptCacheConfig
+
+
+def make_cache(tmp_path, interval: float = 60) -> PromptCache:
+    return PromptCache(tmp_path, PromptCacheConfig(check_interval=interval))
+
+
+def bump(path, text: str) -> None:
+    """Rewrite a file with a visibly newer mtime."""
+    path.write_text(text)
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+@pytest.mark.parametrize("persona", ["", ".hidden", "../system", "a/b", "a\\b"])
+async def test_invalid_persona_names_are_rejected(tmp_path, persona):
+    with pytest.raises(ValueError):
+        await make_cache(tmp_path).get(persona)
+
+
+async def test_missing_files_fall_back_to_default_prompt(tmp_path):
+    cache = make_cache(tmp_path)
+
+    assert await cache.get() == DEFAULT_PROMPT
+    assert await cache.get("pirate") == DEFAULT_PROMPT
+
+
+async def test_persona_is_appended_to_the_base_prompt(tmp_path):
+    (tmp_path / "system.md").write_text("Base.")
+    (tmp_path / "persona_pirate.md").write_text("Arr.")
+
+    assert await make_cache(tmp_path).get("pirate") == "Base.\n\n## Persona\n\nArr."
+
+
+async def test_entries_are_served_from_memory_within_the_interval(tmp_path):
+    (tmp_path / "system.md").write_text("v1")
+    cache = make_cache(tmp_path)
+    await cache.get()
+    bump(tmp_path / "system.md", "v2")
+
+    assert await cache.get() == "v1"
+    assert cache.cached() == "v1"
+
+
+async def test_stale_entry_is_refreshed_in_the_background(tmp_path):
+    """The cached text is served while the check runs; the next read sees the change."""
+    (tmp_path / "system.md").write_text("v1")
+    cache = make_cache(tmp_path)
+    await cache.get()
+    bump(tmp_path / "system.md", "v2")
+    cache.invalidate()
+
+    assert await cache.get() == "v1"
+    await asyncio.gather(*cache._tasks)
+    assert await cache.get() == "v2"
+
+
+async def test_zero_interval_checks_on_every_access(tmp_path):
+    (tmp_path / "system.md").write_text("v1")
+    cache = make_cache(tmp_path, interval=0)
+    await cache.get()
+    bump(tmp_path / "system.md", "v2")
+
+    assert await cache.get() == "v2"
+
+
+async def test_touched_but_unchanged_file_keeps_the_text_object(tmp_path):
+    (tmp_path / "system.md").write_text("same")
+    cache = make_cache(tmp_path, interval=0)
+    first = await cache.get_compiled()
+    bump(tmp_path / "system.md", "same")
+
+    second = await cache.get_compiled()
+
+    assert second.text is first.text
+    assert second.signature != first.signature
+
+
+async def test_concurrent_cold_loads_share_one_read(tmp_path, monkeypatch):
+    loads = []
+    load = PromptCache._load
+
+    def counting_load(self, persona, current):
+        loads.append(persona)
+        return load(self, persona, current)
+
+    monkeypatch.setattr(PromptCache, "_load", counting_load)
+    cache = make_cache(tmp_path)
+
+    texts = await asyncio.gather(*(cache.get() for _ in range(5)))
+
+    assert len(set(texts)) == 1
+    assert loads == ["default"]
+
+
+async def test_failed_background_refresh_is_reported(tmp_path, monkeypatch):
+    cache = make_cache(tmp_path)
+    await cache.get()
+
+    def failing_stat(path):
+        raise PermissionError("denied")
+
+    monkeypatch.setattr(prompt_cache, "_stat", failing_stat)
+    cache.invalidate()
+
+    assert await cache.get() == DEFAULT_PROMPT
+    await asyncio.gather(*cache._tasks, return_exceptions=True)
+    assert cache.stats()["last_error"] == "PermissionError: denied"
+    assert not cache._tasks
+
+
+async def test_session_keeps_its_persona_when_the_default_changes(client, fake_sdk):
+    from src.modules.agent.service import agent_service
+
+    response = await client.post("/api/chat/sessions", json={"persona": "pirate"})
+    assert response.status_code == 200
+    session_id = response.json()["session_id"]
+    try:
+        assert (await client.post("/api/chat/admin/set-persona", params={"persona": "robot"})).status_code == 200
+        assert agent_service.persona == "robot"
+        assert (await client.get(f"/api/chat/sessions/{session_id}")).json()["persona"] == "pirate"
+    finally:
+        await agent_service.set_persona("default")
+        await client.delete(f"/api/chat/sessions/{session_id}")
+
+
+async def test_invalid_persona_is_rejected_by_the_api(client):
+    assert (await client.post("/api/chat/sessions", json={"persona": "../etc"})).status_code == 400
+    assert (await client.post("/api/chat/admin/set-persona", params={"persona": ".x"})).status_code == 400
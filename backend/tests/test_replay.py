@@ -0,0 +1,212 @@
+"""
+Tests for replayable event streams (Last-Event-ID).
+"""
+import asyncio
+import json
+
+from src.modules.chat.replay import ReplayConfig, ReplayStore, replay_store
+from src.modules.chat.sse import SSEConfig, SSEEncoder
+
+
+def make_store(**overrides) -> ReplayStore:
+    """A replay store without text coalescing, so every event is one frame."""
+    config = ReplayConfig(**{
+        "max_events": 100,
+        "max_bytes": 1 << 20,
+        "max_total_bytes": 1 << 22,
+        "retention_seconds": 60,
+        "disconnect_grace_seconds": 0,
+        "attach_timeout_seconds": 5.0,
+        **overrides,
+    })
+    return ReplayStore(config, encoder=SSEEncoder(SSEConfig(coalesce_interval_ms=0)))
+
+
+async def scripted(count: int):
+    for i in range(count):
+        yield {"type": "tool_use", "id": f"tool-{i}", "tool": "Bash", "input": {}}
+    yield {"type": "done", "usage": {}}
+
+
+def parse(chunks: list[bytes]) -> list[tuple[int | None, dict]]:
+    """Split SSE bytes into (id, event) pairs."""
+    frames = []
+    for block in b"".join(chunks).decode().split("\n\n"):
+        if not block:
+            continue
+        fields = dict(line.split(": ", 1) for line in block.split("\n"))
+        event_id = int(fields["id"]) if "id" in fields else None
+        frames.append((event_id, json.loads(fields["data"])))
+    return frames
+
+
+async def read_all(stream) -> list[bytes]:
+    return [chunk async for chunk in stream]
+
+
+async def finished_buffer(store: ReplayStore, count: int):
+    buffer, run = store.start_run("s1", scripted(count))
+    live = parse(await read_all(buffer.subscribe(run=run)))
+    assert not buffer.running
+    return buffer, live
+
+
+async def test_live_stream_gets_every_event_with_ids():
+    store = make_store()
+    _, live = await finished_buffer(store, 3)
+
+    assert [event_id for event_id, _ in live] == [1, 2, 3, 4]
+    assert [event["type"] for _, event in live] == ["tool_use"] * 3 + ["done"]
+
+
+async def test_resume_after_last_event_id():
+    """A reconnect receives only the frames after Last-Event-ID."""
+    store = make_store()
+    buffer, live = await finished_buffer(store, 5)
+
+    resumed = parse(await read_all(buffer.subscribe(after_id=3)))
+
+    assert resumed == live[3:]
+
+
+async def test_resume_of_a_complete_stream_is_empty():
+    store = make_store()
+    buffer, _ = await finished_buffer(store, 2)
+
+    assert await read_all(buffer.subscribe(after_id=buffer.last_id)) == []
+
+
+async def test_resume_follows_a_running_turn():
+    """A stream attached mid-run gets the backlog, then the live events."""
+    # The run survives the dropped connection within the grace period
+    store = make_store(disconnect_grace_seconds=5)
+    gate = asyncio.Event()
+
+    async def events():
+        yield {"type": "text", "content": "before"}
+        await gate.wait()
+        yield {"type": "text", "content": "after"}
+
+    buffer, run = store.start_run("s1", events())
+    first = buffer.subscribe(run=run)
+    assert parse([await anext(first)]) == [(1, {"type": "text", "content": "before"})]
+    await first.aclose()
+
+    resumed = asyncio.create_task(read_all(buffer.subscribe(after_id=0)))
+    await asyncio.sleep(0.01)
+    gate.set()
+
+    assert [event["content"] for _, event in parse(await resumed)] == ["before", "after"]
+
+
+async def test_evicted_events_are_reported_as_a_gap():
+    store = make_store(max_events=3)
+    buffer, _ = await finished_buffer(store, 5)
+
+    resumed = parse(await read_all(buffer.subscribe(after_id=1)))
+
+    gap_id, gap = resumed[0]
+    assert gap_id is None
+    assert gap["code"] == "replay_gap"
+    assert gap["message"] == "Events 2-3 are no longer available"
+    assert [event_id for event_id, _ in resumed[1:]] == [4, 5, 6]
+
+
+async def test_ids_continue_across_runs():
+    store = make_store()
+    buffer, _ = await finished_buffer(store, 1)
+
+    _, run = store.start_run("s1", scripted(1))
+    second = parse(await read_all(buffer.subscribe(run=run)))
+
+    assert [event_id for event_id, _ in second] == [3, 4]
+
+
+async def test_run_without_a_stream_is_cancelled():
+    """A run nobody attaches to stops instead of spending tokens."""
+    store = make_store(attach_timeout_seconds=0.01)
+
+    async def endless():
+        while True:
+            await asyncio.sleep(0.001)
+            yield {"type": "tool_use", "id": "t", "tool": "Bash", "input": {}}
+
+    buffer, _ = store.start_run("s1", endless())
+    async with asyncio.timeout(1):
+        while buffer.running:
+            await asyncio.sleep(0.005)
+
+    _, last = parse([buffer.frames[-1].data])[0]
+    assert last["code"] == "cancelled"
+
+
+async def test_last_stream_detaching_cancels_the_run():
+    store = make_store()
+    gate = asyncio.Event()
+
+    async def events():
+        yield {"type": "text", "content": "working"}
+        await gate.wait()
+
+    buffer, run = store.start_run("s1", events())
+    stream = buffer.subscribe(run=run)
+    await anext(stream)
+    await stream.aclose()
+
+    async with asyncio.timeout(1):
+        while buffer.running:
+            await asyncio.sleep(0.005)
+    _, last = parse([buffer.frames[-1].data])[0]
+    assert last["code"] == "cancelled"
+
+
+async def test_discard_mid_run_keeps_no_bytes():
+    """Discarding cancels the run; its cancellation frame is not stored or counted."""
+    store = make_store()
+    gate = asyncio.Event()
+
+    async def events():
+        yield {"type": "text", "content": "before"}
+        await gate.wait()
+        yield {"type": "text", "content": "after"}
+
+    buffer, run = store.start_run("s1", events())
+    await anext(buffer.subscribe(run=run))
+    assert store.total_bytes > 0
+
+    store.discard("s1")
+    gate.set()
+    async with asyncio.timeout(1):
+        while buffer.running:
+            await asyncio.sleep(0.005)
+
+    assert store.total_bytes == 0
+    assert not buffer.frames
+    assert store.get("s1") is None
+
+
+async def test_resume_endpoint_replays_after_last_event_id(client, fake_sdk):
+    response = await client.post("/api/chat/message", json={"message": "hello"})
+    assert response.status_code == 200
+    session_id = response.headers["X-Session-Id"]
+    live = parse([response.content])
+    assert live[-1][1]["type"] == "done"
+
+    resumed = await client.get(
+        f"/api/chat/sessions/{session_id}/stream", headers={"Last-Event-ID": "2"}
+    )
+
+    assert resumed.status_code == 200
+    assert parse([resumed.content]) == [frame for frame in live if frame[0] > 2]
+
+
+async def test_resume_endpoint_errors(client):
+    missing = await client.get("/api/chat/sessions/unknown/stream")
+    assert missing.status_code == 404
+
+    buffer, _ = await finished_buffer(replay_store, 1)
+    invalid = await client.get(
+        f"/api/chat/sessions/{buffer.session_id}/stream",
+        headers={"Last-Event-ID": "abc"},
+    )
+    assert invalid.status_code == 400
@@ -0,0 +1,206 @@
+"""
+Tests for the response cache: keys, cacheability, eviction and the disk tier.
+"""
+import asyncio
+import json
+import os
+import time
+
+import pytest
+
+from src.modules.agent import response_cache
+from src.modules.agent.response_cache import (
+    ResponseCache,
+    ResponseCacheConfig,
+    cache_key,
+    is_cacheable,
+)
+
+
+def turn(text: str = "hello") -> list[dict]:
+    return [{"type": "text", "content": text}, {"type": "done", "usage": {}}]
+
+
+def make_cache(**overrides) -> ResponseCache:
+    config = {"enabled": True, "ttl_seconds": 60, "max_entries": 10, "max_bytes": 1 << 20, "disk_dir": ""}
+    return ResponseCache(ResponseCacheConfig(**{**config, **overrides}))
+
+
+async def drain(cache: ResponseCache) -> None:
+    """Wait for background disk writes."""
+    await asyncio.gather(*cache._disk_tasks)
+
+
+def test_key_covers_every_input():
+    base = cache_key("hi", "prompt", "model", ["Read", "Bash"])
+
+    assert cache_key("hi", "prompt", "model", ["Bash", "Read"]) == base
+    assert len({
+        base,
+        cache_key("hi!", "prompt", "model", ["Read", "Bash"]),
+        cache_key("hi", "other prompt", "model", ["Read", "Bash"]),
+        cache_key("hi", "prompt", "other-model", ["Read", "Bash"]),
+        cache_key("hi", "prompt", "model", ["Read"]),
+        cache_key("hi", "prompt", "model", None),
+    }) == 6
+
+
+def test_key_fields_cannot_bleed_into_each_other():
+    assert cache_key("a", "bc", "m", None) != cache_key("ab", "c", "m", None)
+
+
+@pytest.mark.parametrize("events", [
+    [],
+    [{"type": "text", "content": "partial"}],
+    [{"type": "done", "is_error": True}],
+    [{"type": "error", "message": "boom"}, {"type": "done"}],
+    # Spilled outputs live in the original session's workspace
+    [{"type": "tool_result", "output": "...", "output_ref": {"id": "t1", "size": 9}}, {"type": "done"}],
+])
+def test_incomplete_or_failed_turns_are_not_cacheable(events):
+    assert not is_cacheable(events)
+
+
+def test_successful_turn_is_cacheable():
+    assert is_cacheable(turn())
+
+
+async def test_put_and_get():
+    cache = make_cache()
+
+    assert await cache.get("k") is None
+    cache.put("k", turn())
+    entry = await cache.get("k")
+
+    assert entry.events == turn()
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+async def test_uncacheable_turn_is_not_stored():
+    cache = make_cache()
+
+    assert cache.put("k", [{"type": "error", "message": "boom"}]) is None
+    assert cache.stats()["entries"] == 0
+
+
+async def test_least_recently_used_entry_is_evicted():
+    cache = make_cache(max_entries=2)
+    cache.put("a", turn())
+    cache.put("b", turn())
+    await cache.get("a")
+
+    cache.put("c", turn())
+
+    assert await cache.get("b") is None
+    assert await cache.get("a") is not None and await cache.get("c") is not None
+
+
+async def test_byte_limit_evicts_and_rejects_oversized_entries():
+    size = len(json.dumps(turn("x" * 100)))
+    cache = make_cache(max_bytes=size * 2)
+    for key in ("a", "b", "c"):
+        cache.put(key, turn("x" * 100))
+
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["bytes"] == size * 2
+    assert await cache.get("a") is None
+    assert cache.put("big", turn("x" * size * 2)) is None
+
+
+async def test_expired_entries_are_dropped(monkeypatch):
+    cache = make_cache(ttl_seconds=10)
+    cache.put("k", turn())
+    now = time.time()
+    monkeypatch.setattr(response_cache.time, "time", lambda: now + 11)
+
+    assert await cache.get("k") is None
+    assert cache.stats()["bytes"] == 0
+
+
+async def test_disk_tier_survives_a_new_instance(tmp_path):
+    first = make_cache(disk_dir=str(tmp_path))
+    first.put("k", turn())
+    await drain(first)
+
+    second = make_cache(disk_dir=str(tmp_path))
+    entry = await second.get("k")
+
+    assert entry.events == turn()
+    assert second.disk_hits == 1
+    # Promoted to memory
+    await second.get("k")
+    assert second.disk_hits == 1
+
+
+async def test_disk_tier_ignores_expired_and_corrupt_files(tmp_path):
+    cache = make_cache(disk_dir=str(tmp_path), ttl_seconds=10)
+    (tmp_path / "bad.json").write_text("{not json")
+    (tmp_path / "old.json").write_text(json.dumps({"created_at": time.time() - 60, "size": 1, "events": turn()}))
+
+    assert await cache.get("bad") is None
+    assert await cache.get("old") is None
+    assert not (tmp_path / "old.json").exists()
+
+
+async def test_disk_tier_is_pruned_to_its_byte_budget(tmp_path):
+    """Oldest files go first until the directory fits disk_max_bytes."""
+    cache = make_cache(disk_dir=str(tmp_path))
+    cache._next_disk_prune = float("inf")
+    for key in ("a", "b", "c"):
+        cache.put(key, turn())
+        await drain(cache)
+    for age, key in enumerate(("c", "b", "a")):
+        stamp = time.time() - age
+        os.utime(tmp_path / f"{key}.json", (stamp, stamp))
+    # Room for two entries (sizes differ by a byte or so with the timestamps)
+    cache.config.disk_max_bytes = max(p.stat().st_size for p in tmp_path.iterdir()) * 2
+
+    cache._prune_disk(tmp_path)
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["b.json", "c.json"]
+
+
+async def test_clear_empties_both_tiers(tmp_path):
+    cache = make_cache(disk_dir=str(tmp_path))
+    cache.put("k", turn())
+    await drain(cache)
+
+    await cache.clear()
+
+    assert cache.stats()["entries"] == 0
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.fixture
+def enabled_cache(monkeypatch):
+    from src.modules.agent.service import agent_service
+
+    cache = make_cache()
+    monkeypatch.setattr(agent_service, "response_cache", cache)
+    return cache
+
+
+async def test_sync_endpoint_reports_cache_status(client, fake_sdk, enabled_cache):
+    message = {"message": "What is 2 + 2?"}
+
+    miss = await client.post("/api/chat/message/sync", json=message)
+    hit = await client.post("/api/chat/message/sync", json=message)
+    bypass = await client.post("/api/chat/message/sync", json={**message, "cache": False})
+    follow_up = await client.post(
+        "/api/chat/message/sync", json={**message, "session_id": miss.json()["session_id"]}
+    )
+
+    assert miss.headers["X-Cache"] == "MISS"
+    assert hit.headers["X-Cache"] == "HIT"
+    assert "Age" in hit.headers and len(hit.headers["X-Cache-Key"]) == 16
+    assert hit.json()["response"] == miss.json()["response"]
+    assert bypass.headers["X-Cache"] == "BYPASS"
+    # Only first messages of fresh sessions are looked up
+    assert follow_up.headers["X-Cache"] == "BYPASS"
+    assert enabled_cache.stats()["entries"] == 1
+
+
+async def test_disabled_cache_bypasses(client, fake_sdk):
+    response = await client.post("/api/chat/message/sync", json={"message": "hi"})
+
+    assert response.headers["X-Cache"] == "BYPASS"
@@ -0,0 +1,152 @@
+"""
+Tests for latency-aware model routing.
+"""
+import pytest
+
+from src.modules.agent.driver import claude_sdk_driver
+from src.modules.agent.routing import ModelRouter, RouteRule, RoutingConfig, needs_tools
+from src.modules.agent.service import agent_service
+
+MODELS = ["haiku", "sonnet", "opus"]
+
+RULES = [
+    {"name": "review", "model": "opus", "personas": ["reviewer"]},
+    {"name": "quick", "model": "haiku", "max_chars": 80, "needs_tools": False},
+    {"name": "long", "model": "opus", "min_chars": 400},
+    {"name": "sql", "model": "sonnet", "pattern": r"\bselect\b"},
+]
+
+
+def router(rules=RULES, enabled: bool = True, allow_hints: bool = True) -> ModelRouter:
+    return ModelRouter(RoutingConfig(
+        enabled=enabled,
+        default_model="sonnet",
+        rules=list(rules),
+        models=MODELS,
+        allow_hints=allow_hints,
+    ))
+
+
+@pytest.mark.parametrize("message, persona, route, model", [
+    ("What is a monad?", "default", "quick", "haiku"),
+    ("What is a monad?", "reviewer", "review", "opus"),
+    ("Please fix the failing test in src/app.py", "default", "default", "sonnet"),
+    ("why " * 150, "default", "long", "opus"),
+    ("How do I SELECT the newest row per group, and why does my query time out?" * 2,
+     "default", "sql", "sonnet"),
+])
+def test_first_matching_rule_wins(message, persona, route, model):
+    decision = router().route(message, persona)
+    assert (decision.route, decision.model) == (route, model)
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("What is a monad?", False),
+    ("Run the test suite", True),
+    ("Look at `config.yaml`", True),
+    ("What's in ./scripts/deploy?", True),
+    ("```python\nprint(1)\n```", True),
+])
+def test_needs_tools_heuristic(message, expected):
+    assert needs_tools(message) is expected
+
+
+def test_hint_overrides_rules():
+    decision = router().route("What is a monad?", "default", hint="opus")
+    assert (decision.route, decision.model) == ("hint", "opus")
+
+
+def test_unknown_hint_is_rejected():
+    with pytest.raises(ValueError):
+        router().route("hi", "default", hint="gpt-4")
+
+
+def test_hints_are_ignored_when_not_allowed():
+    decision = router(allow_hints=False).route("What is a monad?", "default", hint="opus")
+    assert decision.route == "quick"
+    router(allow_hints=False).validate_hint("gpt-4")
+
+
+def test_disabled_routing_uses_the_default_model():
+    routes = router(enabled=False)
+    decision = routes.route("What is a monad?", "reviewer", hint="opus")
+    assert (decision.route, decision.model) == ("default", "sonnet")
+    assert routes.models() == ["sonnet"]
+
+
+def test_models_lists_every_routable_model_default_first():
+    assert router(allow_hints=False).models() == ["sonnet", "opus", "haiku"]
+    assert router().models() == ["sonnet", "opus", "haiku"]
+
+
+@pytest.mark.parametrize("spec", [
+    {"model": "opus", "max_words": 10},
+    {"model": "gpt-4"},
+])
+def test_invalid_rules_are_rejected(spec):
+    with pytest.raises(ValueError):
+        RouteRule.parse(spec, MODELS)
+
+
+def test_rule_name_defaults_to_the_model():
+    assert RouteRule.parse({"model": "haiku"}, MODELS).name == "haiku"
+
+
+def test_observed_turns_are_recorded_per_route():
+    routes = router()
+    decision = routes.route("What is a monad?", "default")
+
+    turn = routes.observe(decision)
+    turn.event({"type": "text", "content": "A monad is"})
+    turn.event({"type": "done", "usage": {"input_tokens": 10, "output_tokens": 5}, "total_cost_usd": 0.01})
+    turn.finish()
+
+    failed = routes.observe(decision)
+    failed.event({"type": "error", "message": "boom"})
+    failed.finish()
+
+    # Cut short by the client: not recorded
+    routes.observe(decision).finish()
+
+    [stats] = routes.stats()["routes"]
+    assert (stats["route"], stats["model"]) == ("quick", "haiku")
+    assert stats["turns"] == 2 and stats["errors"] == 1
+    assert stats["tokens"] == 15
+    assert stats["cost_usd_per_turn"] == pytest.approx(0.005)
+    assert stats["first_token_ms"]["p50"] is not None
+
+
+async def test_turn_runs_on_the_routed_model(fake_sdk, monkeypatch):
+    monkeypatch.setattr(agent_service, "router", router())
+
+    events = [event async for event in agent_service.chat("What is a monad?", "routing-1")]
+
+    done = events[-1]
+    assert (done["type"], done["route"], done["model"]) == ("done", "quick", "haiku")
+    client = claude_sdk_driver._clients["routing-1"]
+    assert client.model == "haiku"
+    await agent_service.end_session("routing-1")
+
+
+async def test_follow_up_on_another_model_switches_the_live_client(fake_sdk, monkeypatch):
+    monkeypatch.setattr(agent_service, "router", router())
+    [event async for event in agent_service.chat("What is a monad?", "routing-2")]
+    client = claude_sdk_driver._clients["routing-2"]
+
+    events = [event async for event in agent_service.chat("Explain it again", "routing-2", model="opus")]
+
+    assert (events[-1]["route"], events[-1]["model"]) == ("hint", "opus")
+    # Same connection, new model
+    assert claude_sdk_driver._clients["routing-2"] is client
+    assert client.model == "opus"
+    await agent_service.end_session("routing-2")
+
+
+async def test_endpoint_rejects_an_unknown_model_hint(client, fake_sdk, monkeypatch):
+    monkeypatch.setattr(agent_service, "router", router())
+
+    response = await client.post("/api/chat/message/sync", json={"message": "hi", "model": "gpt"})
+    routed = await client.post("/api/chat/message/sync", json={"message": "hi", "model": "haiku"})
+
+    assert response.status_code == 400
+    assert routed.status_code == 200
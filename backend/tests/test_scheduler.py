@@ -0,0 +1,123 @@
+"""
+Tests for the run scheduler (admission control and ordering).
+"""
+import asyncio
+
+import pytest
+
+from src.modules.agent.exceptions import QueueFullError, QueueTimeoutError
+from src.modules.agent.scheduler import RunScheduler, SchedulerConfig
+
+
+def scheduler(max_concurrent: int = 1, max_queue: int = 10, max_wait: float = 5.0) -> RunScheduler:
+    return RunScheduler(SchedulerConfig(
+        max_concurrent=max_concurrent, max_queue=max_queue, max_wait_seconds=max_wait
+    ))
+
+
+async def admitted(ticket) -> list[int]:
+    """Wait for a ticket and return the queue positions it reported."""
+    return [position async for position in ticket.wait()]
+
+
+async def test_runs_up_to_max_concurrent_immediately():
+    runs = scheduler(max_concurrent=2)
+    first, second, third = (runs.enqueue(f"s{i}") for i in range(3))
+
+    assert first.granted and second.granted
+    assert not third.granted
+    assert third.position == 1
+    assert runs.stats()["active"] == 2 and runs.stats()["queued"] == 1
+
+
+async def test_queued_run_starts_when_a_slot_frees():
+    runs = scheduler(max_concurrent=1)
+    running = runs.enqueue("a")
+    waiting = runs.enqueue("b")
+
+    task = asyncio.create_task(admitted(waiting))
+    await asyncio.sleep(0)
+    running.release()
+
+    assert await task == [1]
+    assert waiting.granted
+    assert runs.active == 1 and runs.queued == 0
+
+
+async def test_slots_are_granted_in_arrival_order():
+    runs = scheduler(max_concurrent=1)
+    running = runs.enqueue("a")
+    tickets = [runs.enqueue(session) for session in ("b", "c", "d")]
+    assert [ticket.position for ticket in tickets] == [1, 2, 3]
+
+    order = []
+    for _ in tickets:
+        running.release()
+        running = next(ticket for ticket in tickets if ticket.granted and not ticket.released)
+        order.append(running.session_id)
+    assert order == ["b", "c", "d"]
+
+
+async def test_turns_of_one_session_are_serialized():
+    """A session's second turn waits for its first even with free slots."""
+    runs = scheduler(max_concurrent=4)
+    first = runs.enqueue("s")
+    second = runs.enqueue("s")
+    other = runs.enqueue("t")
+
+    assert first.granted and other.granted
+    assert not second.granted
+    first.release()
+    assert second.granted
+
+
+async def test_busy_session_does_not_starve_others():
+    """A session's queued turns do not overtake other sessions' earlier runs."""
+    runs = scheduler(max_concurrent=1)
+    running = runs.enqueue("busy")
+    next_turn = runs.enqueue("busy")
+    newcomer = runs.enqueue("quiet")
+    later_turn = runs.enqueue("busy")
+
+    running.release()
+    assert next_turn.granted
+    next_turn.release()
+    assert newcomer.granted
+    assert not later_turn.granted
+    assert later_turn.position == 1
+
+
+async def test_queue_full_is_rejected():
+    runs = scheduler(max_concurrent=1, max_queue=1)
+    runs.enqueue("a")
+    runs.enqueue("b")
+
+    with pytest.raises(QueueFullError) as exc:
+        runs.enqueue("c")
+    assert exc.value.retry_after >= 1
+    assert runs.queued == 1
+
+
+async def test_queued_run_times_out():
+    runs = scheduler(max_concurrent=1, max_wait=0.05)
+    runs.enqueue("a")
+    waiting = runs.enqueue("b")
+
+    with pytest.raises(QueueTimeoutError):
+        await admitted(waiting)
+    # A timed-out run must still be released, which frees its queue slot
+    waiting.release()
+    assert runs.queued == 0
+
+
+async def test_release_of_a_queued_run_drops_it():
+    runs = scheduler(max_concurrent=1)
+    running = runs.enqueue("a")
+    dropped = runs.enqueue("b")
+    last = runs.enqueue("c")
+
+    dropped.release()
+    assert last.position == 1
+    running.release()
+    assert last.granted and not dropped.granted
+    assert runs.active == 1 and runs.queued == 0
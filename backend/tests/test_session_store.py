@@ -0,0 +1,181 @@
+"""
+Tests for the session store backends.
+"""
+import asyncio
+
+import pytest
+
+from src.modules.agent.session_store import (
+    STORE_BACKENDS,
+    LocalRedis,
+    RedisSessionStore,
+    SessionStore,
+    SessionStoreConfig,
+    SQLiteSessionStore,
+    create_session_store,
+)
+
+
+@pytest.fixture(params=STORE_BACKENDS)
+async def store(request, tmp_path):
+    """One store per backend (redis through its in-process stand-in)."""
+    url = {"memory": "", "sqlite": str(tmp_path / "sessions.db"), "redis": "memory://"}
+    store = create_session_store(SessionStoreConfig(
+        backend=request.param, url=url[request.param], ttl_seconds=0
+    ))
+    yield store
+    await store.close()
+
+
+async def test_put_get_delete(store):
+    record = {"message_count": 1, "persona": "default", "sdk_session_id": None}
+
+    assert await store.get("s1") is None
+    await store.put("s1", record)
+    assert await store.get("s1") == record
+
+    await store.delete("s1")
+    assert await store.get("s1") is None
+
+
+async def test_records_are_copies(store):
+    record = {"message_count": 1}
+    await store.put("s1", record)
+    record["message_count"] = 2
+
+    fetched = await store.get("s1")
+    fetched["message_count"] = 3
+    assert await store.get("s1") == {"message_count": 1}
+
+
+async def test_update_merges_fields(store):
+    assert await store.update("missing", owner="w1") is None
+
+    await store.put("s1", {"message_count": 1, "owner": "w0"})
+    assert await store.update("s1", owner="w1") == {"message_count": 1, "owner": "w1"}
+    assert (await store.get("s1"))["owner"] == "w1"
+
+
+async def test_lease_excludes_other_owners(store):
+    await store.put("s1", {})
+
+    assert await store.acquire("s1", "worker-a", ttl=30)
+    assert not await store.acquire("s1", "worker-b", ttl=30)
+    # Re-entrant for the holder
+    assert await store.acquire("s1", "worker-a", ttl=30)
+
+    # Only the holder can release it
+    await store.release("s1", "worker-b")
+    assert not await store.acquire("s1", "worker-b", ttl=30)
+    await store.release("s1", "worker-a")
+    assert await store.acquire("s1", "worker-b", ttl=30)
+
+
+async def test_expired_lease_can_be_taken_over(store):
+    await store.put("s1", {})
+
+    assert await store.acquire("s1", "worker-a", ttl=0.05)
+    await asyncio.sleep(0.1)
+    assert await store.acquire("s1", "worker-b", ttl=30)
+
+
+async def test_reacquire_extends_the_lease(store):
+    await store.put("s1", {})
+
+    assert await store.acquire("s1", "worker-a", ttl=0.05)
+    assert await store.acquire("s1", "worker-a", ttl=30)
+    await asyncio.sleep(0.1)
+
+    assert not await store.acquire("s1", "worker-b", ttl=30)
+
+
+async def test_release_after_takeover_keeps_the_new_lease(store):
+    """A holder whose lease expired cannot release its successor's."""
+    await store.put("s1", {})
+    assert await store.acquire("s1", "worker-a", ttl=0.05)
+    await asyncio.sleep(0.1)
+    assert await store.acquire("s1", "worker-b", ttl=30)
+
+    await store.release("s1", "worker-a")
+
+    assert not await store.acquire("s1", "worker-a", ttl=30)
+
+
+class ScriptedRedis(LocalRedis):
+    """LocalRedis that records the commands a store sends."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.commands: list[str] = []
+
+    async def get(self, key):
+        self.commands.append("get")
+        return await super().get(key)
+
+    async def set(self, key, value, px=None, nx=False):
+        self.commands.append("set nx" if nx else "set")
+        return await super().set(key, value, px=px, nx=nx)
+
+    async def eval(self, script, numkeys, *keys_and_args):
+        self.commands.append("eval")
+        return await super().eval(script, numkeys, *keys_and_args)
+
+
+async def test_redis_lease_commands_are_atomic():
+    """Leases use SET NX PX and scripts, never a separate read of the holder."""
+    redis = ScriptedRedis()
+    store = RedisSessionStore(redis)
+
+    await store.acquire("s1", "worker-a", ttl=30)
+    await store.acquire("s1", "worker-a", ttl=30)
+    await store.acquire("s1", "worker-b", ttl=30)
+    await store.release("s1", "worker-a")
+
+    assert redis.commands == ["set nx", "set nx", "eval", "set nx", "eval", "eval"]
+
+
+async def test_local_redis_runs_only_the_lease_scripts():
+    redis = LocalRedis()
+    await redis.set("k", "owner")
+
+    with pytest.raises(NotImplementedError):
+        await redis.eval("return 1", 1, "k", "owner")
+
+
+def test_store_interface_is_abstract():
+    with pytest.raises(TypeError):
+        SessionStore()
+
+
+async def test_sqlite_is_shared_between_stores(tmp_path):
+    """Two workers on one host see each other's records and leases."""
+    path = str(tmp_path / "sessions.db")
+    first, second = SQLiteSessionStore(path), SQLiteSessionStore(path)
+    try:
+        await first.put("s1", {"owner": "worker-a"})
+        assert await second.get("s1") == {"owner": "worker-a"}
+
+        assert await first.acquire("s1", "worker-a", ttl=30)
+        assert not await second.acquire("s1", "worker-b", ttl=30)
+    finally:
+        await first.close()
+        await second.close()
+
+
+async def test_sqlite_purges_expired_records(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"), ttl_seconds=1)
+    try:
+        await store.put("old", {})
+        await store._query("UPDATE sessions SET updated_at = updated_at - 10")
+        store._next_purge = 0
+        await store.put("new", {})
+
+        assert await store.get("old") is None
+        assert await store.get("new") == {}
+    finally:
+        await store.close()
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        create_session_store(SessionStoreConfig(backend="etcd"))
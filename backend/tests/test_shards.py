@@ -0,0 +1,209 @@
+"""
+Tests for execution shards: the IPC frame codec, credit flow control, the
+hash ring and recovery from a shard process that dies.
+"""
+import asyncio
+from typing import Any, AsyncIterator
+
+import pytest
+
+from benchmarks.fake_sdk import FakeScript, install_fake_sdk
+from src.modules.agent import shard_worker, shards
+from src.modules.agent.shard_worker import ShardWorker
+from src.modules.agent.shards import (
+    MAX_FRAME_BYTES,
+    HashRing,
+    ShardConfig,
+    ShardPool,
+    encode_frame,
+    read_frame,
+)
+
+
+def reader_for(*chunks: bytes, eof: bool = True) -> asyncio.StreamReader:
+    reader = asyncio.StreamReader()
+    for chunk in chunks:
+        reader.feed_data(chunk)
+    if eof:
+        reader.feed_eof()
+    return reader
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+async def test_frames_round_trip(monkeypatch, use_orjson):
+    if not use_orjson:
+        monkeypatch.setattr(shards, "orjson", None)
+    frames = [
+        {"i": 1, "e": {"type": "text", "content": "naïve ☃"}},
+        {"i": 2, "end": 1},
+        {"op": "call", "i": 3, "method": "traces", "args": [None, 20]},
+    ]
+
+    reader = reader_for(b"".join(encode_frame(frame) for frame in frames))
+
+    assert [await read_frame(reader) for _ in frames] == frames
+    with pytest.raises(asyncio.IncompleteReadError):
+        await read_frame(reader)
+
+
+async def test_partial_frames_wait_for_the_rest():
+    data = encode_frame({"i": 1, "e": {"type": "text", "content": "x" * 100}})
+    reader = reader_for(data[:3], eof=False)
+
+    pending = asyncio.create_task(read_frame(reader))
+    await asyncio.sleep(0.01)
+    assert not pending.done()
+    reader.feed_data(data[3:50])
+    await asyncio.sleep(0.01)
+    assert not pending.done()
+    reader.feed_data(data[50:])
+
+    assert (await asyncio.wait_for(pending, 1))["e"]["content"] == "x" * 100
+
+
+async def test_truncated_and_oversized_frames_are_rejected():
+    data = encode_frame({"i": 1, "end": 1})
+    with pytest.raises(asyncio.IncompleteReadError):
+        await read_frame(reader_for(data[:-1]))
+    with pytest.raises(ValueError):
+        await read_frame(reader_for((MAX_FRAME_BYTES + 1).to_bytes(4, "big")))
+
+
+class FrameWriter:
+    """The write side of the worker's pipe, keeping what it is sent."""
+
+    def __init__(self) -> None:
+        self.data = bytearray()
+
+    def write(self, data: bytes) -> None:
+        self.data += data
+
+    async def drain(self) -> None:
+        pass
+
+    async def frames(self) -> list[dict[str, Any]]:
+        """Frames written since the last call, once the worker has gone quiet."""
+        await asyncio.sleep(0.02)
+        reader = reader_for(bytes(self.data))
+        self.data.clear()
+        frames = []
+        while not reader.at_eof():
+            frames.append(await read_frame(reader))
+        return frames
+
+
+class CountingDriver:
+    """Stands in for the shard's driver: execute yields `count` events."""
+
+    def __init__(self, count: int):
+        self.count = count
+        self.produced = 0
+
+    async def execute(self, **kwargs: Any) -> AsyncIterator[dict[str, Any]]:
+        for n in range(self.count):
+            self.produced += 1
+            yield {"type": "text", "content": str(n)}
+
+
+async def test_worker_stalls_without_credit_and_resumes_when_granted(monkeypatch):
+    driver = CountingDriver(count=5)
+    monkeypatch.setattr(shard_worker, "claude_sdk_driver", driver)
+    writer = FrameWriter()
+    worker = ShardWorker(0, writer)
+
+    worker._dispatch({"op": "execute", "i": 7, "args": {}, "window": 2})
+    first = await writer.frames()
+    # The window is spent; the run waits with the next event in hand
+    assert [frame["e"]["content"] for frame in first] == ["0", "1"]
+    assert driver.produced == 3
+
+    worker._dispatch({"op": "credit", "i": 7, "n": 2})
+    second = await writer.frames()
+    assert [frame["e"]["content"] for frame in second] == ["2", "3"]
+
+    worker._dispatch({"op": "credit", "i": 7, "n": 2})
+    rest = await writer.frames()
+    assert rest == [{"i": 7, "e": {"type": "text", "content": "4"}}, {"i": 7, "end": 1}]
+    assert worker._tasks == {} and worker._credits == {}
+
+
+async def test_cancel_stops_a_stalled_stream(monkeypatch):
+    monkeypatch.setattr(shard_worker, "claude_sdk_driver", CountingDriver(count=5))
+    writer = FrameWriter()
+    worker = ShardWorker(0, writer)
+
+    worker._dispatch({"op": "execute", "i": 1, "args": {}, "window": 1})
+    await writer.frames()
+    worker._dispatch({"op": "cancel", "i": 1})
+
+    assert await writer.frames() == [{"i": 1, "end": 1}]
+    assert worker._tasks == {}
+
+
+def test_ring_is_stable_and_spreads_sessions():
+    sessions = [f"session-{n}" for n in range(2000)]
+    ring = HashRing(4)
+
+    owners = [ring.node(s) for s in sessions]
+
+    assert owners == [HashRing(4).node(s) for s in sessions]
+    counts = [owners.count(node) for node in range(4)]
+    assert min(counts) > len(sessions) / 4 * 0.6
+
+
+def test_adding_a_shard_moves_only_its_share_of_sessions():
+    sessions = [f"session-{n}" for n in range(2000)]
+    before, after = HashRing(4), HashRing(5)
+
+    moved = [s for s in sessions if before.node(s) != after.node(s)]
+
+    # About 1/5 move, and only to the new shard
+    assert 0.1 < len(moved) / len(sessions) < 0.3
+    assert {after.node(s) for s in moved} == {4}
+
+
+async def collect(stream: AsyncIterator[dict[str, Any]]) -> list[dict[str, Any]]:
+    return [event async for event in stream]
+
+
+async def test_shard_runs_turns_and_recovers_from_dying_mid_turn():
+    """Open streams of a dead shard end with an error; the next turn restarts it."""
+    script = FakeScript(
+        connect_latency=0, first_token_latency=0, text_chunks=40, chunk_interval=0.02, tool_calls=0
+    )
+    with install_fake_sdk(script):
+        pool = ShardPool(ShardConfig(shards=1, window_events=4))
+        try:
+            await pool.start()
+            shard = pool.shard_for("shard-s1")
+            first_pid = shard.stats()["pid"]
+
+            stream = pool.execute("hi", "shard-s1")
+            assert (await anext(stream))["type"] == "text"
+            assert shard._process is not None
+            shard._process.kill()
+            events = await asyncio.wait_for(collect(stream), 5)
+
+            assert events[-1] == {"type": "error", "message": "Agent shard 0 exited"}
+            assert not shard.alive
+
+            # Credit is returned as the stream is read, so a long turn completes
+            events = await asyncio.wait_for(collect(pool.execute("again", "shard-s1")), 10)
+            assert events[-1]["type"] == "done"
+            assert sum(e["type"] == "text" for e in events) == 40
+            assert shard.restarts == 1 and shard.stats()["pid"] != first_pid
+        finally:
+            await pool.shutdown()
+
+
+async def test_call_all_reports_errors_per_shard(fake_sdk):
+    pool = ShardPool(ShardConfig(shards=2))
+    try:
+        pids = await pool.call_all("ping")
+        unknown = await pool.call_all("nope")
+    finally:
+        await pool.shutdown()
+
+    assert [reply["shard"] for reply in pids] == [0, 1]
+    assert len({reply["result"] for reply in pids}) == 2
+    assert all("Unknown shard method" in reply["error"] for reply in unknown)
@@ -0,0 +1,165 @@
+"""
+Tests for SSE frame encoding and text coalescing.
+"""
+import asyncio
+import json
+
+import pytest
+
+from src.modules.chat import sse
+from src.modules.chat.sse import SSEConfig, SSEEncoder, get_json_dumps
+
+
+def parse(frame: bytes) -> tuple[str, dict]:
+    """Split one SSE frame into (event type, data)."""
+    assert frame.endswith(b"\n\n")
+    event_line, data_line = frame.decode("utf-8")[:-2].split("\n")
+    assert event_line.startswith("event: ") and data_line.startswith("data: ")
+    return event_line[len("event: "):], json.loads(data_line[len("data: "):])
+
+
+@pytest.mark.parametrize("backend", ["json", "auto"])
+def test_encode_frames_event_type_and_json(backend):
+    encoder = SSEEncoder(SSEConfig(json_backend=backend, coalesce_interval_ms=0))
+    event = {"type": "tool_use", "tool": "Bash", "input": {"command": "ls"}}
+
+    assert parse(encoder.encode(event)) == ("tool_use", event)
+
+
+def test_untyped_events_are_text():
+    encoder = SSEEncoder(SSEConfig(coalesce_interval_ms=0))
+
+    event_type, _ = parse(encoder.encode({"content": "hi"}))
+
+    assert event_type == "text"
+
+
+def test_backends_agree_on_non_ascii_content():
+    event = {"type": "text", "content": "naïve ☃   done"}
+    frames = [
+        SSEEncoder(SSEConfig(json_backend=backend, coalesce_interval_ms=0)).encode(event)
+        for backend in ("json", "auto")
+    ]
+
+    assert parse(frames[0]) == parse(frames[1]) == ("text", event)
+    # The stdlib backend escapes to ASCII, so every frame is valid UTF-8 either way
+    assert frames[0].isascii()
+
+
+def test_orjson_falls_back_to_stdlib_for_what_it_rejects():
+    if sse.orjson is None:
+        pytest.skip("orjson is not installed")
+    dumps = get_json_dumps("orjson")
+
+    assert json.loads(dumps({1: "non-str key"})) == {"1": "non-str key"}
+
+
+def test_orjson_backend_requires_orjson(monkeypatch):
+    monkeypatch.setattr(sse, "orjson", None)
+
+    with pytest.raises(RuntimeError):
+        get_json_dumps("orjson")
+    assert get_json_dumps("auto") is sse._stdlib_dumps
+
+
+async def test_stream_without_coalescing_is_one_frame_per_event():
+    encoder = SSEEncoder(SSEConfig(coalesce_interval_ms=0))
+    events = [{"type": "text", "content": "a"}, {"type": "text", "content": "b"}, {"type": "done"}]
+
+    async def source():
+        for event in events:
+            yield event
+
+    frames = [frame async for frame in encoder.stream(source())]
+
+    assert [parse(frame)[1] for frame in frames] == events
+
+
+def coalescer(interval_ms: int = 1000, max_bytes: int = 1 << 16) -> SSEEncoder:
+    return SSEEncoder(SSEConfig(coalesce_interval_ms=interval_ms, coalesce_max_bytes=max_bytes))
+
+
+def text(content: str) -> dict:
+    return {"type": "text", "content": content}
+
+
+async def from_list(events: list[dict]):
+    for event in events:
+        yield event
+
+
+async def flatten(batches) -> list[dict]:
+    return [event async for batch in batches for event in batch]
+
+
+async def test_text_is_flushed_by_a_non_text_event():
+    events = [text("a"), text("b"), {"type": "tool_use", "tool": "Bash"}, text("c")]
+
+    merged = await flatten(coalescer().coalesce(from_list(events)))
+
+    assert merged == [text("ab"), {"type": "tool_use", "tool": "Bash"}, text("c")]
+
+
+async def test_text_with_extra_fields_is_not_merged():
+    events = [text("a"), {"type": "text", "content": "b", "id": 1}]
+
+    assert await flatten(coalescer().coalesce(from_list(events))) == events
+
+
+async def test_text_is_flushed_after_the_interval():
+    """Buffered text goes out once the interval passes, even while the source is quiet."""
+    gate = asyncio.Event()
+
+    async def source():
+        yield text("a")
+        yield text("b")
+        await gate.wait()
+        yield {"type": "done"}
+
+    batches = coalescer(interval_ms=10).coalesce(source())
+    async with asyncio.timeout(1):
+        first = await anext(batches)
+    gate.set()
+
+    assert first == [text("ab")]
+    assert await flatten(batches) == [{"type": "done"}]
+
+
+async def test_text_is_flushed_at_max_bytes():
+    events = [text("ab"), text("cd"), text("ef")]
+
+    merged = await flatten(coalescer(max_bytes=4).coalesce(from_list(events)))
+
+    assert merged == [text("abcd"), text("ef")]
+
+
+async def test_source_errors_are_raised_after_buffered_text():
+    async def failing():
+        yield text("a")
+        raise RuntimeError("boom")
+
+    seen = []
+    with pytest.raises(RuntimeError, match="boom"):
+        async for batch in coalescer().coalesce(failing()):
+            seen.extend(batch)
+
+    assert seen == [text("a")]
+
+
+async def test_closing_the_consumer_closes_the_source():
+    """The source's cleanup has run by the time the consumer is closed."""
+    closed = asyncio.Event()
+
+    async def endless():
+        try:
+            while True:
+                yield {"type": "tool_use", "tool": "Bash"}
+                await asyncio.sleep(0)
+        finally:
+            closed.set()
+
+    batches = coalescer().coalesce(endless())
+    await anext(batches)
+    await batches.aclose()
+
+    assert closed.is_set()
@@ -0,0 +1,70 @@
+"""
+Tests for a cheap app import: deferred SDK and database imports, no I/O.
+"""
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from benchmarks.bench_startup import _CHECK_DEFERRED, bench_env
+from benchmarks.fake_sdk import FakeClaudeSDKClient
+from src.config.settings import settings
+from src.modules.agent import sdk
+from src.modules.agent.driver import ClaudeSDKConfig, ClaudeSDKDriver
+
+BACKEND = Path(__file__).resolve().parent.parent
+
+
+def test_importing_the_app_defers_heavy_modules(tmp_path):
+    result = subprocess.run(
+        [sys.executable, "-c", _CHECK_DEFERRED],
+        cwd=BACKEND, env=bench_env(str(tmp_path)), capture_output=True, text=True, timeout=60,
+    )
+
+    assert result.returncode == 0, result.stderr
+    assert json.loads(result.stdout) == []
+    # Nothing is created by the import either
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_load_imports_the_sdk_once():
+    module = sdk.load()
+
+    assert module.__name__ == "claude_agent_sdk"
+    assert sdk.is_loaded()
+    assert sdk.load() is module
+
+
+def test_new_client_uses_the_override(monkeypatch):
+    options = sdk.load().ClaudeAgentOptions()
+
+    monkeypatch.setattr(sdk, "client_class", None)
+    assert isinstance(sdk.new_client(options), sdk.load().ClaudeSDKClient)
+
+    monkeypatch.setattr(sdk, "client_class", FakeClaudeSDKClient)
+    client = sdk.new_client(options)
+    assert isinstance(client, FakeClaudeSDKClient)
+    assert client.options is options
+
+
+async def test_aload_returns_the_module():
+    assert await sdk.aload() is sdk.load()
+
+
+@pytest.fixture
+def workspace_root(tmp_path, monkeypatch):
+    root = tmp_path / "workspaces"
+    monkeypatch.setattr(settings, "agent_workspace_dir", str(root))
+    return root
+
+
+async def test_driver_does_no_io_until_started(workspace_root):
+    driver = ClaudeSDKDriver(ClaudeSDKConfig())
+    assert not workspace_root.exists()
+
+    await driver.start()
+
+    assert workspace_root.is_dir()
+    await driver.shutdown()
@@ -0,0 +1,167 @@
+"""
+Tests for workspace templates: listing, lookup and clone modes.
+"""
+import errno
+import os
+import shutil
+
+import pytest
+
+from src.modules.agent import templates
+from src.modules.agent.exceptions import TemplateNotFoundError
+from src.modules.agent.templates import TemplateConfig, TemplateManager
+
+
+@pytest.fixture
+def root(tmp_path):
+    """A templates root with one template, "repo"."""
+    repo = tmp_path / "templates" / "repo"
+    (repo / "src").mkdir(parents=True)
+    (repo / "src" / "main.py").write_text("print('hi')\n")
+    (repo / "README.md").write_text("# repo\n")
+    return tmp_path / "templates"
+
+
+def manager(root, mode: str = "auto") -> TemplateManager:
+    return TemplateManager(TemplateConfig(templates_dir=str(root), clone_mode=mode))
+
+
+def tree(path) -> dict[str, str]:
+    """Relative path -> content (or "-> target" for links) of everything under path."""
+    entries = {}
+    for dirpath, dirnames, filenames in os.walk(path):
+        for name in dirnames + filenames:
+            full = os.path.join(dirpath, name)
+            relative = os.path.relpath(full, path)
+            if os.path.islink(full):
+                entries[relative] = "-> " + os.readlink(full)
+            elif os.path.isfile(full):
+                with open(full) as f:
+                    entries[relative] = f.read()
+    return entries
+
+
+def test_unknown_clone_mode_is_rejected(root):
+    with pytest.raises(ValueError):
+        manager(root, "symlink")
+
+
+def test_names_lists_visible_directories(root):
+    (root / ".hidden").mkdir()
+    (root / "notes.txt").write_text("x")
+
+    assert manager(root).names() == ["repo"]
+    assert manager(root / "missing").names() == []
+
+
+@pytest.mark.parametrize("name", ["missing", "../templates", ".hidden", "repo/src"])
+def test_get_path_rejects_unknown_and_escaping_names(root, name):
+    (root / ".hidden").mkdir()
+
+    with pytest.raises(TemplateNotFoundError):
+        manager(root).get_path(name)
+
+
+@pytest.mark.parametrize("mode", ["copy", "hardlink", "auto"])
+async def test_provision_clones_the_tree(root, tmp_path, mode):
+    workspace = tmp_path / "workspace"
+
+    result = await manager(root, mode).provision("repo", workspace)
+
+    assert tree(workspace) == tree(root / "repo")
+    assert (result.template, result.files) == ("repo", 2)
+    assert result.bytes == len("print('hi')\n") + len("# repo\n")
+    if result.mode == "copy":
+        assert result.bytes_copied == result.bytes
+    else:
+        assert result.bytes_copied == 0
+
+
+async def test_hardlink_mode_shares_inodes(root, tmp_path):
+    workspace = tmp_path / "workspace"
+
+    result = await manager(root, "hardlink").provision("repo", workspace)
+
+    assert result.mode == "hardlink"
+    assert os.path.samefile(workspace / "README.md", root / "repo" / "README.md")
+
+
+async def test_auto_mode_falls_back_to_copy_once(root, tmp_path, monkeypatch):
+    """A filesystem that cannot clone switches auto mode to copying for the rest of the tree."""
+    calls = []
+
+    def no_reflink(fd, request, arg):
+        calls.append(request)
+        raise OSError(errno.EOPNOTSUPP, "not supported")
+
+    monkeypatch.setattr(templates.fcntl, "ioctl", no_reflink)
+    workspace = tmp_path / "workspace"
+
+    result = await manager(root, "auto").provision("repo", workspace)
+
+    assert result.mode == "copy"
+    assert len(calls) == 1
+    assert result.bytes_copied == result.bytes
+    assert tree(workspace) == tree(root / "repo")
+
+
+async def test_reflink_errors_other_than_unsupported_are_raised(root, tmp_path, monkeypatch):
+    def disk_full(fd, request, arg):
+        raise OSError(errno.ENOSPC, "no space")
+
+    monkeypatch.setattr(templates.fcntl, "ioctl", disk_full)
+
+    with pytest.raises(OSError):
+        await manager(root, "reflink").provision("repo", tmp_path / "workspace")
+
+
+async def test_symlinks_are_recreated_not_followed(root, tmp_path):
+    """Links to files and directories stay links with the same target."""
+    repo = root / "repo"
+    shared = tmp_path / "shared"
+    (shared / "data").mkdir(parents=True)
+    (shared / "data" / "big.bin").write_text("x" * 100)
+    os.symlink("src/main.py", repo / "entry.py")
+    os.symlink(shared / "data", repo / "data", target_is_directory=True)
+    os.symlink("src", repo / "src-link", target_is_directory=True)
+    workspace = tmp_path / "workspace"
+
+    result = await manager(root, "copy").provision("repo", workspace)
+
+    for name in ("entry.py", "data", "src-link"):
+        assert (workspace / name).is_symlink()
+        assert os.readlink(workspace / name) == os.readlink(repo / name)
+    # Linked directories are neither copied nor counted
+    assert result.files == 2
+    assert (workspace / "data" / "big.bin").read_text() == "x" * 100
+    assert not (workspace / "src-link").resolve().is_relative_to(root)
+
+
+async def test_session_endpoint_provisions_template(client, fake_sdk):
+    from src.modules.agent.driver import claude_sdk_driver
+
+    source = claude_sdk_driver.templates.root / "starter"
+    source.mkdir(parents=True, exist_ok=True)
+    (source / "hello.txt").write_text("hello")
+    try:
+        response = await client.post("/api/chat/sessions", json={"template": "starter"})
+        assert response.status_code == 200
+        body = response.json()
+        assert body["workspace"]["template"] == "starter"
+        assert body["workspace"]["files"] == 1
+        session_id = body["session_id"]
+
+        workspace = claude_sdk_driver.workspaces.path(session_id)
+        assert (workspace / "hello.txt").read_text() == "hello"
+        assert (await client.get(f"/api/chat/sessions/{session_id}")).json()["workspace"] == body["workspace"]
+        assert "starter" in (await client.get("/api/chat/templates")).json()["templates"]
+
+        await client.delete(f"/api/chat/sessions/{session_id}")
+    finally:
+        shutil.rmtree(source)
+
+
+async def test_session_endpoint_rejects_unknown_template(client, fake_sdk):
+    response = await client.post("/api/chat/sessions", json={"template": "nope"})
+
+    assert response.status_code == 400
@@ -0,0 +1,144 @@
+"""
+Tests for spilling large tool outputs and serving them by reference.
+"""
+import pytest
+
+from src.modules.agent.driver import claude_sdk_driver
+from src.modules.agent.tool_outputs import OUTPUTS_DIR, ToolOutputConfig, ToolOutputStore
+from src.modules.agent.workspace import WorkspaceManager
+
+
+def make_store(tmp_path, spill_chars: int = 10, preview_chars: int = 4) -> ToolOutputStore:
+    config = ToolOutputConfig(spill_chars=spill_chars, preview_chars=preview_chars)
+    return ToolOutputStore(WorkspaceManager(tmp_path), config)
+
+
+def result(output: str, tool_use_id: str = "toolu_1") -> dict:
+    return {"type": "tool_result", "tool_use_id": tool_use_id, "output": output, "is_error": False}
+
+
+def test_only_long_outputs_are_spilled(tmp_path):
+    store = make_store(tmp_path)
+
+    assert not store.should_spill("x" * 10)
+    assert store.should_spill("x" * 11)
+    assert not make_store(tmp_path, spill_chars=0).should_spill("x" * 10**6)
+
+
+async def test_spill_keeps_a_preview_and_writes_the_output(tmp_path):
+    store = make_store(tmp_path)
+    output = "héllo wörld"
+
+    event = await store.spill("my.session", result(output))
+
+    assert event["output"] == "héll"
+    assert event["output_ref"] == {"id": "toolu_1", "size": len(output.encode("utf-8"))}
+    path = tmp_path / "my.session" / OUTPUTS_DIR / "toolu_1.txt"
+    assert path.read_text(encoding="utf-8") == output
+    assert store.path("my.session", "toolu_1") == path
+    assert (store.spilled, store.spilled_bytes) == (1, event["output_ref"]["size"])
+
+
+async def test_unsafe_tool_use_id_gets_a_generated_output_id(tmp_path):
+    store = make_store(tmp_path)
+
+    event = await store.spill("s1", result("x" * 20, tool_use_id="../escape"))
+
+    assert event["output_ref"]["id"] != "../escape"
+    assert store.path("s1", event["output_ref"]["id"]).exists()
+
+
+@pytest.mark.parametrize("session_id", ["", ".", "..", ".trash", "a/b"])
+async def test_sessions_without_a_plain_workspace_get_a_truncated_output(tmp_path, session_id):
+    store = make_store(tmp_path)
+
+    event = await store.spill(session_id, result("x" * 20))
+
+    assert event["output"] == "xxxx" and event["truncated"]
+    assert "output_ref" not in event
+    assert store.truncated == 1
+    with pytest.raises(ValueError):
+        store.path(session_id, "toolu_1")
+
+
+@pytest.mark.parametrize("output_id", ["", "a.txt", "../x", "a" * 129])
+def test_bad_output_ids_are_rejected(tmp_path, output_id):
+    with pytest.raises(ValueError):
+        make_store(tmp_path).path("s1", output_id)
+
+
+@pytest.fixture
+async def spilled():
+    """A 100-byte output spilled into the driver's workspace for session "my.session"."""
+    output = "".join(str(i % 10) for i in range(100))
+    await claude_sdk_driver.tool_outputs.spill("my.session", result(output, "toolu_9"))
+    yield output
+    await claude_sdk_driver.workspaces.remove("my.session")
+
+
+URL = "/api/chat/sessions/my.session/outputs/toolu_9"
+
+
+async def test_endpoint_serves_the_full_output(client, spilled):
+    response = await client.get(URL)
+
+    assert response.status_code == 200
+    assert response.text == spilled
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.headers["content-length"] == "100"
+
+
+@pytest.mark.parametrize("header, start, end", [
+    ("bytes=10-19", 10, 19),
+    ("bytes=90-", 90, 99),
+    ("bytes=-5", 95, 99),
+    ("bytes=95-500", 95, 99),
+])
+async def test_endpoint_serves_byte_ranges(client, spilled, header, start, end):
+    response = await client.get(URL, headers={"Range": header})
+
+    assert response.status_code == 206
+    assert response.text == spilled[start:end + 1]
+    assert response.headers["content-range"] == f"bytes {start}-{end}/100"
+
+
+@pytest.mark.parametrize("header", ["bytes=0-1,5-6", "items=0-1", "bytes=x-y"])
+async def test_endpoint_serves_unsupported_ranges_in_full(client, spilled, header):
+    response = await client.get(URL, headers={"Range": header})
+
+    assert response.status_code == 200
+    assert response.text == spilled
+
+
+@pytest.mark.parametrize("header", ["bytes=100-", "bytes=20-10"])
+async def test_endpoint_rejects_unsatisfiable_ranges(client, spilled, header):
+    response = await client.get(URL, headers={"Range": header})
+
+    assert response.status_code == 416
+    assert response.headers["content-range"] == "bytes */100"
+
+
+@pytest.mark.parametrize("url", [
+    "/api/chat/sessions/my.session/outputs/missing",
+    "/api/chat/sessions/my.session/outputs/bad.id",
+    "/api/chat/sessions/other/outputs/toolu_9",
+    "/api/chat/sessions/.trash/outputs/toolu_9",
+])
+async def test_endpoint_404s_on_bad_references(client, spilled, url):
+    assert (await client.get(url)).status_code == 404
+
+
+async def test_spilled_output_of_a_sync_turn_is_served(client, fake_sdk, monkeypatch):
+    """A session id that is not a plain token still spills and serves its output."""
+    monkeypatch.setattr(
+        claude_sdk_driver.tool_outputs, "config", ToolOutputConfig(spill_chars=100, preview_chars=10)
+    )
+    session_id = "my.sync.session"
+
+    response = await client.post("/api/chat/message/sync", json={"message": "hi", "session_id": session_id})
+
+    assert response.status_code == 200
+    [path] = (claude_sdk_driver.workspaces.path(session_id) / OUTPUTS_DIR).iterdir()
+    output = await client.get(f"/api/chat/sessions/{session_id}/outputs/{path.stem}")
+    assert output.text == "x" * 512
+    await client.delete(f"/api/chat/sessions/{session_id}")
@@ -0,0 +1,156 @@
+"""
+Tests for run tracing: span pairing, exporters and the driver's spans.
+"""
+import json
+
+import pytest
+
+from src.modules.agent import metrics
+from src.modules.agent.driver import ClaudeSDKConfig, ClaudeSDKDriver, claude_sdk_driver
+from src.modules.agent.tracing import (
+    FileExporter,
+    InMemoryExporter,
+    RunTrace,
+    Tracer,
+    TracingConfig,
+)
+
+
+def test_tool_spans_pair_by_tool_use_id():
+    trace = RunTrace("s1")
+    trace.tool_started("a", "Bash")
+    trace.tool_started("b", "Read")
+
+    read = trace.tool_finished("b", is_error=True)
+    bash = trace.tool_finished("a", is_error=False)
+
+    assert (bash.attributes["tool"], read.attributes["tool"]) == ("Bash", "Read")
+    assert read.attributes["is_error"] and not bash.attributes["is_error"]
+    assert bash.duration_ms is not None
+    assert {bash.parent_id, read.parent_id} == {trace.root.span_id}
+    assert trace.root.parent_id is None
+
+
+def test_unknown_or_repeated_tool_result_is_not_paired():
+    trace = RunTrace("s1")
+    trace.tool_started("a", "Bash")
+
+    assert trace.tool_finished("other", is_error=False) is None
+    assert trace.tool_finished("a", is_error=False) is not None
+    assert trace.tool_finished("a", is_error=False) is None
+
+
+def test_finish_cuts_open_spans_short():
+    trace = RunTrace("s1")
+    incomplete = metrics.TOOL_CALLS.value("Grep", "incomplete")
+    trace.tool_started("a", "Grep")
+    query = trace.start("query")
+
+    trace.finish("timeout")
+
+    assert trace.root.attributes["outcome"] == "timeout"
+    assert all(span.duration_ms is not None for span in trace.spans)
+    assert query.attributes["incomplete"]
+    assert metrics.TOOL_CALLS.value("Grep", "incomplete") == incomplete + 1
+
+
+def test_memory_exporter_groups_recent_traces():
+    exporter = InMemoryExporter(max_spans=100)
+    traces = [RunTrace(session_id) for session_id in ("s1", "s2", "s1")]
+    for trace in traces:
+        trace.finish("completed")
+        exporter.export(trace.spans)
+
+    recent = exporter.traces()
+    assert [t["trace_id"] for t in recent] == [t.trace_id for t in reversed(traces)]
+    assert [t["trace_id"] for t in exporter.traces("s1", limit=1)] == [traces[2].trace_id]
+    assert recent[0]["spans"][0]["name"] == "run"
+
+
+def test_memory_exporter_is_bounded():
+    exporter = InMemoryExporter(max_spans=3)
+    trace = RunTrace("s1")
+    for i in range(5):
+        trace.start(f"step-{i}")
+    exporter.export(trace.spans)
+
+    [only] = exporter.traces()
+    assert [span["name"] for span in only["spans"]] == ["step-2", "step-3", "step-4"]
+
+
+def test_tool_stats():
+    exporter = InMemoryExporter(max_spans=100)
+    trace = RunTrace("s1")
+    for tool_use_id, tool, is_error in (("a", "Bash", False), ("b", "Bash", True), ("c", "Read", False)):
+        trace.tool_started(tool_use_id, tool)
+        trace.tool_finished(tool_use_id, is_error)
+    exporter.export(trace.spans)
+
+    stats = exporter.tool_stats()
+
+    assert (stats["Bash"]["calls"], stats["Bash"]["errors"]) == (2, 1)
+    assert stats["Read"]["calls"] == 1
+    assert stats["Bash"]["p50_ms"] <= stats["Bash"]["max_ms"]
+
+
+async def test_file_exporter_appends_json_lines(tmp_path):
+    path = tmp_path / "traces" / "spans.jsonl"
+    exporter = FileExporter(str(path))
+    trace = RunTrace("s1")
+    trace.finish("completed")
+
+    exporter.export(trace.spans)
+    exporter.export(trace.spans)
+    await exporter.close()
+
+    lines = path.read_text().splitlines()
+    assert len(lines) == 2
+    assert json.loads(lines[0])["trace_id"] == trace.trace_id
+
+
+def test_disabled_tracer_starts_no_trace():
+    tracer = Tracer(TracingConfig(enabled=False, buffer_spans=10, file=""))
+
+    assert tracer.start_run("s1") is None
+    tracer.finish(None, "completed")
+
+
+@pytest.fixture
+async def driver(fake_sdk):
+    driver = ClaudeSDKDriver(ClaudeSDKConfig())
+    driver.tracer = Tracer(TracingConfig(enabled=True, buffer_spans=1000, file=""))
+    driver.pool.config.enabled = False
+    yield driver
+    await driver.shutdown()
+
+
+async def test_driver_run_is_traced(driver):
+    events = [event async for event in driver.execute("hello", "s1")]
+
+    [tool_use] = [e for e in events if e["type"] == "tool_use"]
+    [tool_result] = [e for e in events if e["type"] == "tool_result"]
+    assert tool_result["tool_use_id"] == tool_use["id"]
+    assert tool_result["tool"] == "Bash"
+    assert tool_result["duration_ms"] >= 0
+
+    [trace] = driver.tracer.memory.traces("s1")
+    names = [span["name"] for span in trace["spans"]]
+    assert names == ["run", "connect", "query", "first_token", "result", "tool"]
+    run = trace["spans"][0]
+    assert run["attributes"]["outcome"] == "completed"
+    assert all(span["parent_id"] == run["span_id"] for span in trace["spans"][1:])
+
+
+async def test_admin_endpoints_report_the_driver_tracer(client, monkeypatch):
+    tracer = Tracer(TracingConfig(enabled=True, buffer_spans=100, file=""))
+    trace = tracer.start_run("s1")
+    trace.tool_started("a", "Bash")
+    trace.tool_finished("a", is_error=False)
+    tracer.finish(trace, "completed")
+    monkeypatch.setattr(claude_sdk_driver, "tracer", tracer)
+
+    traces = (await client.get("/api/chat/admin/traces", params={"session_id": "s1"})).json()
+    tools = (await client.get("/api/chat/admin/tools")).json()
+
+    assert [t["trace_id"] for t in traces["traces"]] == [trace.trace_id]
+    assert tools["tools"]["Bash"]["calls"] == 1
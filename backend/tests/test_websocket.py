@@ -0,0 +1,261 @@
+"""
+Tests for the multiplexed WebSocket chat transport.
+"""
+import asyncio
+import json
+from typing import Any, Optional
+
+import pytest
+
+from benchmarks.fake_sdk import FakeScript, install_fake_sdk
+from src.modules.chat import websocket
+from src.modules.chat.replay import replay_store
+from src.modules.chat.websocket import ChatConnection, WebSocketConfig, _Outbox
+
+
+class WebSocketClient:
+    """Drives the app's WebSocket endpoint over ASGI on the test event loop."""
+
+    def __init__(self, app: Any, path: str = "/api/chat/ws"):
+        self.scope = {
+            "type": "websocket",
+            "asgi": {"version": "3.0"},
+            "scheme": "ws",
+            "path": path,
+            "raw_path": path.encode(),
+            "root_path": "",
+            "query_string": b"",
+            "headers": [(b"host", b"test")],
+            "client": ("127.0.0.1", 50000),
+            "server": ("test", 80),
+            "subprotocols": [],
+        }
+        self.app = app
+        self._inbound: asyncio.Queue[dict[str, Any]] = asyncio.Queue()
+        self._outbound: asyncio.Queue[dict[str, Any]] = asyncio.Queue()
+        self._task: Optional[asyncio.Task[None]] = None
+
+    async def __aenter__(self) -> "WebSocketClient":
+        self._task = asyncio.create_task(self.app(self.scope, self._inbound.get, self._outbound.put))
+        await self._inbound.put({"type": "websocket.connect"})
+        assert (await self._next())["type"] == "websocket.accept"
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        if self._task is not None and not self._task.done():
+            await self._inbound.put({"type": "websocket.disconnect", "code": 1000})
+            async with asyncio.timeout(2):
+                await self._task
+
+    async def send(self, frame: dict[str, Any]) -> None:
+        await self._inbound.put({"type": "websocket.receive", "text": json.dumps(frame)})
+
+    async def send_raw(self, text: Optional[str] = None, data: Optional[bytes] = None) -> None:
+        await self._inbound.put({"type": "websocket.receive", "text": text, "bytes": data})
+
+    async def receive(self) -> dict[str, Any]:
+        message = await self._next()
+        assert message["type"] == "websocket.send", message
+        return json.loads(message["text"])
+
+    async def receive_until_end(self, session_id: str) -> list[dict[str, Any]]:
+        """Event payloads of a session's stream up to its "end" frame (other sessions' frames skipped)."""
+        events = []
+        while True:
+            frame = await self.receive()
+            if frame.get("session_id") != session_id:
+                continue
+            if frame["type"] == "end":
+                return events
+            assert frame["type"] == "event", frame
+            events.append(frame["event"])
+
+    async def _next(self) -> dict[str, Any]:
+        async with asyncio.timeout(2):
+            return await self._outbound.get()
+
+
+@pytest.fixture
+def app():
+    from src.main import app
+    return app
+
+
+async def test_turn_streams_events_then_end(app, fake_sdk):
+    async with WebSocketClient(app) as ws:
+        await ws.send({"type": "message", "message": "hi", "session_id": "ws-1", "ref": "r1"})
+
+        accepted = await ws.receive()
+        events = await ws.receive_until_end("ws-1")
+
+    assert accepted == {"type": "accepted", "session_id": "ws-1", "ref": "r1", "cache": "BYPASS"}
+    assert [e["type"] for e in events][-1] == "done"
+    assert "".join(e["content"] for e in events if e["type"] == "text")
+
+
+async def test_ping(app):
+    async with WebSocketClient(app) as ws:
+        await ws.send({"type": "ping"})
+
+        assert await ws.receive() == {"type": "pong"}
+
+
+@pytest.mark.parametrize("raw, message", [
+    ({"data": b"\x00\x01"}, "Binary frames"),
+    ({"text": "not json"}, "Expecting value"),
+    ({"text": "[1, 2]"}, "JSON object"),
+    ({"text": '{"type": "nope"}'}, "Unknown frame type"),
+    ({"text": '{"type": "window", "bytes": -1}'}, "non-negative"),
+    ({"text": '{"type": "message"}'}, "message"),
+])
+async def test_bad_frames_get_an_error_and_the_connection_stays_open(app, raw, message):
+    async with WebSocketClient(app) as ws:
+        await ws.send_raw(**raw)
+        error = await ws.receive()
+        await ws.send({"type": "ping"})
+
+        assert error["type"] == "error" and error["code"] == "bad_request"
+        assert message in error["message"]
+        assert await ws.receive() == {"type": "pong"}
+
+
+async def test_interrupt_stops_one_stream_while_others_continue(app):
+    script = FakeScript(
+        connect_latency=0, first_token_latency=0, text_chunks=20, chunk_interval=0.02, tool_latency=0
+    )
+    with install_fake_sdk(script):
+        async with WebSocketClient(app) as ws:
+            for session_id in ("ws-a", "ws-b"):
+                await ws.send({"type": "message", "message": "hi", "session_id": session_id})
+            # Wait until both turns are streaming
+            seen: set[str] = set()
+            while seen != {"ws-a", "ws-b"}:
+                frame = await ws.receive()
+                if frame["type"] == "event" and frame["event"]["type"] == "text":
+                    seen.add(frame["session_id"])
+
+            await ws.send({"type": "interrupt", "session_id": "ws-a"})
+            a_events, b_events = [], []
+            ended: set[str] = set()
+            while ended != {"ws-a", "ws-b"}:
+                frame = await ws.receive()
+                if frame["type"] == "end":
+                    ended.add(frame["session_id"])
+                elif frame["type"] == "event":
+                    (a_events if frame["session_id"] == "ws-a" else b_events).append(frame["event"])
+
+    assert any(e.get("code") == "interrupted" for e in a_events)
+    assert b_events[-1]["type"] == "done" and not b_events[-1].get("is_error")
+    assert not any(e.get("code") == "interrupted" for e in b_events)
+
+
+async def test_interrupt_without_a_run_is_an_error(app):
+    async with WebSocketClient(app) as ws:
+        await ws.send({"type": "interrupt", "session_id": "ws-idle"})
+
+        error = await ws.receive()
+
+    assert (error["code"], error["session_id"]) == ("not_running", "ws-idle")
+
+
+async def test_resume_replays_a_finished_turn(app, fake_sdk):
+    async with WebSocketClient(app) as ws:
+        await ws.send({"type": "message", "message": "hi", "session_id": "ws-r"})
+        await ws.receive()
+        first = await ws.receive_until_end("ws-r")
+
+        await ws.send({"type": "resume", "session_id": "ws-r", "last_event_id": 0})
+        replayed = await ws.receive_until_end("ws-r")
+
+    assert replayed == first
+
+
+async def test_too_many_streams(app, monkeypatch):
+    monkeypatch.setattr(websocket, "WebSocketConfig", lambda: WebSocketConfig(max_streams=1))
+    script = FakeScript(connect_latency=0, first_token_latency=0.5, tool_calls=0)
+    with install_fake_sdk(script):
+        async with WebSocketClient(app) as ws:
+            await ws.send({"type": "message", "message": "hi", "session_id": "ws-m1"})
+            assert (await ws.receive())["type"] == "accepted"
+            await ws.send({"type": "message", "message": "hi", "session_id": "ws-m2", "ref": "r2"})
+
+            error = await ws.receive()
+            await ws.send({"type": "interrupt", "session_id": "ws-m1"})
+            await ws.receive_until_end("ws-m1")
+
+    assert (error["code"], error["ref"]) == ("too_many_streams", "r2")
+
+
+async def test_disconnect_detaches_streams(app):
+    script = FakeScript(
+        connect_latency=0, first_token_latency=0, text_chunks=50, chunk_interval=0.02, tool_latency=0
+    )
+    with install_fake_sdk(script):
+        ws = WebSocketClient(app)
+        await ws.__aenter__()
+        before = websocket._connections
+        await ws.send({"type": "message", "message": "hi", "session_id": "ws-d"})
+        await ws.receive()
+        buffer = replay_store.get("ws-d")
+        assert buffer is not None and buffer.subscribers == 1
+
+        await ws.close()
+
+        assert websocket._connections == before - 1
+        assert buffer.subscribers == 0
+        # The run itself is left to the disconnect grace, like a dropped SSE stream
+        buffer.interrupt()
+
+
+async def test_outbox_bounds_event_bytes_but_not_control_frames():
+    outbox = _Outbox(max_bytes=10)
+    await outbox.put("e1", 10)
+
+    blocked = asyncio.create_task(outbox.put("e2", 5))
+    await outbox.put("pong")
+    await asyncio.sleep(0.01)
+    assert not blocked.done()
+
+    assert await outbox.get() == ("e1", 10)
+    await asyncio.wait_for(blocked, 1)
+    assert [await outbox.get(), await outbox.get()] == [("pong", 0), ("e2", 5)]
+    assert outbox.size == 0
+
+
+class RecordingSocket:
+    """The send side of a WebSocket, for driving ChatConnection._write."""
+
+    def __init__(self) -> None:
+        self.sent: list[str] = []
+
+    async def send_text(self, text: str) -> None:
+        self.sent.append(text)
+
+
+async def test_credit_window_holds_events_until_acked():
+    socket = RecordingSocket()
+    connection = ChatConnection(socket, start_turn=None, config=WebSocketConfig(send_buffer_bytes=1000))
+    await connection._set_credit(window=10)
+    writer = asyncio.create_task(connection._write())
+    try:
+        for name in ("a", "b", "c"):
+            await connection.outbox.put(name, 6)
+        await connection._send({"type": "pong"})
+        await asyncio.sleep(0.01)
+        # One frame always fits; the second would exceed the window
+        assert socket.sent == ["a"]
+
+        await connection._set_credit(acked=6)
+        await asyncio.sleep(0.01)
+        assert socket.sent == ["a", "b"]
+
+        # Turning the window off releases everything
+        await connection._set_credit(window=0)
+        await asyncio.sleep(0.01)
+        assert socket.sent == ["a", "b", "c", '{"type": "pong"}']
+    finally:
+        writer.cancel()
+        await asyncio.gather(writer, return_exceptions=True)
@@ -0,0 +1,158 @@
+"""
+Tests for session workspace lifecycle: trash, janitor, TTL sweep and leases.
+"""
+import asyncio
+import os
+import time
+from pathlib import Path
+
+from src.modules.agent.workspace import POOL_DIR, TRASH_DIR, WorkspaceConfig, WorkspaceManager
+
+
+def age(path: Path, seconds: float) -> None:
+    """Backdate a directory's mtime (its lease)."""
+    stamp = time.time() - seconds
+    os.utime(path, (stamp, stamp), follow_symlinks=False)
+
+
+def make_manager(tmp_path: Path, ttl: int = 60, **kwargs) -> WorkspaceManager:
+    return WorkspaceManager(tmp_path, WorkspaceConfig(ttl_seconds=ttl, janitor_interval_seconds=3600), **kwargs)
+
+
+def pooled(tmp_path: Path, session_id: str, name: str) -> Path:
+    """Create a pool staging directory and link a session workspace to it."""
+    target = tmp_path / POOL_DIR / name
+    target.mkdir(parents=True)
+    os.symlink(os.path.relpath(target, tmp_path), tmp_path / session_id, target_is_directory=True)
+    return target
+
+
+async def test_remove_trashes_then_janitor_deletes(tmp_path):
+    manager = make_manager(tmp_path)
+    workspace = await manager.ensure("s1")
+    (workspace / "notes.md").write_text("x")
+
+    await manager.remove("s1")
+    assert not workspace.exists()
+
+    async with asyncio.timeout(1):
+        while any((tmp_path / TRASH_DIR).iterdir()):
+            await asyncio.sleep(0.01)
+    await manager.close()
+
+
+async def test_remove_pooled_workspace_trashes_its_target(tmp_path):
+    manager = make_manager(tmp_path)
+    target = pooled(tmp_path, "s1", "abc")
+
+    assert await manager.resolve("s1") == target.resolve()
+    await manager.remove("s1")
+    await manager.close()
+
+    assert not (tmp_path / "s1").is_symlink()
+    assert not target.exists()
+
+
+def test_empty_trash_removes_dirs_and_stray_files(tmp_path):
+    manager = make_manager(tmp_path)
+    (tmp_path / TRASH_DIR / "s1-0000" / "sub").mkdir(parents=True)
+    (tmp_path / TRASH_DIR / "stray").write_text("x")
+    os.symlink(tmp_path / "elsewhere", tmp_path / TRASH_DIR / "link")
+
+    manager._empty_trash()
+
+    assert list((tmp_path / TRASH_DIR).iterdir()) == []
+
+
+def test_sweep_removes_only_expired_inactive_workspaces(tmp_path):
+    manager = make_manager(tmp_path, is_active=lambda name: name == "active")
+    for name in ("old", "fresh", "active"):
+        (tmp_path / name).mkdir()
+    age(tmp_path / "old", 120)
+    age(tmp_path / "active", 120)
+
+    swept = manager._sweep_expired()
+
+    assert swept == ["old"]
+    assert sorted(p.name for p in tmp_path.iterdir() if not p.name.startswith(".")) == ["active", "fresh"]
+
+
+def test_sweep_follows_links_for_the_lease(tmp_path):
+    """A pooled workspace expires by its target's mtime; the target goes with it."""
+    manager = make_manager(tmp_path)
+    old = pooled(tmp_path, "old", "a")
+    fresh = pooled(tmp_path, "fresh", "b")
+    age(old, 120)
+    # The link itself is old, but the directory it leases is not
+    age(tmp_path / "fresh", 120)
+
+    assert manager._sweep_expired() == ["old"]
+    assert not old.exists()
+    assert fresh.exists()
+
+
+def test_sweep_removes_dangling_links(tmp_path):
+    manager = make_manager(tmp_path)
+    os.symlink(tmp_path / POOL_DIR / "gone", tmp_path / "s1", target_is_directory=True)
+
+    assert manager._sweep_expired() == ["s1"]
+    assert not (tmp_path / "s1").is_symlink()
+
+
+def test_sweep_keeps_staged_and_linked_pool_dirs(tmp_path):
+    """Old pool directories go unless they are staged here or serve a session."""
+    manager = make_manager(tmp_path, staged=lambda: {"staged"}, is_active=lambda name: True)
+    pool_dir = tmp_path / POOL_DIR
+    for name in ("staged", "orphan"):
+        (pool_dir / name).mkdir(parents=True)
+        age(pool_dir / name, 120)
+    linked = pooled(tmp_path, "s1", "linked")
+    age(linked, 120)
+
+    manager._sweep_expired()
+
+    assert sorted(p.name for p in pool_dir.iterdir()) == ["linked", "staged"]
+
+
+async def test_touch_renews_the_lease(tmp_path):
+    """Touched directories survive a janitor that does not know they are in use."""
+    owner = make_manager(tmp_path, is_active=lambda name: True, staged=lambda: {"p"})
+    for path in (tmp_path / "s1", tmp_path / POOL_DIR / "p"):
+        path.mkdir(parents=True)
+        age(path, 120)
+    owner.adopt("s1")
+
+    owner._touch(owner._in_use() + [tmp_path / "missing"])
+    other = make_manager(tmp_path)
+
+    assert other._sweep_expired() == []
+    assert (tmp_path / POOL_DIR / "p").exists()
+    await owner.close()
+
+
+async def test_zero_ttl_disables_the_sweep(tmp_path):
+    manager = make_manager(tmp_path, ttl=0)
+    (tmp_path / "old").mkdir()
+    age(tmp_path / "old", 10**6)
+
+    manager.ensure_janitor()
+    await asyncio.sleep(0.05)
+    await manager.close()
+
+    assert (tmp_path / "old").exists()
+
+
+async def test_janitor_reports_swept_sessions(tmp_path):
+    removed = []
+    manager = make_manager(tmp_path, on_removed=removed.append)
+    (tmp_path / "old").mkdir()
+    age(tmp_path / "old", 120)
+
+    manager.ensure_janitor()
+    async with asyncio.timeout(1):
+        while not removed:
+            await asyncio.sleep(0.01)
+    await manager.close()
+
+    assert removed == ["old"]
+    assert not (tmp_path / "old").exists()